@@ -391,10 +391,13 @@ void cin_load(
     }
   }
 
-  if (task_cnt % 2 == 1){
-    cin_load_fifo_write(cin_burst_buf_ping, fifo_cin, LAYER_IN_NUM_T_prev, LAYER_IN_H_T_prev, LAYER_IN_W_T_prev, FILTER_S_prev);  
-  } else {
-    cin_load_fifo_write(cin_burst_buf_pong, fifo_cin, LAYER_IN_NUM_T_prev, LAYER_IN_H_T_prev, LAYER_IN_W_T_prev, FILTER_S_prev); 
+  // the last tile, unless all the layers of the call load from the on-chip buffer
+  if (task_cnt > 0){
+    if (task_cnt % 2 == 1){
+      cin_load_fifo_write(cin_burst_buf_ping, fifo_cin, LAYER_IN_NUM_T_prev, LAYER_IN_H_T_prev, LAYER_IN_W_T_prev, FILTER_S_prev);  
+    } else {
+      cin_load_fifo_write(cin_burst_buf_pong, fifo_cin, LAYER_IN_NUM_T_prev, LAYER_IN_H_T_prev, LAYER_IN_W_T_prev, FILTER_S_prev); 
+    }
   }
 }
 
@@ -2410,13 +2413,14 @@ void pool(
 /**
 * Function name: inter_write
 * Function description: This functions writes out intermediate results to on-chip buffers.
-*                       Currently deprecated.
+*                       If INTER_WRITE_EN is set, the output tiles are pushed to the on-chip buffer fifo_inter
+*                       instead of cout_write, and popped by inter_load of the layer that sets INTER_LOAD_EN.
 */
 void inter_write(
   hls::stream<PoolData0Type> &fifo_cin,
   hls::stream<ConfigInst>    &fifo_config_in,
   hls::stream<InterWriteData0Type> &fifo_cout,
-//  hls::stream<InterWriteData1Type> &fifo_inter,
+  hls::stream<InterWriteData1Type> &fifo_inter,
   hls::stream<ConfigInst>    &fifo_config_out
 ){
 #pragma HLS INLINE off
@@ -2524,7 +2528,7 @@ void inter_write(
               fifo_cout.write(tmp);
             }
             else {
-//            fifo_inter.write(tmp);
+              fifo_inter.write(tmp);
 #ifdef DEBUG                  
               fifo_write_cnt++;
 #endif                  
@@ -2561,7 +2565,7 @@ void inter_write(
             if (INTER_WRITE_EN == 0)
               fifo_cout.write(tmp);
             else{
-//              fifo_inter.write(tmp);              
+              fifo_inter.write(tmp);
             }
             w++;
             if (w == LAYER_IN_W_T / 2){
@@ -3094,7 +3098,8 @@ void cout_write(
 
   }
 
-  if (INTER_WRITE_EN == 0){
+  // the last tile written to DDR, the last layer of the call may write to the on-chip buffer
+  if (task_cnt > 0){
     if (task_cnt % 2 == 1){
       cout_write_ddr_write(
         cout_burst_buf_ping, global_cout,
@@ -3191,7 +3196,7 @@ void engine(
   hls::stream<InterWriteData0Type> fifo_inter_write_0;
   static hls::stream<InterWriteData1Type> fifo_inter_write_1;
 #pragma HLS STREAM variable=fifo_inter_write_0 depth=16
-#pragma HLS STREAM variable=fifo_inter_write_1 depth=16
+#pragma HLS STREAM variable=fifo_inter_write_1 depth=INTER_BUF_DEPTH
   // Module: upsample
   // Output ports:
   // 0: cout -> data_write
@@ -3273,7 +3278,7 @@ void engine(
     fifo_pool_0,
     config_inter_write,
     fifo_inter_write_0,
-//    fifo_inter_write_1, // reserved
+    fifo_inter_write_1,
     config_data_write
     );
 //  upsample(
@@ -43,6 +43,28 @@ void instInit(
   cout << "Loading instructions..." << endl;
   char* prj_path_c = getenv("PRJ_PATH");
   string prj_path = prj_path_c;
+
+  // binary instructions of inst_format.py: the payload is the whole config buffer, read without parsing
+  string bin_path = prj_path + "/inst_gen/openpose.insts.bin";
+  ifstream bin_file(bin_path.c_str(), ios::binary);
+  if (bin_file.is_open()){
+    // MAGIC | VERSION | LAYER_NUM | CONFIG_PARAMS | MODEL_PARAMS | PAYLOAD_OFFSET
+    uint header[8];
+    bin_file.read((char*)header, sizeof(header));
+    if (!bin_file || header[0] != 0x4E49504F || header[1] != 1 || header[2] != LAYER_NUM || header[3] != CONFIG_PARAMS || header[4] != 4){
+      cout << "CONFIG binary header mismatch!" << endl;
+      exit(-1);
+    }
+    bin_file.seekg(header[5]);
+    bin_file.read((char*)config, (4 + LAYER_NUM * CONFIG_PARAMS) * sizeof(uint));
+    if (!bin_file){
+      cout << "CONFIG binary truncated!" << endl;
+      exit(-1);
+    }
+    bin_file.close();
+    return;
+  }
+
   string file_path = prj_path + "/inst_gen/openpose.insts";
   ifstream in_file(file_path.c_str());
   
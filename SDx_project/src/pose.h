@@ -36,6 +36,11 @@ using namespace hls;
 #define STENCIL_SPLIT_FACTOR 2
 #define STENCIL_PACK_FACTOR (DEPTH_CONV_LANE / STENCIL_SPLIT_FACTOR)
 
+// Depth of the on-chip buffer between inter_write and inter_load, set in params.h by the layer fusion
+#ifndef INTER_BUF_DEPTH
+#define INTER_BUF_DEPTH 16
+#endif
+
 #define CONFIG_PARAMS  31
 #define INST_PER_LAYER 5
 
@@ -2,9 +2,18 @@
 
 # inst_gen
 rm ./inst_gen/openpose.insts
+rm ./inst_gen/openpose.insts.bin
+rm ./inst_gen/ddr_plan.json
+rm ./inst_gen/layer_fuse.json
+rm ./inst_gen/roofline.json
+rm ./inst_gen/roofline.csv
+rm ./inst_gen/tile_tune.json
+rm ./inst_gen/openpose.tiled.model
 rm ./inst_gen/params.h
 rm ./inst_gen/weight_offset.dat
 rm ./inst_gen/bias_offset.dat
+rm ./inst_gen/network.npy
+rm -rf ./inst_gen/bundle
 
 # HLS_project
 rm -rf ./HLS_project/HLS_kernel/output
@@ -24,3 +33,13 @@ cd -
 # data
 rm ./data/bias_reorg.bin
 rm ./data/weight_reorg.bin
+rm ./data/quant.json
+rm ./data/sim_output.bin
+rm ./data/cin.npy
+rm ./data/keypoints.json
+
+# dse
+rm ./dse/dse_store.db
+rm ./dse/pareto_front.json
+rm ./dse/pareto_front.csv
+rm ./dse/perf.json
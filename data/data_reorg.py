@@ -1,1079 +1,374 @@
-from math import ceil
+import numpy as np
 import json
 import argparse
-from array import array
+import multiprocessing
+import os
+import sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'inst_gen'))
+import network_ir
 
 '''
 Functionality: reorganize data
 cin[BATCH][H][W][IN_NUM]
 bias[OUT_NUM] -> bias[OUT_NUM / OUT_NUM_T][OUT_NUM_T]
-weights[K][K][IN_NUM][OUT_NUM] -> weights[OUT_NUM / OUT_NUM_T][OUT_NUM_T][IN_NUM / IN_NUM_T][K][K][IN_NUM_T]
+weights[K][K][IN_NUM][OUT_NUM] -> weights[OUT_NUM / OUT_NUM_T][IN_NUM / IN_NUM_T][OUT_NUM_T][K][K][IN_NUM_T]
 weights[K][K][IN_NUM] -> weights[IN_NUM / IN_NUM_T][K][K][IN_NUM_T]
 
-For weights, the concat layers original sequnece is:
+The input channels of the layers after a concatenation follow the layout of the concatenated feature maps, where
+each feature map is padded to its OUT_NUM_HW, in the order of network_ir.net_concat_order. For openpose, the first
+concat layers keep the sequence of the model:
   conv2d_3_pool - conv2d_7 - conv2d_11
-we change it to:
-  conv2d_7 - conv2d_11 - conv2d_3_pool
-
-The second concat layer original sequence is:
+The second concat layers keep the sequence of the model in the stage 2 iterations [2,4,6]:
   mconv_stage1_L1_5 - mconv_stage1_L2_5 - conv2d_3_pool - conv2d_7 - conv2d_11
-we change it to:
-  conv2d_7 - conv2d_11 - conv2d_3_pool - mconv_stage1_L1_5 - mconv_stage1_L2_5
-'''
-
-def run(f_tile, f_model, f_model_config, f_input_config, f_weight, f_bias):
-  model = open(f_model, "r")
-  with open(f_tile, "r") as f:
-    tile = json.loads(f.read())
-  with open(f_model_config, "r") as f:
-    model_config = json.loads(f.read())
-  with open(f_input_config, "r") as f:
-    input_config = json.loads(f.read())
+and in the stage 2 iterations [3,5] it is changed to:
+  conv2d_3_pool - conv2d_7 - conv2d_11 - mconv_stage1_L1_5 - mconv_stage1_L2_5
 
-#  weights = open(f_weight, "r")
-#  bias = open(f_bias, "r")
+All the transforms are numpy gathers and transposes, the padded channels index a zero slot appended to the weights.
 
-  # load weights, bias
-#  with open(f_weight) as f:
-#    weights = f.readlines()
-#  weights = [x.strip() for x in weights]
-#  with open(f_bias) as f:
-#    bias = f.readlines()
-#  bias = [x.strip() for x in bias]
-  with open(f_weight, 'rb') as f:
-    weights_arr = array('f')
-    weights_arr.frombytes(f.read())
-  weights = weights_arr.tolist()
+The reorganized data are exported as float32 by default, or as 16-bit/8-bit fixed point with --quant. The fixed point
+format is chosen per layer and separately for the weights and the bias: x = q * 2^-FRAC_BITS, with the integer bits
+covering the largest magnitude of the layer. The formats and the quantization errors against the float data are
+written to quant.json.
+'''
 
-  with open(f_bias, 'rb') as f:
-    bias_arr = array('f')
-    bias_arr.frombytes(f.read())
-  bias = bias_arr.tolist()
+'''
+data type of the exported data, 0 for float
+'''
+QUANT_DTYPE = {0: np.float32, 16: np.int16, 8: np.int8}
 
-  #print(weights[864])
+'''
+pad a channel map with -1 to a multiple of num_t
+'''
+def channel_map_pad(chan_map, num_t):
+  num_pad = -(-len(chan_map) // num_t) * num_t
+  return np.concatenate([chan_map, np.full(num_pad - len(chan_map), -1, dtype = np.int64)])
 
-#  weights_reorg = open('./weight_reorg.dat', 'w')
-#  bias_reorg = open('./bias_reorg.dat', 'w')
-  weights_reorg = []
-  bias_reorg = []
+'''
+channel map of the input feature maps: for each channel in the hardware layout, the input channel in the model weights,
+-1 for the padding
+'''
+def input_channel_map(net, layer_id, it):
+  layer = net[layer_id]
+  if not layer['in_concat']:
+    return channel_map_pad(np.arange(int(layer['in_num']), dtype = np.int64), int(layer['in_num_t']))
+
+  srcs = network_ir.net_concat_sources(net, layer_id)
+  raw_offsets = np.concatenate([[0], np.cumsum(net['out_num'][srcs])[:-1]])
+  segments = []
+  for src in network_ir.net_concat_order(net, layer_id, it):
+    k = srcs.index(src)
+    seg = np.full(int(net[src]['out_num_hw']), -1, dtype = np.int64)
+    seg[:int(net[src]['out_num'])] = np.arange(raw_offsets[k], raw_offsets[k] + int(net[src]['out_num']))
+    segments.append(seg)
+  return np.concatenate(segments)
 
-  IN_NUM_T = tile['IN_NUM_T']
-  OUT_NUM_T = tile['OUT_NUM_T']
-  IN_H_T = tile['IN_H_T']
-  IN_W_T = tile['IN_W_T']
-  OUT_H_T = tile['OUT_H_T']
-  OUT_W_T = tile['OUT_W_T']
-  K_T = tile['K_T']
+'''
+weights[K][K][IN_NUM] -> weights[IN_NUM_HW / IN_NUM_T][K][K][IN_NUM_T]
+the output is cut to the hardware channel number, the length of in_map
+'''
+def reorg_depth_conv(w, in_map, filter_s, in_num_t):
+  in_map_pad = channel_map_pad(in_map, in_num_t)
+  w = np.concatenate([w, np.zeros((filter_s, filter_s, 1), dtype = w.dtype)], axis = 2)
+  w = w[:, :, in_map_pad].reshape(filter_s, filter_s, -1, in_num_t).transpose(2, 0, 1, 3)
+  return w.ravel()[:len(in_map) * filter_s * filter_s]
 
-  VGG_LAYERS = model_config['VGG_LAYERS']
-  STAGE1_LAYERS = model_config['STAGE1_LAYERS']
-  STAGE1_ITER = model_config['STAGE1_ITER']
-  STAGE2_LAYERS = model_config['STAGE2_LAYERS']
-  STAGE2_ITER = model_config['STAGE2_ITER']
+'''
+weights[K][K][IN_NUM][OUT_NUM] -> weights[OUT_NUM_HW / OUT_NUM_T][IN_NUM_HW / IN_NUM_T][OUT_NUM_T][K][K][IN_NUM_T]
+'''
+def reorg_conv(w, in_map, filter_s, in_num_t, out_num_t):
+  in_map_pad = channel_map_pad(in_map, in_num_t)
+  out_map_pad = channel_map_pad(np.arange(w.shape[3], dtype = np.int64), out_num_t)
+  w = np.pad(w, ((0, 0), (0, 0), (0, 1), (0, 1)))
+  w = w[:, :, in_map_pad][:, :, :, out_map_pad]
+  w = w.reshape(filter_s, filter_s, -1, in_num_t, len(out_map_pad) // out_num_t, out_num_t).transpose(4, 2, 5, 0, 1, 3)
+  return w.ravel()[:len(out_map_pad) * len(in_map) * filter_s * filter_s]
 
-  network_in_num = input_config['IN_NUM']
-  network_in_h = input_config['IN_H']
-  network_in_w = input_config['IN_W']
+'''
+bias[OUT_NUM] -> bias[OUT_NUM / OUT_NUM_T][OUT_NUM_T]
+'''
+def reorg_bias(b, out_num_t):
+  return np.pad(b, (0, -(-len(b) // out_num_t) * out_num_t - len(b)))
 
+'''
+offset table of the layers with weights, in the execution order: the offsets and sizes of the raw weights and bias of
+each layer in the input files and of their reorganized blocks in the output files
+'''
+def reorg_plan(net, model_config):
+  plan = []
   weight_offset = 0
   bias_offset = 0
   weight_reorg_offset = 0
   bias_reorg_offset = 0
 
-  in_num = network_in_num
-  out_num = network_in_num
-  in_h = network_in_h
-  in_w = network_in_w
-  out_h = network_in_h
-  out_w = network_in_w
-
-  lines = []
-  for i in model.readlines():
-    lines.append(i)
-
-  line_num = len(lines)
-
-  current_model = "VGG" #{VGG, STAGE1, STAGE2}
-  stage1_line_id = 0
-  stage2_line_id = 0
-
-  vgg_layer_cnt = 0
-  stage1_layer_cnt = 0
-  stage1_iter_cnt = 0
-  stage2_layer_cnt = 0
-  stage2_iter_cnt = 0
-  stage1_channel_cnt = 0
-  stage2_channel_cnt = 0
-
-  filter_list = []
-  for line_id in range(1, line_num):
-    line = lines[line_id].strip('\n')
-    content = line.split(',')
-#    if len(content) > 1 and (content[1] == 'convb' or content[1]) == 'separable_conv':
-    if len(content) > 1:
-      filter_s = int(content[3])
-      filter_list.append(filter_s)
-
-  line_id = 1
-  while line_id < line_num:
-    line = lines[line_id].strip('\n')
-    content = line.split(',')
-    if current_model == 'VGG':
-      pool_en = 0
-      if len(content) > 1 and content[4] == '2':
-        pool_en = 1
-      layer_name = content[0]
-      layer_type = content[1]
-
-      in_num = out_num
-      in_h = out_h
-      in_w = out_w
-      out_num = int(content[2])
-      filter_s = int(content[3])
-      stride = int(content[4])
-      in_num_t = int(content[7])
-      out_num_t = int(content[8])
-
-      if layer_name == 'Conv2d_3_pool':
-        in_num = Conv2d_3_out_num
-        in_h = Conv2d_3_out_h
-        in_w = Conv2d_3_out_w
-
-      if pool_en == 1:
-        out_h = (in_h + 1) / 2
-        out_w = (in_w + 1) / 2
-      else:
-        out_h = in_h
-        out_w = in_w
-
-      cur_filter_s = filter_s
-      nxt_filter_s = 0
-      if layer_name == 'Conv2d_7' or layer_name == 'Conv2d_11' or layer_name == 'Conv2d_3_pool':
-        nxt_filter_s = max(filter_list[VGG_LAYERS], filter_list[VGG_LAYERS + STAGE1_LAYERS * 2])
-      else:
-        nxt_filter_s = filter_list[vgg_layer_cnt + 1]
-
-      in_num_hw = ceil(float(in_num) / in_num_t) * in_num_t
-      out_num_hw = ceil(float(out_num) / out_num_t) * out_num_t
-      in_h_hw = ceil(float(in_h) / IN_H_T) * IN_H_T + (cur_filter_s - 1)
-      in_w_hw = ceil(float(in_w) / IN_W_T) * IN_W_T + (cur_filter_s - 1)
-      out_h_hw = ceil(float(out_h) / OUT_H_T) * OUT_H_T + (nxt_filter_s - 1)
-      out_w_hw = ceil(float(out_w) / OUT_W_T) * OUT_W_T + (nxt_filter_s - 1)
-
-      if layer_name == 'Conv2d_3':
-        Conv2d_3_out_num = out_num
-        Conv2d_3_out_num_hw = out_num_hw
-        Conv2d_3_out_h = out_h
-        Conv2d_3_out_w = out_w
-
-      if layer_name == 'Conv2d_7':
-        Conv2d_7_out_num = out_num
-        Conv2d_7_out_num_hw = out_num_hw
-        Conv2d_7_out_h = out_h
-        Conv2d_7_out_w = out_w
-
-      if layer_name == 'Conv2d_11':
-        Conv2d_11_out_num = out_num
-        Conv2d_11_out_num_hw = out_num_hw
-        Covn2d_11_out_h = out_h
-        Conv2d_11_out_w = out_w
-
-      if layer_name == 'Conv2d_3_pool':
-        Conv2d_3_pool_out_num = out_num
-        Conv2d_3_pool_out_num_hw = out_num_hw
-        Conv2d_3_pool_out_h = out_h
-        Conv2d_3_pool_out_w = out_w
-
-      weights_layer_raw = []
-      weights_layer_reorg = []
-      bias_layer_raw = []
-      bias_layer_reorg = []
-
-      if layer_type == "separable_conv":
-        for weight_idx in range(in_num * filter_s * filter_s):
-          weights_layer_raw.append(weights[weight_offset + weight_idx])
-
-        for i1 in range(int(ceil(float(in_num) / in_num_t))):
-          for p in range(filter_s):
-            for q in range(filter_s):
-              for i2 in range(in_num_t):
-                i = i1 * in_num_t + i2
-#                raw_idx = i * filter_s * filter_s + p * filter_s + q
-                raw_idx = p * filter_s * in_num + q * in_num + i
-                if (i < in_num):
-                  weights_layer_reorg.append(weights_layer_raw[raw_idx])
-                else:
-                  weights_layer_reorg.append(0.0)
-
-        for weight_idx in range(int(in_num_hw * filter_s * filter_s)):
-          weights_reorg.append(weights_layer_reorg[weight_idx])
-
-        weight_offset += in_num * filter_s * filter_s
-        weight_reorg_offset += in_num_hw * filter_s * filter_s
-
-        #print(weight_offset, weight_reorg_offset)
-
-        weights_layer_raw = []
-        weights_layer_reorg = []
-
-        for weight_idx in range(out_num * in_num * 1 * 1):
-          weights_layer_raw.append(weights[weight_offset + weight_idx])
-
-        #print(weights_layer_raw[0])
-
-        for o1 in range(int(ceil(float(out_num) / out_num_t))):
-          for i1 in range(int(ceil(float(in_num) / in_num_t))):
-            for o2 in range(out_num_t):
-              for p in range(1):
-                for q in range(1):
-                  for i2 in range(in_num_t):
-                    o = o1 * out_num_t + o2
-                    i = i1 * in_num_t + i2
-                    raw_idx = p * 1 * in_num * out_num + q * in_num * out_num + i * out_num + o
-                    if (o < out_num) and (i < in_num):
-                      weights_layer_reorg.append(weights_layer_raw[raw_idx])
-                    else:
-                      weights_layer_reorg.append(0.0)
-
-#        for o1 in range(int(ceil(float(out_num) / OUT_NUM_T))):
-#          for o2 in range(OUT_NUM_T):
-#            for i1 in range(int(ceil(float(in_num) / IN_NUM_T))):
-#              for p in range(1):
-#                for q in range(1):
-#                  for i2 in range(IN_NUM_T):
-#                    o = o1 * OUT_NUM_T + o2
-#                    i = i1 * IN_NUM_T + i2
-#                    raw_idx = p * 1 * in_num * out_num + q * in_num * out_num + i * out_num + o
-#                    if (o < out_num) and (i < in_num):
-#                      weights_layer_reorg.append(weights_layer_raw[raw_idx])
-#                    else:
-#                      weights_layer_reorg.append(0.0)
-
-        for weight_idx in range(int(out_num_hw * in_num_hw * 1 * 1)):
-          weights_reorg.append(weights_layer_reorg[weight_idx])
-
-        weight_offset += out_num * in_num * 1 * 1
-        weight_reorg_offset += out_num_hw * in_num_hw * 1 * 1
-
-        for bias_idx in range(out_num):
-          bias_layer_raw.append(bias[bias_offset + bias_idx])
-
-        for o1 in range(int(ceil(float(out_num) / out_num_t))):
-          for o2 in range(out_num_t):
-            o = o1 * out_num_t + o2
-            raw_idx = o
-            if (o < out_num):
-              bias_layer_reorg.append(bias_layer_raw[raw_idx])
-            else:
-              bias_layer_reorg.append(0.0)
-
-        for bias_idx in range(int(out_num_hw)):
-          bias_reorg.append(bias_layer_reorg[bias_idx])
-
-        bias_offset += out_num
-        bias_reorg_offset += out_num_hw
-
-#        print(layer_name, weight_reorg_offset, bias_reorg_offset)
-
-      elif layer_type == "convb":
-        for weight_idx in range(int(out_num * in_num * filter_s * filter_s)):
-          weights_layer_raw.append(weights[weight_offset + weight_idx])
-
-        for o1 in range(int(ceil(float(out_num) / out_num_t))):
-          for i1 in range(int(ceil(float(in_num) / in_num_t))):
-            for o2 in range(out_num_t):
-              for p in range(filter_s):
-                for q in range(filter_s):
-                  for i2 in range(in_num_t):
-                    o = o1 * out_num_t + o2
-                    i = i1 * in_num_t + i2
-                    raw_idx = p * filter_s * in_num * out_num + q * in_num * out_num + i * out_num + o
-                    if (o < out_num) and (i < in_num):
-                      weights_layer_reorg.append(weights_layer_raw[raw_idx])
-                    else:
-                      weights_layer_reorg.append(0.0)
-
-#        for o1 in range(int(ceil(float(out_num) / OUT_NUM_T))):
-#          for o2 in range(OUT_NUM_T):
-#            for i1 in range(int(ceil(float(in_num) / IN_NUM_T))):
-#              for p in range(filter_s):
-#                for q in range(filter_s):
-#                  for i2 in range(IN_NUM_T):
-#                    o = o1 * OUT_NUM_T + o2
-#                    i = i1 * IN_NUM_T + i2
-#                    raw_idx = p * filter_s * in_num * out_num + q * in_num * out_num + i * out_num + o
-#                    if (o < out_num) and (i < in_num):
-#                      weights_layer_reorg.append(weights_layer_raw[raw_idx])
-#                    else:
-#                      weights_layer_reorg.append(0.0)
-
-        for weight_idx in range(int(out_num_hw * in_num_hw * filter_s * filter_s)):
-          weights_reorg.append(weights_layer_reorg[weight_idx])
-
-        weight_offset += out_num * in_num * filter_s * filter_s
-        weight_reorg_offset += out_num_hw * in_num_hw * filter_s * filter_s
-
-        for bias_idx in range(out_num):
-          bias_layer_raw.append(bias[bias_offset + bias_idx])
-
-        for o1 in range(int(ceil(float(out_num) / out_num_t))):
-          for o2 in range(out_num_t):
-            o = o1 * out_num_t + o2
-            raw_idx = o
-            if (o < out_num):
-              bias_layer_reorg.append(bias_layer_raw[raw_idx])
-            else:
-              bias_layer_reorg.append(0.0)
-
-#        print(out_num, out_num_hw, len(bias_layer_reorg))
-
-        for bias_idx in range(int(out_num_hw)):
-          bias_reorg.append(bias_layer_reorg[bias_idx])
-
-        bias_offset += out_num
-        bias_reorg_offset += out_num_hw
-
-        print(layer_name, weight_reorg_offset, bias_reorg_offset)
-
-      vgg_layer_cnt = vgg_layer_cnt + 1
-      if vgg_layer_cnt == VGG_LAYERS:
-        current_model = "STAGE1"
-    elif current_model == 'STAGE1':
-      pool_en = 0
-      if len(content) > 1 and content[4] == '2':
-        pool_en = 1
-      layer_name = content[0]
-      layer_type = content[1]
-
-      in_num = out_num
-      in_h = out_h
-      in_w = out_w
-      out_num = int(content[2])
-      filter_s = int(content[3])
-      stride = int(content[4])
-      in_num_t = int(content[7])
-      out_num_t = int(content[8])
-
-      if stage1_layer_cnt == 0:
-        in_num = Conv2d_3_pool_out_num + Conv2d_7_out_num + Conv2d_11_out_num
-        in_h = Conv2d_3_pool_out_h
-        in_w = Conv2d_3_pool_out_w
-
-      if pool_en == 1:
-        out_h = (in_h + 1) / 2
-        out_w = (in_w + 1) / 2
-      else:
-        out_h = in_h
-        out_w = in_w
-
-      cur_filter_s = filter_s
-      nxt_filter_s = 0
-      if layer_name == "MConv_Stage1_L1_5" or layer_name == "MConv_Stage1_L2_5":
-        nxt_filter_s = filter_list[VGG_LAYERS + STAGE1_LAYERS * 2]
-      else:
-        nxt_filter_s = filter_list[VGG_LAYERS + stage1_layer_cnt + stage1_channel_cnt * STAGE1_LAYERS + 1]
-
-      in_num_hw = ceil(float(in_num) / in_num_t) * in_num_t
-      out_num_hw = ceil(float(out_num) / out_num_t) * out_num_t
-      in_h_hw = ceil(float(in_h) / IN_H_T) * IN_H_T + (cur_filter_s - 1)
-      in_w_hw = ceil(float(in_w) / IN_W_T) * IN_W_T + (cur_filter_s - 1)
-      out_h_hw = ceil(float(out_h) / OUT_H_T) * OUT_H_T + (nxt_filter_s - 1)
-      out_w_hw = ceil(float(out_w) / OUT_W_T) * OUT_W_T + (nxt_filter_s - 1)
-
-      if layer_name == 'MConv_Stage1_L1_1' or layer_name == 'MConv_Stage1_L2_1':
-        in_num_hw = Conv2d_3_pool_out_num_hw + Conv2d_7_out_num_hw + Conv2d_11_out_num_hw
-
-      if layer_name == 'MConv_Stage1_L1_5':
-        MConv_Stage1_L1_5_out_num = out_num
-        MConv_Stage1_L1_5_out_num_hw = out_num_hw
-        MConv_Stage1_L1_5_out_h = out_h
-        MConv_Stage1_L1_5_out_w = out_w
-
-      if layer_name == "MConv_Stage1_L2_5":
-        MConv_Stage1_L2_5_out_num = out_num
-        MConv_Stage1_L2_5_out_num_hw = out_num_hw
-        MConv_Stage1_L2_5_out_h = out_h
-        MConv_Stage1_L2_5_out_w = out_w
-
-      weights_layer_raw = []
-      weights_layer_reorg = []
-      bias_layer_raw = []
-      bias_layer_reorg = []
-
-      if layer_type == "separable_conv":
-#        if layer_name == "MConv_Stage1_L1_1" or layer_name == "MConv_Stage1_L2_1":
-#          for weight_idx in range(Conv2d_7_out_num * filter_s * filter_s):
-#            weights_layer_raw.append(weights[weight_offset + Conv2d_3_pool_out_num * filter_s * filter_s + weight_idx])
-#          for weight_idx in range(Conv2d_11_out_num * filter_s * filter_s):
-#            weights_layer_raw.append(weights[weight_offset + (Conv2d_3_pool_out_num + Conv2d_7_out_num) * filter_s * filter_s + weight_idx])
-#          for weight_idx in range(Conv2d_3_pool_out_num * filter_s * filter_s):
-#            weights_layer_raw.append(weights[weight_offset + weight_idx])
-#        else:
-#          for weight_idx in range(in_num * filter_s * filter_s):
-#            weights_layer_raw.append(weights[weight_offset + weight_idx])
+  for layer_id, it in network_ir.net_executions(net):
+    layer = net[layer_id]
+    if layer['type'] == "max_pool":
+      continue
+
+    in_num = int(layer['in_num'])
+    out_num = int(layer['out_num'])
+    filter_s = int(layer['filter_s'])
+    in_map = input_channel_map(net, layer_id, it)
+    out_num_hw = int(layer['out_num_hw'])
+    if layer['type'] == "separable_conv":
+      weight_size = in_num * filter_s * filter_s + in_num * out_num
+      weight_reorg_size = len(in_map) * filter_s * filter_s + out_num_hw * len(in_map)
+    else:
+      weight_size = in_num * out_num * filter_s * filter_s
+      weight_reorg_size = out_num_hw * len(in_map) * filter_s * filter_s
+
+    entry = {}
+    entry['LAYER_ID'] = int(layer_id)
+    entry['IN_MAP'] = in_map
+    entry['WEIGHT_OFFSET'] = weight_offset
+    entry['WEIGHT_SIZE'] = weight_size
+    entry['BIAS_OFFSET'] = bias_offset
+    entry['BIAS_SIZE'] = out_num
+    entry['WEIGHT_REORG_OFFSET'] = weight_reorg_offset
+    entry['WEIGHT_REORG_SIZE'] = weight_reorg_size
+    entry['BIAS_REORG_OFFSET'] = bias_reorg_offset
+    entry['BIAS_REORG_SIZE'] = out_num_hw
+    plan.append(entry)
+
+    weight_offset += weight_size
+    bias_offset += out_num
+    weight_reorg_offset += weight_reorg_size
+    bias_reorg_offset += out_num_hw
+  return plan
 
-        for weight_idx in range(in_num * filter_s * filter_s):
-          weights_layer_raw.append(weights[weight_offset + weight_idx])
-
-        if layer_name == "MConv_Stage1_L1_1" or layer_name == "MConv_Stage1_L2_1":
-          for i1 in range(int(ceil(in_num_hw / in_num_t))):
-            for p in range(filter_s):
-              for q in range(filter_s):
-                for i2 in range(in_num_t):
-                  i = i1 * in_num_t + i2
-                  if (i < Conv2d_3_pool_out_num):
-                    raw_idx = int(p * filter_s * in_num + q * in_num + i)
-                    weights_layer_reorg.append(weights_layer_raw[raw_idx])
-                  elif (i >= Conv2d_3_pool_out_num_hw) and (i < Conv2d_3_pool_out_num_hw + Conv2d_7_out_num):
-                    raw_idx = int(p * filter_s * in_num + q * in_num + (i - Conv2d_3_pool_out_num_hw + Conv2d_3_pool_out_num))
-                    weights_layer_reorg.append(weights_layer_raw[raw_idx])
-                  elif (i >= Conv2d_3_pool_out_num_hw + Conv2d_7_out_num_hw) and (i < Conv2d_3_pool_out_num_hw + Conv2d_7_out_num_hw + Conv2d_11_out_num):
-                    raw_idx = int(p * filter_s * in_num + q * in_num + (i - Conv2d_3_pool_out_num_hw - Conv2d_7_out_num_hw + Conv2d_3_pool_out_num + Conv2d_7_out_num))
-                    weights_layer_reorg.append(weights_layer_raw[raw_idx])
-                  else:
-                    weights_layer_reorg.append(0.0)
-
-#          for i1 in range(int(ceil(Conv2d_3_pool_out_num / IN_NUM_T))):
-#            for p in range(filter_s):
-#              for q in range(filter_s):
-#                for i2 in range(IN_NUM_T):
-#                  i = i1 * IN_NUM_T + i2
-##                  raw_idx = i * filter_s * filter_s + p * filter_s + q
-#                  raw_idx = p * filter_s * in_num + q * in_num + i
-#                  if (i < Conv2d_3_pool_out_num):
-#                    weights_layer_reorg.append(weights_layer_raw[raw_idx])
-#                  else:
-#                    weights_layer_reorg.append('0')
-#          for i1 in range(int(ceil(Conv2d_7_out_num / IN_NUM_T))):
-#            for p in range(filter_s):
-#              for q in range(filter_s):
-#                for i2 in range(IN_NUM_T):
-#                  i = i1 * IN_NUM_T + i2
-##                  raw_idx = (i + Conv2d_3_pool_out_num) * filter_s * filter_s + p * filter_s + q
-#                  raw_idx = p * filter_s * in_num + q * in_num + (i + Conv2d_3_pool_out_num)
-#                  if (i < Conv2d_7_out_num):
-#                    weights_layer_reorg.append(weights_layer_raw[raw_idx])
-#                  else:
-#                    weights_layer_reorg.append('0')
-#          for i1 in range(int(ceil(Conv2d_11_out_num / IN_NUM_T))):
-#            for p in range(filter_s):
-#              for q in range(filter_s):
-#                for i2 in range(IN_NUM_T):
-#                  i = i1 * IN_NUM_T + i2
-##                  raw_idx = (i + Conv2d_3_pool_out_num + Conv2d_7_out_num) * filter_s * filter_s + p * filter_s + q
-#                  raw_idx = p * filter_s * in_num + q * in_num + (i + Conv2d_3_pool_out_num + Conv2d_7_out_num)
-#                  if (i < Conv2d_11_out_num):
-#                    weights_layer_reorg.append(weights_layer_raw[raw_idx])
-#                  else:
-#                    weights_layer_reorg.append('0')
-        else:
-          for i1 in range(int(ceil(in_num / in_num_t))):
-            for p in range(filter_s):
-              for q in range(filter_s):
-                for i2 in range(in_num_t):
-                  i = i1 * in_num_t + i2
-#                  raw_idx = i * filter_s * filter_s + p * filter_s + q
-                  raw_idx = p * filter_s * in_num + q * in_num + i
-                  if (i < in_num):
-                    weights_layer_reorg.append(weights_layer_raw[raw_idx])
-                  else:
-                    weights_layer_reorg.append(0.0)
-
-        for weight_idx in range(int(in_num_hw * filter_s * filter_s)):
-          weights_reorg.append(weights_layer_reorg[weight_idx])
-
-        weight_offset += in_num * filter_s * filter_s
-        weight_reorg_offset += in_num_hw * filter_s * filter_s
-
-        weights_layer_raw = []
-        weights_layer_reorg = []
-
-#        if layer_name == "MConv_Stage1_L1_1" or layer_name == "MConv_Stage1_L2_1":
-#          for o in range(out_num):
-#            for i in range(Conv2d_3_pool_out_num * 1 * 1, (Conv2d_3_pool_out_num + Conv2d_7_out_num) * 1 * 1):
-#              weights_layer_raw.append(weights[weight_offset + i + o * in_num * 1 * 1])
-#            for i in range((Conv2d_3_pool_out_num + Conv2d_7_out_num) * 1 * 1, (Conv2d_3_pool_out_num + Conv2d_7_out_num + Conv2d_11_out_num) * 1 * 1):
-#              weights_layer_raw.append(weights[weight_offset + i + o * in_num * 1 * 1])
-#            for i in range(Conv2d_3_pool_out_num * 1 * 1):
-#              weights_layer_raw.append(weights[weight_offset + i + o * in_num * 1 * 1])
-#        else:
-#          for weight_idx in range(in_num * out_num * 1 * 1):
-#            weights_layer_raw.append(weights[weight_offset + weight_idx])
-        for weight_idx in range(in_num * out_num * 1 * 1):
-          weights_layer_raw.append(weights[weight_offset + weight_idx])
-
-        if layer_name == "MConv_Stage1_L1_1" or layer_name == "MConv_Stage1_L2_1":
-          for o1 in range(int(ceil(float(out_num_hw) / out_num_t))):
-            for i1 in range(int(ceil(in_num_hw / in_num_t))):
-              for o2 in range(out_num_t):
-                for p in range(1):
-                  for q in range(1):
-                    for i2 in range(in_num_t):
-                      o = o1 * out_num_t + o2
-                      i = i1 * in_num_t + i2
-                      if (i < Conv2d_3_pool_out_num) and (o < out_num):
-                        raw_idx = int(p * 1 * in_num * out_num + q * in_num * out_num + i * out_num + o)
-                        weights_layer_reorg.append(weights_layer_raw[raw_idx])
-                      elif (i >= Conv2d_3_pool_out_num_hw) and (i < Conv2d_3_pool_out_num_hw + Conv2d_7_out_num) and (o < out_num):
-                        raw_idx = int(p * 1 * in_num * out_num + q * in_num * out_num + (i - Conv2d_3_pool_out_num_hw + Conv2d_3_pool_out_num) * out_num + o)
-                        weights_layer_reorg.append(weights_layer_raw[raw_idx])
-                      elif (i >= Conv2d_3_pool_out_num_hw + Conv2d_7_out_num_hw) and (i < Conv2d_3_pool_out_num_hw + Conv2d_7_out_num_hw + Conv2d_11_out_num) and (o < out_num):
-                        raw_idx = int(p * 1 * in_num * out_num + q * in_num * out_num + (i - Conv2d_3_pool_out_num_hw - Conv2d_7_out_num_hw + Conv2d_3_pool_out_num + Conv2d_7_out_num) * out_num + o)
-                        weights_layer_reorg.append(weights_layer_raw[raw_idx])
-                      else:
-                        weights_layer_reorg.append(0.0)
-
-#          for o1 in range(int(ceil(float(out_num) / OUT_NUM_T))):
-#            for o2 in range(OUT_NUM_T):
-#              for i1 in range(int(ceil(float(Conv2d_3_pool_out_num) / IN_NUM_T))):
-#                for p in range(1):
-#                  for q in range(1):
-#                    for i2 in range(IN_NUM_T):
-#                      o = o1 * OUT_NUM_T + o2
-#                      i = i1 * IN_NUM_T + i2
-##                      raw_idx = o * in_num * 1 * 1 + i * 1 * 1 + p * 1 + q
-#                      raw_idx = p * 1 * in_num * out_num + q * in_num * out_num + i * out_num + o
-#                      if (o < out_num) and (i < Conv2d_3_pool_out_num):
-#                        weights_layer_reorg.append(weights_layer_raw[raw_idx])
-#                      else:
-#                        weights_layer_reorg.append('0')
-#          for o1 in range(int(ceil(float(out_num) / OUT_NUM_T))):
-#            for o2 in range(OUT_NUM_T):
-#              for i1 in range(int(ceil(float(Conv2d_7_out_num) / IN_NUM_T))):
-#                for p in range(1):
-#                  for q in range(1):
-#                    for i2 in range(IN_NUM_T):
-#                      o = o1 * OUT_NUM_T + o2
-#                      i = i1 * IN_NUM_T + i2
-##                      raw_idx = o * in_num * 1 * 1 + (i + Conv2d_3_pool_out_num) * 1 * 1 + p * 1 + q
-#                      raw_idx = p * 1 * in_num * out_num + q * in_num * out_num + (i + Conv2d_3_pool_out_num) * out_num + o
-#                      if (o < out_num) and (i < Conv2d_7_out_num):
-#                        weights_layer_reorg.append(weights_layer_raw[raw_idx])
-#                      else:
-#                        weights_layer_reorg.append('0')
-#          for o1 in range(int(ceil(float(out_num) / OUT_NUM_T))):
-#            for o2 in range(OUT_NUM_T):
-#              for i1 in range(int(ceil(float(Conv2d_11_out_num) / IN_NUM_T))):
-#                for p in range(1):
-#                  for q in range(1):
-#                    for i2 in range(IN_NUM_T):
-#                      o = o1 * OUT_NUM_T + o2
-#                      i = i1 * IN_NUM_T + i2
-##                      raw_idx = o * in_num * 1 * 1 + (i + Conv2d_3_pool_out_num + Conv2d_7_out_num) * 1 * 1 + p * 1 + q
-#                      raw_idx = p * 1 * in_num * out_num + q * in_num * out_num + (i + Conv2d_3_pool_out_num + Conv2d_7_out_num) * out_num + o
-#                      if (o < out_num) and (i < Conv2d_11_out_num):
-#                        weights_layer_reorg.append(weights_layer_raw[raw_idx])
-#                      else:
-#                        weights_layer_reorg.append('0')
-
-        else:
-          for o1 in range(int(ceil(float(out_num) / out_num_t))):
-            for i1 in range(int(ceil(float(in_num) / in_num_t))):
-              for o2 in range(out_num_t):
-                for p in range(1):
-                  for q in range(1):
-                    for i2 in range(in_num_t):
-                      o = o1 * out_num_t + o2
-                      i = i1 * in_num_t + i2
-#                      raw_idx = o * in_num * 1 * 1 + i * 1 * 1 + p * 1 + q
-                      raw_idx = p * 1 * in_num * out_num + q * in_num * out_num + i * out_num + o
-                      if (o < out_num) and (i < in_num):
-                        weights_layer_reorg.append(weights_layer_raw[raw_idx])
-                      else:
-                        weights_layer_reorg.append(0.0)
-
-        for weight_idx in range(int(out_num_hw * in_num_hw * 1 * 1)):
-          weights_reorg.append(weights_layer_reorg[weight_idx])
-
-        weight_offset += out_num * in_num * 1 * 1
-        weight_reorg_offset += out_num_hw * in_num_hw * 1 * 1
-
-        for bias_idx in range(out_num):
-          bias_layer_raw.append(bias[bias_offset + bias_idx])
-
-        for o1 in range(int(ceil(float(out_num) / out_num_t))):
-          for o2 in range(out_num_t):
-            o = o1 * out_num_t + o2
-            raw_idx = o
-            if (o < out_num):
-              bias_layer_reorg.append(bias_layer_raw[raw_idx])
-            else:
-              bias_layer_reorg.append(0.0)
-
-        for bias_idx in range(int(out_num_hw)):
-          bias_reorg.append(bias_layer_reorg[bias_idx])
-
-        bias_offset += out_num
-        bias_reorg_offset += out_num_hw
-
-#        print(layer_name, weight_reorg_offset, bias_reorg_offset)
-
-      elif layer_type == "convb":
-        for weight_idx in range(out_num * in_num * filter_s * filter_s):
-          weights_layer_raw.append(weights[weight_offset + weight_idx])
-
-        for o1 in range(int(ceil(out_num / out_num_t))):
-          for i1 in range(int(ceil(in_num / in_num_t))):
-            for o2 in range(out_num_t):
-              for p in range(filter_s):
-                for q in range(filter_s):
-                  for i2 in range(in_num_t):
-                    o = o1 * out_num_t + o2
-                    i = i1 * in_num_t + i2
-#                    raw_idx = o * in_num * filter_s * filter_s + i * filter_s * filter_s + p * filter_s + q
-                    raw_idx = p * filter_s * in_num * out_num + q * in_num * out_num + i * out_num + o
-                    if (o < out_num) and (i < in_num):
-                      weights_layer_reorg.append(weights_layer_raw[raw_idx])
-                    else:
-                      weights_layer_reorg.append(0.0)
+'''
+fractional bits of the fixed point format of the given width that covers the largest magnitude of x
+'''
+def quant_frac_bits(x, bits):
+  max_abs = float(np.max(np.abs(x))) if len(x) > 0 else 0.0
+  if max_abs == 0.0:
+    return bits - 1
+  return bits - 1 - (int(np.floor(np.log2(max_abs))) + 1)
 
-        for weight_idx in range(out_num_hw * in_num_hw * filter_s * filter_s):
-          weights_reorg.append(weights_layer_reorg[weight_idx])
+'''
+round x to the fixed point format, saturate to the range of the width
+'''
+def quantize(x, bits, frac_bits):
+  q_max = (1 << (bits - 1)) - 1
+  q = np.rint(np.asarray(x, dtype = np.float64) * 2.0 ** frac_bits)
+  return np.clip(q, -q_max - 1, q_max).astype(QUANT_DTYPE[bits])
 
-        weight_offset += out_num * in_num * filter_s * filter_s
-        weight_reorg_offset += out_num_hw * in_num_hw * filter_s * filter_s
+'''
+quantization error of x against its fixed point values q: max absolute error, RMS error and SQNR in dB
+'''
+def quant_error(x, q, frac_bits):
+  x = np.asarray(x, dtype = np.float64)
+  err = q.astype(np.float64) * 2.0 ** -frac_bits - x
+  signal = float(np.sum(x * x))
+  noise = float(np.sum(err * err))
+  report = {}
+  report['MAX_ERR'] = float(np.max(np.abs(err))) if len(x) > 0 else 0.0
+  report['RMS_ERR'] = float(np.sqrt(noise / len(x))) if len(x) > 0 else 0.0
+  report['SQNR'] = float(10 * np.log10(signal / noise)) if noise > 0 and signal > 0 else float('inf')
+  report['SIGNAL'] = signal
+  report['NOISE'] = noise
+  return report
 
-        for bias_idx in range(out_num):
-          bias_layer_raw.append(bias[bias_offset + bias_idx])
+'''
+masks of the elements of the reorganized weights and bias of one layer that hold model data, the others are padding
+the layer is reorganized with the element indices, counted from 1, in place of the data
+'''
+def reorg_mask(net, entry):
+  weights, bias = reorg_layer(net, entry, np.arange(1, entry['WEIGHT_SIZE'] + 1), np.arange(1, entry['BIAS_SIZE'] + 1))
+  return weights > 0, bias > 0
 
-        for o1 in range(int(ceil(out_num / out_num_t))):
-          for o2 in range(out_num_t):
-            o = o1 * out_num_t + o2
-            raw_idx = o
-            if (o < out_num):
-              bias_layer_reorg.append(bias_layer_raw[raw_idx])
-            else:
-              bias_layer_reorg.append(0.0)
+'''
+quantize the reorganized weights and bias of one layer
+return the fixed point data and the record of the layer in quant.json
+the errors are computed over the model data, the zeros of the padded channels would lower the RMS errors
+'''
+def quant_layer(net, entry, weights_reorg, bias_reorg, bits):
+  w_frac_bits = quant_frac_bits(weights_reorg, bits)
+  b_frac_bits = quant_frac_bits(bias_reorg, bits)
+  weights_q = quantize(weights_reorg, bits, w_frac_bits)
+  bias_q = quantize(bias_reorg, bits, b_frac_bits)
+  w_mask, b_mask = reorg_mask(net, entry)
+
+  record = {}
+  record['LAYER_NAME'] = str(net[entry['LAYER_ID']]['name'])
+  record['WEIGHT_REORG_OFFSET'] = entry['WEIGHT_REORG_OFFSET']
+  record['WEIGHT_REORG_SIZE'] = entry['WEIGHT_REORG_SIZE']
+  record['WEIGHT_FRAC_BITS'] = w_frac_bits
+  record['WEIGHT_SCALE'] = 2.0 ** -w_frac_bits
+  record['WEIGHT_ERR'] = quant_error(weights_reorg[w_mask], weights_q[w_mask], w_frac_bits)
+  record['BIAS_REORG_OFFSET'] = entry['BIAS_REORG_OFFSET']
+  record['BIAS_REORG_SIZE'] = entry['BIAS_REORG_SIZE']
+  record['BIAS_FRAC_BITS'] = b_frac_bits
+  record['BIAS_SCALE'] = 2.0 ** -b_frac_bits
+  record['BIAS_ERR'] = quant_error(bias_reorg[b_mask], bias_q[b_mask], b_frac_bits)
+  return weights_q, bias_q, record
 
-        for bias_idx in range(out_num_hw):
-          bias_reorg.append(bias_layer_reorg[bias_idx])
+'''
+print the quantization error report, the totals are computed over all the layers
+'''
+def quant_report(records, bits):
+  print('Quantization to %d-bit fixed point' % (bits))
+  print('%-24s %5s %10s %10s %8s %5s %10s %8s' % ('layer', 'w_fb', 'w_max_err', 'w_rms_err', 'w_sqnr', 'b_fb', 'b_max_err', 'b_sqnr'))
+  for record in records:
+    w_err = record['WEIGHT_ERR']
+    b_err = record['BIAS_ERR']
+    print('%-24s %5d %10.3e %10.3e %8.2f %5d %10.3e %8.2f' % (record['LAYER_NAME'], record['WEIGHT_FRAC_BITS'], w_err['MAX_ERR'], \
+      w_err['RMS_ERR'], w_err['SQNR'], record['BIAS_FRAC_BITS'], b_err['MAX_ERR'], b_err['SQNR']))
+  total = {}
+  for key in ['WEIGHT_ERR', 'BIAS_ERR']:
+    signal = sum([record[key]['SIGNAL'] for record in records])
+    noise = sum([record[key]['NOISE'] for record in records])
+    total[key] = {}
+    total[key]['MAX_ERR'] = max([record[key]['MAX_ERR'] for record in records])
+    total[key]['SQNR'] = float(10 * np.log10(signal / noise)) if noise > 0 and signal > 0 else float('inf')
+  print('%-24s %5s %10.3e %10s %8.2f %5s %10.3e %8.2f' % ('total', '', total['WEIGHT_ERR']['MAX_ERR'], '', total['WEIGHT_ERR']['SQNR'], \
+    '', total['BIAS_ERR']['MAX_ERR'], total['BIAS_ERR']['SQNR']))
+  return total
 
-        bias_offset += out_num
-        bias_reorg_offset += out_num_hw
+'''
+reorganize the raw weights and bias of one layer of the plan
+'''
+def reorg_layer(net, entry, weights, bias):
+  layer = net[entry['LAYER_ID']]
+  in_num = int(layer['in_num'])
+  out_num = int(layer['out_num'])
+  filter_s = int(layer['filter_s'])
+  in_num_t = int(layer['in_num_t'])
+  out_num_t = int(layer['out_num_t'])
+  in_map = entry['IN_MAP']
+
+  if layer['type'] == "separable_conv":
+    depth_size = in_num * filter_s * filter_s
+    w_depth = reorg_depth_conv(weights[:depth_size].reshape(filter_s, filter_s, in_num), in_map, filter_s, in_num_t)
+    w_point = reorg_conv(weights[depth_size:].reshape(1, 1, in_num, out_num), in_map, 1, in_num_t, out_num_t)
+    weights_reorg = np.concatenate([w_depth, w_point])
+  else:
+    weights_reorg = reorg_conv(weights.reshape(filter_s, filter_s, in_num, out_num), in_map, filter_s, in_num_t, out_num_t)
+  return weights_reorg, reorg_bias(bias, out_num_t)
 
-        print(layer_name, weight_reorg_offset, bias_reorg_offset)
+'''
+reorganize one layer of the plan between memory-mapped files: only the ranges of the layer in the input files are mapped,
+the reorganized blocks are written at their offsets in the output files, which are already sized
+return the record of the layer in quant.json when quantizing
+'''
+def reorg_layer_mmap(net, entry, f_weight, f_bias, quant_bits = 0):
+  layer_weights = np.memmap(f_weight, dtype = np.float32, mode = 'r', offset = entry['WEIGHT_OFFSET'] * 4, shape = (entry['WEIGHT_SIZE'],))
+  layer_bias = np.memmap(f_bias, dtype = np.float32, mode = 'r', offset = entry['BIAS_OFFSET'] * 4, shape = (entry['BIAS_SIZE'],))
+  layer_weights_reorg, layer_bias_reorg = reorg_layer(net, entry, layer_weights, layer_bias)
+  record = None
+  if quant_bits > 0:
+    layer_weights_reorg, layer_bias_reorg, record = quant_layer(net, entry, layer_weights_reorg, layer_bias_reorg, quant_bits)
+  data_t = np.dtype(QUANT_DTYPE[quant_bits])
+  out = np.memmap('weight_reorg.bin', dtype = data_t, mode = 'r+', offset = entry['WEIGHT_REORG_OFFSET'] * data_t.itemsize, shape = (entry['WEIGHT_REORG_SIZE'],))
+  out[:] = layer_weights_reorg
+  out.flush()
+  out = np.memmap('bias_reorg.bin', dtype = data_t, mode = 'r+', offset = entry['BIAS_REORG_OFFSET'] * data_t.itemsize, shape = (entry['BIAS_REORG_SIZE'],))
+  out[:] = layer_bias_reorg
+  out.flush()
+  return record
 
-      stage1_layer_cnt = stage1_layer_cnt + 1
-      if stage1_layer_cnt == STAGE1_LAYERS:
-        stage1_layer_cnt = 0
-        stage1_channel_cnt = stage1_channel_cnt + 1
-        if stage1_channel_cnt == 2:
-          stage1_channel_cnt = 0
-          stage1_iter_cnt = stage1_iter_cnt + 1
-          if stage1_iter_cnt == STAGE1_ITER:
-            stage1_iter_cnt = 0
-            stage2_line_id = line_id + 1
-            current_model = "STAGE2"
-    elif current_model == 'STAGE2':
-      pool_en = 0
-      if len(content) > 1 and content[4] == '2':
-        pool_en = 1
-      layer_name = content[0]
-      layer_type = content[1]
+'''
+the settings shared by all the layers reorganized by the current process: (net, f_weight, f_bias, quant_bits)
+'''
+process_reorg = None
 
-      in_num = out_num
-      in_h = out_h
-      in_w = out_w
-      out_num = int(content[2])
-      filter_s = int(content[3])
-      stride = int(content[4])
-      in_num_t = int(content[7])
-      out_num_t = int(content[8])
+def pool_init(net, f_weight, f_bias, quant_bits):
+  global process_reorg
+  process_reorg = (net, f_weight, f_bias, quant_bits)
 
-      if stage2_layer_cnt == 0:
-        in_num = MConv_Stage1_L1_5_out_num + MConv_Stage1_L2_5_out_num + Conv2d_3_pool_out_num + Conv2d_7_out_num + Conv2d_11_out_num
-        in_h = Conv2d_3_pool_out_h
-        in_w = Conv2d_3_pool_out_w
+def reorg_layer_task(entry):
+  net, f_weight, f_bias, quant_bits = process_reorg
+  return reorg_layer_mmap(net, entry, f_weight, f_bias, quant_bits)
 
-      if pool_en == 1:
-        out_h = (in_h + 1) / 2
-        out_w = (in_w + 1) / 2
-      else:
-        out_h = in_h
-        out_w = in_w
+def run(f_model, f_model_config, f_input_config, f_weight, f_bias, stream = False, parallel_en = False, quant_bits = 0):
+  model_config = network_ir.model_config_load(f_model, f_model_config)
+  with open(f_input_config, "r") as f:
+    input_config = json.loads(f.read())
 
-      cur_filter_s = filter_s
-      nxt_filter_s = 0
-      if layer_name == "MConv_Stage2_L1_5" or layer_name == "MConv_Stage2_L2_5":
-        nxt_filter_s = filter_list[VGG_LAYERS + STAGE1_LAYERS * 2]
+  # the layer attributes and the feature map shapes come from the network IR
+  net = network_ir.net_build(f_model, model_config, input_config)
+  plan = reorg_plan(net, model_config)
+  weight_reorg_size = plan[-1]['WEIGHT_REORG_OFFSET'] + plan[-1]['WEIGHT_REORG_SIZE']
+  bias_reorg_size = plan[-1]['BIAS_REORG_OFFSET'] + plan[-1]['BIAS_REORG_SIZE']
+  data_t = np.dtype(QUANT_DTYPE[quant_bits])
+
+  # the layers are independent once their offsets are known, in parallel each worker writes its layers to the shared output files
+  if parallel_en:
+    stream = True
+  if stream:
+    # each layer maps its own ranges of the input and output files, the memory use is bounded by one layer
+    with open('weight_reorg.bin', 'wb') as f:
+      f.truncate(weight_reorg_size * data_t.itemsize)
+    with open('bias_reorg.bin', 'wb') as f:
+      f.truncate(bias_reorg_size * data_t.itemsize)
+  else:
+    # load weights, bias as read-only views of the files
+    with open(f_weight, 'rb') as f:
+      weights = np.frombuffer(f.read(), dtype = np.float32)
+    with open(f_bias, 'rb') as f:
+      bias = np.frombuffer(f.read(), dtype = np.float32)
+    weights_reorg = np.zeros(weight_reorg_size, dtype = data_t)
+    bias_reorg = np.zeros(bias_reorg_size, dtype = data_t)
+
+  if parallel_en:
+    num_processes = max(1, int(multiprocessing.cpu_count() * 0.75))
+    print('Parallelizing using %d processes...' % (num_processes))
+    pool = multiprocessing.Pool(processes = num_processes, initializer = pool_init, initargs = (net, f_weight, f_bias, quant_bits))
+    # the largest layers are dispatched first to balance the workers
+    order = sorted(range(len(plan)), key = lambda idx: -plan[idx]['WEIGHT_REORG_SIZE'])
+    records = pool.map(reorg_layer_task, [plan[idx] for idx in order], chunksize = 1)
+    pool.close()
+    pool.join()
+    quant_records = [None] * len(plan)
+    for idx, record in zip(order, records):
+      quant_records[idx] = record
+  else:
+    quant_records = []
+    for entry in plan:
+      if stream:
+        quant_records.append(reorg_layer_mmap(net, entry, f_weight, f_bias, quant_bits))
       else:
-        nxt_filter_s = filter_list[VGG_LAYERS + STAGE1_LAYERS * 2 + stage2_layer_cnt + stage2_channel_cnt * STAGE2_LAYERS + 1]
-
-      in_num_hw = ceil(float(in_num) / in_num_t) * in_num_t
-      out_num_hw = ceil(float(out_num) / out_num_t) * out_num_t
-      in_h_hw = ceil(float(in_h) / IN_H_T) * IN_H_T + (cur_filter_s - 1)
-      in_w_hw = ceil(float(in_w) / IN_W_T) * IN_W_T + (cur_filter_s - 1)
-      out_h_hw = ceil(float(out_h) / OUT_H_T) * OUT_H_T + (nxt_filter_s - 1)
-      out_w_hw = ceil(float(out_w) / OUT_W_T) * OUT_W_T + (nxt_filter_s - 1)
-
-      if layer_name == "MConv_Stage2_L1_1" or layer_name == "MConv_Stage2_L2_1":
-        in_num_hw = MConv_Stage1_L1_5_out_num_hw + MConv_Stage1_L2_5_out_num_hw + Conv2d_3_pool_out_num_hw + Conv2d_7_out_num_hw + Conv2d_11_out_num_hw
-
-      if layer_name == 'MConv_Stage2_L1_5':
-        MConv_Stage2_L1_5_out_num = out_num
-        MConv_Stage2_L1_5_out_num_hw = out_num_hw
-        MConv_Stage2_L1_5_out_h = out_h
-        MConv_Stage2_L1_5_out_w = out_w
-
-      if layer_name == "MConv_Stage2_L2_5":
-        Mconv_Stage2_L2_5_out_num = out_num
-        Mconv_Stage2_L2_5_out_num_hw = out_num_hw
-        Mconv_Stage2_L2_5_out_h = out_h
-        Mconv_Stage2_L2_5_out_w = out_w
-
-      weights_layer_raw = []
-      weights_layer_reorg = []
-      bias_layer_raw = []
-      bias_layer_reorg = []
-
-      if layer_type == "separable_conv":
-        for weight_idx in range(in_num * filter_s * filter_s):
-          weights_layer_raw.append(weights[weight_offset + weight_idx])
-
-        if layer_name == "MConv_Stage2_L1_1" or layer_name == "MConv_Stage2_L2_1":
-          if stage2_iter_cnt % 2 == 0: # [2,4,6]
-            for i1 in range(int(ceil(in_num_hw / in_num_t))):
-              for p in range(filter_s):
-                for q in range(filter_s):
-                  for i2 in range(in_num_t):
-                    i = i1 * in_num_t + i2
-# MConv_Stage1_L1_5
-                    i_lower1 = 0
-                    i_upper1 = i_lower1 + MConv_Stage1_L1_5_out_num
-                    i_offset1 = 0
-# MConv_Stage1_L2_5
-                    i_lower2 = i_lower1 + MConv_Stage1_L1_5_out_num_hw
-                    i_upper2 = i_lower2 + MConv_Stage1_L2_5_out_num
-                    i_offset2 = i_offset1 + MConv_Stage1_L1_5_out_num_hw - MConv_Stage1_L1_5_out_num
-# Conv2d_3_pool
-                    i_lower3 = i_lower2 + MConv_Stage1_L2_5_out_num_hw
-                    i_upper3 = i_lower3 + Conv2d_3_pool_out_num
-                    i_offset3 = i_offset2 + (MConv_Stage1_L2_5_out_num_hw - MConv_Stage1_L2_5_out_num)
-# Conv2d_7
-                    i_lower4 = i_lower3 + Conv2d_3_pool_out_num_hw
-                    i_upper4 = i_lower4 + Conv2d_7_out_num
-                    i_offset4 = i_offset3 + (Conv2d_3_pool_out_num_hw - Conv2d_3_pool_out_num)
-# Conv2d_11
-                    i_lower5 = i_lower4 + Conv2d_7_out_num_hw
-                    i_upper5 = i_lower5 + Conv2d_11_out_num
-                    i_offset5 = i_offset4 + (Conv2d_7_out_num_hw - Conv2d_7_out_num)
-
-                    if (i >= i_lower1) and (i < i_upper1):
-                      raw_idx = int(p * filter_s * in_num + q * in_num + (i - i_offset1))
-                      weights_layer_reorg.append(weights_layer_raw[raw_idx])
-                    elif (i >= i_lower2) and (i < i_upper2):
-                      raw_idx = int(p * filter_s * in_num + q * in_num + (i - i_offset2))
-                      weights_layer_reorg.append(weights_layer_raw[raw_idx])
-                    elif (i >= i_lower3) and (i < i_upper3):
-                      raw_idx = int(p * filter_s * in_num + q * in_num + (i - i_offset3))
-                      weights_layer_reorg.append(weights_layer_raw[raw_idx])
-                    elif (i >= i_lower4) and (i < i_upper4):
-                      raw_idx = int(p * filter_s * in_num + q * in_num + (i - i_offset4))
-                      weights_layer_reorg.append(weights_layer_raw[raw_idx])
-                    elif (i >= i_lower5) and (i < i_upper5):
-                      raw_idx = int(p * filter_s * in_num + q * in_num + (i - i_offset5))
-                      weights_layer_reorg.append(weights_layer_raw[raw_idx])
-                    else:
-                      weights_layer_reorg.append(0.0)
-
-          elif stage2_iter_cnt % 2 == 1: # [3,5]
-            for i1 in range(int(ceil(in_num_hw / in_num_t))):
-              for p in range(filter_s):
-                for q in range(filter_s):
-                  for i2 in range(in_num_t):
-                    i = i1 * in_num_t + i2
-# Conv2d_3_pool
-                    i_lower1 = 0
-                    i_upper1 = i_lower1 + Conv2d_3_pool_out_num
-                    i_offset1 = 0
-# Conv2d_7
-                    i_lower2 = i_lower1 + Conv2d_3_pool_out_num_hw
-                    i_upper2 = i_lower2 + Conv2d_7_out_num
-                    i_offset2 = Conv2d_3_pool_out_num_hw
-# Conv2d_11
-                    i_lower3 = i_lower2 + Conv2d_7_out_num_hw
-                    i_upper3 = i_lower3 + Conv2d_11_out_num
-                    i_offset3 = i_offset2 + Conv2d_7_out_num_hw
-# MConv_Stage1_L1_5
-                    i_lower4 = i_lower3 + Conv2d_11_out_num_hw
-                    i_upper4 = i_lower4 + MConv_Stage1_L1_5_out_num
-                    i_offset4 = i_offset3 + Conv2d_11_out_num_hw
-# MConv_Stage1_L2_5
-                    i_lower5 = i_lower4 + MConv_Stage1_L1_5_out_num_hw
-                    i_upper5 = i_lower5 + MConv_Stage1_L2_5_out_num
-                    i_offset5 = i_offset4 + MConv_Stage1_L1_5_out_num_hw
-
-                    if (i >= i_lower1) and (i < i_upper1):
-                      raw_idx = int(p * filter_s * in_num + q * in_num + (i - i_offset1 + MConv_Stage1_L1_5_out_num + MConv_Stage1_L2_5_out_num))
-                      weights_layer_reorg.append(weights_layer_raw[raw_idx])
-                    elif (i >= i_lower2) and (i < i_upper2):
-                      raw_idx = int(p * filter_s * in_num + q * in_num + (i - i_offset2 + MConv_Stage1_L1_5_out_num + MConv_Stage1_L2_5_out_num + Conv2d_3_pool_out_num))
-                      weights_layer_reorg.append(weights_layer_raw[raw_idx])
-                    elif (i >= i_lower3) and (i < i_upper3):
-                      raw_idx = int(p * filter_s * in_num + q * in_num + (i - i_offset3 + MConv_Stage1_L1_5_out_num + MConv_Stage1_L2_5_out_num + Conv2d_3_pool_out_num + Conv2d_7_out_num))
-                      weights_layer_reorg.append(weights_layer_raw[raw_idx])
-                    elif (i >= i_lower4) and (i < i_upper4):
-                      raw_idx = int(p * filter_s * in_num + q * in_num + (i - i_offset4))
-                      weights_layer_reorg.append(weights_layer_raw[raw_idx])
-                    elif (i >= i_lower5) and (i < i_upper5):
-                      raw_idx = int(p * filter_s * in_num + q * in_num + (i - i_offset5 + MConv_Stage1_L1_5_out_num))
-                      weights_layer_reorg.append(weights_layer_raw[raw_idx])
-                    else:
-                      weights_layer_reorg.append(0.0)
-
-        else:
-          for i1 in range(int(ceil(float(in_num) / in_num_t))):
-            for p in range(filter_s):
-              for q in range(filter_s):
-                for i2 in range(in_num_t):
-                  i = i1 * in_num_t + i2
-#                  raw_idx = i * filter_s * filter_s + p * filter_s + q
-                  raw_idx = p * filter_s * in_num + q * in_num + i
-                  if (i < in_num):
-                    weights_layer_reorg.append(weights_layer_raw[raw_idx])
-                  else:
-                    weights_layer_reorg.append(0.0)
-
-        for weight_idx in range(int(in_num_hw * filter_s * filter_s)):
-          weights_reorg.append(weights_layer_reorg[weight_idx])
-
-        weight_offset += in_num * filter_s * filter_s
-        weight_reorg_offset += in_num_hw * filter_s * filter_s
-
-        weights_layer_raw = []
-        weights_layer_reorg = []
-
-        for weight_idx in range(in_num * out_num * 1 * 1):
-          weights_layer_raw.append(weights[weight_offset + weight_idx])
-
-        if layer_name == "MConv_Stage2_L1_1" or layer_name == "MConv_Stage2_L2_1":
-          if stage2_iter_cnt % 2 == 0: # [2,4,6]
-            for o1 in range(int(ceil(float(out_num_hw) / out_num_t))):
-              for i1 in range(int(ceil(float(in_num_hw) / in_num_t))):
-                for o2 in range(out_num_t):
-                  for p in range(1):
-                    for q in range(1):
-                      for i2 in range(in_num_t):
-                        o = o1 * out_num_t + o2
-                        i = i1 * in_num_t + i2
-# MConv_Stage1_L1_5
-                        i_lower1 = 0
-                        i_upper1 = i_lower1 + MConv_Stage1_L1_5_out_num
-                        i_offset1 = 0
-# MConv_Stage1_L2_5
-                        i_lower2 = i_lower1 + MConv_Stage1_L1_5_out_num_hw
-                        i_upper2 = i_lower2 + MConv_Stage1_L2_5_out_num
-                        i_offset2 = i_offset1 + MConv_Stage1_L1_5_out_num_hw - MConv_Stage1_L1_5_out_num
-# Conv2d_3_pool
-                        i_lower3 = i_lower2 + MConv_Stage1_L2_5_out_num_hw
-                        i_upper3 = i_lower3 + Conv2d_3_pool_out_num
-                        i_offset3 = i_offset2 + (MConv_Stage1_L2_5_out_num_hw - MConv_Stage1_L2_5_out_num)
-# Conv2d_7
-                        i_lower4 = i_lower3 + Conv2d_3_pool_out_num_hw
-                        i_upper4 = i_lower4 + Conv2d_7_out_num
-                        i_offset4 = i_offset3 + (Conv2d_3_pool_out_num_hw - Conv2d_3_pool_out_num)
-# Conv2d_11
-                        i_lower5 = i_lower4 + Conv2d_7_out_num_hw
-                        i_upper5 = i_lower5 + Conv2d_11_out_num
-                        i_offset5 = i_offset4 + (Conv2d_7_out_num_hw - Conv2d_7_out_num)
-
-                        if (i >= i_lower1) and (i < i_upper1) and (o < out_num):
-                          raw_idx = int(p * 1 * in_num * out_num + q * in_num * out_num + (i - i_offset1) * out_num + o)
-                          weights_layer_reorg.append(weights_layer_raw[raw_idx])
-                        elif (i >= i_lower2) and (i < i_upper2) and (o < out_num):
-                          raw_idx = int(p * 1 * in_num * out_num + q * in_num * out_num + (i - i_offset2) * out_num + o)
-                          weights_layer_reorg.append(weights_layer_raw[raw_idx])
-                        elif (i >= i_lower3) and (i < i_upper3) and (o < out_num):
-                          raw_idx = int(p * 1 * in_num * out_num + q * in_num * out_num + (i - i_offset3) * out_num + o)
-                          weights_layer_reorg.append(weights_layer_raw[raw_idx])
-                        elif (i >= i_lower4) and (i < i_upper4) and (o < out_num):
-                          raw_idx = int(p * 1 * in_num * out_num + q * in_num * out_num + (i - i_offset4) * out_num + o)
-                          weights_layer_reorg.append(weights_layer_raw[raw_idx])
-                        elif (i >= i_lower5) and (i < i_upper5) and (o < out_num):
-                          raw_idx = int(p * 1 * in_num * out_num + q * in_num * out_num + (i - i_offset5) * out_num + o)
-                          weights_layer_reorg.append(weights_layer_raw[raw_idx])
-                        else:
-                          weights_layer_reorg.append(0.0)
-
-          elif stage2_iter_cnt % 2 == 1: # [3,5]
-            for o1 in range(int(ceil(float(out_num_hw) / out_num_t))):
-              for i1 in range(int(ceil(float(in_num_hw) / in_num_t))):
-                for o2 in range(out_num_t):
-                  for p in range(1):
-                    for q in range(1):
-                      for i2 in range(in_num_t):
-                        o = o1 * out_num_t + o2
-                        i = i1 * in_num_t + i2
-# Conv2d_3_pool
-                        i_lower1 = 0
-                        i_upper1 = i_lower1 + Conv2d_3_pool_out_num
-                        i_offset1 = 0
-# Conv2d_7
-                        i_lower2 = i_lower1 + Conv2d_3_pool_out_num_hw
-                        i_upper2 = i_lower2 + Conv2d_7_out_num
-                        i_offset2 = Conv2d_3_pool_out_num_hw
-# Conv2d_11
-                        i_lower3 = i_lower2 + Conv2d_7_out_num_hw
-                        i_upper3 = i_lower3 + Conv2d_11_out_num
-                        i_offset3 = i_offset2 + Conv2d_7_out_num_hw
-# MConv_Stage1_L1_5
-                        i_lower4 = i_lower3 + Conv2d_11_out_num_hw
-                        i_upper4 = i_lower4 + MConv_Stage1_L1_5_out_num
-                        i_offset4 = i_offset3 + Conv2d_11_out_num_hw
-# MConv_Stage1_L2_5
-                        i_lower5 = i_lower4 + MConv_Stage1_L1_5_out_num_hw
-                        i_upper5 = i_lower5 + MConv_Stage1_L2_5_out_num
-                        i_offset5 = i_offset4 + MConv_Stage1_L1_5_out_num_hw
-
-                        if (i >= i_lower1) and (i < i_upper1) and (o < out_num):
-                          raw_idx = int(p * 1 * in_num * out_num + q * in_num * out_num + (i - i_offset1 + MConv_Stage1_L1_5_out_num + MConv_Stage1_L2_5_out_num) * out_num + o)
-                          weights_layer_reorg.append(weights_layer_raw[raw_idx])
-                        elif (i >= i_lower2) and (i < i_upper2) and (o < out_num):
-                          raw_idx = int(p * 1 * in_num * out_num + q * in_num * out_num + (i - i_offset2 + MConv_Stage1_L1_5_out_num + MConv_Stage1_L2_5_out_num + Conv2d_3_pool_out_num) * out_num + o)
-                          weights_layer_reorg.append(weights_layer_raw[raw_idx])
-                        elif (i >= i_lower3) and (i < i_upper3) and (o < out_num):
-                          raw_idx = int(p * 1 * in_num * out_num + q * in_num * out_num + (i - i_offset3 + MConv_Stage1_L1_5_out_num + MConv_Stage1_L2_5_out_num + Conv2d_3_pool_out_num + Conv2d_7_out_num) * out_num + o)
-                          weights_layer_reorg.append(weights_layer_raw[raw_idx])
-                        elif (i >= i_lower4) and (i < i_upper4) and (o < out_num):
-                          raw_idx = int(p * 1 * in_num * out_num + q * in_num * out_num + (i - i_offset4) * out_num + o)
-                          weights_layer_reorg.append(weights_layer_raw[raw_idx])
-                        elif (i >= i_lower5) and (i < i_upper5) and (o < out_num):
-                          raw_idx = int(p * 1 * in_num * out_num + q * in_num * out_num + (i - i_offset5 + MConv_Stage1_L1_5_out_num) * out_num + o)
-                          weights_layer_reorg.append(weights_layer_raw[raw_idx])
-                        else:
-                          weights_layer_reorg.append(0.0)
-
-        else:
-          for o1 in range(int(ceil(float(out_num) / out_num_t))):
-            for i1 in range(int(ceil(float(in_num) / in_num_t))):
-              for o2 in range(out_num_t):
-                for p in range(1):
-                  for q in range(1):
-                    for i2 in range(in_num_t):
-                      o = o1 * out_num_t + o2
-                      i = i1 * in_num_t + i2
-#                      raw_idx = o * in_num * 1 * 1 + i * 1 * 1 + p * 1 + q
-                      raw_idx = p * 1 * in_num * out_num + q * in_num * out_num + i * out_num + o
-                      if (o < out_num) and (i < in_num):
-                        weights_layer_reorg.append(weights_layer_raw[raw_idx])
-                      else:
-                        weights_layer_reorg.append(0.0)
-
-        for weight_idx in range(int(out_num_hw * in_num_hw * 1 * 1)):
-          weights_reorg.append(weights_layer_reorg[weight_idx])
-
-        weight_offset += out_num * in_num * 1 * 1
-        weight_reorg_offset += out_num_hw * in_num_hw * 1 * 1
-
-        for bias_idx in range(out_num):
-          bias_layer_raw.append(bias[bias_offset + bias_idx])
-
-        for o1 in range(int(ceil(float(out_num) / out_num_t))):
-          for o2 in range(out_num_t):
-            o = o1 * out_num_t + o2
-            raw_idx = o
-            if (o < out_num):
-              bias_layer_reorg.append(bias_layer_raw[raw_idx])
-            else:
-              bias_layer_reorg.append(0.0)
-
-        for bias_idx in range(int(out_num_hw)):
-          bias_reorg.append(bias_layer_reorg[bias_idx])
-
-        bias_offset += out_num
-        bias_reorg_offset += out_num_hw
-
-        print(layer_name, weight_reorg_offset, bias_reorg_offset)
-
-      elif layer_type == "convb":
-        for weight_idx in range(out_num * in_num * filter_s * filter_s):
-          weights_layer_raw.append(weights[weight_offset + weight_idx])
-
-        for o1 in range(int(ceil(float(out_num) / out_num_t))):
-          for i1 in range(int(ceil(float(in_num) / in_num_t))):
-            for o2 in range(out_num_t):
-              for p in range(filter_s):
-                for q in range(filter_s):
-                  for i2 in range(in_num_t):
-                    o = o1 * out_num_t + o2
-                    i = i1 * in_num_t + i2
-#                    raw_idx = o * in_num * filter_s * filter_s + i * filter_s * filter_s + p * filter_s + q
-                    raw_idx = p * filter_s * in_num * out_num + q * in_num * out_num + i * out_num + o
-                    if (o < out_num) and (i < in_num):
-                      weights_layer_reorg.append(weights_layer_raw[raw_idx])
-                    else:
-                      weights_layer_reorg.append(0.0)
-
-        for weight_idx in range(out_num_hw * in_num_hw * filter_s * filter_s):
-          weights_reorg.append(weights_layer_reorg[weight_idx])
-
-        weight_offset += out_num * in_num * filter_s * filter_s
-        weight_reorg_offset += out_num_hw * in_num_hw * filter_s * filter_s
-
-        for bias_idx in range(out_num):
-          bias_layer_raw.append(bias[bias_offset + bias_idx])
-
-        for o1 in range(int(ceil(float(out_num) / out_num_t))):
-          for o2 in range(out_num_t):
-            o = o1 * out_num_t + o2
-            raw_idx = o
-            if (o < out_num):
-              bias_layer_reorg.append(bias_layer_raw[raw_idx])
-            else:
-              bias_layer_reorg.append(0.0)
-
-        for bias_idx in range(out_num_hw):
-          bias_reorg.append(bias_layer_reorg[bias_idx])
-
-        bias_offset += out_num
-        bias_reorg_offset += out_num_hw
-
-        #print(layer_name, weight_reorg_offset, bias_reorg_offset)
-
-      stage2_layer_cnt = stage2_layer_cnt + 1
-      if stage2_layer_cnt == STAGE2_LAYERS:
-        stage2_layer_cnt = 0
-        stage2_channel_cnt = stage2_channel_cnt + 1
-        if stage2_channel_cnt == 2:
-          stage2_channel_cnt = 0
-          stage2_iter_cnt = stage2_iter_cnt + 1
-          if stage2_iter_cnt == STAGE2_ITER:
-            stage2_iter_cnt = 0
-            current_model = "STAGE2"
-            break
-          else:
-            line_id = stage2_line_id - 1
-
-    line_id = line_id + 1
+        layer_weights = weights[entry['WEIGHT_OFFSET'] : entry['WEIGHT_OFFSET'] + entry['WEIGHT_SIZE']]
+        layer_bias = bias[entry['BIAS_OFFSET'] : entry['BIAS_OFFSET'] + entry['BIAS_SIZE']]
+        layer_weights_reorg, layer_bias_reorg = reorg_layer(net, entry, layer_weights, layer_bias)
+        if quant_bits > 0:
+          layer_weights_reorg, layer_bias_reorg, record = quant_layer(net, entry, layer_weights_reorg, layer_bias_reorg, quant_bits)
+          quant_records.append(record)
+        weights_reorg[entry['WEIGHT_REORG_OFFSET'] : entry['WEIGHT_REORG_OFFSET'] + entry['WEIGHT_REORG_SIZE']] = layer_weights_reorg
+        bias_reorg[entry['BIAS_REORG_OFFSET'] : entry['BIAS_REORG_OFFSET'] + entry['BIAS_REORG_SIZE']] = layer_bias_reorg
+
+  for entry in plan:
+    print(str(net[entry['LAYER_ID']]['name']), entry['WEIGHT_REORG_OFFSET'] + entry['WEIGHT_REORG_SIZE'], entry['BIAS_REORG_OFFSET'] + entry['BIAS_REORG_SIZE'])
 
   # dump out the reorganized data
-#  with open('weight_reorg.dat', 'w') as f:
-#    for w in weights_reorg:
-#      f.write(w + '\n')
-#
-#  with open('bias_reorg.dat', 'w') as f:
-#    for b in bias_reorg:
-#      f.write(b + '\n')
-  weights_arr = array('f', weights_reorg)
-  with open('weight_reorg.bin', 'wb') as f:
-    weights_arr.tofile(f)
-
-  bias_arr = array('f', bias_reorg)
-  with open('bias_reorg.bin', 'wb') as f:
-    bias_arr.tofile(f)
-
-  model.close()
+  if not stream:
+    with open('weight_reorg.bin', 'wb') as f:
+      weights_reorg.tofile(f)
+    with open('bias_reorg.bin', 'wb') as f:
+      bias_reorg.tofile(f)
+
+  # the fixed point formats of the layers and the quantization errors
+  if quant_bits > 0:
+    quant = {}
+    quant['BITS'] = quant_bits
+    quant['TOTAL'] = quant_report(quant_records, quant_bits)
+    quant['LAYERS'] = quant_records
+    with open('quant.json', 'w') as f:
+      json.dump(quant, f, indent = 2)
 
 if __name__ == "__main__":
   parser = argparse.ArgumentParser(description='Data reorganization.')
 
-  parser.add_argument('-t', '--tile', metavar='TILE', required=True, help='tiling configuration', dest='tile')
-  parser.add_argument('-m', '--model', metavar='MODEL', required=True, help='model description', dest='model')
-  parser.add_argument('-mc', '--model-config', metavar='MODEL_CONFIG', required=True, help='model topology', dest='model_config')
+  parser.add_argument('-t', '--tile', metavar='TILE', default=None, help='ignored, the tiles of the layers are taken from the model', dest='tile')
+  parser.add_argument('-m', '--model', metavar='MODEL', required=True, help='model description (.model) or layer graph (.json)', dest='model')
+  parser.add_argument('-mc', '--model-config', metavar='MODEL_CONFIG', default=None, help='model topology, not used with a layer graph', dest='model_config')
 #  parser.add_argument('--cin', metavar='INPUT_FIGURE', required=True, help='input feature maps', dest='input_figure')
   parser.add_argument('-i', '--input-config', metavar='INPUT_CONFIG', required=True, help='input configuration', dest='input_config')
   parser.add_argument('-w', '--weight', metavar='WEIGHT', required=True, help='weights data', dest='weight')
   parser.add_argument('-b', '--bias', metavar='BIAS', required=True, help='bias data', dest='bias')
+  parser.add_argument('--stream', help='memory-map the data and write the reorganized layers one by one, the memory use is bounded by one layer', action='store_true', default=False)
+  parser.add_argument('--parallel', help='reorganize the layers in parallel, implies --stream', action='store_true', default=False)
+  parser.add_argument('--quant', metavar='BITS', type=int, choices=[16, 8], default=0, help='export the data as fixed point of the given width, float by default', dest='quant')
 
   args = parser.parse_args()
-  run(args.tile, args.model, args.model_config, args.input_config, args.weight, args.bias)
+  run(args.model, args.model_config, args.input_config, args.weight, args.bias, args.stream, args.parallel, args.quant)
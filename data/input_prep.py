@@ -0,0 +1,175 @@
+import numpy as np
+import json
+import argparse
+import os
+import sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'inst_gen'))
+import network_ir
+
+'''
+Functionality: preprocess the input frames
+frames[BATCH][H][W][IN_NUM] -> cin[BATCH][IN_NUM_HW / IN_NUM_T][H_HW][W_HW][IN_NUM_T]
+
+The frames are resized to the network input, normalized as x * SCALE - MEAN and laid out as the cin buffer of the
+first layer: the channels are padded to IN_NUM_HW and tiled by IN_NUM_T, the feature maps are padded to H_HW and W_HW
+with a halo of K / 2 on the top and left, as the host code does. The cin buffer of one frame has IN_OUT_OFFSET
+elements, the offset of the first output in the DDR layout of inst_parse.py.
+The batch is written to a memory-mapped file, one cin buffer per frame.
+'''
+
+'''
+layout of the cin buffer of the first layer
+'''
+def cin_layout(net):
+  layer = net[0]
+  filter_s = int(layer['filter_s'])
+  in_num_t = int(layer['in_num_t'])
+  layout = {}
+  layout['IN_NUM'] = int(layer['in_num'])
+  layout['IN_H'] = int(layer['in_h'])
+  layout['IN_W'] = int(layer['in_w'])
+  layout['IN_NUM_T'] = in_num_t
+  layout['IN_NUM_HW'] = -(-int(layer['in_num']) // in_num_t) * in_num_t
+  layout['IN_H_HW'] = -(-int(layer['in_h']) // int(layer['in_h_t'])) * int(layer['in_h_t']) + filter_s - 1
+  layout['IN_W_HW'] = -(-int(layer['in_w']) // int(layer['in_w_t'])) * int(layer['in_w_t']) + filter_s - 1
+  layout['OFFSET'] = filter_s // 2
+  layout['IN_OUT_OFFSET'] = layout['IN_NUM_HW'] * layout['IN_H_HW'] * layout['IN_W_HW']
+  return layout
+
+'''
+read a binary ppm (P6) image as frame[H][W][3]
+'''
+def ppm_load(f_name):
+  with open(f_name, 'rb') as f:
+    data = f.read()
+  # the header has 4 fields separated by whitespace, comments start with #
+  fields = []
+  pos = 0
+  while len(fields) < 4:
+    while data[pos:pos + 1].isspace():
+      pos += 1
+    if data[pos:pos + 1] == b'#':
+      pos = data.index(b'\n', pos) + 1
+      continue
+    end = pos
+    while not data[end:end + 1].isspace():
+      end += 1
+    fields.append(data[pos:end])
+    pos = end
+  if fields[0] != b'P6':
+    raise ValueError("%s: only binary ppm (P6) files are supported" % (f_name))
+  width, height, max_val = int(fields[1]), int(fields[2]), int(fields[3])
+  dtype = np.uint8 if max_val < 256 else np.dtype('>u2')
+  return np.frombuffer(data, dtype = dtype, count = height * width * 3, offset = pos + 1).reshape(height, width, 3)
+
+'''
+list the frames of a directory of .npy/.ppm files, in the order of the file names
+'''
+def frame_files(f_dir):
+  return [os.path.join(f_dir, f_name) for f_name in sorted(os.listdir(f_dir)) if os.path.splitext(f_name)[1] in ['.npy', '.ppm']]
+
+'''
+read one frame as frame[H][W][C]
+'''
+def frame_load(f_name):
+  if os.path.splitext(f_name)[1] == '.ppm':
+    return ppm_load(f_name)
+  frame = np.load(f_name, mmap_mode = 'r')
+  if frame.ndim == 2:
+    frame = frame[:, :, np.newaxis]
+  return frame
+
+'''
+bilinear resize of a batch of frames[BATCH][H][W][C] to [BATCH][out_h][out_w][C], with aligned pixel centers
+'''
+def frames_resize(frames, out_h, out_w):
+  in_h, in_w = frames.shape[1], frames.shape[2]
+  if (in_h, in_w) == (out_h, out_w):
+    return frames.astype(np.float32)
+
+  def axis_weights(in_size, out_size):
+    pos = np.clip((np.arange(out_size) + 0.5) * in_size / out_size - 0.5, 0, in_size - 1)
+    lo = np.floor(pos).astype(np.int64)
+    hi = np.minimum(lo + 1, in_size - 1)
+    return lo, hi, (pos - lo).astype(np.float32)
+
+  h_lo, h_hi, h_frac = axis_weights(in_h, out_h)
+  w_lo, w_hi, w_frac = axis_weights(in_w, out_w)
+  frames = frames.astype(np.float32)
+  rows = frames[:, h_lo] * (1 - h_frac)[:, np.newaxis, np.newaxis] + frames[:, h_hi] * h_frac[:, np.newaxis, np.newaxis]
+  return rows[:, :, w_lo] * (1 - w_frac)[:, np.newaxis] + rows[:, :, w_hi] * w_frac[:, np.newaxis]
+
+'''
+lay out a batch of normalized frames[BATCH][IN_H][IN_W][IN_NUM] as cin[BATCH][IN_NUM_HW / IN_NUM_T][H_HW][W_HW][IN_NUM_T]
+the output is written to cin, which has IN_OUT_OFFSET elements per frame and may be memory-mapped
+'''
+def cin_tile(frames, layout, cin):
+  batch = frames.shape[0]
+  in_num_t = layout['IN_NUM_T']
+  offset = layout['OFFSET']
+  frames = np.pad(frames, ((0, 0), (0, 0), (0, 0), (0, layout['IN_NUM_HW'] - layout['IN_NUM'])))
+  frames = frames.reshape(batch, layout['IN_H'], layout['IN_W'], -1, in_num_t).transpose(0, 3, 1, 2, 4)
+  cin = cin.reshape(batch, layout['IN_NUM_HW'] // in_num_t, layout['IN_H_HW'], layout['IN_W_HW'], in_num_t)
+  cin[:] = 0
+  cin[:, :, offset : offset + layout['IN_H'], offset : offset + layout['IN_W'], :] = frames
+
+'''
+preprocess a batch of frames, a list of frame[H][W][C] arrays or of .npy/.ppm file names
+frames are read and written batch_size at a time, the memory use is bounded by one batch
+'''
+def preprocess(frames, layout, f_cin, scale = 1.0, mean = 0.0, bgr = False, batch_size = 16):
+  cin = np.lib.format.open_memmap(f_cin, mode = 'w+', dtype = np.float32, shape = (len(frames), layout['IN_OUT_OFFSET']))
+  for start in range(0, len(frames), batch_size):
+    batch = [frame_load(frame) if isinstance(frame, str) else frame for frame in frames[start : start + batch_size]]
+    if len(set([frame.shape for frame in batch])) == 1:
+      batch = frames_resize(np.stack(batch), layout['IN_H'], layout['IN_W'])
+    else:
+      batch = np.concatenate([frames_resize(frame[np.newaxis], layout['IN_H'], layout['IN_W']) for frame in batch])
+    if batch.shape[3] != layout['IN_NUM']:
+      raise ValueError("frames have %d channels, the network expects %d" % (batch.shape[3], layout['IN_NUM']))
+    if bgr:
+      batch = batch[:, :, :, ::-1]
+    batch = batch * np.float32(scale) - np.asarray(mean, dtype = np.float32)
+    cin_tile(batch, layout, cin[start : start + len(batch)])
+  cin.flush()
+  return cin
+
+def run(f_model, f_model_config, f_input_config, f_frames, f_cin, scale, mean, bgr, batch_size):
+  model_config = network_ir.model_config_load(f_model, f_model_config)
+  with open(f_input_config, "r") as f:
+    input_config = json.loads(f.read())
+
+  net = network_ir.net_build(f_model, model_config, input_config)
+  layout = cin_layout(net)
+  print('cin layout: [%d / %d][%d][%d][%d], IN_OUT_OFFSET %d' % (layout['IN_NUM_HW'], layout['IN_NUM_T'], layout['IN_H_HW'], \
+    layout['IN_W_HW'], layout['IN_NUM_T'], layout['IN_OUT_OFFSET']))
+
+  frames = []
+  for f_name in f_frames:
+    if os.path.isdir(f_name):
+      frames += frame_files(f_name)
+    elif os.path.splitext(f_name)[1] == '.bin':
+      # raw float frames of the network input size, as data/input.bin
+      data = np.fromfile(f_name, dtype = np.float32).reshape(-1, layout['IN_H'], layout['IN_W'], layout['IN_NUM'])
+      frames += list(data)
+    else:
+      frames.append(f_name)
+
+  cin = preprocess(frames, layout, f_cin, scale, mean, bgr, batch_size)
+  print('%d frames written to %s' % (cin.shape[0], f_cin))
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description='Input preprocessing.')
+
+  parser.add_argument('-m', '--model', metavar='MODEL', required=True, help='model description (.model) or layer graph (.json)', dest='model')
+  parser.add_argument('-mc', '--model-config', metavar='MODEL_CONFIG', default=None, help='model topology, not used with a layer graph', dest='model_config')
+  parser.add_argument('-i', '--input-config', metavar='INPUT_CONFIG', required=True, help='input configuration', dest='input_config')
+  parser.add_argument('-f', '--frames', metavar='FRAMES', required=True, nargs='+', help='frames: .npy/.ppm files, raw float .bin files or directories', dest='frames')
+  parser.add_argument('-o', '--output', metavar='OUTPUT', default='cin.npy', help='cin buffers of the frames', dest='output')
+  parser.add_argument('--scale', metavar='SCALE', type=float, default=1.0, help='scale of the pixel values', dest='scale')
+  parser.add_argument('--mean', metavar='MEAN', type=float, nargs='+', default=[0.0], help='mean subtracted after scaling, one value or one per channel', dest='mean')
+  parser.add_argument('--bgr', help='reverse the channel order of the frames', action='store_true', default=False)
+  parser.add_argument('--batch', metavar='BATCH', type=int, default=16, help='frames processed at a time', dest='batch')
+
+  args = parser.parse_args()
+  run(args.model, args.model_config, args.input_config, args.frames, args.output, args.scale, args.mean, args.bgr, args.batch)
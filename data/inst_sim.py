@@ -0,0 +1,284 @@
+import numpy as np
+import argparse
+import time
+import collections
+import os
+import sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'inst_gen'))
+import inst_format
+import input_prep
+import output_post
+
+'''
+Functionality: functional simulation of the accelerator
+openpose.insts, weight_reorg.bin, bias_reorg.bin, cin[BATCH][H][W][IN_NUM] -> ddr[BATCH][CIN_SIZE] -> out[BATCH][H][W][19 + 38]
+
+The instructions are executed one layer at a time over a flat DDR image of CIN_SIZE elements per frame, as the kernel
+does: each layer reads its input feature maps cin[IN_NUM_HW / IN_NUM_T][IN_H_HW][IN_W_HW][IN_NUM_T] at CIN_OFFSET and its
+weights and bias at WEIGHT_OFFSET and BIAS_OFFSET, and writes cout[OUT_NUM_HW / OUT_NUM_T][OUT_H_HW][OUT_W_HW][OUT_NUM_T] at
+COUT_OFFSET, which already holds the halo shift of the next layer. The concatenations and the ping-pong buffers of the
+stages are only offsets in the instructions, so they are simulated as they are laid out on the board. The layers
+fused by layer_fuse.py pass their outputs through the on-chip buffer of inter_write and inter_load instead of DDR, a
+fifo of whole feature maps in the simulation.
+
+The computation follows the kernel modules:
+  depth_conv: the 3x3 stencil, summed in the order of the adder tree of stencil_w3, or the product of stencil_w1
+  conv:       the pointwise or KxK convolution, in the reduction order of the systolic array of codegen.py: the
+              products of SIMD channels are summed by the adder tree of the PEs, and accumulated over the channel
+              groups, the kernel columns and rows and the IN_NUM_T channel tiles, in the order of the feeders
+  relu:       cin + bias, max(0, x) if RELU_EN
+  pool:       the 2x2 max pooling with stride 2
+  cout_write: whole IN_H_T x IN_W_T tiles are written, the pixels out of OUT_H x OUT_W are zeros with pooling or stride 2
+All the float operations of the kernel are done in float32 in the same order, so the outputs are bit-exact with the
+float kernel. The outputs are checked against output.bin, the outputs of the software reference, with the tolerance
+of tb_pose.cpp.
+All the layers are computed on the whole batch with numpy, the feature maps are never split in tiles.
+'''
+
+CONFIG_PARAMS = inst_format.CONFIG_PARAMS
+INST_FIELDS = inst_format.INST_FIELDS
+'''
+bits of LAYER_EN
+'''
+LAYER_EN_BITS = {'DEPTH_CONV_EN': 0, 'CONV_EN': 1, 'RELU_EN': 2, 'POOL_EN': 3, 'UP_SAMPLE_EN': 4, 'BIAS_EN': 5, \
+  'INTER_LOAD_EN': 6, 'INTER_WRITE_EN': 7}
+'''
+tolerance of the comparison in tb_pose.cpp
+'''
+TOLERANCE = 0.001
+
+'''
+read openpose.insts, text or binary, return one dict of the instruction fields per layer
+'''
+def insts_load(f_insts):
+  values = inst_format.insts_read(f_insts)[0]
+  insts = []
+  for values_layer in values:
+    inst = dict(zip(INST_FIELDS, [int(value) for value in values_layer]))
+    for name, bit in LAYER_EN_BITS.items():
+      inst[name] = (inst['LAYER_EN'] >> bit) & 1
+    insts.append(inst)
+  return insts
+
+'''
+layout of the cin buffer of the first layer from its instruction, as input_prep.cin_layout
+'''
+def inst_cin_layout(inst):
+  layout = {}
+  for name in ['IN_NUM', 'IN_H', 'IN_W', 'IN_NUM_T', 'IN_NUM_HW', 'IN_H_HW', 'IN_W_HW']:
+    layout[name] = inst[name]
+  layout['OFFSET'] = max(inst['FILTER_S1'], inst['FILTER_S2']) // 2
+  layout['IN_OUT_OFFSET'] = inst['IN_NUM_HW'] * inst['IN_H_HW'] * inst['IN_W_HW']
+  return layout
+
+'''
+DDR indices of the window [0, h) x [0, w) of the feature maps [NUM_HW / NUM_T][H_HW][W_HW][NUM_T] at offset
+return the indices as [h][w][num], the channels of all the tiles in order
+'''
+def fm_index(offset, num, num_t, h_hw, w_hw, h, w):
+  tiles = num // num_t
+  idx = offset + np.arange(tiles)[:, np.newaxis, np.newaxis, np.newaxis] * (h_hw * w_hw * num_t) \
+    + np.arange(h)[:, np.newaxis, np.newaxis] * (w_hw * num_t) + np.arange(w)[:, np.newaxis] * num_t + np.arange(num_t)
+  return idx.transpose(1, 2, 0, 3).reshape(h, w, num)
+
+'''
+windows of the feature maps x[BATCH][H][W][C] for a KxK filter, the window of the output (h, w) starts at
+(h * STRIDE + STRIDE - 1, w * STRIDE + STRIDE - 1), as in conv_core
+return the windows [K][K] of x[BATCH][out_h][out_w][C]
+'''
+def fm_windows(x, filter_s, stride, out_h, out_w):
+  start = stride - 1
+  return [[x[:, start + p : start + p + stride * (out_h - 1) + 1 : stride, start + q : start + q + stride * (out_w - 1) + 1 : stride, :] \
+    for q in range(filter_s)] for p in range(filter_s)]
+
+'''
+depthwise convolution of x[BATCH][H][W][C] with w[K][K][C]
+the products of the 3x3 stencil are summed by the adder tree of stencil_w3
+'''
+def depth_conv(x, w, filter_s, stride, out_h, out_w):
+  windows = fm_windows(x, filter_s, stride, out_h, out_w)
+  prod = [[windows[p][q] * w[p, q] for q in range(filter_s)] for p in range(filter_s)]
+  if filter_s == 1:
+    return prod[0][0]
+  if filter_s == 3:
+    return ((prod[0][0] + prod[0][1]) + (prod[0][2] + prod[1][0])) + ((prod[1][1] + prod[1][2]) + (prod[2][0] + prod[2][1])) + prod[2][2]
+  raise ValueError("depthwise filter size %d is not supported by the kernel" % (filter_s))
+
+'''
+sum of the SIMD lanes of the last axis by the adder tree of the PEs, the lanes are added in pairs
+'''
+def simd_tree(prod):
+  while prod.shape[-1] > 1:
+    prod = prod[..., 0::2] + prod[..., 1::2]
+  return prod[..., 0]
+
+'''
+convolution of x[BATCH][H][W][IN_NUM] with w[OUT_NUM_HW / OUT_NUM_T][IN_NUM_HW / IN_NUM_T][OUT_NUM_T][K][K][IN_NUM_T]
+in the order of the systolic array: each PE sums the products of simd input channels by its adder tree, and adds
+the sum to its local register, which starts from zero at the first input channel tile and is kept over the tiles.
+The feeders iterate over the groups of simd channels of a tile, then the kernel columns, then the kernel rows.
+'''
+def conv(x, w, filter_s, stride, out_h, out_w, in_num_t, simd):
+  windows = fm_windows(x, filter_s, stride, out_h, out_w)
+  out_tiles = []
+  for out_tile in range(w.shape[0]):
+    acc = np.zeros(x.shape[:1] + (out_h, out_w, w.shape[2]), dtype = np.float32)
+    for in_tile in range(w.shape[1]):
+      for group in range(in_tile * in_num_t, (in_tile + 1) * in_num_t, simd):
+        for q in range(filter_s):
+          for p in range(filter_s):
+            w_group = w[out_tile, in_tile, :, p, q, group - in_tile * in_num_t : group - in_tile * in_num_t + simd]
+            acc += simd_tree(windows[p][q][..., np.newaxis, group : group + simd] * w_group)
+    out_tiles.append(acc)
+  return np.concatenate(out_tiles, axis = 3)
+
+'''
+2x2 max pooling with stride 2 of x[BATCH][H][W][C]
+'''
+def max_pool(x, out_h, out_w):
+  windows = [x[:, p : p + 2 * out_h : 2, q : q + 2 * out_w : 2, :] for p in range(2) for q in range(2)]
+  return np.maximum(np.maximum(windows[0], windows[1]), np.maximum(windows[2], windows[3]))
+
+'''
+execute the instruction of one layer on ddr[BATCH][CIN_SIZE], in place
+inter is the on-chip buffer, the fifo of the feature maps written with INTER_WRITE_EN and not loaded yet
+'''
+def layer_run(ddr, inst, weights, bias, inter):
+  in_num_t = inst['IN_NUM_T']
+  out_num_t = inst['OUT_NUM_T']
+  # the kernel iterates over the channel tiles until IN_NUM and OUT_NUM are covered
+  in_num = -(-inst['IN_NUM'] // in_num_t) * in_num_t
+  out_num = -(-inst['OUT_NUM'] // out_num_t) * out_num_t
+  # the feature maps are processed in whole tiles
+  in_h = -(-inst['IN_H'] // inst['IN_H_T']) * inst['IN_H_T']
+  in_w = -(-inst['IN_W'] // inst['IN_W_T']) * inst['IN_W_T']
+  filter_s1 = inst['FILTER_S1'] if inst['DEPTH_CONV_EN'] else 1
+  filter_s2 = inst['FILTER_S2'] if inst['CONV_EN'] else 1
+  stride1 = inst['STRIDE'] if inst['DEPTH_CONV_EN'] else 1
+  stride2 = inst['STRIDE'] if inst['CONV_EN'] and not inst['DEPTH_CONV_EN'] else 1
+  halo = max(filter_s1, filter_s2) - 1
+
+  if inst['INTER_LOAD_EN']:
+    if len(inter) == 0:
+      raise ValueError("the on-chip buffer is empty")
+    x = inter.popleft()
+    if x.shape[1:] != (in_h + halo, in_w + halo, in_num):
+      raise ValueError("tiles of shape %s in the on-chip buffer, the layer loads %s" % (str(x.shape[1:]), str((in_h + halo, in_w + halo, in_num))))
+  else:
+    x = ddr[:, fm_index(inst['CIN_OFFSET'], in_num, in_num_t, inst['IN_H_HW'], inst['IN_W_HW'], in_h + halo, in_w + halo)]
+  weight_offset = inst['WEIGHT_OFFSET']
+  if inst['DEPTH_CONV_EN']:
+    depth_size = in_num * filter_s1 * filter_s1
+    w = weights[weight_offset : weight_offset + depth_size]
+    w = w.reshape(-1, filter_s1, filter_s1, in_num_t).transpose(1, 2, 0, 3).reshape(filter_s1, filter_s1, in_num)
+    x = depth_conv(x, w, filter_s1, stride1, in_h // stride1, in_w // stride1)
+    weight_offset += depth_size
+  if inst['CONV_EN']:
+    conv_size = out_num * in_num * filter_s2 * filter_s2
+    w = weights[weight_offset : weight_offset + conv_size]
+    w = w.reshape(out_num // out_num_t, in_num // in_num_t, out_num_t, filter_s2, filter_s2, in_num_t)
+    # LOCAL_ACCUM_NUM is the number of simd groups of a tile the PEs accumulate
+    simd = in_num_t * filter_s2 * filter_s2 // inst['LOCAL_ACCUM_NUM']
+    x = conv(x, w, filter_s2, stride2, in_h // stride1 // stride2, in_w // stride1 // stride2, in_num_t, simd)
+  else:
+    x = x[..., :out_num]
+  if inst['RELU_EN'] or inst['BIAS_EN']:
+    x = x + bias[inst['BIAS_OFFSET'] : inst['BIAS_OFFSET'] + out_num]
+    if inst['RELU_EN']:
+      x = np.maximum(x, 0)
+  if inst['POOL_EN']:
+    x = max_pool(x, x.shape[1] // 2, x.shape[2] // 2)
+  # the pixels of the padded tiles past OUT_H and OUT_W are written as zeros
+  x[:, inst['OUT_H']:] = 0
+  x[:, :, inst['OUT_W']:] = 0
+
+  if inst['INTER_WRITE_EN']:
+    inter.append(x)
+  else:
+    ddr[:, fm_index(inst['COUT_OFFSET'], out_num, out_num_t, inst['OUT_H_HW'], inst['OUT_W_HW'], x.shape[1], x.shape[2])] = x
+
+'''
+simulate a batch of frames[BATCH][IN_H][IN_W][IN_NUM], or of cin buffers[BATCH][IN_OUT_OFFSET] laid out by input_prep.py
+return the DDR images ddr[BATCH][CIN_SIZE] after the last layer
+'''
+def simulate(insts, params, weights, bias, frames):
+  layout = inst_cin_layout(insts[0])
+  ddr = np.zeros((len(frames), params['CIN_SIZE']), dtype = np.float32)
+  if frames.ndim == 2:
+    ddr[:, :layout['IN_OUT_OFFSET']] = frames
+  else:
+    cin = np.zeros((len(frames), layout['IN_OUT_OFFSET']), dtype = np.float32)
+    input_prep.cin_tile(frames, layout, cin)
+    ddr[:, :layout['IN_OUT_OFFSET']] = cin
+  inter = collections.deque()
+  for inst in insts:
+    layer_run(ddr, inst, weights, bias, inter)
+  if len(inter) > 0:
+    raise ValueError("%d feature maps left in the on-chip buffer" % (len(inter)))
+  return ddr
+
+'''
+outputs of the DDR images in the layout of output.bin: out[BATCH][H][W][19 heatmaps + 38 PAFs]
+'''
+def sim_outputs(ddr, params):
+  return np.concatenate([output_post.cout_detile(ddr, params, 'STAGE2R'), output_post.cout_detile(ddr, params, 'STAGE2L')], axis = 3)
+
+'''
+compare the simulated outputs with the reference outputs, as tb_pose.cpp
+return the number of mismatches
+'''
+def sim_check(outputs, golden):
+  err = np.abs(outputs.astype(np.float64) - golden.astype(np.float64))
+  # NaN and inf count as mismatches
+  err_num = int(np.sum(~(err <= TOLERANCE)))
+  print('max error: %e, mean error: %e' % (float(np.max(err)), float(np.mean(err))))
+  print('%d/%d outputs out of the tolerance %g' % (err_num, err.size, TOLERANCE))
+  return err_num
+
+def run(f_insts, f_params, f_weight, f_bias, f_input, f_output, f_dump, batch_size):
+  insts = insts_load(f_insts)
+  params = inst_format.params_load(f_params)
+  if len(insts) != params['LAYER_NUM']:
+    raise ValueError("%s has %d layers, %s has %d" % (f_insts, len(insts), f_params, params['LAYER_NUM']))
+  weights = np.fromfile(f_weight, dtype = np.float32)
+  bias = np.fromfile(f_bias, dtype = np.float32)
+
+  layout = inst_cin_layout(insts[0])
+  if os.path.splitext(f_input)[1] == '.npy':
+    # cin buffers of input_prep.py
+    data = np.load(f_input, mmap_mode = 'r')
+  else:
+    # raw float frames of the network input size
+    data = np.fromfile(f_input, dtype = np.float32).reshape(-1, layout['IN_H'], layout['IN_W'], layout['IN_NUM'])
+
+  start_time = time.time()
+  outputs = []
+  for start in range(0, len(data), batch_size):
+    ddr = simulate(insts, params, weights, bias, np.asarray(data[start : start + batch_size]))
+    outputs.append(sim_outputs(ddr, params))
+  outputs = np.concatenate(outputs)
+  print('%d frames, %d layers simulated in %.2f s' % (len(outputs), len(insts), time.time() - start_time))
+
+  if f_dump is not None:
+    outputs.tofile(f_dump)
+  if f_output is not None:
+    golden = np.fromfile(f_output, dtype = np.float32).reshape(outputs.shape)
+    if sim_check(outputs, golden) > 0:
+      print('Failed.')
+      sys.exit(1)
+    print('Passed.')
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description='Functional simulation.')
+
+  parser.add_argument('-n', '--insts', metavar='INSTS', required=True, help='instructions', dest='insts')
+  parser.add_argument('-p', '--params', metavar='PARAMS', required=True, help='params.h', dest='params')
+  parser.add_argument('-w', '--weight', metavar='WEIGHT', default='weight_reorg.bin', help='reorganized weights', dest='weight')
+  parser.add_argument('-b', '--bias', metavar='BIAS', default='bias_reorg.bin', help='reorganized bias', dest='bias')
+  parser.add_argument('-f', '--input', metavar='INPUT', default='input.bin', help='raw float frames, or cin buffers of input_prep.py (.npy)', dest='input')
+  parser.add_argument('-o', '--output', metavar='OUTPUT', default=None, help='reference outputs to compare with, as output.bin', dest='output')
+  parser.add_argument('-d', '--dump', metavar='DUMP', default=None, help='write the simulated outputs in the layout of output.bin', dest='dump')
+  parser.add_argument('--batch', metavar='BATCH', type=int, default=1, help='frames simulated at a time', dest='batch')
+
+  args = parser.parse_args()
+  run(args.insts, args.params, args.weight, args.bias, args.input, args.output, args.dump, args.batch)
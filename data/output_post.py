@@ -0,0 +1,261 @@
+import numpy as np
+import json
+import argparse
+import os
+import sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'inst_gen'))
+import network_ir
+import inst_format
+import input_prep
+
+'''
+Functionality: decode the network outputs into keypoints
+out[BATCH][H][W][HEATMAP_NUM + PAF_NUM] -> people[BATCH][][PART_NUM][x, y, score]
+
+The outputs are the heatmaps of MConv_Stage*_L2_5 (18 parts and the background) and the part affinity fields (PAFs) of
+MConv_Stage*_L1_5 (x and y of 19 limbs), in the layout of output.bin: [H][W][19 heatmaps + 38 PAFs] per frame.
+The outputs can also be read from a dump of the DDR buffer of the accelerator, the cin buffer of CIN_SIZE floats per
+frame, where the two layers are laid out as cout[OUT_NUM_HW / OUT_NUM_T][OUT_H_HW][OUT_W_HW][OUT_NUM_T] at
+STAGE2L_OFFSET and STAGE2R_OFFSET of params.h.
+
+The decoding follows OpenPose: the peaks of the heatmaps are the part candidates, each pair of candidates of a limb is
+scored by the line integral of the PAF along the segment, the limbs are matched greedily by score and assembled into
+people. The peak detection and the limb scoring run on the whole batch at once.
+'''
+
+PART_NAMES = ['Nose', 'Neck', 'RShoulder', 'RElbow', 'RWrist', 'LShoulder', 'LElbow', 'LWrist', 'RHip', 'RKnee', \
+  'RAnkle', 'LHip', 'LKnee', 'LAnkle', 'REye', 'LEye', 'REar', 'LEar']
+'''
+limbs as (part a, part b) and the PAF channels of their x and y components
+'''
+LIMBS = [(1, 2), (1, 5), (2, 3), (3, 4), (5, 6), (6, 7), (1, 8), (8, 9), (9, 10), (1, 11), (11, 12), (12, 13), (1, 0), \
+  (0, 14), (14, 16), (0, 15), (15, 17), (2, 16), (5, 17)]
+LIMB_PAFS = [(12, 13), (20, 21), (14, 15), (16, 17), (22, 23), (24, 25), (0, 1), (2, 3), (4, 5), (6, 7), (8, 9), (10, 11), \
+  (28, 29), (30, 31), (34, 35), (32, 33), (36, 37), (18, 19), (26, 27)]
+
+'''
+shapes of the outputs from the network IR: the last layers of the two branches of stage 2
+'''
+def output_layout(net):
+  paf_id = [i for i in range(len(net)) if net[i]['stage'] == 2 and net[i]['branch'] == 0 and net[i]['out_concat']][0]
+  heatmap_id = [i for i in range(len(net)) if net[i]['stage'] == 2 and net[i]['branch'] == 1 and net[i]['out_concat']][0]
+  layout = {}
+  layout['OUT_H'] = int(net[heatmap_id]['out_h'])
+  layout['OUT_W'] = int(net[heatmap_id]['out_w'])
+  layout['HEATMAP_NUM'] = int(net[heatmap_id]['out_num'])
+  layout['PAF_NUM'] = int(net[paf_id]['out_num'])
+  return layout
+
+'''
+extract the outputs of one branch from the DDR buffers ddr[BATCH][]
+cout[OUT_NUM_HW / OUT_NUM_T][OUT_H_HW][OUT_W_HW][OUT_NUM_T] at <prefix>_OFFSET -> out[BATCH][OUT_H][OUT_W][OUT_NUM]
+'''
+def cout_detile(ddr, params, prefix):
+  out_num_t = params[prefix + '_OUT_NUM_T']
+  out_h_hw = params[prefix + '_OUT_H_HW']
+  out_w_hw = params[prefix + '_OUT_W_HW']
+  offset = params[prefix + '_K'] // 2
+  size = params[prefix + '_OUT_NUM_HW'] * out_h_hw * out_w_hw
+  cout = ddr[:, params[prefix + '_OFFSET'] : params[prefix + '_OFFSET'] + size]
+  cout = cout.reshape(len(ddr), -1, out_h_hw, out_w_hw, out_num_t).transpose(0, 2, 3, 1, 4).reshape(len(ddr), out_h_hw, out_w_hw, -1)
+  return cout[:, offset : offset + params[prefix + '_OUT_H'], offset : offset + params[prefix + '_OUT_W'], :params[prefix + '_OUT_NUM']]
+
+'''
+peaks of the part heatmaps[BATCH][H][W][PART_NUM]: local maxima over the 3x3 neighborhood above the threshold
+return the arrays (frame, part, y, x, score) of the peaks, sorted by frame and part
+'''
+def peaks_find(heatmaps, thre):
+  batch, h, w, _ = heatmaps.shape
+  padded = np.pad(heatmaps, ((0, 0), (1, 1), (1, 1), (0, 0)), constant_values = -np.inf)
+  is_peak = heatmaps > thre
+  for dy in range(3):
+    for dx in range(3):
+      if (dy, dx) != (1, 1):
+        is_peak &= heatmaps >= padded[:, dy : dy + h, dx : dx + w, :]
+  frame, y, x, part = np.nonzero(is_peak)
+  order = np.lexsort((x, y, part, frame))
+  frame, y, x, part = frame[order], y[order], x[order], part[order]
+  return frame, part, y, x, heatmaps[frame, y, x, part]
+
+'''
+score all the candidate pairs of one limb in the batch by the line integral of the PAF along the segment between them
+a and b are the peak indices of the pairs, which belong to the same frame
+return the scores and whether the pairs pass the criteria
+'''
+def limb_score(pafs, peaks, a, b, paf_x, paf_y, thre, sample_num = 10):
+  frame, part, y, x, score = peaks
+  h = pafs.shape[1]
+  dx = (x[b] - x[a]).astype(np.float32)
+  dy = (y[b] - y[a]).astype(np.float32)
+  norm = np.sqrt(dx * dx + dy * dy)
+  valid = norm > 0
+  norm = np.where(valid, norm, 1)
+  t = np.linspace(0, 1, sample_num, dtype = np.float32)
+  xs = np.rint(x[a][:, np.newaxis] + t * dx[:, np.newaxis]).astype(np.int64)
+  ys = np.rint(y[a][:, np.newaxis] + t * dy[:, np.newaxis]).astype(np.int64)
+  fs = frame[a][:, np.newaxis]
+  score_mid = pafs[fs, ys, xs, paf_x] * (dx / norm)[:, np.newaxis] + pafs[fs, ys, xs, paf_y] * (dy / norm)[:, np.newaxis]
+  # the distance prior penalizes the limbs longer than half of the map
+  score_prior = np.mean(score_mid, axis = 1) + np.minimum(0.5 * h / norm - 1, 0)
+  passed = valid & (np.sum(score_mid > thre, axis = 1) > 0.8 * sample_num) & (score_prior > 0)
+  return score_prior, passed
+
+'''
+candidate limbs of the batch: for each limb, the pairs of peaks of the same frame that pass the PAF criteria, matched
+greedily by score so that each peak is used once per limb
+return a list with the arrays (frame, a, b, score) of each limb
+'''
+def limbs_connect(pafs, peaks, thre):
+  frame, part = peaks[0], peaks[1]
+  connections = []
+  for (part_a, part_b), (paf_x, paf_y) in zip(LIMBS, LIMB_PAFS):
+    cand_a = np.flatnonzero(part == part_a)
+    cand_b = np.flatnonzero(part == part_b)
+    pair_a, pair_b = np.nonzero(frame[cand_a][:, np.newaxis] == frame[cand_b][np.newaxis, :])
+    a, b = cand_a[pair_a], cand_b[pair_b]
+    score, passed = limb_score(pafs, peaks, a, b, paf_x, paf_y, thre)
+    a, b, score = a[passed], b[passed], score[passed]
+
+    # greedy matching, the best pairs first
+    order = np.argsort(-score, kind = 'stable')
+    used = set()
+    keep = []
+    for idx in order:
+      if a[idx] not in used and b[idx] not in used:
+        used.add(a[idx])
+        used.add(b[idx])
+        keep.append(idx)
+    keep = np.array(sorted(keep), dtype = np.int64)
+    connections.append((frame[a[keep]], a[keep], b[keep], score[keep]))
+  return connections
+
+'''
+assemble the limbs of one frame into people
+each person is a row of PART_NUM peak indices (-1 for the missing parts), followed by the score and the part count
+'''
+def people_assemble(connections, peak_score, frame_id, min_parts = 4, min_score = 0.4):
+  part_num = len(PART_NAMES)
+  people = np.zeros((0, part_num + 2))
+  for limb_id, (part_a, part_b) in enumerate(LIMBS):
+    frame, a, b, score = connections[limb_id]
+    sel = frame == frame_id
+    for ia, ib, s in zip(a[sel], b[sel], score[sel]):
+      found = np.flatnonzero((people[:, part_a] == ia) | (people[:, part_b] == ib))
+      if len(found) == 1:
+        person = people[found[0]]
+        if person[part_b] != ib:
+          person[part_b] = ib
+          person[-1] += 1
+          person[-2] += peak_score[ib] + s
+      elif len(found) == 2:
+        p0, p1 = people[found[0]], people[found[1]]
+        if not np.any((p0[:part_num] >= 0) & (p1[:part_num] >= 0)):
+          # the two people are disjoint, merge them
+          p0[:part_num] += p1[:part_num] + 1
+          p0[-2:] += p1[-2:]
+          p0[-2] += s
+          people = np.delete(people, found[1], axis = 0)
+        else:
+          p0[part_b] = ib
+          p0[-1] += 1
+          p0[-2] += peak_score[ib] + s
+      elif len(found) == 0 and limb_id < 17:
+        person = -np.ones(part_num + 2)
+        person[part_a] = ia
+        person[part_b] = ib
+        person[-1] = 2
+        person[-2] = peak_score[ia] + peak_score[ib] + s
+        people = np.vstack([people, person])
+  keep = (people[:, -1] >= min_parts) & (people[:, -2] / np.maximum(people[:, -1], 1) >= min_score)
+  return people[keep]
+
+'''
+decode a batch of outputs[BATCH][H][W][HEATMAP_NUM + PAF_NUM]
+return for each frame the list of people, each person is a dict with the keypoints [x, y, score] in the map coordinates
+(None for the missing parts) and the score
+'''
+def decode(outputs, layout, upsample = 1, thre_peak = 0.1, thre_paf = 0.05):
+  heatmaps = outputs[:, :, :, :layout['HEATMAP_NUM']]
+  pafs = outputs[:, :, :, layout['HEATMAP_NUM']:]
+  if upsample > 1:
+    heatmaps = input_prep.frames_resize(heatmaps, layout['OUT_H'] * upsample, layout['OUT_W'] * upsample)
+    pafs = input_prep.frames_resize(pafs, layout['OUT_H'] * upsample, layout['OUT_W'] * upsample)
+
+  # the last heatmap is the background
+  peaks = peaks_find(heatmaps[:, :, :, :len(PART_NAMES)], thre_peak)
+  connections = limbs_connect(pafs, peaks, thre_paf)
+  _, _, y, x, peak_score = peaks
+
+  results = []
+  for frame_id in range(len(outputs)):
+    people = []
+    for person in people_assemble(connections, peak_score, frame_id):
+      keypoints = []
+      for peak in person[:len(PART_NAMES)].astype(np.int64):
+        if peak < 0:
+          keypoints.append(None)
+        else:
+          keypoints.append([(float(x[peak]) + 0.5) / upsample - 0.5, (float(y[peak]) + 0.5) / upsample - 0.5, float(peak_score[peak])])
+      people.append({'KEYPOINTS': keypoints, 'SCORE': float(person[-2])})
+    results.append(people)
+  return results
+
+def run(f_model, f_model_config, f_input_config, f_output, f_params, f_keypoints, upsample, batch_size):
+  model_config = network_ir.model_config_load(f_model, f_model_config)
+  with open(f_input_config, "r") as f:
+    input_config = json.loads(f.read())
+
+  net = network_ir.net_build(f_model, model_config, input_config)
+  layout = output_layout(net)
+  # keypoints in the coordinates of the network input
+  scale_h = float(input_config['IN_H']) / layout['OUT_H']
+  scale_w = float(input_config['IN_W']) / layout['OUT_W']
+
+  if f_params is None:
+    frame_size = layout['OUT_H'] * layout['OUT_W'] * (layout['HEATMAP_NUM'] + layout['PAF_NUM'])
+    data = np.memmap(f_output, dtype = np.float32, mode = 'r')
+    if len(data) % frame_size != 0:
+      raise ValueError("%s holds %d floats, not a whole number of frames of %d floats" % (f_output, len(data), frame_size))
+    data = data.reshape(-1, layout['OUT_H'], layout['OUT_W'], layout['HEATMAP_NUM'] + layout['PAF_NUM'])
+  else:
+    # DDR dumps, one cin buffer of CIN_SIZE per frame, as the host reads it back
+    params = inst_format.params_load(f_params)
+    ddr_size = params['CIN_SIZE']
+    data = np.memmap(f_output, dtype = np.float32, mode = 'r')
+    if len(data) % ddr_size != 0:
+      raise ValueError("%s holds %d floats, not a whole number of frames of %d floats" % (f_output, len(data), ddr_size))
+    data = data.reshape(-1, ddr_size)
+
+  results = []
+  for start in range(0, len(data), batch_size):
+    if f_params is None:
+      outputs = np.asarray(data[start : start + batch_size])
+    else:
+      ddr = data[start : start + batch_size]
+      # the heatmaps (STAGE2R) come first, as in output.bin
+      outputs = np.concatenate([cout_detile(ddr, params, 'STAGE2R'), cout_detile(ddr, params, 'STAGE2L')], axis = 3)
+    for people in decode(outputs, layout, upsample):
+      for person in people:
+        person['KEYPOINTS'] = [None if kp is None else [(kp[0] + 0.5) * scale_w - 0.5, (kp[1] + 0.5) * scale_h - 0.5, kp[2]] \
+          for kp in person['KEYPOINTS']]
+      results.append(people)
+
+  for frame_id, people in enumerate(results):
+    print('frame %d: %d people' % (frame_id, len(people)))
+  with open(f_keypoints, 'w') as f:
+    json.dump({'PARTS': PART_NAMES, 'FRAMES': results}, f, indent = 2)
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description='Output postprocessing.')
+
+  parser.add_argument('-m', '--model', metavar='MODEL', required=True, help='model description (.model) or layer graph (.json)', dest='model')
+  parser.add_argument('-mc', '--model-config', metavar='MODEL_CONFIG', default=None, help='model topology, not used with a layer graph', dest='model_config')
+  parser.add_argument('-i', '--input-config', metavar='INPUT_CONFIG', required=True, help='input configuration', dest='input_config')
+  parser.add_argument('-o', '--output', metavar='OUTPUT', default='output.bin', help='network outputs', dest='output')
+  parser.add_argument('-p', '--params', metavar='PARAMS', default=None, help='params.h, the outputs are DDR dumps of the accelerator', dest='params')
+  parser.add_argument('-k', '--keypoints', metavar='KEYPOINTS', default='keypoints.json', help='decoded keypoints', dest='keypoints')
+  parser.add_argument('--upsample', metavar='UPSAMPLE', type=int, default=1, help='upsampling of the maps before the peak detection', dest='upsample')
+  parser.add_argument('--batch', metavar='BATCH', type=int, default=16, help='frames processed at a time', dest='batch')
+
+  args = parser.parse_args()
+  run(args.model, args.model_config, args.input_config, args.output, args.params, args.keypoints, args.upsample, args.batch)
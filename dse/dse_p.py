@@ -2,14 +2,16 @@ import numpy as np
 import json
 import argparse
 import copy
+import collections
 import multiprocessing
 import subprocess
 import time
-
-def list_split(ori_list, split_num):
-  chunk_size = int(np.ceil(float(len(ori_list)) / split_num))
-  chunks = [ori_list[i: i + min(chunk_size, len(ori_list) - i)] for i in range(0, len(ori_list), chunk_size)]
-  return chunks
+import csv
+import os
+import sys
+import dse_store
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'inst_gen'))
+import network_ir
 
 def effective_dram_est(port_width, burst_len, fre):
   # assume all designs work at 250MHz
@@ -144,244 +146,283 @@ def layer_latency_est(params):
   return total_latency
 
 '''
-sweep each layer, pick up the optimal in_num_t/out_num_t, in_h_t, in_w_t
+vectorized version of layer_latency_est
+the tiling factors, systolic array shape and frequency are numpy arrays broadcast against each other,
+the layer configuration and data precision are read from params
+it mirrors the scalar estimators above operation by operation, layer_latency_est is the reference
 '''
-def model_latency_est(params, model_config, layer_configs, dynamic_tiling_level):
-  VGG_LAYERS = model_config['VGG_LAYERS']
-  STAGE1_LAYERS = model_config['STAGE1_LAYERS']
-  STAGE1_ITER = model_config['STAGE1_ITER']
-  STAGE2_LAYERS = model_config['STAGE2_LAYERS']
-  STAGE2_ITER = model_config['STAGE2_ITER']
-  current_model = "VGG"
-  vgg_layer_cnt = 0
-  stage1_layer_cnt = 0
-  stage1_iter_cnt = 0
-  stage2_layer_cnt = 0
-  stage2_iter_cnt = 0
-  stage1_channel_cnt = 0
-  stage2_channel_cnt = 0
+def layer_latency_est_batch(params, in_num_t, out_num_t, in_h_t, in_w_t, sa_rows, sa_cols, sa_lane, fre):
+  in_num = params['LAYER_IN_NUM']
+  out_num = params['LAYER_OUT_NUM']
+  in_h = params['LAYER_IN_H']
+  in_w = params['LAYER_IN_W']
+  filter_s1 = params['LAYER_FILTER_S1']
+  filter_s2 = params['LAYER_FILTER_S2']
+  lane = params['SIMD_LANE']
+  dw0 = params['DATA_W0']
+  dw1 = params['DATA_W1']
+  dw2 = params['DATA_W2']
+  port_width = params['BUS_W']
+  depth_conv_en = params['DEPTH_CONV_EN']
+  point_conv_en = params['POINT_CONV_EN']
+  bias_en = params['BIAS_EN']
+  max_pool_en = params['MAX_POOL_EN']
+  stride = params['LAYER_STRIDE']
+  # the latency model always uses the same output and input tile
+  out_h_t = in_h_t
+  out_w_t = in_w_t
+  filter_s = max(filter_s1, filter_s2)
+  in_num_iter = np.ceil(in_num / in_num_t)
+
+  # cin_load
+  burst_len = (in_w_t + filter_s - 1) * in_num_t / (port_width / dw0)
+  eff_bw, eff_port_width = effective_dram_est(port_width, burst_len, fre)
+  cin_load_latency = np.maximum( \
+    in_num_t * (filter_s - 1 + in_h_t) * (filter_s - 1 + in_w_t) / (eff_port_width / dw0), \
+    in_num_t * (filter_s - 1 + in_h_t) * (filter_s - 1 + in_w_t) / lane)
+
+  # weight_load
+  load_phase_latency = 0
+  write_phase_latency = 0
+  if depth_conv_en == 1:
+    burst_len = in_num_t * filter_s1 * filter_s1 / (port_width / dw0)
+    eff_bw, eff_port_width = effective_dram_est(port_width, burst_len, fre)
+    load_phase_latency = load_phase_latency + in_num_t * filter_s1 * filter_s1 / (eff_port_width / dw0)
+  if point_conv_en == 1:
+    burst_len = in_num_t * out_num_t * filter_s2 * filter_s2 / (port_width / dw1)
+    eff_bw, eff_port_width = effective_dram_est(port_width, burst_len, fre)
+    load_phase_latency = load_phase_latency + in_num_t * out_num_t * filter_s2 * filter_s2 / (eff_port_width / dw1)
+  if bias_en == 1:
+    burst_len = out_num_t / (port_width / dw2)
+    eff_bw, eff_port_width = effective_dram_est(port_width, burst_len, fre)
+    load_phase_latency = load_phase_latency + out_num_t / (eff_port_width / dw2)
+  if depth_conv_en == 1:
+    write_phase_latency = np.maximum(write_phase_latency, in_num_t * filter_s1 * filter_s1 / lane)
+  if point_conv_en == 1:
+    write_phase_latency = np.maximum(write_phase_latency, in_num_t * out_num_t * filter_s2 * filter_s2 / lane)
+  if bias_en == 1:
+    write_phase_latency = np.maximum(write_phase_latency, out_num_t / lane)
+  weight_load_latency = load_phase_latency + write_phase_latency
+
+  # inter_load
+  inter_load_latency = in_num_t * (filter_s - 1 + in_h_t) * (filter_s - 1 + in_w_t) / lane
+
+  # depth_conv
+  if depth_conv_en == 1:
+    depth_conv_latency = in_num_t * (filter_s1 - 1 + in_h_t) * (filter_s1 - 1 + in_w_t) / lane
+  else:
+    depth_conv_latency = 0
 
+  # point_conv
+  if point_conv_en == 1:
+    point_conv_latency = np.maximum.reduce(np.broadcast_arrays( \
+      np.maximum(in_num_t * (filter_s1 - 1 + out_h_t) * (filter_s1 - 1 + out_w_t) / lane, in_num_t * out_num_t * filter_s2 * filter_s2 / lane), \
+      in_num_t * out_num_t * out_h_t * out_w_t * filter_s2 * filter_s2 / sa_rows / sa_cols / sa_lane, \
+      out_num_t * out_w_t / sa_cols * out_h_t / in_num_iter, \
+      out_num_t * out_h_t * out_w_t / in_num_iter / lane))
+  else:
+    point_conv_latency = 0
+
+  # relu, pool, inter_write
+  relu_latency = out_num_t * out_h_t * out_w_t / lane / in_num_iter
+  if max_pool_en == 1:
+    pool_latency = out_num_t * out_h_t * out_w_t / lane / in_num_iter
+  else:
+    pool_latency = 0
+  inter_write_latency = out_num_t * out_h_t * out_w_t / lane / in_num_iter
+
+  # cout_write
+  burst_len = out_w_t / stride * out_num_t / (port_width / dw0)
+  eff_bw, eff_port_width = effective_dram_est(port_width, burst_len, fre)
+  cout_write_latency = np.maximum( \
+    out_num_t * out_h_t * out_w_t / lane / in_num_iter, \
+    out_num_t * out_h_t / stride * out_w_t / stride / in_num_iter / (eff_port_width / dw0))
+
+  stage_latency = np.maximum.reduce(np.broadcast_arrays(cin_load_latency, weight_load_latency, inter_load_latency, depth_conv_latency, point_conv_latency, relu_latency, pool_latency, inter_write_latency, cout_write_latency))
+  total_iter = in_num_iter * np.ceil(out_num / out_num_t) * np.ceil(in_h / in_h_t) * np.ceil(in_w / in_w_t)
+  extra_latency = np.maximum(cin_load_latency, weight_load_latency) + cout_write_latency
+  total_latency = extra_latency + stage_latency * total_iter
+
+  return total_latency
+
+# bump when the latency model changes, the design points kept in the DSE store are invalidated
+ESTIMATOR_VERSION = 1
+# tiling factors picked by model_latency_est that are recorded for each design point
+EST_PARAMS_KEYS = ['LAYER_IN_NUM_T', 'LAYER_OUT_NUM_T', 'LAYER_IN_H_T', 'LAYER_IN_W_T', 'LAYER_OUT_H_T', 'LAYER_OUT_W_T', \
+  'LAYER_IN_NUM_T_LIST', 'LAYER_OUT_NUM_T_LIST', 'LAYER_IN_H_T_LIST', 'LAYER_IN_W_T_LIST']
+# parameters read by layer_latency_est apart from the tiling factors
+LAYER_LATENCY_KEYS = ['LAYER_IN_NUM', 'LAYER_OUT_NUM', 'LAYER_IN_H', 'LAYER_IN_W', 'LAYER_FILTER_S1', 'LAYER_FILTER_S2', 'LAYER_STRIDE', \
+  'DEPTH_CONV_EN', 'POINT_CONV_EN', 'BIAS_EN', 'MAX_POOL_EN', 'SIMD_LANE', 'SA_ROWS', 'SA_COLS', 'SA_SIMD_LANE', 'FRE', \
+  'DATA_W0', 'DATA_W1', 'DATA_W2', 'BUS_W']
+# the local cache evicts its least recently used entries beyond this number of entries
+LATENCY_CACHE_MAX_ENTRIES = 1 << 20
+
+'''
+create the latency cache used by model_latency_est and model_latency_est_batch
+entries are kept in a per-process LRU dict, shared is an optional dict (e.g. multiprocessing.Manager().dict()) visible to
+all workers. each lookup of the shared dict that misses the local dict is a round trip to the manager process, so it only
+pays off when the per-layer searches are expensive (scalar estimator, dynamic tiling level 2). the new entries are
+published to the shared dict in one update per task by latency_cache_flush
+'''
+def latency_cache_create(shared = None):
+  cache = {}
+  cache['local'] = collections.OrderedDict()
+  cache['shared'] = shared
+  cache['pending'] = {}
+  cache['hit'] = 0
+  cache['miss'] = 0
+  return cache
+
+def latency_cache_get(cache, key, share = True):
+  if cache is None:
+    return None
+  value = cache['local'].get(key)
+  if value is not None:
+    cache['local'].move_to_end(key)
+  elif share and cache['shared'] is not None:
+    value = cache['shared'].get(key)
+    if value is not None:
+      latency_cache_put(cache, key, value, share = False)
+  if value is None:
+    cache['miss'] += 1
+  else:
+    cache['hit'] += 1
+  return value
+
+def latency_cache_put(cache, key, value, share = True):
+  if cache is None:
+    return
+  cache['local'][key] = value
+  cache['local'].move_to_end(key)
+  while len(cache['local']) > LATENCY_CACHE_MAX_ENTRIES:
+    cache['local'].popitem(last = False)
+  if share and cache['shared'] is not None:
+    cache['pending'][key] = value
+
+'''
+cache of the entries tied to one batch of design points, the arrays of the batch estimators. they are only reused
+within one estimator call, so they are kept out of the LRU of cache, which counts entries and not bytes, and dropped
+with the call. latency_cache_close adds the hits and misses of the scope to cache
+'''
+def latency_cache_scope(cache):
+  if cache is None:
+    return None
+  return latency_cache_create()
+
+def latency_cache_close(cache, scope):
+  if cache is None:
+    return
+  cache['hit'] += scope['hit']
+  cache['miss'] += scope['miss']
+
+'''
+publish the entries put since the last flush to the shared dict
+'''
+def latency_cache_flush(cache):
+  if cache is None or cache['shared'] is None or len(cache['pending']) == 0:
+    return
+  cache['shared'].update(cache['pending'])
+  cache['pending'] = {}
+
+'''
+search the tiling candidates of one layer, return the optimal latency and in_num_t/out_num_t, in_h_t, in_w_t
+the results are memoized in cache on the layer configuration, the array configuration and the candidates
+as in the original search loop, the tiling factors in layer_params are left at the last candidates
+'''
+def layer_tiling_search(layer_params, layer_in_num_t_candidates, layer_out_num_t_candidates, layer_in_h_t_candidates, layer_in_w_t_candidates, cache = None):
+  key = None
+  if cache is not None:
+    key = (tuple(layer_params[k] for k in LAYER_LATENCY_KEYS), tuple(layer_in_num_t_candidates), tuple(layer_out_num_t_candidates), \
+      tuple(layer_in_h_t_candidates), tuple(layer_in_w_t_candidates))
+  opt = latency_cache_get(cache, key)
+  if opt is None:
+    opt_layer_latency = np.inf
+    for layer_in_num_t in layer_in_num_t_candidates:
+      for layer_out_num_t in layer_out_num_t_candidates:
+        for layer_in_h_t in layer_in_h_t_candidates:
+          for layer_in_w_t in layer_in_w_t_candidates:
+            layer_params['LAYER_IN_NUM_T'] = layer_in_num_t
+            layer_params['LAYER_OUT_NUM_T'] = layer_out_num_t
+            layer_params['LAYER_IN_H_T'] = layer_in_h_t
+            layer_params['LAYER_IN_W_T'] = layer_in_w_t
+            layer_params['LAYER_OUT_H_T'] = layer_in_h_t
+            layer_params['LAYER_OUT_W_T'] = layer_in_w_t
+            layer_latency = layer_latency_est(layer_params)
+            if layer_latency < opt_layer_latency:
+              opt_layer_latency = layer_latency
+              opt_layer_in_num_t = layer_in_num_t
+              opt_layer_out_num_t = layer_out_num_t
+              opt_layer_in_h_t = layer_in_h_t
+              opt_layer_in_w_t = layer_in_w_t
+    opt = (opt_layer_latency, opt_layer_in_num_t, opt_layer_out_num_t, opt_layer_in_h_t, opt_layer_in_w_t)
+    latency_cache_put(cache, key, opt)
+  else:
+    layer_params['LAYER_IN_NUM_T'] = layer_in_num_t_candidates[-1]
+    layer_params['LAYER_OUT_NUM_T'] = layer_out_num_t_candidates[-1]
+    layer_params['LAYER_IN_H_T'] = layer_in_h_t_candidates[-1]
+    layer_params['LAYER_IN_W_T'] = layer_in_w_t_candidates[-1]
+    layer_params['LAYER_OUT_H_T'] = layer_in_h_t_candidates[-1]
+    layer_params['LAYER_OUT_W_T'] = layer_in_w_t_candidates[-1]
+  return opt
+
+'''
+sweep each layer, pick up the optimal in_num_t/out_num_t, in_h_t, in_w_t
+the layers are walked in the order of schedule (see model_layer_schedule)
+the per-layer searches are memoized in cache if given (see latency_cache_create)
+'''
+def model_latency_est(params, schedule, layer_configs, dynamic_tiling_level, cache = None):
   latency = 0
-  layer_id = 0
   layer_out_num_t_prev = 0
+  concat_num_t = 0
   layer_in_num_t_list = []
   layer_out_num_t_list = []
   layer_in_h_t_list = []
   layer_in_w_t_list = []
-  total_layer = VGG_LAYERS + STAGE1_LAYERS * 2 * STAGE1_ITER + STAGE2_LAYERS * 2 * STAGE2_ITER
-  while layer_id < total_layer:
-    if current_model == "VGG":
-      layer_params = params
-      layer_config = layer_configs[vgg_layer_cnt]
-      layer_params.update(layer_config)
-      # search for better in_num_t and out_num_t
-      in_num = layer_config['LAYER_IN_NUM']
-      out_num = layer_config['LAYER_OUT_NUM']
-      in_num_t = params['LAYER_IN_NUM_T']
-      out_num_t = params['LAYER_OUT_NUM_T']
-      in_h_t = params['LAYER_IN_H_T']
-      in_w_t = params['LAYER_IN_W_T']
-      sa_cols = params['SA_COLS']
-
-      if dynamic_tiling_level == 0:
-        layer_in_num_t_candidates = [in_num_t]
-        layer_out_num_t_candidates = [out_num_t]
+  for layer_idx, in_mode, out_mode in schedule:
+    layer_params = params
+    layer_config = layer_configs[layer_idx]
+    layer_params.update(layer_config)
+    # search for better in_num_t and out_num_t
+    in_num_t = params['LAYER_IN_NUM_T']
+    out_num_t = params['LAYER_OUT_NUM_T']
+    in_h_t = params['LAYER_IN_H_T']
+    in_w_t = params['LAYER_IN_W_T']
+    sa_cols = params['SA_COLS']
+
+    if dynamic_tiling_level == 0:
+      layer_in_num_t_candidates = [in_num_t]
+      layer_out_num_t_candidates = [out_num_t]
+    else:
+      if in_mode == "free":
+        layer_in_num_t_candidates = list(filter(lambda x : x % 8 == 0, range(1, in_num_t + 1)))
+      elif in_mode == "concat":
+        layer_in_num_t_candidates = [concat_num_t]
       else:
-        if layer_id == 0:
-          layer_in_num_t_candidates = list(filter(lambda x : x % 8 == 0, range(1, in_num_t + 1)))
-        elif layer_id == 12:
-          layer_in_num_t_candidates = [concat_num_t]
-        else:
-          layer_in_num_t_candidates = [layer_out_num_t_prev]
-
-        if layer_id == 11 or layer_id == 12:
-          layer_out_num_t_candidates = [concat_num_t]
-        else:
-          layer_out_num_t_candidates = list(filter(lambda x : x % 8 == 0, range(1, out_num_t + 1)))
-
-      if dynamic_tiling_level == 0 or dynamic_tiling_level == 1:
-        layer_in_h_t_candidates = [in_h_t]
-        layer_in_w_t_candidates = [in_w_t]
-      else:
-        layer_in_h_t_candidates = list(filter(lambda x : x % 2 == 0, range(1, in_h_t + 1)))
-        layer_in_w_t_candidates = list(filter(lambda x : x % sa_cols == 0, range(1, in_w_t + 1)))
-
-      opt_layer_latency = np.inf
-      for layer_in_num_t in layer_in_num_t_candidates:
-        for layer_out_num_t in layer_out_num_t_candidates:
-          for layer_in_h_t in layer_in_h_t_candidates:
-            for layer_in_w_t in layer_in_w_t_candidates:
-              layer_params['LAYER_IN_NUM_T'] = layer_in_num_t
-              layer_params['LAYER_OUT_NUM_T'] = layer_out_num_t
-              layer_params['LAYER_IN_H_T'] = layer_in_h_t
-              layer_params['LAYER_IN_W_T'] = layer_in_w_t
-              layer_params['LAYER_OUT_H_T'] = layer_in_h_t
-              layer_params['LAYER_OUT_W_T'] = layer_in_w_t
-#             print(vgg_layer_cnt, layer_in_num_t, layer_out_num_t)
-              layer_latency = layer_latency_est(layer_params)
-              if layer_latency < opt_layer_latency:
-                opt_layer_latency = layer_latency
-                opt_layer_in_num_t = layer_in_num_t
-                opt_layer_out_num_t = layer_out_num_t
-                opt_layer_in_h_t = layer_in_h_t
-                opt_layer_in_w_t = layer_in_w_t
-
-#      print(opt_layer_latency, opt_layer_in_num_t, opt_layer_out_num_t)
-      layer_in_num_t_list.append(opt_layer_in_num_t)
-      layer_out_num_t_list.append(opt_layer_out_num_t)
-      layer_in_h_t_list.append(opt_layer_in_h_t)
-      layer_in_w_t_list.append(opt_layer_in_w_t)
-      latency += opt_layer_latency
-      layer_out_num_t_prev = opt_layer_out_num_t
-
-      if layer_id == 7:
-        concat_num_t = opt_layer_out_num_t
-#        print(concat_num_t)
-
-      vgg_layer_cnt = vgg_layer_cnt + 1
-      if vgg_layer_cnt == VGG_LAYERS:
-        current_model = "STAGE1"
-    elif current_model == "STAGE1":
-      layer_params = params
-      layer_config = layer_configs[VGG_LAYERS + stage1_layer_cnt + STAGE1_LAYERS * stage1_channel_cnt]
-      layer_params.update(layer_config)
-      # search for better in_num_t and out_num_t
-      in_num = layer_config['LAYER_IN_NUM']
-      out_num = layer_config['LAYER_OUT_NUM']
-      in_num_t = params['LAYER_IN_NUM_T']
-      out_num_t = params['LAYER_OUT_NUM_T']
-      in_h_t = params['LAYER_IN_H_T']
-      in_w_t = params['LAYER_IN_W_T']
-      sa_cols = params['SA_COLS']
-
-      if dynamic_tiling_level == 0:
-        layer_in_num_t_candidates = [in_num_t]
-        layer_out_num_t_candidates = [out_num_t]
-      else:
-        if stage1_layer_cnt == 0:
-          layer_in_num_t_candidates = [concat_num_t]
-        else:
-          layer_in_num_t_candidates = [layer_out_num_t_prev]
-
-        if stage1_layer_cnt == STAGE1_LAYERS - 1:
-          layer_out_num_t_candidates = [concat_num_t]
-        else:
-          layer_out_num_t_candidates = list(filter(lambda x : x % 8 == 0, range(1, out_num_t + 1)))
-
-      if dynamic_tiling_level == 0 or dynamic_tiling_level == 1:
-        layer_in_h_t_candidates = [in_h_t]
-        layer_in_w_t_candidates = [in_w_t]
-      else:
-        layer_in_h_t_candidates = list(filter(lambda x : x % 2 == 0, range(1, in_h_t + 1)))
-        layer_in_w_t_candidates = list(filter(lambda x : x % sa_cols == 0, range(1, in_w_t + 1)))
-
-      opt_layer_latency = np.inf
-      for layer_in_num_t in layer_in_num_t_candidates:
-        for layer_out_num_t in layer_out_num_t_candidates:
-          for layer_in_h_t in layer_in_h_t_candidates:
-            for layer_in_w_t in layer_in_w_t_candidates:
-              layer_params['LAYER_IN_NUM_T'] = layer_in_num_t
-              layer_params['LAYER_OUT_NUM_T'] = layer_out_num_t
-              layer_params['LAYER_IN_H_T'] = layer_in_h_t
-              layer_params['LAYER_IN_W_T'] = layer_in_w_t
-              layer_params['LAYER_OUT_H_T'] = layer_in_h_t
-              layer_params['LAYER_OUT_W_T'] = layer_in_w_t
-              layer_latency = layer_latency_est(layer_params)
-              if layer_latency < opt_layer_latency:
-                opt_layer_latency = layer_latency
-                opt_layer_in_num_t = layer_in_num_t
-                opt_layer_out_num_t = layer_out_num_t
-                opt_layer_in_h_t = layer_in_h_t
-                opt_layer_in_w_t = layer_in_w_t
-
-      layer_in_num_t_list.append(opt_layer_in_num_t)
-      layer_out_num_t_list.append(opt_layer_out_num_t)
-      layer_in_h_t_list.append(opt_layer_in_h_t)
-      layer_in_w_t_list.append(opt_layer_in_w_t)
-      latency += opt_layer_latency
-      layer_out_num_t_prev = opt_layer_out_num_t
-
-      stage1_layer_cnt = stage1_layer_cnt + 1
-      if stage1_layer_cnt == STAGE1_LAYERS:
-        stage1_layer_cnt = 0
-        stage1_channel_cnt = stage1_channel_cnt + 1
-        if stage1_channel_cnt == 2:
-          stage1_channel_cnt = 0
-          stage1_iter_cnt = stage1_iter_cnt + 1
-          if stage1_iter_cnt == STAGE1_ITER:
-            stage1_iter_cnt = 0
-            current_model = "STAGE2"
-    elif current_model == "STAGE2":
-      layer_params = params
-      layer_config = layer_configs[VGG_LAYERS + STAGE1_LAYERS * 2 * STAGE1_ITER + stage2_layer_cnt + STAGE2_LAYERS * stage2_channel_cnt]
-      layer_params.update(layer_config)
-      # search for better in_num_t and out_num_t
-      in_num = layer_config['LAYER_IN_NUM']
-      out_num = layer_config['LAYER_OUT_NUM']
-      in_num_t = params['LAYER_IN_NUM_T']
-      out_num_t = params['LAYER_OUT_NUM_T']
-      in_h_t = params['LAYER_IN_H_T']
-      in_w_t = params['LAYER_IN_W_T']
-      sa_cols = params['SA_COLS']
-
-      if dynamic_tiling_level == 0:
-        layer_in_num_t_candidates = [in_num_t]
-        layer_out_num_t_candidates = [out_num_t]
-      else:
-        if stage2_layer_cnt == 0:
-          layer_in_num_t_candidates = [concat_num_t]
-        else:
-          layer_in_num_t_candidates = [layer_out_num_t_prev]
-
-        if stage2_layer_cnt == STAGE2_LAYERS - 1:
-          layer_out_num_t_candidates = [concat_num_t]
-        else:
-          layer_out_num_t_candidates = list(filter(lambda x : x % 8 == 0, range(1, out_num_t + 1)))
-
-      if dynamic_tiling_level == 0 or dynamic_tiling_level == 1:
-        layer_in_h_t_candidates = [in_h_t]
-        layer_in_w_t_candidates = [in_w_t]
+        layer_in_num_t_candidates = [layer_out_num_t_prev]
+
+      if out_mode == "concat":
+        layer_out_num_t_candidates = [concat_num_t]
       else:
-        layer_in_h_t_candidates = list(filter(lambda x : x % 2 == 0, range(1, in_h_t + 1)))
-        layer_in_w_t_candidates = list(filter(lambda x : x % sa_cols == 0, range(1, in_w_t + 1)))
-
-      opt_layer_latency = np.inf
-      for layer_in_num_t in layer_in_num_t_candidates:
-        for layer_out_num_t in layer_out_num_t_candidates:
-          for layer_in_h_t in layer_in_h_t_candidates:
-            for layer_in_w_t in layer_in_w_t_candidates:
-              layer_params['LAYER_IN_NUM_T'] = layer_in_num_t
-              layer_params['LAYER_OUT_NUM_T'] = layer_out_num_t
-              layer_params['LAYER_IN_H_T'] = layer_in_h_t
-              layer_params['LAYER_IN_W_T'] = layer_in_w_t
-              layer_params['LAYER_OUT_H_T'] = layer_in_h_t
-              layer_params['LAYER_OUT_W_T'] = layer_in_w_t
-              layer_latency = layer_latency_est(layer_params)
-              if layer_latency < opt_layer_latency:
-                opt_layer_latency = layer_latency
-                opt_layer_in_num_t = layer_in_num_t
-                opt_layer_out_num_t = layer_out_num_t
-                opt_layer_in_h_t = layer_in_h_t
-                opt_layer_in_w_t = layer_in_w_t
-
-      layer_in_num_t_list.append(opt_layer_in_num_t)
-      layer_out_num_t_list.append(opt_layer_out_num_t)
-      layer_in_h_t_list.append(opt_layer_in_h_t)
-      layer_in_w_t_list.append(opt_layer_in_w_t)
-      latency += opt_layer_latency
-      layer_out_num_t_prev = opt_layer_out_num_t
-
-      stage2_layer_cnt = stage2_layer_cnt + 1
-      if stage2_layer_cnt == STAGE2_LAYERS:
-        stage2_layer_cnt = 0
-        stage2_channel_cnt = stage2_channel_cnt + 1
-        if stage2_channel_cnt == 2:
-          stage2_channel_cnt = 0
-          stage2_iter_cnt = stage2_iter_cnt + 1
-          if stage2_iter_cnt == STAGE2_ITER:
-            stage2_iter_cnt = 0
-            break
-    layer_id = layer_id + 1
+        layer_out_num_t_candidates = list(filter(lambda x : x % 8 == 0, range(1, out_num_t + 1)))
+
+    if dynamic_tiling_level == 0 or dynamic_tiling_level == 1:
+      layer_in_h_t_candidates = [in_h_t]
+      layer_in_w_t_candidates = [in_w_t]
+    else:
+      layer_in_h_t_candidates = list(filter(lambda x : x % 2 == 0, range(1, in_h_t + 1)))
+      layer_in_w_t_candidates = list(filter(lambda x : x % sa_cols == 0, range(1, in_w_t + 1)))
+
+    opt_layer_latency, opt_layer_in_num_t, opt_layer_out_num_t, opt_layer_in_h_t, opt_layer_in_w_t = layer_tiling_search(layer_params, \
+      layer_in_num_t_candidates, layer_out_num_t_candidates, layer_in_h_t_candidates, layer_in_w_t_candidates, cache)
+
+    layer_in_num_t_list.append(opt_layer_in_num_t)
+    layer_out_num_t_list.append(opt_layer_out_num_t)
+    layer_in_h_t_list.append(opt_layer_in_h_t)
+    layer_in_w_t_list.append(opt_layer_in_w_t)
+    latency += opt_layer_latency
+    layer_out_num_t_prev = opt_layer_out_num_t
+    if out_mode == "first":
+      concat_num_t = opt_layer_out_num_t
 
   params['LAYER_IN_NUM_T_LIST'] = layer_in_num_t_list
   params['LAYER_OUT_NUM_T_LIST'] = layer_out_num_t_list
@@ -389,6 +430,386 @@ def model_latency_est(params, model_config, layer_configs, dynamic_tiling_level)
   params['LAYER_IN_W_T_LIST'] = layer_in_w_t_list
   return latency, params
 
+'''
+get the layer sequence walked by the latency estimators from the network IR, one entry per execution of a layer in the
+order of network_ir.net_schedule, with the index in layer_configs of the first execution of the layer, the repeated
+executions of the stages share their configurations, and how the in_num_t/out_num_t candidates are chosen under dynamic
+tiling. all the layers that write or read a concatenation share one channel tile, concat_num_t.
+in_mode: "free" (multiples of 8) for the layers that read the network input,
+         "concat" (concat_num_t) for the layers that read a concatenation, and the max pooling layers that write one,
+         as the pooling keeps the channel tiles,
+         "prev" (out_num_t of the previous layer) for the others, which must read the previous layer
+out_mode: "first" (multiples of 8) for the first layer that writes a concatenation, its out_num_t sets concat_num_t,
+          "concat" (concat_num_t) for the other layers that write a concatenation, "free" (multiples of 8) for the others
+'''
+def model_layer_schedule(net):
+  order = [int(layer_id) for layer_id in network_ir.net_schedule(net)]
+  first_exec = {}
+  concat_set = False
+  schedule = []
+  for exec_id, layer_id in enumerate(order):
+    layer = net[layer_id]
+    first_exec.setdefault(layer_id, exec_id)
+    if not layer['out_concat']:
+      out_mode = "free"
+    elif concat_set:
+      out_mode = "concat"
+    else:
+      out_mode = "first"
+      concat_set = True
+    srcs = network_ir.net_concat_sources(net, layer_id)
+    if len(srcs) == 0:
+      in_mode = "free"
+    elif layer['in_concat'] or (layer['pool_en'] and out_mode == "concat"):
+      in_mode = "concat"
+    elif exec_id > 0 and srcs[0] == order[exec_id - 1]:
+      in_mode = "prev"
+    else:
+      raise ValueError("layer %s reads %s, which is not the layer executed before it, the DSE chains the channel tiles of consecutive layers" \
+        % (layer['name'], net[srcs[0]]['name']))
+    schedule.append((first_exec[layer_id], in_mode, out_mode))
+  return schedule
+
+'''
+vectorized model_latency_est over a batch of systolic array configurations
+sa_rows, sa_cols, sa_lane and fre are 1-D arrays, one entry per design point
+the per-layer tiling search of model_latency_est is reproduced with masked candidate grids, including the way the
+candidate bounds in params follow the last searched candidates
+return the latency array and the per-layer tiling lists/final tiling factors as 2-D/1-D arrays
+the per-layer searches of the call are memoized if cache is given (see latency_cache_scope)
+'''
+def model_latency_est_batch(params, schedule, layer_configs, dynamic_tiling_level, sa_rows, sa_cols, sa_lane, fre, cache = None):
+  n = len(sa_rows)
+  batch_cache = latency_cache_scope(cache)
+  sa_rows = np.asarray(sa_rows).reshape(n, 1, 1, 1, 1)
+  sa_cols = np.asarray(sa_cols).reshape(n, 1, 1, 1, 1)
+  sa_lane = np.asarray(sa_lane).reshape(n, 1, 1, 1, 1)
+  fre = np.asarray(fre).reshape(n, 1, 1, 1, 1)
+  rows = np.arange(n)
+
+  # the tiling factors left in params by the previous layer, they bound the candidates of the next layer
+  in_num_t = np.full(n, params['LAYER_IN_NUM_T'], dtype = np.int64)
+  out_num_t = np.full(n, params['LAYER_OUT_NUM_T'], dtype = np.int64)
+  in_h_t = np.full(n, params['LAYER_IN_H_T'], dtype = np.int64)
+  in_w_t = np.full(n, params['LAYER_IN_W_T'], dtype = np.int64)
+  layer_out_num_t_prev = np.zeros(n, dtype = np.int64)
+  concat_num_t = np.zeros(n, dtype = np.int64)
+
+  latency = np.zeros(n)
+  layer_in_num_t_list = np.zeros((n, len(schedule)), dtype = np.int64)
+  layer_out_num_t_list = np.zeros((n, len(schedule)), dtype = np.int64)
+  layer_in_h_t_list = np.zeros((n, len(schedule)), dtype = np.int64)
+  layer_in_w_t_list = np.zeros((n, len(schedule)), dtype = np.int64)
+
+  for layer_id, (layer_idx, in_mode, out_mode) in enumerate(schedule):
+    layer_params = dict(params)
+    layer_params.update(layer_configs[layer_idx])
+
+    # candidate grids, axis 0 for design points, axes 1-4 for in_num_t, out_num_t, in_h_t, in_w_t
+    if dynamic_tiling_level == 0:
+      in_cand = in_num_t.reshape(n, 1, 1, 1, 1)
+      out_cand = out_num_t.reshape(n, 1, 1, 1, 1)
+      in_valid = True
+      out_valid = True
+    else:
+      if in_mode == "free":
+        in_cand = np.arange(8, in_num_t.max() + 1, 8).reshape(1, -1, 1, 1, 1)
+        in_valid = in_cand <= in_num_t.reshape(n, 1, 1, 1, 1)
+      elif in_mode == "concat":
+        in_cand = concat_num_t.reshape(n, 1, 1, 1, 1)
+        in_valid = True
+      else:
+        in_cand = layer_out_num_t_prev.reshape(n, 1, 1, 1, 1)
+        in_valid = True
+      if out_mode == "concat":
+        out_cand = concat_num_t.reshape(n, 1, 1, 1, 1)
+        out_valid = True
+      else:
+        out_cand = np.arange(8, out_num_t.max() + 1, 8).reshape(1, 1, -1, 1, 1)
+        out_valid = out_cand <= out_num_t.reshape(n, 1, 1, 1, 1)
+
+    if dynamic_tiling_level == 0 or dynamic_tiling_level == 1:
+      h_cand = in_h_t.reshape(n, 1, 1, 1, 1)
+      w_cand = in_w_t.reshape(n, 1, 1, 1, 1)
+      h_valid = True
+      w_valid = True
+    else:
+      h_cand = np.arange(2, in_h_t.max() + 1, 2).reshape(1, 1, 1, -1, 1)
+      h_valid = h_cand <= in_h_t.reshape(n, 1, 1, 1, 1)
+      w_cand = np.arange(1, in_w_t.max() + 1).reshape(1, 1, 1, 1, -1)
+      w_valid = (w_cand <= in_w_t.reshape(n, 1, 1, 1, 1)) & (w_cand % sa_cols == 0)
+
+    # the search only depends on the layer and the bounds, the repeated stage layers hit the cache
+    key = None
+    if batch_cache is not None:
+      key = (tuple(layer_params[k] for k in LAYER_LATENCY_KEYS if k in layer_configs[layer_idx]), in_mode, out_mode, \
+        in_num_t.tobytes(), out_num_t.tobytes(), in_h_t.tobytes(), in_w_t.tobytes(), layer_out_num_t_prev.tobytes(), concat_num_t.tobytes())
+    opt = latency_cache_get(batch_cache, key)
+    if opt is None:
+      layer_latency = layer_latency_est_batch(layer_params, in_cand, out_cand, h_cand, w_cand, sa_rows, sa_cols, sa_lane, fre)
+      valid = in_valid & out_valid & h_valid & w_valid
+      layer_latency = np.where(valid, layer_latency, np.inf)
+      grid_shape = layer_latency.shape
+      layer_latency = layer_latency.reshape(n, -1)
+      # argmin picks the first minimum in the loop order of model_latency_est
+      opt_idx = np.argmin(layer_latency, axis = 1)
+      opt_layer_latency = layer_latency[rows, opt_idx]
+      opt_idx = np.unravel_index(opt_idx, grid_shape[1:])
+
+      opt_tiling = []
+      for cand, idx in zip([in_cand, out_cand, h_cand, w_cand], opt_idx):
+        cand = np.broadcast_to(cand, (n,) + cand.shape[1:]).reshape(n, -1)
+        opt_tiling.append(cand[rows, idx])
+      opt = (opt_layer_latency,) + tuple(opt_tiling)
+      latency_cache_put(batch_cache, key, opt)
+    opt_layer_latency, opt_layer_in_num_t, opt_layer_out_num_t, opt_layer_in_h_t, opt_layer_in_w_t = opt
+
+    layer_in_num_t_list[:, layer_id] = opt_layer_in_num_t
+    layer_out_num_t_list[:, layer_id] = opt_layer_out_num_t
+    layer_in_h_t_list[:, layer_id] = opt_layer_in_h_t
+    layer_in_w_t_list[:, layer_id] = opt_layer_in_w_t
+    latency += opt_layer_latency
+
+    # move the bounds to the last candidates
+    if dynamic_tiling_level != 0:
+      if in_mode == "free":
+        in_num_t = in_num_t // 8 * 8
+      elif in_mode == "concat":
+        in_num_t = concat_num_t
+      else:
+        in_num_t = layer_out_num_t_prev
+      if out_mode == "concat":
+        out_num_t = concat_num_t
+      else:
+        out_num_t = out_num_t // 8 * 8
+    if dynamic_tiling_level == 2:
+      in_h_t = in_h_t // 2 * 2
+      in_w_t = in_w_t // sa_cols.reshape(n) * sa_cols.reshape(n)
+    layer_out_num_t_prev = opt_layer_out_num_t
+    if out_mode == "first":
+      concat_num_t = opt_layer_out_num_t
+  latency_cache_close(cache, batch_cache)
+
+  res = {}
+  res['LAYER_IN_NUM_T'] = in_num_t
+  res['LAYER_OUT_NUM_T'] = out_num_t
+  res['LAYER_IN_H_T'] = in_h_t
+  res['LAYER_IN_W_T'] = in_w_t
+  res['LAYER_IN_NUM_T_LIST'] = layer_in_num_t_list
+  res['LAYER_OUT_NUM_T_LIST'] = layer_out_num_t_list
+  res['LAYER_IN_H_T_LIST'] = layer_in_h_t_list
+  res['LAYER_IN_W_T_LIST'] = layer_in_w_t_list
+  return latency, res
+
+'''
+min-plus product of the cost matrices of two chained segments, vectorized over the design points
+a[:, i, k] is the cost from the input state i to the output state k, b[:, k, j] from k to j
+return the cost from i to j and the intermediate state k that reaches it
+'''
+def tiling_min_plus(a, b):
+  cost = a[:, :, :, np.newaxis] + b[:, np.newaxis, :, :]
+  idx = np.argmin(cost, axis = 2)
+  cost = np.take_along_axis(cost, idx[:, :, np.newaxis, :], axis = 2)[:, :, 0, :]
+  return cost, idx
+
+'''
+search a chain of layers where the in_num_t of each layer is the out_num_t of the previous one
+costs is the list of the cost matrices of the layers, indexed by [design point, in_num_t, out_num_t]
+return the cost matrix of the chain and the back pointers used by tiling_chain_path
+'''
+def tiling_chain(costs):
+  total = costs[0]
+  backs = []
+  for cost in costs[1:]:
+    total, idx = tiling_min_plus(total, cost)
+    backs.append(idx)
+  return total, backs
+
+'''
+recover the in_num_t/out_num_t states of each layer of a chain given its input and output states
+return two lists of state arrays, one entry per layer
+'''
+def tiling_chain_path(backs, start, end):
+  rows = np.arange(len(start))
+  outs = [end]
+  for idx in reversed(backs):
+    outs.insert(0, idx[rows, start, outs[0]])
+  ins = [start] + outs[:-1]
+  return ins, outs
+
+'''
+split the schedule into the chains of layers searched by model_latency_est_dp. the layers of a chain read the layer
+before them ("prev"), a chain starts at a layer that reads the network input or concat_num_t and ends at a layer that
+writes concat_num_t, or before the start of the next chain. the repeated executions of a chain are counted once.
+return a list of (layer indices, in_mode of the chain, "free" or "concat", out_mode of the chain, "free", "first" or
+"concat", number of executions)
+'''
+def model_layer_chains(schedule):
+  execs = {}
+  for layer_idx, in_mode, out_mode in schedule:
+    execs[layer_idx] = execs.get(layer_idx, 0) + 1
+  chains = []
+  chain = None
+  seen = set()
+  for layer_idx, in_mode, out_mode in schedule:
+    if layer_idx in seen:
+      continue
+    seen.add(layer_idx)
+    if chain is None or in_mode != "prev":
+      if chain is not None:
+        chains.append(tuple(chain))
+      # a chain that starts with "prev" follows a chain that ends with concat_num_t
+      chain = [[layer_idx], "free" if in_mode == "free" else "concat", out_mode, execs[layer_idx]]
+    else:
+      if execs[layer_idx] != chain[3]:
+        raise ValueError("the layers of a chain are executed %d and %d times" % (chain[3], execs[layer_idx]))
+      chain[0].append(layer_idx)
+      chain[2] = out_mode
+    if out_mode != "free":
+      chains.append(tuple(chain))
+      chain = None
+  if chain is not None:
+    chains.append(tuple(chain))
+  return chains
+
+'''
+exact version of the per-layer tiling search of model_latency_est, vectorized over the systolic array configurations
+the in_num_t of each layer is chained to the out_num_t of the previous layer, and the layers that write or read the
+concatenations share one concat_num_t (see model_layer_schedule).
+for each concat_num_t, the chains of layers between the network input and the concatenations (see model_layer_chains)
+are searched with min-plus products of the per-layer cost matrices (Viterbi), the concat_num_t with the lowest total
+latency is picked.
+each layer cost is minimized over in_h_t/in_w_t for dynamic_tiling_level 2.
+the channel tiles are the multiples of 8 up to the tiling configuration in params, which are kept as the buffer sizes.
+return the latency array and the per-layer tiling lists/tiling factors as model_latency_est_batch
+'''
+def model_latency_est_dp(params, schedule, layer_configs, dynamic_tiling_level, sa_rows, sa_cols, sa_lane, fre, cache = None):
+  n = len(sa_rows)
+  batch_cache = latency_cache_scope(cache)
+  sa_rows = np.asarray(sa_rows).reshape(n, 1, 1, 1, 1)
+  sa_cols = np.asarray(sa_cols).reshape(n, 1, 1, 1, 1)
+  sa_lane = np.asarray(sa_lane).reshape(n, 1, 1, 1, 1)
+  fre = np.asarray(fre).reshape(n, 1, 1, 1, 1)
+  rows = np.arange(n)
+
+  num_t = np.arange(8, min(params['LAYER_IN_NUM_T'], params['LAYER_OUT_NUM_T']) + 1, 8)
+  in_cand = num_t.reshape(1, -1, 1, 1, 1)
+  out_cand = num_t.reshape(1, 1, -1, 1, 1)
+  if dynamic_tiling_level == 1:
+    h_cand = np.array([params['LAYER_IN_H_T']]).reshape(1, 1, 1, 1, 1)
+    w_cand = np.array([params['LAYER_IN_W_T']]).reshape(1, 1, 1, 1, 1)
+    hw_valid = True
+  else:
+    h_cand = np.arange(2, params['LAYER_IN_H_T'] + 1, 2).reshape(1, 1, 1, -1, 1)
+    w_cand = np.arange(1, params['LAYER_IN_W_T'] + 1).reshape(1, 1, 1, 1, -1)
+    hw_valid = (w_cand % sa_cols == 0) & (h_cand > 0)
+
+  # cost matrices of the layers, the repeated stage layers share the same entry, and the layers of the same shape
+  # share the entry of the cache of the call
+  layer_costs = {}
+  layer_hw = {}
+  def layer_cost(layer_idx):
+    if layer_idx not in layer_costs:
+      key = None
+      if batch_cache is not None:
+        key = tuple(layer_configs[layer_idx][k] for k in LAYER_LATENCY_KEYS if k in layer_configs[layer_idx])
+      opt = latency_cache_get(batch_cache, key)
+      if opt is None:
+        layer_params = dict(params)
+        layer_params.update(layer_configs[layer_idx])
+        layer_latency = layer_latency_est_batch(layer_params, in_cand, out_cand, h_cand, w_cand, sa_rows, sa_cols, sa_lane, fre)
+        layer_latency = np.where(hw_valid, layer_latency, np.inf)
+        layer_latency = np.broadcast_to(layer_latency, (n, len(num_t), len(num_t)) + layer_latency.shape[3:])
+        layer_latency = layer_latency.reshape(n, len(num_t), len(num_t), -1)
+        hw_idx = np.argmin(layer_latency, axis = 3)
+        opt = (np.take_along_axis(layer_latency, hw_idx[:, :, :, np.newaxis], axis = 3)[:, :, :, 0], hw_idx)
+        latency_cache_put(batch_cache, key, opt)
+      layer_costs[layer_idx], layer_hw[layer_idx] = opt
+    return layer_costs[layer_idx]
+
+  # latency of each chain for each concat_num_t state, the free ends of the chains are minimized
+  num_states = len(num_t)
+  latency = np.zeros((n, num_states))
+  chain_ends = []
+  chain_backs = []
+  for layer_idxs, in_mode, out_mode, repeat in model_layer_chains(schedule):
+    cost, backs = tiling_chain([layer_cost(layer_idx) for layer_idx in layer_idxs])
+    concat_states = np.broadcast_to(np.arange(num_states), (n, num_states))
+    if in_mode == "concat" and out_mode != "free":
+      chain_latency = np.diagonal(cost, axis1 = 1, axis2 = 2)
+      start, end = concat_states, concat_states
+    elif in_mode == "concat":
+      chain_latency = np.min(cost, axis = 2)
+      start, end = concat_states, np.argmin(cost, axis = 2)
+    elif out_mode != "free":
+      chain_latency = np.min(cost, axis = 1)
+      start, end = np.argmin(cost, axis = 1), concat_states
+    else:
+      flat_idx = np.argmin(cost.reshape(n, -1), axis = 1)
+      chain_latency = np.broadcast_to(cost.reshape(n, -1)[rows, flat_idx][:, np.newaxis], (n, num_states))
+      start, end = [np.broadcast_to(idx[:, np.newaxis], (n, num_states)) for idx in np.unravel_index(flat_idx, cost.shape[1:])]
+    latency = latency + chain_latency * repeat
+    chain_ends.append((layer_idxs, start, end))
+    chain_backs.append(backs)
+  concat = np.argmin(latency, axis = 1)
+  latency = latency[rows, concat]
+
+  # recover the states of each layer
+  layer_states = {}
+  for (layer_idxs, start, end), backs in zip(chain_ends, chain_backs):
+    ins, outs = tiling_chain_path(backs, start[rows, concat], end[rows, concat])
+    for layer_idx, in_state, out_state in zip(layer_idxs, ins, outs):
+      layer_states[layer_idx] = (in_state, out_state)
+
+  layer_in_num_t_list = np.zeros((n, len(schedule)), dtype = np.int64)
+  layer_out_num_t_list = np.zeros((n, len(schedule)), dtype = np.int64)
+  layer_in_h_t_list = np.zeros((n, len(schedule)), dtype = np.int64)
+  layer_in_w_t_list = np.zeros((n, len(schedule)), dtype = np.int64)
+  for layer_id, (layer_idx, in_mode, out_mode) in enumerate(schedule):
+    in_state, out_state = layer_states[layer_idx]
+    h_idx, w_idx = np.unravel_index(layer_hw[layer_idx][rows, in_state, out_state], (h_cand.size, w_cand.size))
+    layer_in_num_t_list[:, layer_id] = num_t[in_state]
+    layer_out_num_t_list[:, layer_id] = num_t[out_state]
+    layer_in_h_t_list[:, layer_id] = h_cand.reshape(-1)[h_idx]
+    layer_in_w_t_list[:, layer_id] = w_cand.reshape(-1)[w_idx]
+
+  res = {}
+  res['LAYER_IN_NUM_T'] = np.full(n, params['LAYER_IN_NUM_T'])
+  res['LAYER_OUT_NUM_T'] = np.full(n, params['LAYER_OUT_NUM_T'])
+  res['LAYER_IN_H_T'] = np.full(n, params['LAYER_IN_H_T'])
+  res['LAYER_IN_W_T'] = np.full(n, params['LAYER_IN_W_T'])
+  res['LAYER_IN_NUM_T_LIST'] = layer_in_num_t_list
+  res['LAYER_OUT_NUM_T_LIST'] = layer_out_num_t_list
+  res['LAYER_IN_H_T_LIST'] = layer_in_h_t_list
+  res['LAYER_IN_W_T_LIST'] = layer_in_w_t_list
+  latency_cache_close(cache, batch_cache)
+  return latency, res
+
+'''
+lower bound of the latency of model_latency_est for any tiling factors, vectorized over the systolic array configurations
+for each layer, the iterations of the pipeline cover the whole layer, so the stages bounded below are:
+point_conv: in_num * out_num * in_h * in_w * filter_s2^2 MACs on sa_rows * sa_cols * sa_lane PEs
+inter_load: in_num * in_h * in_w words through SIMD_LANE lanes
+relu: out_num * in_h * in_w words through SIMD_LANE lanes
+'''
+def model_latency_lb(params, schedule, layer_configs, sa_rows, sa_cols, sa_lane):
+  pe_num = np.asarray(sa_rows) * np.asarray(sa_cols) * np.asarray(sa_lane)
+  lane = params['SIMD_LANE']
+  latency = np.zeros(pe_num.shape)
+  for layer_idx, in_mode, out_mode in schedule:
+    layer_config = layer_configs[layer_idx]
+    in_num = layer_config['LAYER_IN_NUM']
+    out_num = layer_config['LAYER_OUT_NUM']
+    in_h = layer_config['LAYER_IN_H']
+    in_w = layer_config['LAYER_IN_W']
+    filter_s2 = layer_config['LAYER_FILTER_S2']
+    layer_latency = max(in_num, out_num) * in_h * in_w / lane
+    if layer_config['POINT_CONV_EN'] == 1:
+      layer_latency = np.maximum(layer_latency, in_num * out_num * in_h * in_w * filter_s2 * filter_s2 / pe_num)
+    latency = latency + layer_latency
+  # leave some room for the rounding errors of the estimators
+  return latency * (1 - 1e-9)
+
 def BRAM_SDP_predict_HLS(dw, s):
   if dw > 18:
     alpha = np.ceil(dw / 36)
@@ -444,14 +865,12 @@ def res_est(params):
 
   return DSP, BRAM18K
 
-def run(f_model, f_model_config, f_input_config, f_board, parallel_en, dynamic_tiling_level):
+def run(f_model, f_model_config, f_input_config, f_board, parallel_en, dynamic_tiling_level, est_mode, latency_cache, f_store, task_size = None, pareto_en = False, bnb_en = False, tiling_search = "greedy"):
   print("*************************************************")
   # record start time
   global_timer_start = time.time()
 
-  model = open(f_model, "r")
-  with open(f_model_config, "r") as f:
-    model_config = json.loads(f.read())
+  model_config = network_ir.model_config_load(f_model, f_model_config)
   with open(f_input_config, "r") as f:
     input_config = json.loads(f.read())
   with open(f_board, "r") as f:
@@ -460,7 +879,17 @@ def run(f_model, f_model_config, f_input_config, f_board, parallel_en, dynamic_t
   config = {}
   config['BOARD'] = board_info
   config['DYNAMIC_TILING_LEVEL'] = dynamic_tiling_level
+  config['EST_MODE'] = est_mode
+  config['LATENCY_CACHE'] = latency_cache
+  config['LATENCY_CACHE_SHARED'] = None
   print('Dynamic tiling level: ', dynamic_tiling_level)
+  print('Latency estimator: ', est_mode)
+  print('Latency cache: ', latency_cache)
+  config['PARETO'] = pareto_en
+  config['TILING_SEARCH'] = tiling_search
+  print('Tiling search: ', tiling_search)
+  config['BNB'] = bnb_en
+  config['STORE'] = f_store
 
   params = {}
   """
@@ -482,367 +911,99 @@ def run(f_model, f_model_config, f_input_config, f_board, parallel_en, dynamic_t
   """
   Model Params
   """
-  # openpose_thin model
-  VGG_LAYERS = model_config["VGG_LAYERS"]
-  STAGE1_LAYERS = model_config["STAGE1_LAYERS"]
-  STAGE1_ITER = model_config["STAGE1_ITER"]
-  STAGE2_LAYERS = model_config["STAGE2_LAYERS"]
-  STAGE2_ITER = model_config["STAGE2_ITER"]
 
   # input info
   network_in_num = input_config["IN_NUM"]
   network_in_h = input_config["IN_H"]
   network_in_w = input_config["IN_W"]
 
-  # get the maximal channel number throughout the network, get the layer configurations
-  network_channel_max = network_in_num
-  lines = []
-  for i in model.readlines():
-    lines.append(i)
-  line_num = len(lines)
-
-  layer_configs = []
-  line_id = 1
-  current_model = "VGG"
-  stage1_line_id = 0
-  stage2_line_id = 0
-  vgg_layer_cnt = 0
-  stage1_layer_cnt = 0
-  stage1_iter_cnt = 0
-  stage2_layer_cnt = 0
-  stage2_iter_cnt = 0
-  stage1_channel_cnt = 0
-  stage2_channel_cnt = 0
-
-  in_num = network_in_num
-  out_num = network_in_num
-  in_h = network_in_h
-  in_w = network_in_w
-  out_h = network_in_h
-  out_w = network_in_w
-
-  while line_id < len(lines):
-    line = lines[line_id].strip('\n')
-    content = line.split(",")
-    if current_model == "VGG":
-      network_channel_max = max(network_channel_max, int(content[2]))
-      relu_en = 0
-      pool_en = 0
-      bias_en = 0
-      if len(content) > 1 and content[6] == "1":
-        bias_en = 1
-      if len(content) > 1 and content[5] == "1":
-        relu_en = 1
-      if len(content) > 1 and content[1] == "max_pool":
-        pool_en = 1
-      layer_name = content[0]
-      layer_type = content[1]
-
-      in_num = out_num
-      in_h = out_h
-      in_w = out_w
-      out_num = int(content[2])
-      filter_s = int(content[3])
-      stride = int(content[4])
-
-      if layer_name == "Conv2d_3_pool":
-        in_num = Conv2d_3_out_num
-        in_h = Conv2d_3_out_h
-        in_w = Conv2d_3_out_w
-
-      if stride == 2:
-        out_h = int(np.ceil(float(in_h) / 2))
-        out_w = int(np.ceil(float(in_w) / 2))
-      else:
-        out_h = in_h
-        out_w = in_w
-
-      if layer_name == "Conv2d_3":
-        Conv2d_3_out_num = out_num
-        Conv2d_3_out_h = out_h
-        Conv2d_3_out_w = out_w
-
-      if layer_name == "Conv2d_7":
-        Conv2d_7_out_num = out_num
-        Conv2d_7_out_h = out_h
-        Conv2d_7_out_w = out_w
-
-      if layer_name == "Conv2d_11":
-        Conv2d_11_out_num = out_num
-        Conv2d_11_out_h = out_h
-        Conv2d_11_out_w = out_w
-
-      if layer_name == "Conv2d_3_pool":
-        Conv2d_3_pool_out_num = out_num
-        Conv2d_3_pool_out_h = out_h
-        Conv2d_3_pool_out_w = out_w
-
-      if layer_type == "separable_conv":
-        depth_conv_en = 1
-        point_conv_en = 1
-      elif layer_type == "convb":
-        depth_conv_en = 0
-        point_conv_en = 1
-      elif layer_type == "max_pool":
-        depth_conv_en = 0
-        point_conv_en = 0
-
-      layer_config = {}
-      layer_config['LAYER_IN_NUM'] = in_num
-      layer_config['LAYER_OUT_NUM'] = out_num
-      layer_config['LAYER_IN_H'] = in_h
-      layer_config['LAYER_IN_W'] = in_w
-      if layer_type == 'separable_conv':
-        layer_config['LAYER_FILTER_S1'] = filter_s
-        layer_config['LAYER_FILTER_S2'] = 1
-      elif layer_type == 'convb':
-        layer_config['LAYER_FILTER_S1'] = 1
-        layer_config['LAYER_FILTER_S2'] = filter_s
-      elif layer_type == 'max_pool':
-        layer_config['LAYER_FILTER_S1'] = 1
-        layer_config['LAYER_FILTER_S2'] = 1
-      layer_config['LAYER_STRIDE'] = stride
-      layer_config['DEPTH_CONV_EN'] = depth_conv_en
-      layer_config['POINT_CONV_EN'] = point_conv_en
-      layer_config['BIAS_EN'] = bias_en
-      layer_config['MAX_POOL_EN'] = pool_en
-      layer_configs.append(layer_config)
-
-      vgg_layer_cnt = vgg_layer_cnt + 1
-      if vgg_layer_cnt == VGG_LAYERS:
-        current_model = "STAGE1"
-    elif current_model == "STAGE1":
-      network_channel_max = max(network_channel_max, int(content[2]))
-      relu_en = 0
-      pool_en = 0
-      bias_en = 0
-      if len(content) > 1 and content[6] == "1":
-        bias_en = 1
-      if len(content) > 1 and content[5] == "1":
-        relu_en = 1
-      if len(content) > 1 and content[1] == "max_pool":
-        pool_en = 1
-      layer_name = content[0]
-      layer_type = content[1]
-
-      in_num = out_num
-      in_h = out_h
-      in_w = out_w
-      out_num = int(content[2])
-      filter_s = int(content[3])
-      stride = int(content[4])
-
-      if stage1_layer_cnt == 0:
-        in_num = Conv2d_3_pool_out_num + Conv2d_7_out_num + Conv2d_11_out_num
-        in_h = Conv2d_3_pool_out_h
-        in_w = Conv2d_3_pool_out_w
-
-      if stride == 2:
-        out_h = int(ceil(float(in_h) / 2))
-        out_w = int(ceil(float(in_w) / 2))
-      else:
-        out_h = in_h
-        out_w = in_w
-
-      if layer_name == "MConv_Stage1_L1_5":
-        MConv_Stage1_L1_5_out_num = out_num
-        MConv_Stage1_L1_5_out_h = out_h
-        MConv_Stage1_L1_5_out_w = out_w
-
-      if layer_name == "MConv_Stage1_L2_5":
-        MConv_Stage1_L2_5_out_num = out_num
-        MConv_Stage1_L2_5_out_h = out_h
-        MConv_Stage1_L2_5_out_w = out_w
-
-      if layer_type == "separable_conv":
-        depth_conv_en = 1
-        point_conv_en = 1
-      elif layer_type == "convb":
-        depth_conv_en = 0
-        point_conv_en = 1
-      elif layer_type == "max_pool":
-        depth_conv_en = 0
-        point_conv_en = 0
-
-      layer_config = {}
-      layer_config['LAYER_IN_NUM'] = in_num
-      layer_config['LAYER_OUT_NUM'] = out_num
-      layer_config['LAYER_IN_H'] = in_h
-      layer_config['LAYER_IN_W'] = in_w
-      if layer_type == 'separable_conv':
-        layer_config['LAYER_FILTER_S1'] = filter_s
-        layer_config['LAYER_FILTER_S2'] = 1
-      elif layer_type == 'convb':
-        layer_config['LAYER_FILTER_S1'] = 1
-        layer_config['LAYER_FILTER_S2'] = filter_s
-      elif layer_type == 'max_pool':
-        layer_config['LAYER_FILTER_S1'] = 1
-        laeyr_config['LAYER_FILTER_S2'] = 1
-      layer_config['LAYER_STRIDE'] = stride
-      layer_config['DEPTH_CONV_EN'] = depth_conv_en
-      layer_config['POINT_CONV_EN'] = point_conv_en
-      layer_config['BIAS_EN'] = bias_en
-      layer_config['MAX_POOL_EN'] = pool_en
-      layer_configs.append(layer_config)
-
-      stage1_layer_cnt = stage1_layer_cnt + 1
-      if stage1_layer_cnt == STAGE1_LAYERS:
-        stage1_layer_cnt = 0
-        stage1_channel_cnt = stage1_channel_cnt + 1
-        if stage1_channel_cnt == 2:
-          stage1_channel_cnt = 0
-          stage1_iter_cnt = stage1_iter_cnt + 1
-          if stage1_iter_cnt == STAGE1_ITER:
-            stage1_iter_cnt = 0
-            stage2_line_id = line_id + 1
-            current_model = "STAGE2"
-    elif current_model == "STAGE2":
-      network_channel_max = max(network_channel_max, int(content[2]))
-      relu_en = 0
-      pool_en = 0
-      bias_en = 0
-      if len(content) > 1 and content[6] == "1":
-        bias_en = 1
-      if len(content) > 1 and content[5] == "1":
-        relu_en = 1
-      if len(content) > 1 and content[1] == "max_pool":
-        pool_en = 1
-      layer_name = content[0]
-      layer_type = content[1]
-
-      in_num = out_num
-      in_h = out_h
-      in_w = out_w
-      out_num = int(content[2])
-      filter_s = int(content[3])
-      stride = int(content[4])
-
-      if stage2_layer_cnt == 0:
-        in_num = MConv_Stage1_L1_5_out_num + MConv_Stage1_L2_5_out_num + Conv2d_3_pool_out_num + Conv2d_7_out_num + Conv2d_11_out_num
-        in_h = Conv2d_3_pool_out_h
-        in_w = Conv2d_3_pool_out_w
-
-      if stride == 2:
-        out_h = int(ceil(float(in_h) / 2))
-        out_w = int(ceil(float(in_w) / 2))
-      else:
-        out_h = in_h
-        out_w = in_w
-
-      if layer_name == "MConv_Stage2_L1_5":
-        MConv_Stage2_L1_5_out_num = out_num
-        MConv_Stage2_L1_5_out_h = out_h
-        MConv_Stage2_L1_5_out_w = out_w
-
-      if layer_name == "MConv_Stage2_L2_5":
-        MConv_Stage2_L2_5_out_num = out_num
-        MConv_Stage2_L2_5_out_h = out_h
-        MConv_Stage2_L2_5_out_w = out_w
-
-      if layer_type == "separable_conv":
-        depth_conv_en = 1
-        point_conv_en = 1
-      elif layer_type == "convb":
-        depth_conv_en = 0
-        point_conv_en = 1
-      elif layer_type == "max_pool":
-        depth_conv_en = 0
-        point_conv_en = 0
-
-      layer_config = {}
-      layer_config['LAYER_IN_NUM'] = in_num
-      layer_config['LAYER_OUT_NUM'] = out_num
-      layer_config['LAYER_IN_H'] = in_h
-      layer_config['LAYER_IN_W'] = in_w
-      if layer_type == 'separable_conv':
-        layer_config['LAYER_FILTER_S1'] = filter_s
-        layer_config['LAYER_FILTER_S2'] = 1
-      elif layer_type == 'convb':
-        layer_config['LAYER_FILTER_S1'] = 1
-        layer_config['LAYER_FILTER_S2'] = filter_s
-      elif layer_type == 'max_pool':
-        layer_config['LAYER_FILTER_S1'] = 1
-        laeyr_config['LAYER_FILTER_S2'] = 1
-      layer_config['LAYER_STRIDE'] = stride
-      layer_config['DEPTH_CONV_EN'] = depth_conv_en
-      layer_config['POINT_CONV_EN'] = point_conv_en
-      layer_config['BIAS_EN'] = bias_en
-      layer_config['MAX_POOL_EN'] = pool_en
-      layer_configs.append(layer_config)
-
-      stage2_layer_cnt = stage2_layer_cnt + 1
-      if stage2_layer_cnt == STAGE2_LAYERS:
-        stage2_layer_cnt = 0
-        stage2_channel_cnt = stage2_channel_cnt + 1
-        if stage2_channel_cnt == 2:
-          stage2_channel_cnt = 0
-          stage2_iter_cnt = stage2_iter_cnt + 1
-          if stage2_iter_cnt == STAGE2_ITER:
-            stage2_iter_cnt = 0
-            current_model = "STAGE2"
-            break
-          else:
-            line_id = stage2_line_id - 1
-    line_id = line_id + 1
+  # get the maximal channel number throughout the network
+  net = network_ir.net_build(f_model, model_config, input_config)
+  network_channel_max = max(network_in_num, int(np.max(net['out_num'])))
+  # the layer sequence of the estimators, checked here before the workers start
+  model_layer_schedule(net)
+  if f_store is not None:
+    # the parameters set above (data precision, K_T) are covered by the tiling configuration of each point
+    config['STORE_KEY'] = dse_store.store_key(net, ESTIMATOR_VERSION, [dynamic_tiling_level, tiling_search])
+    dse_store.store_create(f_store).close()
+    print('DSE store: %s (%s)' % (f_store, config['STORE_KEY']))
 
   # Start the design space exploration
   # It works in a greedy fashion, as we will minimize the latency layer by layer.
-  opt_latency = np.inf
-  opt_DSP = np.inf
-  opt_BRAM18K = np.inf
-  opt_params = {}
-
-  params_list = []
-  for IN_H_T in list(filter(lambda x : network_in_h % x == 0 and x % 2 == 0, range(1, int(network_in_h / 8) + 1))): # upper_bound
-    for IN_W_T in list(filter(lambda x : network_in_w % x == 0 and x % 2 == 0, range(1, int(network_in_w / 8) + 1))): # upper_bound
-      for IN_NUM_T in list(filter(lambda x : network_channel_max % x == 0 and x % 16 == 0, range(1, 128 + 1))): # upper_bound
-        for SIMD_LANE in list(filter(lambda x : IN_NUM_T % x == 0 and x % 2 == 0, range(1, min(IN_NUM_T, 8) + 1))):
-#          debug_cnt += 1
-#          print(debug_cnt)
-#          print(IN_NUM_T, IN_W_T, SIMD_LANE)
-          params['LAYER_IN_H_T'] = IN_H_T
-          params['LAYER_IN_W_T'] = IN_W_T
-          params['LAYER_OUT_H_T'] = IN_H_T
-          params['LAYER_OUT_W_T'] = IN_W_T
-          params['LAYER_IN_NUM_T'] = IN_NUM_T
-          params['LAYER_OUT_NUM_T'] = IN_NUM_T
-          params['SIMD_LANE'] = SIMD_LANE
-          tmp_params = dict(params)
-          params_list.append(tmp_params)
+  opt = {}
+  opt['opt_latency'] = np.inf
+  opt['opt_DSP'] = np.inf
+  opt['opt_BRAM18K'] = np.inf
+  opt['opt_params'] = {}
+
+  # the tiling configurations are enumerated on demand, only their number is needed here
+  num_tilings = sum(1 for tiling in tiling_candidates(network_in_h, network_in_w, network_channel_max))
 
   if parallel_en is True:
-    num_processes = int(multiprocessing.cpu_count() * 0.75)
+    num_processes = max(1, int(multiprocessing.cpu_count() * 0.75))
   else:
     num_processes = 1
   print('Parallelizing using %d processes...' % (num_processes))
 
-  chunks = list_split(params_list, num_processes)
-  pool = multiprocessing.Pool(processes = num_processes)
-  results = pool.starmap(param_sweep, [(chunk, config, model_config, layer_configs) for chunk in chunks])
-#  result = param_sweep(params_list, config, model_config, layer_configs)
-
-  print('Aggregating results...')
+  if latency_cache == "shared":
+    # the manager process has to stay alive until all the workers finish
+    manager = multiprocessing.Manager()
+    config['LATENCY_CACHE_SHARED'] = manager.dict()
+
+  # the inner loops of param_sweep vary a lot in size, the tiling configurations are dispatched in small tasks
+  # to keep all the workers busy
+  if task_size is None:
+    task_size = max(1, num_tilings // (num_processes * 16))
+  print('Dispatching %d tasks...' % (int(np.ceil(num_tilings / task_size))))
+  # the shared settings are sent once to each worker, the tasks only carry the tiling tuples
+  incumbent = multiprocessing.Value('d', 0.0)
+  pool = multiprocessing.Pool(processes = num_processes, initializer = pool_init, initargs = (params, config, net, incumbent))
+  results = pool.imap_unordered(param_sweep_task, sweep_tasks(tiling_candidates(network_in_h, network_in_w, network_channel_max), task_size))
+
+  # the results are reduced in the task order as they arrive, the tasks that finish early are buffered
+  cache_hit = 0
+  cache_miss = 0
+  store_hit = 0
+  store_miss = 0
+  if f_store is not None:
+    store = dse_store.store_create(f_store)
+  pending = {}
+  next_task_id = 0
+  front = []
+  front_objs = np.empty((0, 4))
+  bnb_pruned = 0
   for result in results:
-    cur_latency = result['opt_latency']
-    cur_DSP = result['opt_DSP']
-    cur_BRAM18K = result['opt_BRAM18K']
-    cur_params = result['opt_params']
-    if cur_latency < opt_latency:
-      opt_latency = cur_latency
-      opt_DSP = cur_DSP
-      opt_BRAM18K = cur_BRAM18K
-      opt_params = cur_params
-    elif cur_latency == opt_latency:
-      if cur_DSP < opt_DSP or (cur_DSP == opt_DSP and cur_BRAM18K < opt_BRAM18K):
-        opt_latency = cur_latency
-        opt_DSP = cur_DSP
-        opt_BRAM18K = cur_BRAM18K
-        opt_params = cur_params
-
-  opt_latency = result['opt_latency']
-  opt_DSP = result['opt_DSP']
-  opt_BRAM18K = result['opt_BRAM18K']
-  opt_params = result['opt_params']
+    cache_hit += result['cache_hit']
+    cache_miss += result['cache_miss']
+    store_hit += result['store_hit']
+    store_miss += result['store_miss']
+    bnb_pruned += result['bnb_pruned']
+    if f_store is not None:
+      dse_store.store_save(store, config['STORE_KEY'], result['store_rows'])
+    pending[result['task_id']] = result
+    while next_task_id in pending:
+      result = pending.pop(next_task_id)
+      for latency, DSP, BRAM18K, params in result['records']:
+        opt_update(opt, latency, DSP, BRAM18K, params)
+      incumbent.value = 250 * 1e6 * (1 / opt['opt_latency'])
+      if pareto_en and len(result['front']) > 0:
+        # merge the front of the task into the current front, in one pass over the points of both
+        front = front + result['front']
+        task_objs = np.array([[latency, DSP, BRAM18K, -FRE] for latency, DSP, BRAM18K, FRE, params in result['front']])
+        front_objs = np.concatenate([front_objs, task_objs])
+        merged = pareto_front(front_objs)
+        front = [front[idx] for idx in merged]
+        front_objs = front_objs[merged]
+      next_task_id = next_task_id + 1
+  pool.close()
+  pool.join()
+  if f_store is not None:
+    store.close()
+
+  opt_latency = opt['opt_latency']
+  opt_DSP = opt['opt_DSP']
+  opt_BRAM18K = opt['opt_BRAM18K']
+  opt_params = opt['opt_params']
 
 # print out results
   print("*************************************************")
@@ -857,19 +1018,134 @@ def run(f_model, f_model_config, f_input_config, f_board, parallel_en, dynamic_t
   print("opt DSP: %d (%d%%)" % (opt_DSP, opt_DSP_util))
   with open('opt_params.json', 'w') as f:
     json.dump(opt_params, f, indent = 2)
+  if pareto_en:
+    pareto_dump(front, board_info, 'pareto_front')
+    print("Pareto front: %d designs (pareto_front.json, pareto_front.csv)" % (len(front)))
+  if latency_cache != "none":
+    cache_total = max(cache_hit + cache_miss, 1)
+    print("latency cache hits: %d (%.1f%%), misses: %d" % (cache_hit, cache_hit / cache_total * 100, cache_miss))
+  if f_store is not None:
+    print("design points loaded from store: %d, evaluated: %d" % (store_hit, store_miss))
+  if bnb_en:
+    print("design points pruned by branch and bound: %d" % (bnb_pruned))
 
-  model.close()
 
   print("*************************************************")
   global_timer_end = time.time()
   print('Total elapsed time (s): %.3f' % (global_timer_end - global_timer_start))
   print("*************************************************")
 
-def param_sweep(params_list, config, model_config, layer_configs):
-  opt_latency = np.inf
-  opt_DSP = np.inf
-  opt_BRAM18K = np.inf
-  opt_params = {}
+'''
+update the optimal design with one design point
+a design point replaces the optimal design only if it improves the FPS by at least 0.5
+'''
+def opt_update(opt, latency, DSP, BRAM18K, params):
+  cur_fps = 250 * 1e6 * (1 / latency)
+  opt_fps = 250 * 1e6 * (1 / opt['opt_latency'])
+#  print(cur_fps)
+  if cur_fps - opt_fps >= 0.5:
+#    print("updated FPS (%.2f -> %.2f)" % (opt_fps, cur_fps))
+    opt['opt_latency'] = latency
+    opt['opt_DSP'] = DSP
+    opt['opt_BRAM18K'] = BRAM18K
+    opt['opt_params'] = params
+
+'''
+the design parameters recorded in opt_params.json
+'''
+def design_params(est_params, SIMD_LANE, SA_ROWS, SA_COLS, SA_SIMD_LANE, FRE):
+  params = {}
+  params['LAYER_IN_H_T'] = est_params['LAYER_IN_H_T']
+  params['LAYER_IN_W_T'] = est_params['LAYER_IN_W_T']
+  params['LAYER_OUT_H_T'] = est_params['LAYER_OUT_H_T']
+  params['LAYER_OUT_W_T'] = est_params['LAYER_OUT_W_T']
+  params['LAYER_IN_NUM_T'] = est_params['LAYER_IN_NUM_T']
+  params['LAYER_OUT_NUM_T'] = est_params['LAYER_OUT_NUM_T']
+  params['SIMD_LANE'] = SIMD_LANE
+  params['SA_ROWS'] = SA_ROWS
+  params['SA_COLS'] = SA_COLS
+  params['SA_SIMD_LANE'] = SA_SIMD_LANE
+  params['LAYER_IN_NUM_T_LIST'] = list(est_params['LAYER_IN_NUM_T_LIST'])
+  params['LAYER_OUT_NUM_T_LIST'] = list(est_params['LAYER_OUT_NUM_T_LIST'])
+  params['LAYER_IN_H_T_LIST'] = list(est_params['LAYER_IN_H_T_LIST'])
+  params['LAYER_IN_W_T_LIST'] = list(est_params['LAYER_IN_W_T_LIST'])
+  params['FRE'] = FRE
+  return params
+
+'''
+get the Pareto front of the design points, objs is a 2-D array with one row of objectives (to be minimized) per point
+return the indices of the non-dominated points in the lexicographic order of the objectives,
+for points with identical objectives only the first one is kept
+'''
+def pareto_front(objs):
+  # a point can only be dominated by the points before it in the lexicographic order
+  order = np.lexsort(objs.T[::-1])
+  front = []
+  # the objectives of the front so far, in an array of the largest front size, the first len(front) rows are used
+  front_objs = np.empty(objs.shape)
+  for idx in order:
+    obj = objs[idx]
+    if np.any(np.all(front_objs[:len(front)] <= obj, axis = 1)):
+      continue
+    front_objs[len(front)] = obj
+    front.append(idx)
+  return front
+
+'''
+the latency cache of the current process, it is kept across the tasks of param_sweep
+'''
+process_cache = None
+'''
+the FPS of the optimal design found by the tasks reduced so far, published by run for the pruning of param_sweep
+'''
+process_incumbent = None
+'''
+the settings shared by all the tasks of the current process: (params, config, schedule, layer_configs)
+'''
+process_sweep = None
+
+'''
+the workers receive the network IR, which is pickled as one buffer, and build the layer configurations locally
+'''
+def pool_init(params, config, net, incumbent):
+  global process_sweep, process_incumbent
+  process_sweep = (params, config, model_layer_schedule(net), layer_configs_build(net))
+  process_incumbent = incumbent
+
+'''
+sweep one task of the tiling configurations
+as the optimal design is updated in the sweep order with opt_update, the result of a task depends on the optimal design
+found by the earlier tasks, so instead of its local optimum, the task returns the design points that can still update the
+optimal design: a point whose FPS is not above all the earlier points of the task can never improve the optimal design by 0.5.
+the records are replayed in the task order by run
+'''
+def param_sweep(task_id, params_list, config, schedule, layer_configs):
+  global process_cache
+  records = []
+  record_latency = np.inf
+  pareto_en = config['PARETO']
+  pareto_objs = []
+  pareto_points = []
+  bnb_en = config['BNB']
+  bnb_pruned = 0
+  # front of the points evaluated so far in the task, used by the pruning
+  pareto_task_objs = np.empty((0, 4))
+  pareto_task_cnt = 0
+  if config['LATENCY_CACHE'] == "none":
+    cache = None
+  else:
+    if process_cache is None:
+      process_cache = latency_cache_create(config['LATENCY_CACHE_SHARED'])
+    cache = process_cache
+  cache_hit = cache['hit'] if cache is not None else 0
+  cache_miss = cache['miss'] if cache is not None else 0
+  if config['STORE'] is not None:
+    store = dse_store.store_open(config['STORE'])
+  else:
+    store = None
+  store_rows = []
+  store_hit = 0
+  store_miss = 0
 
   for params_t in params_list:
     params = dict(params_t)
@@ -878,16 +1154,11 @@ def param_sweep(params_list, config, model_config, layer_configs):
     IN_W_T = params['LAYER_IN_W_T']
     SIMD_LANE = params['SIMD_LANE']
 #    print(IN_NUM_T, IN_W_T, SIMD_LANE)
+    # collect the systolic array configurations that pass the resource pruning
+    sa_points = []
     for SA_ROWS in list(filter(lambda x : IN_NUM_T % x == 0, range(1, IN_NUM_T + 1))):
       for SA_COLS in list(filter(lambda x : IN_W_T % x == 0, range(1, IN_W_T + 1))):
         for SA_SIMD_LANE in list(filter(lambda x : SIMD_LANE % x == 0, range(1, SIMD_LANE + 1))):
-          params['LAYER_IN_H_T'] = IN_H_T
-          params['LAYER_IN_W_T'] = IN_W_T
-          params['LAYER_OUT_H_T'] = IN_H_T
-          params['LAYER_OUT_W_T'] = IN_W_T
-          params['LAYER_IN_NUM_T'] = IN_NUM_T
-          params['LAYER_OUT_NUM_T'] = IN_NUM_T
-          params['SIMD_LANE'] = SIMD_LANE
           params['SA_ROWS'] = SA_ROWS
           params['SA_COLS'] = SA_COLS
           params['SA_SIMD_LANE'] = SA_SIMD_LANE
@@ -902,65 +1173,313 @@ def param_sweep(params_list, config, model_config, layer_configs):
           # frequency adjustment
           # as the resource utilization will affect the frequency, we will adjust freqeuncy here using a simple step-wise function
           if DSP / config['BOARD']['DSP'] > 0.6 or BRAM18K / config['BOARD']['BRAM18K'] > 0.5:
-            params['FRE'] = 180
+            FRE = 180
           else:
-            params['FRE'] = 250
-
-#          if (IN_NUM_T == 32) and (IN_W_T == 2) and (SIMD_LANE == 2):
-#            if (SA_ROWS == 1) and (SA_COLS == 1) and ((SA_SIMD_LANE == 2) or (SA_SIMD_LANE == 1)):
-#              print(params)
-
-          # latency estimation
-          latency, params = model_latency_est(params, model_config, layer_configs, config['DYNAMIC_TILING_LEVEL'])
-
-#          if (IN_NUM_T == 32) and (IN_W_T == 2) and (SIMD_LANE == 2):
-#            print(latency, SA_ROWS, SA_COLS, SA_SIMD_LANE)
-#            if (SA_ROWS == 1) and (SA_COLS == 1) and ((SA_SIMD_LANE == 2) or (SA_SIMD_LANE == 1)):
-#              print(params)
-
-          cur_fps = 250 * 1e6 * (1 / latency)
-          opt_fps = 250 * 1e6 * (1 / opt_latency)
-
-#          print(cur_fps)
-          if cur_fps - opt_fps >= 0.5:
-#            print("updated FPS (%.2f -> %.2f)" % (opt_fps, cur_fps))
-#            if IN_NUM_T == 32 and IN_H_T == 2 and SIMD_LANE == 2:
-#                print(params)
-            opt_latency = latency
-            opt_DSP = DSP
-            opt_BRAM18K = BRAM18K
-            opt_params['LAYER_IN_H_T'] = params['LAYER_IN_H_T']
-            opt_params['LAYER_IN_W_T'] = params['LAYER_IN_W_T']
-            opt_params['LAYER_OUT_H_T'] = params['LAYER_OUT_H_T']
-            opt_params['LAYER_OUT_W_T'] = params['LAYER_OUT_W_T']
-            opt_params['LAYER_IN_NUM_T'] = params['LAYER_IN_NUM_T']
-            opt_params['LAYER_OUT_NUM_T'] = params['LAYER_OUT_NUM_T']
-            opt_params['SIMD_LANE'] = params['SIMD_LANE']
-            opt_params['SA_ROWS'] = params['SA_ROWS']
-            opt_params['SA_COLS'] = params['SA_COLS']
-            opt_params['SA_SIMD_LANE'] = params['SA_SIMD_LANE']
-            opt_params['LAYER_IN_NUM_T_LIST'] = list(params['LAYER_IN_NUM_T_LIST'])
-            opt_params['LAYER_OUT_NUM_T_LIST'] = list(params['LAYER_OUT_NUM_T_LIST'])
-            opt_params['LAYER_IN_H_T_LIST'] = list(params['LAYER_IN_H_T_LIST'])
-            opt_params['LAYER_IN_W_T_LIST'] = list(params['LAYER_IN_W_T_LIST'])
-            opt_params['FRE'] = params['FRE']
+            FRE = 250
+          sa_points.append((SA_ROWS, SA_COLS, SA_SIMD_LANE, FRE, DSP, BRAM18K))
+
+    # latency estimation, the points found in the store are not evaluated again
+    if store is not None:
+      stored_points = dse_store.store_load(store, config['STORE_KEY'], params_t)
+    else:
+      stored_points = {}
+    new_points = list(filter(lambda x : x[:4] not in stored_points, sa_points))
+    store_hit += len(sa_points) - len(new_points)
+    if bnb_en and len(new_points) > 0:
+      # branch and bound, skip the points that can neither be recorded nor update the optimal design found by
+      # the earlier tasks
+      sa_arr = np.array(new_points)
+      lb = model_latency_lb(params_t, schedule, layer_configs, sa_arr[:, 0], sa_arr[:, 1], sa_arr[:, 2])
+      ub_fps = 250 * 1e6 * (1 / lb)
+      record_fps = 250 * 1e6 * (1 / record_latency)
+      incumbent_fps = process_incumbent.value if process_incumbent is not None else 0
+      bound = (ub_fps > record_fps) & (ub_fps - incumbent_fps >= 0.5)
+      if pareto_en:
+        # the points that are dominated by (or identical to) an earlier point of the task are not on the front
+        objs = np.stack([lb, sa_arr[:, 4], sa_arr[:, 5], -sa_arr[:, 3]], axis = 1)
+        dominated = np.all(pareto_task_objs[np.newaxis, :, :] <= objs[:, np.newaxis, :], axis = 2).any(axis = 1)
+        bound = bound | ~dominated
+      bnb_pruned += int(np.sum(~bound))
+      new_points = [sa_point for sa_point, keep in zip(new_points, bound) if keep]
+    est_points = {}
+    for sa_point, latency, cur_params in sa_latency_est(params_t, new_points, config, schedule, layer_configs, cache):
+      cur_params = {key: cur_params[key] for key in EST_PARAMS_KEYS}
+      est_points[sa_point[:4]] = (latency, cur_params)
+      if store is not None:
+        store_rows.append(dse_store.store_row(params_t, sa_point, latency, cur_params))
+      store_miss += 1
+
+    for sa_point in sa_points:
+      if sa_point[:4] in est_points:
+        latency, cur_params = est_points[sa_point[:4]]
+      elif sa_point[:4] in stored_points:
+        latency, cur_params = stored_points[sa_point[:4]]
+      else:
+        continue
+      SA_ROWS, SA_COLS, SA_SIMD_LANE, FRE, DSP, BRAM18K = sa_point
+      cur_fps = 250 * 1e6 * (1 / latency)
+      record_fps = 250 * 1e6 * (1 / record_latency)
+
+      if cur_fps > record_fps:
+        record_latency = latency
+        records.append((latency, DSP, BRAM18K, design_params(cur_params, SIMD_LANE, SA_ROWS, SA_COLS, SA_SIMD_LANE, FRE)))
+      if pareto_en:
+        pareto_objs.append((latency, DSP, BRAM18K, -FRE))
+        pareto_points.append((cur_params, SIMD_LANE, SA_ROWS, SA_COLS, SA_SIMD_LANE, FRE))
+
+    if bnb_en and pareto_en and len(pareto_objs) > pareto_task_cnt:
+      objs = np.vstack([pareto_task_objs, np.array(pareto_objs[pareto_task_cnt:])])
+      pareto_task_objs = objs[pareto_front(objs)]
+      pareto_task_cnt = len(pareto_objs)
+
+  if pareto_en:
+    # only the designs on the front of the task can be on the global front
+    front = []
+    for idx in pareto_front(np.array(pareto_objs).reshape(-1, 4)):
+      latency, DSP, BRAM18K, FRE = pareto_objs[idx]
+      front.append((latency, DSP, BRAM18K, -FRE, design_params(*pareto_points[idx])))
+
+  latency_cache_flush(cache)
 
   res = {}
-  res['opt_latency'] = opt_latency
-  res['opt_DSP'] = opt_DSP
-  res['opt_BRAM18K'] = opt_BRAM18K
-  res['opt_params'] = opt_params
+  res['task_id'] = task_id
+  res['records'] = records
+  res['front'] = front if pareto_en else None
+  res['bnb_pruned'] = bnb_pruned
+  res['cache_hit'] = cache['hit'] - cache_hit if cache is not None else 0
+  res['cache_miss'] = cache['miss'] - cache_miss if cache is not None else 0
+  res['store_rows'] = store_rows
+  res['store_hit'] = store_hit
+  res['store_miss'] = store_miss
+  if store is not None:
+    store.close()
   return res
 
+'''
+dump the Pareto front to <prefix>.json and <prefix>.csv, sorted by latency
+'''
+def pareto_dump(front, board_info, prefix):
+  designs = []
+  for latency, DSP, BRAM18K, FRE, params in front:
+    design = {}
+    design['latency'] = float(latency)
+    design['latency_s'] = float(latency / (FRE * 1e6))
+    design['FPS'] = float(FRE * 1e6 / latency)
+    design['DSP'] = int(DSP)
+    design['DSP_util'] = float(DSP / board_info['DSP'])
+    design['BRAM18K'] = int(BRAM18K)
+    design['BRAM18K_util'] = float(BRAM18K / board_info['BRAM18K'])
+    design['FRE'] = int(FRE)
+    design['params'] = params
+    designs.append(design)
+  with open(prefix + '.json', 'w') as f:
+    json.dump(designs, f, indent = 2)
+
+  # the per-layer tiling lists are only kept in the json file
+  param_keys = ['SA_ROWS', 'SA_COLS', 'SA_SIMD_LANE', 'SIMD_LANE', 'LAYER_IN_NUM_T', 'LAYER_OUT_NUM_T', 'LAYER_IN_H_T', 'LAYER_IN_W_T']
+  with open(prefix + '.csv', 'w', newline = '') as f:
+    writer = csv.writer(f)
+    writer.writerow(['latency', 'latency_s', 'FPS', 'DSP', 'DSP_util', 'BRAM18K', 'BRAM18K_util', 'FRE'] + param_keys)
+    for design in designs:
+      writer.writerow([design['latency'], design['latency_s'], design['FPS'], design['DSP'], design['DSP_util'], \
+        design['BRAM18K'], design['BRAM18K_util'], design['FRE']] + [design['params'][key] for key in param_keys])
+
+'''
+enumerate the tiling configurations explored by the sweep as (IN_H_T, IN_W_T, IN_NUM_T, SIMD_LANE) tuples
+'''
+def tiling_candidates(network_in_h, network_in_w, network_channel_max):
+  for IN_H_T in filter(lambda x : network_in_h % x == 0 and x % 2 == 0, range(1, int(network_in_h / 8) + 1)): # upper_bound
+    for IN_W_T in filter(lambda x : network_in_w % x == 0 and x % 2 == 0, range(1, int(network_in_w / 8) + 1)): # upper_bound
+      for IN_NUM_T in filter(lambda x : network_channel_max % x == 0 and x % 16 == 0, range(1, 128 + 1)): # upper_bound
+        for SIMD_LANE in filter(lambda x : IN_NUM_T % x == 0 and x % 2 == 0, range(1, min(IN_NUM_T, 8) + 1)):
+#          print(IN_NUM_T, IN_W_T, SIMD_LANE)
+          yield (IN_H_T, IN_W_T, IN_NUM_T, SIMD_LANE)
+
+'''
+expand a tiling tuple into the params of param_sweep
+'''
+def tiling_params(params, tiling):
+  IN_H_T, IN_W_T, IN_NUM_T, SIMD_LANE = tiling
+  params = dict(params)
+  params['LAYER_IN_H_T'] = IN_H_T
+  params['LAYER_IN_W_T'] = IN_W_T
+  params['LAYER_OUT_H_T'] = IN_H_T
+  params['LAYER_OUT_W_T'] = IN_W_T
+  params['LAYER_IN_NUM_T'] = IN_NUM_T
+  params['LAYER_OUT_NUM_T'] = IN_NUM_T
+  params['SIMD_LANE'] = SIMD_LANE
+  return params
+
+'''
+group the tiling tuples into tasks of task_size tuples, the tasks are produced on demand
+'''
+def sweep_tasks(tilings, task_size):
+  task_id = 0
+  task = []
+  for tiling in tilings:
+    task.append(tiling)
+    if len(task) == task_size:
+      yield task_id, task
+      task_id = task_id + 1
+      task = []
+  if len(task) > 0:
+    yield task_id, task
+
+def param_sweep_task(task):
+  task_id, tilings = task
+  params, config, schedule, layer_configs = process_sweep
+  return param_sweep(task_id, [tiling_params(params, tiling) for tiling in tilings], config, schedule, layer_configs)
+
+'''
+estimate the latency of the systolic array configurations under one tiling configuration
+yield (sa_point, latency, params) in the order of sa_points, params holds the tiling factors picked by the estimator
+'''
+def sa_latency_est(params_t, sa_points, config, schedule, layer_configs, cache = None):
+  est_mode = config['EST_MODE']
+  dynamic_tiling_level = config['DYNAMIC_TILING_LEVEL']
+  # the exact tiling search only has a vectorized version, in check mode it is compared against the greedy search
+  dp_en = config['TILING_SEARCH'] == "dp" and dynamic_tiling_level > 0
+  scalar_en = est_mode == "check" or (est_mode == "scalar" and not dp_en)
+  batch_en = est_mode != "scalar" or dp_en
+
+  if not batch_en:
+    batches = [sa_points]
+  else:
+    # split the design points so that the candidate grids of one layer stay around 1M entries
+    grid_size = 1
+    if dynamic_tiling_level >= 1:
+      grid_size *= (params_t['LAYER_IN_NUM_T'] // 8) * (params_t['LAYER_OUT_NUM_T'] // 8)
+    if dynamic_tiling_level == 2:
+      grid_size *= (params_t['LAYER_IN_H_T'] // 2) * params_t['LAYER_IN_W_T']
+    batch_size = max(1, (1 << 20) // grid_size)
+    batches = [sa_points[i : i + batch_size] for i in range(0, len(sa_points), batch_size)]
+
+  for batch in batches:
+    if batch_en and len(batch) > 0:
+      sa_arr = np.array(batch, dtype = np.int64)
+      if dp_en:
+        latency_batch, res = model_latency_est_dp(params_t, schedule, layer_configs, dynamic_tiling_level, \
+          sa_arr[:, 0], sa_arr[:, 1], sa_arr[:, 2], sa_arr[:, 3], cache)
+      else:
+        latency_batch, res = model_latency_est_batch(params_t, schedule, layer_configs, dynamic_tiling_level, \
+          sa_arr[:, 0], sa_arr[:, 1], sa_arr[:, 2], sa_arr[:, 3], cache)
+
+    for idx, sa_point in enumerate(batch):
+      if scalar_en:
+        params = dict(params_t)
+        params['SA_ROWS'], params['SA_COLS'], params['SA_SIMD_LANE'], params['FRE'] = sa_point[:4]
+        latency, params = model_latency_est(params, schedule, layer_configs, dynamic_tiling_level, cache)
+        scalar_params = params
+      if batch_en:
+        params = {}
+        params['LAYER_IN_NUM_T'] = int(res['LAYER_IN_NUM_T'][idx])
+        params['LAYER_OUT_NUM_T'] = int(res['LAYER_OUT_NUM_T'][idx])
+        params['LAYER_IN_H_T'] = int(res['LAYER_IN_H_T'][idx])
+        params['LAYER_IN_W_T'] = int(res['LAYER_IN_W_T'][idx])
+        params['LAYER_OUT_H_T'] = params['LAYER_IN_H_T']
+        params['LAYER_OUT_W_T'] = params['LAYER_IN_W_T']
+        for key in ['LAYER_IN_NUM_T_LIST', 'LAYER_OUT_NUM_T_LIST', 'LAYER_IN_H_T_LIST', 'LAYER_IN_W_T_LIST']:
+          params[key] = res[key][idx].tolist()
+        if est_mode == "check" and dp_en:
+          # the greedy plan is one of the plans covered by the exact search
+          if latency_batch[idx] > latency * (1 + 1e-9):
+            raise RuntimeError("exact tiling search worse than greedy search at %s: %s (greedy) vs %s (exact)" % (str(sa_point), str(latency), str(latency_batch[idx])))
+          plan_params = dict(params_t)
+          plan_params.update(params)
+          plan_params['SA_ROWS'], plan_params['SA_COLS'], plan_params['SA_SIMD_LANE'], plan_params['FRE'] = sa_point[:4]
+          if not plan_check(plan_params, schedule):
+            raise RuntimeError("exact tiling search breaks the channel chaining at %s" % (str(sa_point)))
+          plan_latency = plan_latency_est(plan_params, schedule, layer_configs)
+          if abs(plan_latency - latency_batch[idx]) > plan_latency * 1e-9:
+            raise RuntimeError("exact tiling search mismatch at %s: %s (plan) vs %s (search)" % (str(sa_point), str(plan_latency), str(latency_batch[idx])))
+        elif est_mode == "check":
+          for key in params:
+            if params[key] != scalar_params[key]:
+              raise RuntimeError("batched latency estimation mismatch on %s at %s: %s (scalar) vs %s (batch)" % (key, str(sa_point), str(scalar_params[key]), str(params[key])))
+          if latency != latency_batch[idx]:
+            raise RuntimeError("batched latency estimation mismatch at %s: %s (scalar) vs %s (batch)" % (str(sa_point), str(latency), str(latency_batch[idx])))
+        latency = latency_batch[idx]
+      if est_mode == "check":
+        lb = model_latency_lb(params_t, schedule, layer_configs, sa_point[0], sa_point[1], sa_point[2])
+        if latency < lb:
+          raise RuntimeError("latency lower bound violated at %s: %s (latency) vs %s (bound)" % (str(sa_point), str(latency), str(lb)))
+      yield sa_point, latency, params
+
+'''
+the layer configurations used by the latency estimators, one dict per layer in the execution order of the network IR
+'''
+def layer_configs_build(net):
+  layer_configs = []
+  for layer_idx in network_ir.net_schedule(net):
+    layer = net[layer_idx]
+    layer_config = {}
+    layer_config['LAYER_IN_NUM'] = int(layer['in_num'])
+    layer_config['LAYER_OUT_NUM'] = int(layer['out_num'])
+    layer_config['LAYER_IN_H'] = int(layer['in_h'])
+    layer_config['LAYER_IN_W'] = int(layer['in_w'])
+    layer_config['LAYER_FILTER_S1'] = int(layer['filter_s1'])
+    layer_config['LAYER_FILTER_S2'] = int(layer['filter_s2'])
+    layer_config['LAYER_STRIDE'] = int(layer['stride'])
+    layer_config['DEPTH_CONV_EN'] = int(layer['depth_conv_en'])
+    layer_config['POINT_CONV_EN'] = int(layer['point_conv_en'])
+    layer_config['BIAS_EN'] = int(layer['bias_en'])
+    layer_config['MAX_POOL_EN'] = int(layer['pool_en'])
+    layer_configs.append(layer_config)
+  return layer_configs
+
+'''
+estimate the latency of a tiling plan, params holds the per-layer tiling lists
+'''
+def plan_latency_est(params, schedule, layer_configs):
+  latency = 0
+  for layer_id, (layer_idx, in_mode, out_mode) in enumerate(schedule):
+    layer_params = dict(params)
+    layer_params.update(layer_configs[layer_idx])
+    layer_params['LAYER_IN_NUM_T'] = params['LAYER_IN_NUM_T_LIST'][layer_id]
+    layer_params['LAYER_OUT_NUM_T'] = params['LAYER_OUT_NUM_T_LIST'][layer_id]
+    layer_params['LAYER_IN_H_T'] = params['LAYER_IN_H_T_LIST'][layer_id]
+    layer_params['LAYER_IN_W_T'] = params['LAYER_IN_W_T_LIST'][layer_id]
+    layer_params['LAYER_OUT_H_T'] = params['LAYER_IN_H_T_LIST'][layer_id]
+    layer_params['LAYER_OUT_W_T'] = params['LAYER_IN_W_T_LIST'][layer_id]
+    latency += layer_latency_est(layer_params)
+  return latency
+
+'''
+check that a tiling plan follows the chaining of model_latency_est: in_num_t is the out_num_t of the previous layer
+and the layers that write or read the concatenations share the out_num_t of the first layer that writes one
+'''
+def plan_check(params, schedule):
+  in_list = params['LAYER_IN_NUM_T_LIST']
+  out_list = params['LAYER_OUT_NUM_T_LIST']
+  concat_num_t = None
+  for layer_id, (layer_idx, in_mode, out_mode) in enumerate(schedule):
+    if in_mode == "prev" and in_list[layer_id] != out_list[layer_id - 1]:
+      return False
+    if in_mode == "concat" and in_list[layer_id] != concat_num_t:
+      return False
+    if out_mode == "concat" and out_list[layer_id] != concat_num_t:
+      return False
+    if out_mode == "first":
+      concat_num_t = out_list[layer_id]
+  return True
+
 if __name__ == "__main__":
   parser = argparse.ArgumentParser(description='Design space exploration.')
 
-  parser.add_argument('-m', '--model', metavar='MODEL', required=True, help='model description', dest='model')
-  parser.add_argument('-mc', '--model-config', metavar='MODEL_CONFIG', required=True, help='model topology', dest='model_config')
+  parser.add_argument('-m', '--model', metavar='MODEL', required=True, help='model description (.model) or layer graph (.json)', dest='model')
+  parser.add_argument('-mc', '--model-config', metavar='MODEL_CONFIG', default=None, help='model topology, not used with a layer graph', dest='model_config')
   parser.add_argument('-i', '--input-config', metavar='INPUT_CONFIG', required=True, help='input configuration', dest='input_config')
   parser.add_argument('-b', '--board', metavar='BOARD', required=True, help='FPGA board information', dest='board')
   parser.add_argument('--parallel', help='multi-threading parallelization', action='store_true', dest='parallel')
   parser.add_argument('-dt', '--dynamic-tiling', metavar='DYNAMIC_TILING', help='dynamic tiling level (0:disabled, 1:channel 2:height/width)', required=False, type=int, default=1, dest='dynamic_tiling')
+  parser.add_argument('-lc', '--latency-cache', metavar='LATENCY_CACHE', help='per-layer latency cache (none:disabled, local:per process, shared:across processes, a round trip to a manager process per local miss)', required=False, choices=['none', 'local', 'shared'], default='local', dest='latency_cache')
+  parser.add_argument('-s', '--store', metavar='STORE', help='SQLite store of the evaluated design points, reused by later runs, next to dse_p.py by default', required=False, default=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'dse_store.db'), dest='store')
+  parser.add_argument('--no-store', help='do not read or write the design point store', action='store_true', dest='no_store')
+  parser.add_argument('-ts', '--task-size', metavar='TASK_SIZE', help='number of tiling configurations per task (default: balanced over the processes)', required=False, type=int, default=None, dest='task_size')
+  parser.add_argument('--pareto', help='dump the Pareto front of latency, DSP, BRAM18K and frequency', action='store_true', dest='pareto')
+  parser.add_argument('--bnb', help='skip the design points whose latency lower bound cannot improve the optimal design', action='store_true', dest='bnb')
+  parser.add_argument('--tiling-search', metavar='TILING_SEARCH', help='per-layer tiling search (greedy:layer by layer, dp:exact search over the chained layers)', required=False, choices=['greedy', 'dp'], default='greedy', dest='tiling_search')
+  parser.add_argument('-e', '--estimator', metavar='ESTIMATOR', help='latency estimator (batch:vectorized, scalar:reference, check:run both and compare)', required=False, choices=['batch', 'scalar', 'check'], default='batch', dest='estimator')
 
   args = parser.parse_args()
-  run(args.model, args.model_config, args.input_config, args.board, args.parallel, args.dynamic_tiling)
+  run(args.model, args.model_config, args.input_config, args.board, args.parallel, args.dynamic_tiling, args.estimator, args.latency_cache, None if args.no_store else args.store, args.task_size, args.pareto, args.bnb, args.tiling_search)
@@ -0,0 +1,81 @@
+import sqlite3
+import hashlib
+import json
+
+'''
+persistent store of the evaluated design points of dse_p.py
+each row holds the latency estimated for one systolic array configuration under one tiling configuration,
+rows are grouped by a model key that covers everything the latency depends on (see store_key)
+'''
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS points (
+  model_key TEXT NOT NULL,
+  tiling TEXT NOT NULL,
+  sa_rows INTEGER NOT NULL,
+  sa_cols INTEGER NOT NULL,
+  sa_simd_lane INTEGER NOT NULL,
+  fre INTEGER NOT NULL,
+  latency REAL NOT NULL,
+  params TEXT NOT NULL,
+  PRIMARY KEY (model_key, tiling, sa_rows, sa_cols, sa_simd_lane, fre)
+)
+'''
+
+'''
+hash the network IR, the estimator version and any extra settings
+the IR holds the layers parsed from the model description and its topology, or from the layer graph, and the feature
+map shapes of the input configuration, so a model description and its layer graph share their points
+the board file only decides which points are explored and at which frequency, the frequency is part of each row,
+so the points evaluated for one board are reused for another
+'''
+def store_key(net, estimator_version, extra = None):
+  h = hashlib.sha1()
+  h.update(str(net.dtype.descr).encode())
+  h.update(net.tobytes())
+  h.update(json.dumps([estimator_version, extra], sort_keys = True).encode())
+  return h.hexdigest()
+
+'''
+the tiling configuration is stored as canonical json
+'''
+def store_tiling(params_t):
+  return json.dumps(params_t, sort_keys = True)
+
+'''
+create the store if missing, return a connection used to write the new points
+'''
+def store_create(f_store):
+  conn = sqlite3.connect(f_store)
+  with conn:
+    conn.execute(SCHEMA)
+  return conn
+
+'''
+open the store read-only, used by the worker processes
+'''
+def store_open(f_store):
+  return sqlite3.connect('file:%s?mode=ro' % (f_store), uri = True)
+
+'''
+load the stored points of one tiling configuration
+return a dict from (sa_rows, sa_cols, sa_simd_lane, fre) to (latency, params)
+'''
+def store_load(conn, model_key, params_t):
+  points = {}
+  cursor = conn.execute('SELECT sa_rows, sa_cols, sa_simd_lane, fre, latency, params FROM points WHERE model_key = ? AND tiling = ?', \
+    (model_key, store_tiling(params_t)))
+  for sa_rows, sa_cols, sa_simd_lane, fre, latency, params in cursor:
+    points[(sa_rows, sa_cols, sa_simd_lane, fre)] = (latency, json.loads(params))
+  return points
+
+'''
+write the new points, rows are (tiling, sa_rows, sa_cols, sa_simd_lane, fre, latency, params) as produced by store_row
+'''
+def store_save(conn, model_key, rows):
+  with conn:
+    conn.executemany('INSERT OR REPLACE INTO points VALUES (?, ?, ?, ?, ?, ?, ?, ?)', [(model_key,) + tuple(row) for row in rows])
+
+def store_row(params_t, sa_point, latency, params):
+  sa_rows, sa_cols, sa_simd_lane, fre = sa_point[:4]
+  return (store_tiling(params_t), int(sa_rows), int(sa_cols), int(sa_simd_lane), int(fre), float(latency), json.dumps(params))
@@ -0,0 +1,313 @@
+import numpy as np
+import json
+import argparse
+import os
+import sys
+import dse_p
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data'))
+import inst_sim
+
+'''
+Functionality: cycle-approximate performance simulation of the instruction stream
+openpose.insts -> cycles[LAYER][MODULE], the latency of each layer and its bottleneck module
+
+The simulation replays the engine calls of top_kernel: the layers are grouped by NXT_LAYER_BATCH, the pipeline is
+drained between two calls. A layer is a stream of TASK_NUM1 tasks, one per tile, iterated as in the kernel: input
+channel tiles innermost, then rows, columns and output channel tiles. Only the last of the TASK_NUM1 / TASK_NUM2 input
+channel tiles of an output tile goes through relu, pool and cout_write.
+
+The cycles of each module for a task are derived from the instruction fields:
+  cin_load:    DDR bursts of (IN_W_T + K - 1) * IN_NUM_T words per row, or the whole feature maps if they fit
+  weight_load: DDR bursts of the depthwise weights, the conv weights and the bias, then the fifo writes
+  inter_load, depth_conv, relu, pool, inter_write: SIMD_LANE words per cycle
+  conv:        LOCAL_REG_NUM * LOCAL_ACCUM_NUM cycles of the systolic array, the feeding of the tile and the drain
+               of the output tile through the SA_COLS columns
+  cout_write:  DDR bursts of IN_W_T / STRIDE * OUT_NUM_T words per row
+The layers fused by layer_fuse.py load or write their feature maps through the on-chip buffer of inter_load and
+inter_write, their cin_load or cout_write do not access DDR.
+A DDR burst of n words costs DDR_LATENCY + n / (BUS_W / DATA_W) cycles, as in dse_p.effective_dram_est.
+The modules exchanging data through the small stream fifos run in lockstep and are grouped in stages, the stages are
+decoupled by the ping-pong tile buffers of the kernel: a stage starts a task when it has finished the previous one,
+the previous stage has finished the same task and the buffer the task is written to has been released.
+The bottleneck of a layer is the stage with the most busy cycles over its tasks, the stage that gates the pipeline.
+The layers whose stages are within BALANCED_TOL of each other, or whose gating stage has several modules at the same
+rate, stream the tiles at the SIMD_LANE rate and are reported as stream. cin_load and cout_write are only reported,
+as DDR bound, when their DDR bursts take longer than the stream of the tile.
+The latency estimated by dse_p.layer_latency_est for the same layer is reported for comparison.
+'''
+
+'''
+hardware parameters of the kernel, SIMD_LANE and FRE can be read from opt_params.json
+'''
+HW_PARAMS = {
+  'SIMD_LANE': 8,
+  'DATA_W0': 32,
+  'DATA_W1': 32,
+  'DATA_W2': 32,
+  'BUS_W': 512,
+  'K_T': 3,
+  'DDR_LATENCY': 120,
+  'FRE': 250
+}
+MODULES = ['cin_load', 'weight_load', 'inter_load', 'depth_conv', 'conv', 'relu', 'pool', 'inter_write', 'cout_write']
+'''
+stages of the pipeline: the modules of a stage stream through fifos, the stages are separated by ping-pong buffers
+'''
+STAGES = [['cin_load', 'weight_load'], ['inter_load', 'depth_conv'], ['conv'], ['relu', 'pool', 'inter_write'], ['cout_write']]
+'''
+tile buffers between two stages
+'''
+STAGE_BUFFERS = 2
+'''
+relative difference of the busy cycles under which the stages or modules of a layer are balanced
+'''
+BALANCED_TOL = 0.01
+
+'''
+cycles of a DDR transfer of burst_num bursts of burst_size words of width dw
+'''
+def ddr_cycles(burst_num, burst_size, dw, hw):
+  if burst_num == 0 or burst_size == 0:
+    return 0
+  return burst_num * (hw['DDR_LATENCY'] + int(np.ceil(burst_size * dw / float(hw['BUS_W']))))
+
+'''
+cycles of each module for the tasks of a layer: the tasks that write out an output tile (last) and the others
+return two dicts of the module cycles, and the DDR cycles of cin_load for a task and of cout_write for a last task
+'''
+def layer_task_cycles(inst, hw):
+  lane = hw['SIMD_LANE']
+  in_num_t = inst['IN_NUM_T']
+  out_num_t = inst['OUT_NUM_T']
+  in_h_t = inst['IN_H_T']
+  in_w_t = inst['IN_W_T']
+  stride = inst['STRIDE']
+  max_pool = not inst['DEPTH_CONV_EN'] and not inst['CONV_EN']
+  filter_s1 = inst['FILTER_S1'] if inst['DEPTH_CONV_EN'] else 1
+  filter_s2 = inst['FILTER_S2'] if inst['CONV_EN'] else 1
+  filter_s = max(filter_s1, filter_s2)
+  # the depthwise conv strides in separable convs, the conv strides in conv2d
+  stride1 = stride if inst['DEPTH_CONV_EN'] else 1
+  # the tile out of conv and relu, and the tile written out
+  conv_h_t = in_h_t if max_pool else in_h_t // stride
+  conv_w_t = in_w_t if max_pool else in_w_t // stride
+  out_stride = 2 if inst['POOL_EN'] or stride == 2 else 1
+  out_h_t = in_h_t // out_stride
+  out_w_t = in_w_t // out_stride
+
+  cycles = dict([(module, 0) for module in MODULES])
+  # cin_load, the DDR reads of the next tile overlap the fifo writes of the current one
+  in_tile_size = in_num_t * (in_h_t + filter_s - 1) * (in_w_t + filter_s - 1)
+  if inst['IN_H_HW'] <= in_h_t + hw['K_T'] - 1 and inst['IN_W_HW'] <= in_w_t + hw['K_T'] - 1 and not max_pool:
+    cin_ddr = ddr_cycles(1, in_num_t * inst['IN_H_HW'] * inst['IN_W_HW'], hw['DATA_W0'], hw)
+  else:
+    cin_ddr = ddr_cycles(in_h_t + filter_s - 1, in_num_t * (in_w_t + filter_s - 1), hw['DATA_W0'], hw)
+  cycles['cin_load'] = max(cin_ddr, in_tile_size / lane)
+  if inst['INTER_LOAD_EN']:
+    cycles['cin_load'] = 0
+    cin_ddr = 0
+  # weight_load, the weights are read then written to the fifos
+  weight_sizes = []
+  if inst['DEPTH_CONV_EN']:
+    weight_sizes.append(in_num_t * filter_s1 * filter_s1)
+  if inst['CONV_EN']:
+    weight_sizes.append(in_num_t * out_num_t * filter_s2 * filter_s2)
+  cycles['weight_load'] = sum([ddr_cycles(1, size, hw['DATA_W1'], hw) for size in weight_sizes]) + max(weight_sizes + [0]) / lane
+  cycles['inter_load'] = in_tile_size / lane
+  cycles['depth_conv'] = in_tile_size / lane
+  # conv, the systolic array loads the next tile while computing
+  if inst['CONV_EN']:
+    sa_in_size = in_num_t * (in_h_t // stride1 + filter_s2 - 1) * (in_w_t // stride1 + filter_s2 - 1)
+    cycles['conv'] = max(inst['LOCAL_REG_NUM'] * inst['LOCAL_ACCUM_NUM'], sa_in_size / lane, in_num_t * out_num_t * filter_s2 * filter_s2 / lane)
+  else:
+    cycles['conv'] = in_tile_size / lane
+
+  last = dict(cycles)
+  if inst['CONV_EN']:
+    bias_cycles = ddr_cycles(1, out_num_t, hw['DATA_W2'], hw) + out_num_t / lane
+    last['weight_load'] = cycles['weight_load'] + bias_cycles
+    # the output tile is drained through the columns of the array
+    sa_cols = max(1, (in_w_t // stride) // inst['COL_IL_FACTOR'])
+    last['conv'] = max(cycles['conv'], out_num_t * conv_h_t * conv_w_t / sa_cols)
+  last['relu'] = out_num_t * conv_h_t * conv_w_t / lane
+  last['pool'] = out_num_t * conv_h_t * conv_w_t / lane
+  last['inter_write'] = out_num_t * out_h_t * out_w_t / lane
+  cout_ddr = ddr_cycles(out_h_t, out_num_t * out_w_t, hw['DATA_W0'], hw)
+  last['cout_write'] = max(cout_ddr, out_num_t * out_h_t * out_w_t / lane)
+  if inst['INTER_WRITE_EN']:
+    last['cout_write'] = 0
+    cout_ddr = 0
+  return cycles, last, {'cin_load': cin_ddr, 'cout_write': cout_ddr}
+
+'''
+cycles of the tasks of a layer, task_cycles[TASK_NUM1][MODULE]
+'''
+def layer_tasks(inst, hw):
+  cycles, last, _ = layer_task_cycles(inst, hw)
+  in_tiles = inst['TASK_NUM1'] // inst['TASK_NUM2']
+  task_cycles = np.tile(np.array([cycles[module] for module in MODULES], dtype = np.float64), (inst['TASK_NUM1'], 1))
+  task_cycles[in_tiles - 1 :: in_tiles] = [last[module] for module in MODULES]
+  return task_cycles
+
+'''
+simulate one engine call on the tasks of its layers, task_cycles[TASK][MODULE], from cycle start
+return the start and finish cycles of the tasks in each stage, [TASK][STAGE]
+'''
+def engine_sim(task_cycles, start):
+  stage_ids = [[MODULES.index(module) for module in stage] for stage in STAGES]
+  # the modules of a stage run in lockstep, a stage takes the cycles of its slowest module
+  stage_cycles = np.stack([np.max(task_cycles[:, ids], axis = 1) for ids in stage_ids], axis = 1)
+  task_num, stage_num = stage_cycles.shape
+  task_start = np.zeros((task_num, stage_num))
+  task_finish = np.zeros((task_num, stage_num))
+  for task in range(task_num):
+    for stage in range(stage_num):
+      t = start
+      if task > 0:
+        t = max(t, task_finish[task - 1, stage])
+      if stage > 0:
+        t = max(t, task_finish[task, stage - 1])
+      if stage < stage_num - 1 and task >= STAGE_BUFFERS:
+        # the buffer to the next stage is released when the next stage has finished the task that used it
+        t = max(t, task_finish[task - STAGE_BUFFERS, stage + 1])
+      task_start[task, stage] = t
+      task_finish[task, stage] = t + stage_cycles[task, stage]
+  return task_start, task_finish
+
+'''
+bottleneck of a layer from the cycles its tasks spent in each stage, stage_busy[STAGE], and the busy cycles of the
+modules, busy[MODULE]
+return the module that gates the pipeline, or stream if the stages or the modules of the gating stage are balanced
+'''
+def layer_bottleneck(inst, stage_busy, busy, hw):
+  stages = np.flatnonzero(stage_busy >= np.max(stage_busy) * (1 - BALANCED_TOL))
+  if len(stages) > 1:
+    return 'stream'
+  ids = [MODULES.index(module) for module in STAGES[stages[0]]]
+  modules = [MODULES[idx] for idx in ids if busy[idx] >= np.max(busy[ids]) * (1 - BALANCED_TOL)]
+  if len(modules) > 1:
+    return 'stream'
+  module = modules[0]
+  if module in ['cin_load', 'cout_write']:
+    # DDR bound only if the bursts take longer than the stream of the tiles
+    _, _, ddr = layer_task_cycles(inst, hw)
+    ddr_busy = ddr[module] * (inst['TASK_NUM1'] if module == 'cin_load' else inst['TASK_NUM2'])
+    if ddr_busy < busy[MODULES.index(module)] * (1 - BALANCED_TOL):
+      return 'stream'
+  return module
+
+'''
+closed-form estimate of dse_p for the layer of an instruction
+'''
+def layer_latency_est(inst, hw):
+  params = {}
+  for name in ['IN_NUM', 'OUT_NUM', 'IN_H', 'IN_W', 'IN_NUM_T', 'OUT_NUM_T', 'IN_H_T', 'IN_W_T', 'FILTER_S1', 'FILTER_S2', 'STRIDE']:
+    params['LAYER_' + name] = inst[name]
+  params['LAYER_OUT_H_T'] = inst['IN_H_T']
+  params['LAYER_OUT_W_T'] = inst['IN_W_T']
+  for name in ['SIMD_LANE', 'DATA_W0', 'DATA_W1', 'DATA_W2', 'BUS_W', 'FRE']:
+    params[name] = hw[name]
+  params['DEPTH_CONV_EN'] = inst['DEPTH_CONV_EN']
+  params['POINT_CONV_EN'] = inst['CONV_EN']
+  params['BIAS_EN'] = inst['BIAS_EN']
+  params['MAX_POOL_EN'] = inst['POOL_EN']
+  # the shape of the systolic array from the loop bounds of the instruction
+  params['SA_ROWS'] = inst['OUT_NUM_T'] // max(1, inst['ROW_IL_FACTOR'])
+  params['SA_COLS'] = max(1, (inst['IN_W_T'] // inst['STRIDE']) // max(1, inst['COL_IL_FACTOR']))
+  params['SA_SIMD_LANE'] = max(1, inst['IN_NUM_T'] * (inst['FILTER_S2'] ** 2 if not inst['DEPTH_CONV_EN'] else 1) // max(1, inst['LOCAL_ACCUM_NUM']))
+  return dse_p.layer_latency_est(params)
+
+'''
+simulate the instruction stream
+return one record per layer with the cycles of the layer, the busy cycles of the modules and the bottleneck
+'''
+def perf_sim(insts, hw):
+  records = []
+  cycle = 0
+  layer_id = 0
+  layer_batch = 1
+  while layer_id < len(insts):
+    batch = insts[layer_id : layer_id + layer_batch]
+    tasks = [layer_tasks(inst, hw) for inst in batch]
+    # the instructions of the call are read before the engine starts
+    config_cycles = ddr_cycles(1, inst_sim.CONFIG_PARAMS * len(batch), 32, hw)
+    task_start, task_finish = engine_sim(np.concatenate(tasks), cycle + config_cycles)
+
+    task_id = 0
+    for inst, task_cycles in zip(batch, tasks):
+      start = task_start[task_id, 0]
+      finish = task_finish[task_id + len(task_cycles) - 1, -1]
+      busy = np.sum(task_cycles, axis = 0)
+      stage_busy = np.sum(task_finish[task_id : task_id + len(task_cycles)] - task_start[task_id : task_id + len(task_cycles)], axis = 0)
+      record = {}
+      record['LAYER_ID'] = layer_id
+      record['LAYER_BATCH'] = len(batch)
+      record['TASK_NUM'] = len(task_cycles)
+      record['START'] = float(start)
+      record['FINISH'] = float(finish)
+      # the layers of a call overlap in the pipeline, a layer is charged the cycles since the previous layer finished
+      record['CYCLES'] = float(finish - cycle)
+      record['MODULES'] = dict([(module, float(busy[idx])) for idx, module in enumerate(MODULES)])
+      record['BOTTLENECK'] = layer_bottleneck(inst, stage_busy, busy, hw)
+      record['EST_CYCLES'] = float(layer_latency_est(inst, hw))
+      records.append(record)
+      task_id += len(task_cycles)
+      layer_id += 1
+      cycle = finish
+
+    layer_batch = batch[-1]['NXT_LAYER_BATCH']
+  return records, cycle
+
+'''
+print the cycle breakdown of the layers
+'''
+def perf_report(insts, records, total_cycles, hw):
+  header = '%5s %-5s %-22s %10s %6s %10s %-11s' % ('layer', 'type', 'shape', 'cycles', '%', 'dse_est', 'bottleneck')
+  print(header + ''.join([' %11s' % (module) for module in MODULES]))
+  for inst, record in zip(insts, records):
+    if inst['DEPTH_CONV_EN']:
+      layer_type = 'sep'
+    elif inst['CONV_EN']:
+      layer_type = 'conv'
+    else:
+      layer_type = 'pool'
+    shape = '%dx%dx%d->%d/%d' % (inst['IN_NUM'], inst['IN_H'], inst['IN_W'], inst['OUT_NUM'], inst['STRIDE'])
+    line = '%5d %-5s %-22s %10d %6.2f %10d %-11s' % (record['LAYER_ID'], layer_type, shape, record['CYCLES'], \
+      100.0 * record['CYCLES'] / total_cycles, record['EST_CYCLES'], record['BOTTLENECK'])
+    print(line + ''.join([' %11d' % (record['MODULES'][module]) for module in MODULES]))
+
+  bottlenecks = {}
+  for record in records:
+    bottlenecks[record['BOTTLENECK']] = bottlenecks.get(record['BOTTLENECK'], 0) + record['CYCLES']
+  print('total cycles: %d, %.3f ms, %.2f FPS at %d MHz' % (total_cycles, total_cycles / (hw['FRE'] * 1e3), hw['FRE'] * 1e6 / total_cycles, hw['FRE']))
+  print('dse_p estimate: %d cycles' % (sum([record['EST_CYCLES'] for record in records])))
+  for module, cycles in sorted(bottlenecks.items(), key = lambda item: -item[1]):
+    print('  %-11s bound: %5.2f%% of the cycles' % (module, 100.0 * cycles / total_cycles))
+
+def run(f_insts, f_params, f_perf, fre):
+  insts = inst_sim.insts_load(f_insts)
+  hw = dict(HW_PARAMS)
+  if f_params is not None:
+    with open(f_params, 'r') as f:
+      params = json.loads(f.read())
+    for name in ['SIMD_LANE', 'FRE']:
+      if name in params:
+        hw[name] = params[name]
+  if fre is not None:
+    hw['FRE'] = fre
+
+  records, total_cycles = perf_sim(insts, hw)
+  perf_report(insts, records, total_cycles, hw)
+  with open(f_perf, 'w') as f:
+    json.dump({'HW': hw, 'CYCLES': float(total_cycles), 'FPS': hw['FRE'] * 1e6 / total_cycles, 'LAYERS': records}, f, indent = 2)
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description='Performance simulation.')
+
+  parser.add_argument('-n', '--insts', metavar='INSTS', required=True, help='instructions', dest='insts')
+  parser.add_argument('-p', '--params', metavar='PARAMS', default=None, help='design parameters, as opt_params.json', dest='params')
+  parser.add_argument('-o', '--output', metavar='OUTPUT', default='perf.json', help='cycle breakdown of the layers', dest='output')
+  parser.add_argument('--fre', metavar='FRE', type=int, default=None, help='kernel frequency in MHz', dest='fre')
+
+  args = parser.parse_args()
+  run(args.insts, args.params, args.output, args.fre)
@@ -0,0 +1,289 @@
+import numpy as np
+import json
+import argparse
+import os
+import sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data'))
+import inst_format
+import inst_sim
+
+'''
+Functionality: DDR memory planner of the feature maps
+openpose.insts, params.h -> openpose.insts, params.h with the feature maps packed by their lifetimes
+
+The feature maps of all the layers live in the cin buffer of the kernel. ddr_layout of inst_parse.py gives each row
+of the network IR its own slot after the input, the concatenated outputs last and the second buffers of the carried
+layers next to them. Only the iterations of a repeated block overwrite a slot, no slot is reused by another row, so
+the footprint is the sum of the feature maps even though most of them are dead once the layers reading them have
+run. The planner derives the layout from the instructions instead: each layer reads the window [IN_H_HW][IN_W_HW] of
+its input tiles at CIN_OFFSET and writes the interior of its output tiles at COUT_OFFSET. The DDR ranges of the
+reads and writes are merged into blocks, so that a block holds whatever has to stay contiguous: a feature map with
+its halo, and the feature maps concatenated as the input of the stages, with the ping-pong outputs of the stage
+iterations around them. The blocks are live from the first to the last engine call that accesses them, the layers
+batched by NXT_LAYER_BATCH run in one call.
+
+The blocks are packed by first fit, largest first. Blocks with overlapping lifetimes never share memory. Blocks with
+disjoint lifetimes may share memory if no cell written by one of them is a cell the other one reads without writing:
+the halos are never written by the kernel and must stay zero from the initialization of the buffer, across the layers
+and the frames. The input (IN_OUT_OFFSET at 0) is written by the host and stays in place, the outputs at
+STAGE2L_OFFSET and STAGE2R_OFFSET are read by the host and live until the end. The blocks are moved by multiples of
+the bus width, the offsets in the instructions and params.h are relocated. The feature maps that layer_fuse.py keeps
+on chip are not in DDR, the CIN_OFFSET of INTER_LOAD_EN and the COUT_OFFSET of INTER_WRITE_EN are not used by the
+kernel and are left as they are.
+'''
+
+'''
+alignment of the block moves, the elements of one bus word
+'''
+DDR_ALIGN = 16
+
+'''
+DDR cells read and written by the instruction of one layer, as inst_sim.layer_run accesses them
+the layers fused through the on-chip buffer do not read or write the feature maps there
+'''
+def layer_access(inst):
+  in_num = -(-inst['IN_NUM'] // inst['IN_NUM_T']) * inst['IN_NUM_T']
+  out_num = -(-inst['OUT_NUM'] // inst['OUT_NUM_T']) * inst['OUT_NUM_T']
+  in_h = -(-inst['IN_H'] // inst['IN_H_T']) * inst['IN_H_T']
+  in_w = -(-inst['IN_W'] // inst['IN_W_T']) * inst['IN_W_T']
+  filter_s1 = inst['FILTER_S1'] if inst['DEPTH_CONV_EN'] else 1
+  filter_s2 = inst['FILTER_S2'] if inst['CONV_EN'] else 1
+  halo = max(filter_s1, filter_s2) - 1
+  out_h, out_w = in_h // inst['STRIDE'], in_w // inst['STRIDE']
+  if inst['POOL_EN']:
+    out_h, out_w = out_h // 2, out_w // 2
+  read = np.zeros(0, dtype = np.int64)
+  write = np.zeros(0, dtype = np.int64)
+  if not inst['INTER_LOAD_EN']:
+    read = inst_sim.fm_index(inst['CIN_OFFSET'], in_num, inst['IN_NUM_T'], inst['IN_H_HW'], inst['IN_W_HW'], in_h + halo, in_w + halo).ravel()
+  if not inst['INTER_WRITE_EN']:
+    write = inst_sim.fm_index(inst['COUT_OFFSET'], out_num, inst['OUT_NUM_T'], inst['OUT_H_HW'], inst['OUT_W_HW'], out_h, out_w).ravel()
+  return read, write
+
+'''
+engine call of each layer, the layers are batched by the NXT_LAYER_BATCH of the last layer of the previous call
+'''
+def layer_steps(insts):
+  steps = []
+  step = 0
+  layer_batch = 1
+  layer_id = 0
+  while layer_id < len(insts):
+    batch = insts[layer_id : layer_id + layer_batch]
+    steps += [step] * len(batch)
+    layer_id += len(batch)
+    layer_batch = batch[-1]['NXT_LAYER_BATCH']
+    step += 1
+  return steps, step
+
+'''
+merge the ranges [lo, hi) that overlap, return the sorted disjoint ranges
+'''
+def ranges_merge(ranges):
+  blocks = []
+  for lo, hi in sorted(ranges):
+    if len(blocks) > 0 and lo < blocks[-1][1]:
+      blocks[-1][1] = max(blocks[-1][1], hi)
+    else:
+      blocks.append([lo, hi])
+  return blocks
+
+'''
+split the cin buffer into the blocks accessed by the instructions
+return the blocks with their DDR range, lifetime [FIRST, LAST] in engine calls and the masks of the written cells
+and of the cells that are read without being written
+'''
+def ddr_blocks(insts, params):
+  size = params['CIN_SIZE']
+  steps, step_num = layer_steps(insts)
+  first_read = np.full(size, step_num, dtype = np.int32)
+  first_write = np.full(size, step_num, dtype = np.int32)
+  last = np.full(size, -1, dtype = np.int32)
+  ranges = []
+
+  # the input is written by the host before the first call
+  in_size = params['IN_OUT_OFFSET']
+  first_write[:in_size] = -1
+  ranges.append((0, in_size))
+  for inst, step in zip(insts, steps):
+    read, write = layer_access(inst)
+    first_read[read] = np.minimum(first_read[read], step)
+    first_write[write] = np.minimum(first_write[write], step)
+    last[read] = step
+    last[write] = step
+    for access in [read, write]:
+      if len(access) > 0:
+        ranges.append((int(access.min()), int(access.max()) + 1))
+  # the outputs are read by the host after the last call
+  for prefix in ['STAGE2L', 'STAGE2R']:
+    offset = params[prefix + '_OFFSET']
+    out_size = params[prefix + '_OUT_NUM_HW'] * params[prefix + '_OUT_H_HW'] * params[prefix + '_OUT_W_HW']
+    last[offset : offset + out_size] = step_num
+    ranges.append((offset, offset + out_size))
+
+  blocks = []
+  for lo, hi in ranges_merge(ranges):
+    block = {'START': lo, 'SIZE': hi - lo}
+    written = first_write[lo:hi] < step_num
+    read = first_read[lo:hi] < step_num
+    block['WRITTEN'] = written
+    block['ZERO'] = read & ~written
+    touched = written | read
+    block['FIRST'] = int(np.min(np.minimum(first_read[lo:hi], first_write[lo:hi])[touched]))
+    block['LAST'] = int(np.max(last[lo:hi]))
+    # a cell read before it is written carries data from the previous frame, the block is live all the time
+    if np.any(read & written & (first_read[lo:hi] < first_write[lo:hi])):
+      block['FIRST'], block['LAST'] = -1, step_num
+    blocks.append(block)
+  return blocks, step_num
+
+'''
+peak of the sizes of the blocks live at the same time, the lower bound of the footprint
+'''
+def live_peak(blocks, step_num):
+  live = np.zeros(step_num + 2, dtype = np.int64)
+  for block in blocks:
+    live[block['FIRST'] + 1 : block['LAST'] + 2] += block['SIZE']
+  return int(np.max(live))
+
+'''
+place the blocks by first fit, largest first, the input stays at 0
+return the new start of each block
+'''
+def blocks_pack(blocks):
+  size = sum([block['SIZE'] for block in blocks]) + DDR_ALIGN * len(blocks)
+  ddr_written = np.zeros(size, dtype = bool)
+  ddr_zero = np.zeros(size, dtype = bool)
+  placed = []
+  starts = [0] * len(blocks)
+
+  def fits(block, offset):
+    end = offset + block['SIZE']
+    for other, other_offset in placed:
+      if other_offset < end and offset < other_offset + other['SIZE']:
+        if other['FIRST'] <= block['LAST'] and block['FIRST'] <= other['LAST']:
+          return False
+    return not np.any(ddr_written[offset:end] & block['ZERO']) and not np.any(ddr_zero[offset:end] & block['WRITTEN'])
+
+  order = [0] + sorted(range(1, len(blocks)), key = lambda block_id: -blocks[block_id]['SIZE'])
+  for block_id in order:
+    block = blocks[block_id]
+    if block_id == 0:
+      offset = 0
+    else:
+      # candidates: the starts and ends of the placed blocks, moved by multiples of DDR_ALIGN
+      candidates = set([0])
+      for other, other_offset in placed:
+        candidates.add(other_offset)
+        candidates.add(other_offset + other['SIZE'])
+      offset = None
+      for candidate in sorted(candidates):
+        candidate += (block['START'] - candidate) % DDR_ALIGN
+        if fits(block, candidate):
+          offset = candidate
+          break
+    starts[block_id] = offset
+    placed.append((block, offset))
+    ddr_written[offset : offset + block['SIZE']] |= block['WRITTEN']
+    ddr_zero[offset : offset + block['SIZE']] |= block['ZERO']
+  return starts
+
+'''
+new address of an address of the original layout
+'''
+def addr_relocate(blocks, starts, addr):
+  block_id = int(np.searchsorted([block['START'] for block in blocks], addr, side = 'right')) - 1
+  block = blocks[block_id]
+  if block_id < 0 or addr >= block['START'] + block['SIZE']:
+    raise ValueError("address %d is not in a block" % (addr))
+  return addr - block['START'] + starts[block_id]
+
+'''
+plan the layout of the instructions, return the relocated instructions, the macros to update and the report
+'''
+def ddr_plan(insts, params):
+  blocks, step_num = ddr_blocks(insts, params)
+  starts = blocks_pack(blocks)
+  planned = []
+  for inst in insts:
+    inst = dict(inst)
+    if not inst['INTER_LOAD_EN']:
+      inst['CIN_OFFSET'] = addr_relocate(blocks, starts, inst['CIN_OFFSET'])
+    if not inst['INTER_WRITE_EN']:
+      inst['COUT_OFFSET'] = addr_relocate(blocks, starts, inst['COUT_OFFSET'])
+    planned.append(inst)
+  macros = {}
+  macros['CIN_SIZE'] = max([start + block['SIZE'] for block, start in zip(blocks, starts)])
+  for prefix in ['STAGE2L', 'STAGE2R']:
+    macros[prefix + '_OFFSET'] = addr_relocate(blocks, starts, params[prefix + '_OFFSET'])
+
+  report = {}
+  report['CIN_SIZE'] = params['CIN_SIZE']
+  report['PLANNED_CIN_SIZE'] = macros['CIN_SIZE']
+  report['BLOCK_SIZE'] = sum([block['SIZE'] for block in blocks])
+  report['LIVE_PEAK'] = live_peak(blocks, step_num)
+  report['BLOCKS'] = [{'START': block['START'], 'SIZE': block['SIZE'], 'FIRST': block['FIRST'], 'LAST': block['LAST'], \
+    'PLANNED_START': start} for block, start in zip(blocks, starts)]
+  return planned, macros, report
+
+'''
+rewrite the values of some macros of params.h, the macros that are not defined yet are appended
+'''
+def params_update(f_params, macros):
+  with open(f_params, 'r') as f:
+    lines = f.readlines()
+  defined = set()
+  with open(f_params, 'w') as f:
+    for line in lines:
+      content = line.split()
+      if len(content) == 3 and content[0] == '#define' and content[1] in macros:
+        line = '#define %s %d\n' % (content[1], macros[content[1]])
+        defined.add(content[1])
+      f.write(line)
+    for name in macros:
+      if name not in defined:
+        f.write('#define %s %d\n' % (name, macros[name]))
+
+'''
+rewrite the instructions in place, in the text and the binary formats
+'''
+def insts_update(f_insts, insts, params):
+  values = np.array([[inst[name] for name in inst_format.INST_FIELDS] for inst in insts])
+  if inst_format.insts_is_bin(f_insts):
+    f_text, f_bin = os.path.splitext(f_insts)[0], f_insts
+  else:
+    f_text, f_bin = f_insts, f_insts + '.bin'
+  inst_format.insts_text_write(f_text, values)
+  inst_format.insts_bin_write(f_bin, values, dict([(name, params[name]) for name in inst_format.MODEL_FIELDS]))
+
+def ddr_report(report):
+  print('%10s %10s %6s %6s %10s' % ('start', 'size', 'first', 'last', 'planned'))
+  for block in report['BLOCKS']:
+    print('%10d %10d %6d %6d %10d' % (block['START'], block['SIZE'], block['FIRST'], block['LAST'], block['PLANNED_START']))
+  print('CIN_SIZE: %d -> %d (%.1f%%), blocks: %d, live peak: %d' % (report['CIN_SIZE'], report['PLANNED_CIN_SIZE'], \
+    100.0 * report['PLANNED_CIN_SIZE'] / report['CIN_SIZE'], report['BLOCK_SIZE'], report['LIVE_PEAK']))
+
+'''
+plan the layout of the instructions and params.h of out_dir in place
+'''
+def run(f_insts, f_params, f_report):
+  insts = inst_sim.insts_load(f_insts)
+  params = inst_format.params_load(f_params)
+  planned, macros, report = ddr_plan(insts, params)
+  ddr_report(report)
+
+  insts_update(f_insts, planned, params)
+  params_update(f_params, macros)
+  if f_report is not None:
+    with open(f_report, 'w') as f:
+      json.dump(report, f, indent = 2)
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description='DDR memory planning.')
+
+  parser.add_argument('-n', '--insts', metavar='INSTS', required=True, help='instructions, rewritten in place with the text and binary formats', dest='insts')
+  parser.add_argument('-p', '--params', metavar='PARAMS', required=True, help='params.h, rewritten in place', dest='params')
+  parser.add_argument('-o', '--output', metavar='OUTPUT', default='ddr_plan.json', help='layout report', dest='output')
+
+  args = parser.parse_args()
+  run(args.insts, args.params, args.output)
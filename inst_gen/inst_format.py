@@ -0,0 +1,194 @@
+import numpy as np
+import json
+import argparse
+
+'''
+Functionality: instruction file formats
+openpose.insts (text) <-> openpose.insts.bin (binary)
+
+The text format is written by inst_parse.py: 5 lines of space-separated decimals per layer, followed by a blank line.
+The binary format holds the same values as fixed-width little-endian int32 records, behind a header:
+  header:  MAGIC | VERSION | LAYER_NUM | CONFIG_PARAMS | MODEL_PARAMS | PAYLOAD_OFFSET | 0 | 0     (8 x uint32)
+  layout:  the names of the MODEL_PARAMS + CONFIG_PARAMS fields, FIELD_NAME_LEN bytes each, zero padded
+  padding: zeros up to PAYLOAD_OFFSET
+  payload: VGG_LAYERS | STAGE1_LAYERS | STAGE2_LAYERS | STAGE2_ITER | insts[LAYER_NUM][CONFIG_PARAMS]   (int32)
+The payload is the config buffer of the kernel, as instInit builds it in host.cpp, so that it can be mapped into the
+buffer_config buffer without parsing. PAYLOAD_OFFSET is page aligned, the mapped payload is aligned as the host
+buffers. The field layout is stored with the file, a reader checks it against INST_FIELDS before using the records.
+'''
+
+MAGIC = 0x4E49504F # 'OPIN'
+VERSION = 1
+CONFIG_PARAMS = 31
+'''
+fields of the 5 instructions of a layer, in the order of openpose.insts
+'''
+INST_FIELDS = [
+  # inst0
+  'IN_NUM_HW', 'OUT_NUM_HW', 'IN_H_HW', 'IN_W_HW', 'OUT_H_HW', 'OUT_W_HW',
+  # inst1
+  'IN_NUM', 'OUT_NUM', 'IN_H', 'IN_W', 'OUT_H', 'OUT_W',
+  # inst2
+  'CIN_OFFSET', 'WEIGHT_OFFSET', 'BIAS_OFFSET', 'COUT_OFFSET', 'FILTER_S1', 'FILTER_S2', 'STRIDE',
+  # inst3
+  'LAYER_EN', 'IN_NUM_T', 'OUT_NUM_T', 'IN_H_T', 'IN_W_T', 'NXT_LAYER_BATCH',
+  # inst4
+  'TASK_NUM1', 'TASK_NUM2', 'LOCAL_ACCUM_NUM', 'LOCAL_REG_NUM', 'ROW_IL_FACTOR', 'COL_IL_FACTOR'
+]
+'''
+number of fields of each of the 5 instructions, the lines of a layer in the text format
+'''
+INST_LINES = [6, 6, 7, 6, 6]
+'''
+model configuration at the head of the config buffer
+'''
+MODEL_FIELDS = ['VGG_LAYERS', 'STAGE1_LAYERS', 'STAGE2_LAYERS', 'STAGE2_ITER']
+HEADER_DTYPE = np.dtype([('MAGIC', '<u4'), ('VERSION', '<u4'), ('LAYER_NUM', '<u4'), ('CONFIG_PARAMS', '<u4'), \
+  ('MODEL_PARAMS', '<u4'), ('PAYLOAD_OFFSET', '<u4'), ('RESERVED', '<u4', (2,))])
+FIELD_NAME_LEN = 32
+PAYLOAD_ALIGN = 4096
+
+'''
+check if a file is in the binary format
+'''
+def insts_is_bin(f_insts):
+  with open(f_insts, 'rb') as f:
+    magic = f.read(4)
+  return len(magic) == 4 and np.frombuffer(magic, dtype = '<u4')[0] == MAGIC
+
+'''
+read the text format, return insts[LAYER_NUM][CONFIG_PARAMS]
+'''
+def insts_text_read(f_insts):
+  with open(f_insts, 'r') as f:
+    values = np.array(f.read().split(), dtype = np.int64)
+  if len(values) % CONFIG_PARAMS != 0:
+    raise ValueError("%s: %d values is not a multiple of %d" % (f_insts, len(values), CONFIG_PARAMS))
+  return values.reshape(-1, CONFIG_PARAMS).astype(np.int32)
+
+'''
+write insts[LAYER_NUM][CONFIG_PARAMS] in the text format, as inst_parse.py does
+'''
+def insts_text_write(f_insts, insts):
+  with open(f_insts, 'w') as f:
+    for inst in insts:
+      pos = 0
+      for line_len in INST_LINES:
+        f.write(" ".join(str(int(e)) for e in inst[pos : pos + line_len]) + "\n")
+        pos += line_len
+      f.write("\n")
+
+'''
+write insts[LAYER_NUM][CONFIG_PARAMS] in the binary format, model holds the values of MODEL_FIELDS
+'''
+def insts_bin_write(f_insts, insts, model):
+  insts = np.asarray(insts)
+  if insts.ndim != 2 or insts.shape[1] != CONFIG_PARAMS:
+    raise ValueError("instructions of shape %s, expected [LAYER_NUM][%d]" % (str(insts.shape), CONFIG_PARAMS))
+  if np.any(insts < np.iinfo(np.int32).min) or np.any(insts > np.iinfo(np.int32).max):
+    raise ValueError("instruction fields out of the int32 range")
+  names = MODEL_FIELDS + INST_FIELDS
+  layout = np.zeros(len(names), dtype = 'S%d' % (FIELD_NAME_LEN))
+  layout[:] = [name.encode('ascii') for name in names]
+  payload_offset = -(-(HEADER_DTYPE.itemsize + layout.nbytes) // PAYLOAD_ALIGN) * PAYLOAD_ALIGN
+
+  header = np.zeros(1, dtype = HEADER_DTYPE)
+  header['MAGIC'] = MAGIC
+  header['VERSION'] = VERSION
+  header['LAYER_NUM'] = insts.shape[0]
+  header['CONFIG_PARAMS'] = CONFIG_PARAMS
+  header['MODEL_PARAMS'] = len(MODEL_FIELDS)
+  header['PAYLOAD_OFFSET'] = payload_offset
+  with open(f_insts, 'wb') as f:
+    f.write(header.tobytes())
+    f.write(layout.tobytes())
+    f.write(bytes(payload_offset - HEADER_DTYPE.itemsize - layout.nbytes))
+    f.write(np.array([model[name] for name in MODEL_FIELDS], dtype = '<i4').tobytes())
+    f.write(insts.astype('<i4').tobytes())
+
+'''
+read the header of the binary format and check its field layout
+'''
+def insts_bin_header(f_insts):
+  header = np.fromfile(f_insts, dtype = HEADER_DTYPE, count = 1)
+  if len(header) != 1 or header['MAGIC'][0] != MAGIC:
+    raise ValueError("%s: not a binary instruction file" % (f_insts))
+  header = dict(zip(HEADER_DTYPE.names, [value.tolist() for value in header[0]]))
+  if header['VERSION'] != VERSION:
+    raise ValueError("%s: version %d, expected %d" % (f_insts, header['VERSION'], VERSION))
+  field_num = header['MODEL_PARAMS'] + header['CONFIG_PARAMS']
+  layout = np.fromfile(f_insts, dtype = 'S%d' % (FIELD_NAME_LEN), count = field_num, offset = HEADER_DTYPE.itemsize)
+  names = [name.decode('ascii') for name in layout]
+  if names != MODEL_FIELDS + INST_FIELDS:
+    raise ValueError("%s: field layout %s does not match %s" % (f_insts, names, MODEL_FIELDS + INST_FIELDS))
+  return header
+
+'''
+map the payload of the binary format, the config buffer of the kernel [MODEL_PARAMS + LAYER_NUM * CONFIG_PARAMS]
+nothing is copied, the array is a read-only view of the file
+'''
+def config_buffer(f_insts):
+  header = insts_bin_header(f_insts)
+  return np.memmap(f_insts, dtype = '<i4', mode = 'r', offset = header['PAYLOAD_OFFSET'], \
+    shape = (header['MODEL_PARAMS'] + header['LAYER_NUM'] * header['CONFIG_PARAMS'],))
+
+'''
+read the binary format, return insts[LAYER_NUM][CONFIG_PARAMS] as a view of the mapped file and the model dict
+'''
+def insts_bin_read(f_insts):
+  config = config_buffer(f_insts)
+  model = dict(zip(MODEL_FIELDS, [int(value) for value in config[:len(MODEL_FIELDS)]]))
+  return config[len(MODEL_FIELDS):].reshape(-1, CONFIG_PARAMS), model
+
+'''
+read the #define macros of params.h
+'''
+def params_load(f_params):
+  params = {}
+  with open(f_params, 'r') as f:
+    for line in f:
+      content = line.split()
+      if len(content) == 3 and content[0] == '#define':
+        params[content[1]] = int(content[2])
+  return params
+
+'''
+read either format, return insts[LAYER_NUM][CONFIG_PARAMS] and the model dict, None for the text format
+'''
+def insts_read(f_insts):
+  if insts_is_bin(f_insts):
+    return insts_bin_read(f_insts)
+  return insts_text_read(f_insts), None
+
+'''
+convert between the formats, the direction is given by the format of f_in
+model is required to write the binary format, the text format does not hold it
+'''
+def insts_convert(f_in, f_out, model = None):
+  insts, model_in = insts_read(f_in)
+  if model_in is None:
+    if model is None:
+      raise ValueError("the model configuration is required to write the binary format")
+    insts_bin_write(f_out, insts, model)
+  else:
+    insts_text_write(f_out, insts)
+  return insts
+
+def run(f_in, f_out, f_model_config):
+  model = None
+  if f_model_config is not None:
+    with open(f_model_config, "r") as f:
+      model_config = json.loads(f.read())
+    model = dict([(name, model_config[name]) for name in MODEL_FIELDS])
+  insts = insts_convert(f_in, f_out, model)
+  print('%d layers written to %s' % (len(insts), f_out))
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description='Instruction format conversion.')
+
+  parser.add_argument('-n', '--insts', metavar='INSTS', required=True, help='instructions, text or binary', dest='insts')
+  parser.add_argument('-o', '--output', metavar='OUTPUT', required=True, help='instructions in the other format', dest='output')
+  parser.add_argument('-mc', '--model-config', metavar='MODEL_CONFIG', default=None, help='model topology, required to write the binary format', dest='model_config')
+
+  args = parser.parse_args()
+  run(args.insts, args.output, args.model_config)
@@ -1,6 +1,9 @@
 from math import ceil
 import json
 import argparse
+import os
+import network_ir
+import inst_format
 
 # TODO: LAYER1_K, STAGE2L_K, STAGE2R_K, STAGE2L_OFFSET, STAGE2R_OFFSET
 
@@ -10,59 +13,312 @@ import argparse
 # bias[OUT_NUM_HW]
 # cout[OUT_NUM_HW / OUT_NUM_T][H_HW][W_HW][OUT_NUM_T]
 
-# Memory Layout:
+# Memory Layout (ddr_layout), e.g. for openpose:
 # ----------------
 # input figure
 # ----------------
-# *** REGION 0 ***
-# conv2d_0
-# conv2d_1
-# conv2d_2
-# conv2d_3
-# conv2d_4
-# conv2d_5
-# conv2d_6
-# ----------------
-# *** REGION 1 ***
-# conv2d_8
-# conv2d_9
-# conv2d_10
-# ----------------
-# *** REGION 2 ***
+# the feature maps that are not concatenated, in the order of the rows of the network IR
+# conv2d_[0-6]
+# conv2d_[8-10]
 # MConv_Stage1_L1_[1-4]
 # MConv_Stage1_L2_[1-4]
-# ----------------
-# *** REGION 3 ***
-# MConv_Stage[2-6]_L1_[1-4]
 # MConv_Stage[2-6]_L1_[1-4]
+# MConv_Stage[2-6]_L2_[1-4]
 # ----------------
-# *** REGION 4 ***
+# the concatenations, with the second buffers of the carried layers at the other end
 # MConv_Stage1_L1_5 / MConv_Stage[3,5]_L1_5
 # MConv_Stage1_L2_5 / MConv_Stage[3,5]_L2_5
 # conv2d_3_pool
 # conv2d_7
 # conv2d_11
-# ----------------
-# *** REGION 5 ***
-# MConv_Stage[2,4,6]_L1_5
 # MConv_Stage[2,4,6]_L1_5
+# MConv_Stage[2,4,6]_L2_5
 # ----------------
 
 # Instruction Layout:
 # inst0: in_num_hw | out_num_hw | in_h_hw | in_w_hw | out_h_hw | out_w_hw
 # inst1: in_num | out_num | in_h | in_w | out_h | out_w
 # inst2: cin_offset | weight_offset | bias_offset | cout_offset | filter_s1 | filter_s2 | stride
-# inst3: layer_en: depth_conv_en, conv_en, relu_en, pool_en, up_sample_en, bias_en | in_num_t | out_num_t | layer_batch | in_h_t | in_w_t
+# inst3: layer_en: depth_conv_en, conv_en, relu_en, pool_en, up_sample_en, bias_en, inter_load_en, inter_write_en | in_num_t | out_num_t | layer_batch | in_h_t | in_w_t
+
+'''
+macros of params.h of the network outputs, in the order of the rows: the PAFs and the heatmaps of openpose
+'''
+OUTPUT_MACROS = ['STAGE2L', 'STAGE2R']
+
+'''
+configuration of a layer: the fields of its instruction but the offsets, and the sizes of its data
+the output feature maps are laid out for the layers that read them: with the halo of their largest filter, and the
+height and width padded to the tiles of the concatenation or of the first layer that reads them. the max pooling reads
+the feature maps of its input with their halo, from the configurations of the rows before in layer_configs
+'''
+def layer_config_get(net, layer_id, readers, layer_configs, SA_ROWS, SA_COLS, SA_SIMD):
+  layer = net[layer_id]
+  layer_type = str(layer['type'])
+
+  # the first layers of the stages read the padded concatenated feature maps
+  in_num = int(layer['in_num_cat'])
+  in_h = int(layer['in_h'])
+  in_w = int(layer['in_w'])
+  out_num = int(layer['out_num'])
+  out_h = int(layer['out_h'])
+  out_w = int(layer['out_w'])
+  filter_s = int(layer['filter_s'])
+  stride = int(layer['stride'])
+  in_num_t = int(layer['in_num_t'])
+  out_num_t = int(layer['out_num_t'])
+  in_h_t = int(layer['in_h_t'])
+  in_w_t = int(layer['in_w_t'])
+
+  srcs = network_ir.net_concat_sources(net, layer_id)
+  if layer['pool_en'] and len(srcs) > 0:
+    filter_s = layer_configs[srcs[0]]['NXT_FILTER_S']
+
+  cur_filter_s = filter_s
+  nxt_filter_s = max([int(net[reader]['filter_s']) for reader in readers[layer_id] if not net[reader]['pool_en']] + [1])
+  tile_readers = []
+  if layer['out_concat']:
+    tile_readers = [reader for reader in readers[layer_id] if net[reader]['in_concat']]
+  if len(tile_readers) == 0:
+    tile_readers = readers[layer_id]
+  if len(tile_readers) > 0:
+    out_h_t = int(net[tile_readers[0]]['in_h_t'])
+    out_w_t = int(net[tile_readers[0]]['in_w_t'])
+  else:
+    # the network outputs
+    out_h_t = in_h_t
+    out_w_t = in_w_t
+
+  in_num_hw = int(ceil(float(in_num) / in_num_t) * in_num_t)
+  out_num_hw = int(ceil(float(out_num) / out_num_t) * out_num_t)
+  in_h_hw = int(ceil(float(in_h) / in_h_t) * in_h_t + (cur_filter_s - 1))
+  in_w_hw = int(ceil(float(in_w) / in_w_t) * in_w_t + (cur_filter_s - 1))
+  out_h_hw = int(ceil(float(out_h) / out_h_t) * out_h_t + (nxt_filter_s - 1))
+  out_w_hw = int(ceil(float(out_w) / out_w_t) * out_w_t + (nxt_filter_s - 1))
+
+  task_num1 = int(ceil(float(in_num) / in_num_t) * ceil(float(out_num) / out_num_t) * ceil(float(in_h) / in_h_t) * ceil(float(in_w) / in_w_t))
+  task_num2 = int(ceil(float(out_num) / out_num_t) * ceil(float(in_h) / in_h_t) * ceil(float(in_w) / in_w_t))
+  if layer_type == "separable_conv":
+    local_accum_num = int(in_num_t / SA_SIMD * 1 * 1)
+  else:
+    local_accum_num = int(in_num_t / SA_SIMD * filter_s * filter_s)
+  local_reg_num = int((in_h_t / stride) * (in_w_t / SA_COLS / stride) * (out_num_t / SA_ROWS))
+  row_il_factor = int(out_num_t / SA_ROWS)
+  col_il_factor = int(in_w_t / SA_COLS / stride)
+
+  if layer_type == "separable_conv":
+    weight_size_hw = in_num_hw * filter_s * filter_s + in_num_hw *out_num_hw * 1 * 1
+    bias_size_hw = out_num_hw
+  elif layer_type == "convb":
+    weight_size_hw = in_num_hw * out_num_hw * filter_s * filter_s
+    bias_size_hw = out_num_hw
+  else: # maxpool
+    weight_size_hw = 0
+    bias_size_hw = 0
+
+  layer_config = {}
+  layer_config['IN_NUM'] = in_num
+  layer_config['OUT_NUM'] = out_num
+  layer_config['IN_H'] = in_h
+  layer_config['IN_W'] = in_w
+  layer_config['OUT_H'] = out_h
+  layer_config['OUT_W'] = out_w
+  layer_config['IN_NUM_HW'] = in_num_hw
+  layer_config['OUT_NUM_HW'] = out_num_hw
+  layer_config['IN_H_HW'] = in_h_hw
+  layer_config['IN_W_HW'] = in_w_hw
+  layer_config['OUT_H_HW'] = out_h_hw
+  layer_config['OUT_W_HW'] = out_w_hw
+  layer_config['FILTER_S1'] = int(layer['filter_s1'])
+  layer_config['FILTER_S2'] = int(layer['filter_s2'])
+  layer_config['STRIDE'] = stride
+  layer_config['IN_NUM_T'] = in_num_t
+  layer_config['OUT_NUM_T'] = out_num_t
+  layer_config['IN_H_T'] = in_h_t
+  layer_config['IN_W_T'] = in_w_t
+  layer_config['NXT_LAYER_BATCH'] = 1
+  layer_config['TASK_NUM1'] = task_num1
+  layer_config['TASK_NUM2'] = task_num2
+  layer_config['LOCAL_ACCUM_NUM'] = local_accum_num
+  layer_config['LOCAL_REG_NUM'] = local_reg_num
+  layer_config['ROW_IL_FACTOR'] = row_il_factor
+  layer_config['COL_IL_FACTOR'] = col_il_factor
+
+  up_sample_en = 0
+  inter_load_en = 0
+  inter_write_en = 0
+  layer_en = int(layer['depth_conv_en']) + (int(layer['point_conv_en']) << 1) + (int(layer['relu_en']) << 2) + (int(layer['pool_en']) << 3) + \
+    (up_sample_en << 4) + (int(layer['bias_en']) << 5) + (inter_load_en << 6) + (inter_write_en << 7)
+  layer_config['LAYER_EN'] = layer_en
+  layer_config['POOL_EN'] = int(layer['pool_en'])
+
+  layer_config['NXT_FILTER_S'] = nxt_filter_s
+  layer_config['CIN_SIZE_HW'] = in_num_hw * in_h_hw * in_w_hw
+  layer_config['COUT_SIZE_HW'] = out_num_hw * out_h_hw * out_w_hw
+  layer_config['WEIGHT_SIZE_HW'] = weight_size_hw
+  layer_config['BIAS_SIZE_HW'] = bias_size_hw
+  return layer_config
+
+'''
+offset of the first pixel of the output feature maps of a layer past their halo
+'''
+def fm_shift(layer_config):
+  return layer_config['OUT_NUM_T'] * layer_config['OUT_W_HW'] * int(layer_config['NXT_FILTER_S'] / 2) + layer_config['OUT_NUM_T'] * int(layer_config['NXT_FILTER_S'] / 2)
+
+'''
+the DDR slot (row, buffer) of the output of a layer in the iteration it of its block: a carried layer writes the buffer
+of its initial layer that the next iteration reads, the initial layer writes the first one
+'''
+def fm_slot(net, layer_id, it):
+  if net[layer_id]['carry'] >= 0:
+    return (int(net[layer_id]['carry']), (it + 1) % 2)
+  return (layer_id, 0)
+
+'''
+the executions (row, iteration) of the layers read by a layer in the iteration it of its block, in the channel order
+of network_ir.net_concat_order: the same iteration in the block of the layer, the last one in the blocks before, the
+previous iteration for the carried layers. the network input is (-1, 0)
+'''
+def src_executions(net, layer_id, it):
+  layer = net[layer_id]
+  if layer['in_src_num'] == 0:
+    return [(-1, 0)]
+  carried = network_ir.net_carried(net, layer_id)
+  src_execs = []
+  for src in network_ir.net_concat_order(net, layer_id, it):
+    if src in carried and it > 0:
+      src_execs.append((carried[src], it - 1))
+    elif net[src]['stage'] == layer['stage']:
+      src_execs.append((src, it))
+    else:
+      src_execs.append((src, int(net[src]['repeat']) - 1))
+  return src_execs
+
+'''
+lay out the output feature maps in DDR after the input figure, return the offsets of the slots of fm_slot and the size
+of the layout
+the feature maps that are not concatenated have one slot each, in the order of the rows, the iterations of a repeated
+block overwrite them. the concatenated ones follow, the largest concatenation first, in its channel order with the
+second buffers of the carried layers at the other end. the other concatenations must read a contiguous part of the
+ones laid out before
+'''
+def ddr_layout(net, layer_configs, in_out_offset):
+  slots = [(layer_id, 0) for layer_id in range(len(net)) if not net[layer_id]['out_concat']]
+
+  concats = {}
+  for layer_id in range(len(net)):
+    if net[layer_id]['in_concat']:
+      concats.setdefault(tuple(network_ir.net_concat_sources(net, layer_id)), layer_id)
+  reads = []
+  for srcs in sorted(concats.keys(), key = lambda srcs: (-len(srcs), concats[srcs])):
+    layer_id = concats[srcs]
+    # the slots read by the even and the odd iterations
+    its = 2 if any([src in network_ir.net_carried(net, layer_id) for src in srcs]) else 1
+    concat_reads = [[fm_slot(net, src, src_it) for src, src_it in src_executions(net, layer_id, it)] for it in range(its)]
+    reads += [(layer_id, concat_read) for concat_read in concat_reads]
+    placed = [slot in slots for concat_read in concat_reads for slot in concat_read]
+    if all(placed):
+      continue
+    if any(placed):
+      raise ValueError("layer %s: the concatenation shares a part of the feature maps of another one" % (net[layer_id]['name']))
+    layout = concat_reads[0]
+    second = [slot for slot in concat_reads[-1] if slot not in layout]
+    if len(second) > 0 and concat_reads[-1][0] in second:
+      layout = second + layout
+    else:
+      layout = layout + second
+    slots += layout
+  for layer_id, concat_read in reads:
+    start = slots.index(concat_read[0])
+    if slots[start : start + len(concat_read)] != concat_read:
+      raise ValueError("layer %s: the concatenation is not contiguous in DDR" % (net[layer_id]['name']))
+
+  # the carried layers share the buffers of their initial layer
+  for layer_id in range(len(net)):
+    init_id = int(net[layer_id]['carry'])
+    if init_id >= 0 and any([layer_configs[layer_id][name] != layer_configs[init_id][name] for name in ['OUT_NUM_HW', 'OUT_NUM_T', 'OUT_H_HW', 'OUT_W_HW']]):
+      raise ValueError("layer %s: the output is not laid out as the output of %s" % (net[layer_id]['name'], net[init_id]['name']))
+
+  fm_offsets = {}
+  offset = in_out_offset
+  for layer_id, buf in slots:
+    fm_offsets[(layer_id, buf)] = offset
+    offset += layer_configs[layer_id]['COUT_SIZE_HW']
+  return fm_offsets, offset
+
+'''
+check the DDR dataflow of the instructions against the network IR: each layer reads the feature maps of the executions
+of src_executions contiguously, with their channel tiles, height and width, after they are written and before they are
+overwritten, not over its own inputs, and the outputs are still in DDR after the last layer
+a ValueError is raised otherwise, so that a graph the layout does not support does not give wrong instructions
+'''
+def insts_check(net, order, exec_configs, in_out_offset, cin_size, outputs):
+  # the feature maps in DDR, {execution: (start, end)}, and the layers that overwrote the others
+  live = {(-1, 0): (0, in_out_offset)}
+  overwritten = {}
+  for layer_id, it in order:
+    layer_config = exec_configs[(layer_id, it)]
+    name = "%s (iteration %d)" % (net[layer_id]['name'], it)
+    cin_offset = layer_config['CIN_OFFSET']
+    in_num_hw = 0
+    reads = []
+    for src_id, src_it in src_executions(net, layer_id, it):
+      src_name = "%s (iteration %d)" % (net[src_id]['name'], src_it) if src_id >= 0 else "the input figure"
+      if (src_id, src_it) not in live:
+        raise ValueError("%s reads %s, overwritten by %s" % (name, src_name, overwritten.get((src_id, src_it), 'no layer')))
+      start, end = live[(src_id, src_it)]
+      reads.append((src_name, start, end))
+      if src_id < 0:
+        if cin_offset != start or layer_config['CIN_SIZE_HW'] > end - start:
+          raise ValueError("%s reads [%d, %d), the input figure is [%d, %d)" % (name, cin_offset, cin_offset + layer_config['CIN_SIZE_HW'], start, end))
+        in_num_hw = layer_config['IN_NUM_HW']
+        continue
+      src_config = exec_configs[(src_id, src_it)]
+      if net[layer_id]['pool_en']:
+        start += fm_shift(src_config)
+      if cin_offset != start:
+        raise ValueError("%s reads %s at %d, it is written at %d" % (name, src_name, cin_offset, start))
+      for in_name, out_name in [('IN_NUM_T', 'OUT_NUM_T'), ('IN_H_HW', 'OUT_H_HW'), ('IN_W_HW', 'OUT_W_HW')]:
+        if layer_config[in_name] != src_config[out_name]:
+          raise ValueError("%s reads %s with %s %d, it is written with %s %d" % (name, src_name, in_name, layer_config[in_name], out_name, src_config[out_name]))
+      cin_offset = end
+      in_num_hw += src_config['OUT_NUM_HW']
+    if in_num_hw != layer_config['IN_NUM_HW']:
+      raise ValueError("%s reads %d channels, %d are written" % (name, layer_config['IN_NUM_HW'], in_num_hw))
+
+    start = layer_config['COUT_OFFSET']
+    end = start + layer_config['COUT_SIZE_HW']
+    if start < in_out_offset or end > cin_size:
+      raise ValueError("%s writes [%d, %d) out of the feature maps [%d, %d)" % (name, start, end, in_out_offset, cin_size))
+    for src_name, src_start, src_end in reads:
+      if src_start < end and start < src_end:
+        raise ValueError("%s writes [%d, %d) over %s that it reads" % (name, start, end, src_name))
+    for fm_exec, (fm_start, fm_end) in list(live.items()):
+      if fm_start < end and start < fm_end:
+        del live[fm_exec]
+        overwritten[fm_exec] = name
+    live[(layer_id, it)] = (start, end)
+
+  for layer_id in outputs:
+    if (layer_id, int(net[layer_id]['repeat']) - 1) not in live:
+      raise ValueError("the output %s is overwritten by %s" % (net[layer_id]['name'], overwritten[(layer_id, int(net[layer_id]['repeat']) - 1)]))
+
+'''
+generate the instructions of one input into out_dir
+model is the network IR of network_ir.net_parse, parsed from f_model if not given
+with plan, the feature maps are packed by ddr_plan.py instead of the layout of ddr_layout
+with fuse, the layers are fused by layer_fuse.py with an on-chip buffer of fuse_buf elements, sized by the default
+board of layer_fuse.py if not given
+with board, the DDR traffic and roofline report of roofline.py against the board JSON is written to roofline.json
+'''
+def run(f_tile, f_model, f_model_config, f_input_config, out_dir = '.', model = None, plan = False, fuse = False, \
+  fuse_buf = None, board = None):
+
+  macros = open(os.path.join(out_dir, "params.h"), "w")
 
-def run(f_tile, f_model, f_model_config, f_input_config):
-
-  macros = open("./params.h", "w")
-
-  model = open(f_model, "r")
   with open(f_tile, "r") as f:
     tile = json.loads(f.read())
-  with open(f_model_config, "r") as f:
-    model_config = json.loads(f.read())
+  model_config = network_ir.model_config_load(f_model, f_model_config)
   with open(f_input_config, "r") as f:
     input_config = json.loads(f.read())
 
@@ -91,11 +347,6 @@ def run(f_tile, f_model, f_model_config, f_input_config):
   STAGE2_LAYERS = model_config["STAGE2_LAYERS"]
   STAGE2_ITER = model_config["STAGE2_ITER"]
 
-  # input info
-  network_in_num = input_config["IN_NUM"]
-  network_in_h = input_config["IN_H"]
-  network_in_w = input_config["IN_W"]
-
   # Please do not change the code below
   # write out macros
   macros.write("#define IN_NUM_T " + str(IN_NUM_T) + '\n')
@@ -106,7 +357,19 @@ def run(f_tile, f_model, f_model_config, f_input_config):
   macros.write("#define OUT_W_T " + str(OUT_W_T) + '\n')
   macros.write("#define K_T " + str(K_T) + '\n')
 
-  LAYER_NUM = VGG_LAYERS + STAGE1_LAYERS*2 + STAGE2_LAYERS * 2 * STAGE2_ITER
+  # the layer attributes and the feature map shapes come from the network IR
+  if model is None:
+    model = network_ir.net_parse(f_model, model_config)
+  net = network_ir.net_shape(model, input_config)
+  # the executions of the layers, in the order of the weights and in the order of the instructions
+  execs = network_ir.net_executions(net)
+  order = network_ir.net_inst_order(net)
+  outputs = network_ir.net_outputs(net)
+  if len(outputs) != len(OUTPUT_MACROS):
+    raise ValueError("the network has %d outputs %s, the host reads %d" % (len(outputs), \
+      [str(net[layer_id]['name']) for layer_id in outputs], len(OUTPUT_MACROS)))
+
+  LAYER_NUM = len(order)
   macros.write("#define LAYER_NUM " + str(LAYER_NUM) + '\n')
   macros.write("#define VGG_LAYERS " + str(VGG_LAYERS) + '\n')
   macros.write("#define STAGE1_LAYERS " + str(STAGE1_LAYERS) + '\n')
@@ -115,1388 +378,265 @@ def run(f_tile, f_model, f_model_config, f_input_config):
   macros.write("#define STAGE2_ITER " + str(STAGE2_ITER) + '\n')
 
   #model = open("./small.model", "r")
-  insts = open("./openpose.insts", "w")
-  weight_load = open("./weight_offset.dat", "w")
-  bias_load = open("./bias_offset.dat", "w")
-
-  lines = []
-  for i in model.readlines():
-    lines.append(i)
-
-  line_num = len(lines)
-
-  vgg_layer_cnt = 0
-  stage1_layer_cnt = 0
-  stage1_iter_cnt = 0
-  stage2_layer_cnt = 0
-  stage2_iter_cnt = 0
-  stage1_channel_cnt = 0
-  stage2_channel_cnt = 0
-
+  insts = open(os.path.join(out_dir, "openpose.insts"), "w")
+  weight_load = open(os.path.join(out_dir, "weight_offset.dat"), "w")
+  bias_load = open(os.path.join(out_dir, "bias_offset.dat"), "w")
+
+  # Pass 1: To learn about the layer configurations and output sizes
+  readers = network_ir.net_readers(net)
+  layer_configs = []
+  for layer_id in range(len(net)):
+    layer_configs.append(layer_config_get(net, layer_id, readers, layer_configs, SA_ROWS, SA_COLS, SA_SIMD))
+
+  # Pass 2: To lay out the feature maps in DDR
+  # the input figure is read by the first layers
+  in_out_offset = max([layer_configs[layer_id]['CIN_SIZE_HW'] for layer_id in range(len(net)) if net[layer_id]['in_src_num'] == 0])
+  fm_offsets, cin_size = ddr_layout(net, layer_configs, in_out_offset)
+
+  # Pass 3: To generate offsets
   """
   Offset Calculation
-  cin_offset <- cin_offset + IN_NUM_HW(prev_layer)*IN_H_HW(prev_layer)*IN_W_HW(prev_layer)
-  weight_offset <- weight_offset + OUT_NUM_HW(prev_layer)*IN_NUM_HW(prev_layer)*FILTER_S(prev_layer)*FILTER_S(prev_layer)
+  cin_offset <- the output of the layer read, the first one of a concatenation, past its halo for the max pooling
+  weight_offset <- weight_offset + WEIGHT_SIZE_HW(prev_layer), in the execution order of network_ir.net_schedule
   bias_offset <- bias_offset + OUT_NUM_HW(prev_layer)
-  cout_offset <- cout_offset + OUT_NUM_HW(prev_layer)*OUT_H_HW(prev_layer)*OUT_W_HW(prev_layer)
+  cout_offset <- the slot of the output, shifted by the halo of the layers that read it
   """
-  cin_offset = 0
-  cout_offset = 0
+  exec_configs = {}
   weight_offset = 0
   bias_offset = 0
-
-  region0_offset = 0
-  region1_offset = 0
-  region2_offset = 0
-  region3_offset = 0
-  region4_offset = 0
-
-  current_model = "VGG" #{VGG, STAGE1, STAGE2}
-  stage1_line_id = 0
-  stage2_line_id = 0
-
-  in_num_hw = 0
-  out_num_hw = 0
-  in_h_hw = 0
-  in_w_hw = 0
-  out_h_hw = 0
-  out_w_hw = 0
-  filter_s = 0
-
-  in_num = network_in_num
-  out_num = network_in_num
-  in_h = network_in_h
-  in_w = network_in_w
-  out_h = network_in_h
-  out_w = network_in_w
-
-  in_out_offset = 0
-
-  # Pass 1: To learn about the filter size, in_out_offset, in_h_t, in_w_t
-  # We need a separate pass to learn about the filter size
-  filter_list = []
-  in_h_t_list = []
-  in_w_t_list = []
-  for line_id in range(1, len(lines)):
-    line = lines[line_id].strip('\n')
-    content = line.split(",")
-    if len(content) > 1:
-      filter_s = int(content[3])
-      filter_list.append(filter_s)
-      in_h_t = int(content[9])
-      in_w_t = int(content[10])
-      in_h_t_list.append(in_h_t)
-      in_w_t_list.append(in_w_t)
-
-  #print filter_list
-  # Get the in_out_offset
-  line_id = 1
-  while line_id < len(lines):
-    line = lines[line_id].strip('\n')
-    content = line.split(",")
-    if current_model == "VGG":
-      if content[1] == "convb" or content[1] == "separable_conv":
-        if vgg_layer_cnt == 1:
-  	      in_out_offset = in_num_hw * in_h_hw * in_w_hw
-
-        if vgg_layer_cnt == 1:
-          macros.write("#define IN_OUT_OFFSET " + str(int(in_out_offset)) + '\n')
-
-        relu_en = 0
-        pool_en = 0
-        if len(content) > 1 and (content[5] == "1"):
-          relu_en = 1
-        if content[1] == "max_pool":
-          pool_en = 1
-        layer_name = content[0]
-        layer_type = content[1]
-
-        in_num = out_num
-        out_num = int(content[2])
-        filter_s = int(content[3])
-        stride = int(content[4])
-        in_h = out_h
-        in_w = out_w
-        in_num_t = int(content[7])
-        out_num_t = int(content[8])
-        in_h_t = int(content[9])
-        in_w_t = int(content[10])
-
-        if stride == 2:
-          out_h = int(ceil(float(in_h) / 2))
-          out_w = int(ceil(float(in_w) / 2))
-        else:
-          out_h = in_h
-          out_w = in_w
-
-        cur_filter_s = filter_s
-        nxt_filter_s = 0
-        if layer_name == "Conv2d_7" or layer_name == "Conv2d_11" or layer_name == "Conv2d_3_pool":
-          nxt_filter_s = max(filter_list[VGG_LAYERS], filter_list[VGG_LAYERS + STAGE1_LAYERS * 2])
-          out_h_t = in_h_t_list[VGG_LAYERS]
-          out_w_t = in_w_t_list[VGG_LAYERS]
-        else:
-          nxt_filter_s = filter_list[vgg_layer_cnt + 1]
-          out_h_t = in_h_t_list[vgg_layer_cnt + 1]
-          out_w_t = in_w_t_list[vgg_layer_cnt + 1]
-
-        in_num_hw = int(ceil(float(in_num) / in_num_t) * in_num_t)
-        out_num_hw = int(ceil(float(out_num) / out_num_t) * out_num_t)
-        in_h_hw = int(ceil(float(in_h) / in_h_t) * in_h_t + (cur_filter_s - 1))
-        in_w_hw = int(ceil(float(in_w) / in_w_t) * in_w_t + (cur_filter_s - 1))
-        out_h_hw = int(ceil(float(out_h) / out_h_t) * out_h_t + (nxt_filter_s - 1))
-        out_w_hw = int(ceil(float(out_w) / out_w_t) * out_w_t + (nxt_filter_s - 1))
-
-#        print(in_num_hw, in_h_hw, in_w_hw)
-#        print(vgg_layer_cnt)
-
-        vgg_layer_cnt = vgg_layer_cnt + 1
-  	    # store the start line number of stage 1
-        if vgg_layer_cnt == 2:
-          break
-    line_id = line_id + 1
-
-#  print(in_out_offset)
-
-  # reinitialize all parameters
-  vgg_layer_cnt = 0
-  vgg_layer_cnt = 0
-  stage1_layer_cnt = 0
-  stage1_iter_cnt = 0
-  stage2_layer_cnt = 0
-  stage2_iter_cnt = 0
-  stage1_channel_cnt = 0
-  stage2_channel_cnt = 0
-
-  in_num_hw = 0
-  out_num_hw = 0
-  in_h_hw = 0
-  in_w_hw = 0
-  out_h_hw = 0
-  out_w_hw = 0
-  filter_s = 0
-
-  in_num = network_in_num
-  out_num = network_in_num
-  in_h = network_in_h
-  in_w = network_in_w
-  out_h = network_in_h
-  out_w = network_in_w
-
-  # Pass 2: To learn about layer output size
-  layer_cin_size = {}
-  layer_cin_size_hw = {}
-  layer_cout_size = {}
-  layer_cout_size_hw = {}
-  layer_cout_size_hw_concat = {}
-  layer_weight_size = {}
-  layer_weight_size_hw = {}
-  layer_bias_size = {}
-  layer_bias_size_hw = {}
-
-  Conv2d_3_out_num = 0
-  Conv2d_3_out_h = 0
-  Conv2d_3_out_w = 0
-  Conv2d_3_pool_out_num = 0
-  Conv2d_3_pool_out_h = 0
-  Conv2d_3_pool_out_w = 0
-  Conv2d_7_out_num = 0
-  Conv2d_7_out_h = 0
-  Conv2d_7_out_w = 0
-  Conv2d_11_out_num = 0
-  Conv2d_11_out_h = 0
-  Conv2d_11_out_w = 0
-  MConv_Stage1_L1_5_out_num = 0
-  MConv_Stage1_L1_5_out_h = 0
-  MConv_Stage1_L1_5_out_w = 0
-  MConv_Stage1_L2_5_out_num = 0
-  MConv_Stage1_L2_5_out_h = 0
-  MConv_Stage1_L2_5_out_w = 0
-  MConv_Stage2_L1_5_out_num = 0
-  MConv_Stage2_L1_5_out_h = 0
-  MConv_Stage2_L1_5_out_w = 0
-  MConv_Stage2_L2_5_out_num = 0
-  MConv_Stage2_L2_5_out_h = 0
-  MConv_Stage2_L2_5_out_w = 0
-
+  for layer_id, it in execs:
+    layer_config = layer_configs[layer_id]
+    weight_load.write(str(weight_offset) + " " + str(layer_config['WEIGHT_SIZE_HW']) + '\n')
+    bias_load.write(str(bias_offset) + " " + str(layer_config['BIAS_SIZE_HW']) + '\n')
+
+    src_exec = src_executions(net, layer_id, it)[0]
+    if src_exec[0] < 0:
+      cin_offset = 0
+    else:
+      cin_offset = fm_offsets[fm_slot(net, src_exec[0], src_exec[1])]
+      # the max pooling reads the feature maps of its input without their halo
+      if net[layer_id]['pool_en']:
+        cin_offset += fm_shift(layer_configs[src_exec[0]])
+    cout_offset = fm_offsets[fm_slot(net, layer_id, it)]
+
+    exec_config = dict(layer_config)
+    exec_config['CIN_OFFSET'] = cin_offset
+    exec_config['WEIGHT_OFFSET'] = weight_offset
+    exec_config['BIAS_OFFSET'] = bias_offset
+    exec_config['COUT_OFFSET'] = cout_offset
+    exec_config['SHIFTED_COUT_OFFSET'] = cout_offset + fm_shift(layer_config)
+    exec_configs[(layer_id, it)] = exec_config
+
+    weight_offset += layer_config['WEIGHT_SIZE_HW']
+    bias_offset += layer_config['BIAS_SIZE_HW']
+
+  # the layers of the next depth of a block iteration are batched after the last layer of a depth, the layers of the
+  # branches of the stages
   max_layer_batch = 1
-  layer_configs = {}
-
-  #for line_id in range(0,len(lines)):
-  line_id = 1
-  while line_id < len(lines):
-    line = lines[line_id].strip('\n')
-    content = line.split(",")
-    if current_model == "VGG":
-      relu_en = 0
-      pool_en = 0
-      bias_en = 0
-      if len(content) > 1 and content[6] == "1":
-        bias_en = 1
-      if len(content) > 1 and content[5] == "1":
-        relu_en = 1
-#      if len(content) > 1 and content[4] == "2":
-#        pool_en = 1
-      if len(content) > 1 and content[1] == "max_pool":
-        pool_en = 1
-      layer_name = content[0]
-      layer_type = content[1]
-
-      #print(layer_name)
-
-      in_num = out_num
-      in_h = out_h
-      in_w = out_w
-      out_num = int(content[2])
-      filter_s = int(content[3])
-      stride = int(content[4])
-      in_num_t = int(content[7])
-      out_num_t = int(content[8])
-      in_h_t = int(content[9])
-      in_w_t = int(content[10])
-
-      if layer_name == "Conv2d_3_pool":
-        in_num = Conv2d_3_out_num
-        in_h = Conv2d_3_out_h
-        in_w = Conv2d_3_out_w
-        filter_s = Conv2d_3_nxt_filter_s
-
-      if stride == 2:
-        out_h = int(ceil(float(in_h) / 2))
-        out_w = int(ceil(float(in_w) / 2))
-#        out_h = (in_h + 1) / 2
-#        out_w = (in_w + 1) / 2
-      else:
-        out_h = in_h
-        out_w = in_w
-
-      cur_filter_s = filter_s
-      nxt_filter_s = 0
-      #if vgg_layer_cnt == VGG_LAYERS - 2:
-      if layer_name == "Conv2d_7" or layer_name == "Conv2d_11" or layer_name == "Conv2d_3_pool":
-        nxt_filter_s = max(filter_list[VGG_LAYERS], filter_list[VGG_LAYERS + STAGE1_LAYERS * 2])
-        out_h_t = in_h_t_list[VGG_LAYERS]
-        out_w_t = in_w_t_list[VGG_LAYERS]
-      else:
-        nxt_filter_s = filter_list[vgg_layer_cnt + 1]
-        out_h_t = in_h_t_list[vgg_layer_cnt + 1]
-        out_w_t = in_w_t_list[vgg_layer_cnt + 1]
-
-      in_num_hw = int(ceil(float(in_num) / in_num_t) * in_num_t)
-      out_num_hw = int(ceil(float(out_num) / out_num_t) * out_num_t)
-      in_h_hw = int(ceil(float(in_h) / in_h_t) * in_h_t + (cur_filter_s - 1))
-      in_w_hw = int(ceil(float(in_w) / in_w_t) * in_w_t + (cur_filter_s - 1))
-      out_h_hw = int(ceil(float(out_h) / out_h_t) * out_h_t + (nxt_filter_s - 1))
-      out_w_hw = int(ceil(float(out_w) / out_w_t) * out_w_t + (nxt_filter_s - 1))
-
-      task_num1 = int(ceil(float(in_num) / in_num_t) * ceil(float(out_num) / out_num_t) * ceil(float(in_h) / in_h_t) * ceil(float(in_w) / in_w_t))
-      task_num2 = int(ceil(float(out_num) / out_num_t) * ceil(float(in_h) / in_h_t) * ceil(float(in_w) / in_w_t))
-      if layer_type == "separable_conv":
-        local_accum_num = int(in_num_t / SA_SIMD * 1 * 1)
-      else:
-        local_accum_num = int(in_num_t / SA_SIMD * filter_s * filter_s)
-      local_reg_num = int((in_h_t / stride) * (in_w_t / SA_COLS / stride) * (out_num_t / SA_ROWS))
-      row_il_factor = int(out_num_t / SA_ROWS)
-      col_il_factor = int(in_w_t / SA_COLS / stride)
-
-      if layer_name == "Conv2d_3":
-        Conv2d_3_out_num = out_num
-        Conv2d_3_out_num_hw = out_num_hw
-        Conv2d_3_out_h = out_h
-        Conv2d_3_out_w = out_w
-        Conv2d_3_nxt_filter_s = nxt_filter_s
-
-      if layer_name == "Conv2d_7":
-        Conv2d_7_out_num = out_num
-        Conv2d_7_out_num_hw = out_num_hw
-        Conv2d_7_out_h = out_h
-        Conv2d_7_out_w = out_w
-        Conv2d_7_nxt_filter_s = nxt_filter_s
-
-      if layer_name == "Conv2d_11":
-        Conv2d_11_out_num = out_num
-        Conv2d_11_out_num_hw = out_num_hw
-        Conv2d_11_out_h = out_h
-        Conv2d_11_out_w = out_w
-        Conv2d_11_nxt_filter_s = nxt_filter_s
-
-      if layer_name == "Conv2d_3_pool":
-        Conv2d_3_pool_out_num = out_num
-        Conv2d_3_pool_out_num_hw = out_num_hw
-        Conv2d_3_pool_out_h = out_h
-        Conv2d_3_pool_out_w = out_w
-        Conv2d_3_pool_nxt_filter_s = nxt_filter_s
-
-      # calculate cin, cout, weight, bias size
-      cin_size = in_num * in_h * in_w
-      cin_size_hw = in_num_hw * in_h_hw * in_w_hw
-
-      cout_size = out_num * out_h * out_w
-      cout_size_hw = out_num_hw * out_h_hw * out_w_hw
-      cout_size_hw_concat = out_num * out_h_hw * out_w_hw
-
-      if layer_type == "separable_conv":
-        weight_size = in_num * filter_s * filter_s + in_num * out_num * 1 * 1
-        weight_size_hw = in_num_hw * filter_s * filter_s + in_num_hw *out_num_hw * 1 * 1
-        bias_size = out_num
-        bias_size_hw = out_num_hw
-      elif layer_type == "convb":
-        weight_size = in_num * out_num * filter_s * filter_s
-        weight_size_hw = in_num_hw * out_num_hw * filter_s * filter_s
-        bias_size = out_num
-        bias_size_hw = out_num_hw
-      else: # maxpool
-        weight_size = 0
-        weight_size_hw = 0
-        bias_size = 0
-        bias_size_hw = 0
-
-      weight_load_size = weight_size_hw
-      bias_load_size = bias_size_hw
-      weight_load.write(str(weight_offset) + " " + str(weight_load_size) + '\n')
-      bias_load.write(str(bias_offset) + " " + str(bias_load_size) + '\n')
-
-      weight_offset = weight_offset + weight_load_size
-      bias_offset = bias_offset + bias_load_size
-
-      if vgg_layer_cnt == 0:
-        macros.write("#define LAYER1_IN_NUM " + str(in_num) + '\n')
-        macros.write("#define LAYER1_OUT_NUM " + str(out_num) + '\n')
-        macros.write("#define LAYER1_IN_NUM_T " + str(in_num_t) + '\n')
-        macros.write("#define LAYER1_OUT_NUM_T " + str(out_num_t) + '\n')
-        macros.write("#define LAYER1_IN_H " + str(in_h) + '\n')
-        macros.write("#define LAYER1_IN_W " + str(in_w) + '\n')
-        macros.write("#define LAYER1_OUT_H " + str(out_h) + '\n')
-        macros.write("#define LAYER1_OUT_W " + str(out_w) + '\n')
-        macros.write("#define LAYER1_IN_NUM_HW " + str(int(in_num_hw)) + '\n')
-        macros.write("#define LAYER1_OUT_NUM_HW " + str(int(out_num_hw)) + '\n')
-        macros.write("#define LAYER1_IN_H_HW " + str(int(in_h_hw)) + '\n')
-        macros.write("#define LAYER1_IN_W_HW " + str(int(in_w_hw)) + '\n')
-        macros.write("#define LAYER1_OUT_H_HW " + str(int(out_h_hw)) + '\n')
-        macros.write("#define LAYER1_OUT_W_HW " + str(int(out_w_hw)) + '\n')
-#        macros.write("#define LAYER1_K " + str(filter_s) + '\n')
-        macros.write("#define LAYER1_K " + str(nxt_filter_s) + '\n')
-        macros.write("#define LAYER1_POOL " + str(pool_en) + '\n')
-
-      layer_cin_size[layer_name] = cin_size
-      layer_cin_size_hw[layer_name] = cin_size_hw
-
-      layer_cout_size[layer_name] = cout_size
-      layer_cout_size_hw[layer_name] = cout_size_hw
-      layer_cout_size_hw_concat[layer_name] = cout_size_hw_concat
-
-      layer_weight_size[layer_name] = weight_size
-      layer_weight_size_hw[layer_name] = weight_size_hw
-
-      layer_bias_size[layer_name] = bias_size
-      layer_bias_size_hw[layer_name] = bias_size_hw
-
-      layer_config = {}
-      layer_config['IN_NUM'] = in_num
-      layer_config['OUT_NUM'] = out_num
-      layer_config['IN_H'] = in_h
-      layer_config['IN_W'] = in_w
-      layer_config['OUT_H'] = out_h
-      layer_config['OUT_W'] = out_w
-      layer_config['IN_NUM_HW'] = in_num_hw
-      layer_config['OUT_NUM_HW'] = out_num_hw
-      layer_config['IN_H_HW'] = in_h_hw
-      layer_config['IN_W_HW'] = in_w_hw
-      layer_config['OUT_H_HW'] = out_h_hw
-      layer_config['OUT_W_HW'] = out_w_hw
-      if layer_type == "separable_conv":
-        layer_config['FILTER_S1'] = filter_s
-        layer_config['FILTER_S2'] = 1
-      elif layer_type == "convb":
-        layer_config['FILTER_S1'] = 1
-        layer_config['FILTER_S2'] = filter_s
-      elif layer_type == "max_pool":
-        layer_config['FILTER_S1'] = 1
-        layer_config['FILTER_S2'] = 1
-      layer_config['STRIDE'] = stride
-      layer_config['IN_NUM_T'] = in_num_t
-      layer_config['OUT_NUM_T'] = out_num_t
-      layer_config['IN_H_T'] = in_h_t
-      layer_config['IN_W_T'] = in_w_t
-      layer_config['NXT_LAYER_BATCH'] = 1
-      layer_config['TASK_NUM1'] = task_num1
-      layer_config['TASK_NUM2'] = task_num2
-      layer_config['LOCAL_ACCUM_NUM'] = local_accum_num
-      layer_config['LOCAL_REG_NUM'] = local_reg_num
-      layer_config['ROW_IL_FACTOR'] = row_il_factor
-      layer_config['COL_IL_FACTOR'] = col_il_factor
-
-      if layer_type == "separable_conv":
-        depth_conv_en = 1
-        conv_en = 1
-      elif layer_type == "convb":
-        depth_conv_en = 0
-        conv_en = 1
-      elif layer_type == "max_pool":
-        depth_conv_en = 0
-        conv_en = 0
-
-      up_sample_en = 0
-      inter_load_en = 0
-      inter_write_en = 0
-
-      layer_en = depth_conv_en + (conv_en << 1) + (relu_en << 2) + (pool_en << 3) + (up_sample_en << 4) + (bias_en << 5) + (inter_load_en << 6) + (inter_write_en << 7)
-
-#      if vgg_layer_cnt == 0:
-#        print(depth_conv_en)
-#        print(conv_en << 1)
-#        print(relu_en << 2)
-#        print(pool_en << 3)
-#        print(up_sample_en << 4)
-#        print(ld_sel << 5)
-#        print(wr_sel << 6)
-#        print(depth_conv_en, conv_en, relu_en, pool_en, up_sample_en, ld_sel, wr_sel, layer_en)
-
-      layer_config['LAYER_EN'] = layer_en
-      layer_configs[layer_name] = layer_config
-
-      vgg_layer_cnt = vgg_layer_cnt + 1
-  	  # store the start line number of stage 1
-      if vgg_layer_cnt == VGG_LAYERS:
-        current_model = "STAGE1"
-
-    elif current_model == "STAGE1":
-      relu_en = 0
-      pool_en = 0
-      bias_en = 0
-      if len(content) > 1 and content[6] == "1":
-        bias_en = 1
-      if len(content) > 1 and content[5] == "1":
-        relu_en = 1
-#      if len(content) > 1 and content[4] == "2":
-#        pool_en = 1
-      if len(content) > 1 and content[1] == "max_pool":
-        pool_en = 1
-      layer_name = content[0]
-      layer_type = content[1]
-
-      #print(layer_name)
-
-      in_num = out_num
-      in_h = out_h
-      in_w = out_w
-      out_num = int(content[2])
-      filter_s = int(content[3])
-      stride = int(content[4])
-      in_num_t = int(content[7])
-      out_num_t = int(content[8])
-      in_h_t = int(content[9])
-      in_w_t = int(content[10])
-
-      if stage1_layer_cnt == 0:
-        in_num = Conv2d_3_pool_out_num_hw + Conv2d_7_out_num_hw + Conv2d_11_out_num_hw
-        in_h = Conv2d_3_pool_out_h
-        in_w = Conv2d_3_pool_out_w
-
-      if stride == 2:
-        out_h = int(ceil(float(in_h) / 2))
-        out_w = int(ceil(float(in_w) / 2))
-#        out_h = (in_h + 1) / 2
-#        out_w = (in_w + 1) / 2
-      else:
-        out_h = in_h
-        out_w = in_w
-
-      cur_filter_s = filter_s
-      nxt_filter_s = 0
-      if layer_name == "MConv_Stage1_L1_5" or layer_name == "MConv_Stage1_L2_5":
-        nxt_filter_s = filter_list[VGG_LAYERS + STAGE1_LAYERS * 2]
-        out_h_t = in_h_t_list[VGG_LAYERS + STAGE1_LAYERS * 2]
-        out_w_t = in_w_t_list[VGG_LAYERS + STAGE1_LAYERS * 2]
-      else:
-        nxt_filter_s = filter_list[VGG_LAYERS + stage1_layer_cnt + stage1_channel_cnt * STAGE1_LAYERS + 1]
-        out_h_t = in_h_t_list[VGG_LAYERS + stage1_layer_cnt + stage1_channel_cnt * STAGE1_LAYERS + 1]
-        out_w_t = in_w_t_list[VGG_LAYERS + stage1_layer_cnt + stage1_channel_cnt * STAGE1_LAYERS + 1]
-
-      in_num_hw = int(ceil(float(in_num) / in_num_t) * in_num_t)
-      out_num_hw = int(ceil(float(out_num) / out_num_t) * out_num_t)
-      in_h_hw = int(ceil(float(in_h) / in_h_t) * in_h_t + (cur_filter_s - 1))
-      in_w_hw = int(ceil(float(in_w) / in_w_t) * in_w_t + (cur_filter_s - 1))
-      out_h_hw = int(ceil(float(out_h) / out_h_t) * out_h_t + (nxt_filter_s - 1))
-      out_w_hw = int(ceil(float(out_w) / out_w_t) * out_w_t + (nxt_filter_s - 1))
-
-      task_num1 = int(ceil(float(in_num) / in_num_t) * ceil(float(out_num) / out_num_t) * ceil(float(in_h) / in_h_t) * ceil(float(in_w) / in_w_t))
-      task_num2 = int(ceil(float(out_num) / out_num_t) * ceil(float(in_h) / in_h_t) * ceil(float(in_w) / in_w_t))
-      if layer_type == "separable_conv":
-        local_accum_num = int(in_num_t / SA_SIMD * 1 * 1)
-      else:
-        local_accum_num = int(in_num_t / SA_SIMD * filter_s * filter_s)
-#      local_accum_num = int(in_num_t / SA_SIMD * filter_s * filter_s)
-      local_reg_num = int((in_h_t / stride) * (in_w_t / SA_COLS / stride) * (out_num_t / SA_ROWS))
-      row_il_factor = int(out_num_t / SA_ROWS)
-      col_il_factor = int(in_w_t / SA_COLS / stride)
-
-      if layer_name == "MConv_Stage1_L1_5":
-        MConv_Stage1_L1_5_out_num = out_num
-        MConv_Stage1_L1_5_out_num_hw = out_num_hw
-        MConv_Stage1_L1_5_out_h = out_h
-        MConv_Stage1_L1_5_out_w = out_w
-
-      if layer_name == "MConv_Stage1_L2_5":
-        MConv_Stage1_L2_5_out_num = out_num
-        MConv_Stage1_L2_5_out_num_hw = out_num_hw
-        MConv_Stage1_L2_5_out_h = out_h
-        MConv_Stage1_L2_5_out_w = out_w
-
-      # calculate cin, cout, weight, bias size
-      cin_size = in_num * in_h * in_w
-      cin_size_hw = in_num_hw * in_h_hw * in_w_hw
-
-      cout_size = out_num * out_h * out_w
-      cout_size_hw = out_num_hw * out_h_hw * out_w_hw
-      cout_size_hw_concat = out_num * out_h_hw * out_w_hw
-
-      if layer_type == "separable_conv":
-        weight_size = in_num * filter_s * filter_s + in_num * out_num * 1 * 1
-        weight_size_hw = in_num_hw * filter_s * filter_s + in_num_hw *out_num_hw * 1 * 1
-        bias_size = out_num
-        bias_size_hw = out_num_hw
-      elif layer_type == "convb":
-        weight_size = in_num * out_num * filter_s * filter_s
-        weight_size_hw = in_num_hw * out_num_hw * filter_s * filter_s
-        bias_size = out_num
-        bias_size_hw = out_num_hw
-      else: # maxpool
-        weight_size = 0
-        weight_size_hw = 0
-        bias_size = 0
-        bias_size_hw = 0
-
-      weight_load_size = weight_size_hw
-      bias_load_size = bias_size_hw
-      weight_load.write(str(weight_offset) + " " + str(weight_load_size) + '\n')
-      bias_load.write(str(bias_offset) + " " + str(bias_load_size) + '\n')
-
-      weight_offset = weight_offset + weight_load_size
-      bias_offset = bias_offset + bias_load_size
-
-      layer_cin_size[layer_name] = cin_size
-      layer_cin_size_hw[layer_name] = cin_size_hw
-
-      layer_cout_size[layer_name] = cout_size
-      layer_cout_size_hw[layer_name] = cout_size_hw
-      layer_cout_size_hw_concat[layer_name] = cout_size_hw_concat
-
-      layer_weight_size[layer_name] = weight_size
-      layer_weight_size_hw[layer_name] = weight_size_hw
-
-      layer_bias_size[layer_name] = bias_size
-      layer_bias_size_hw[layer_name] = bias_size_hw
-
-      layer_config = {}
-      layer_config['IN_NUM'] = in_num
-      layer_config['OUT_NUM'] = out_num
-      layer_config['IN_H'] = in_h
-      layer_config['IN_W'] = in_w
-      layer_config['OUT_H'] = out_h
-      layer_config['OUT_W'] = out_w
-      layer_config['IN_NUM_HW'] = in_num_hw
-      layer_config['OUT_NUM_HW'] = out_num_hw
-      layer_config['IN_H_HW'] = in_h_hw
-      layer_config['IN_W_HW'] = in_w_hw
-      layer_config['OUT_H_HW'] = out_h_hw
-      layer_config['OUT_W_HW'] = out_w_hw
-      if layer_type == "separable_conv":
-        layer_config['FILTER_S1'] = filter_s
-        layer_config['FILTER_S2'] = 1
-      elif layer_type == "convb":
-        layer_config['FILTER_S1'] = 1
-        layer_config['FILTER_S2'] = filter_s
-      elif layer_type == "max_pool":
-        layer_config['FILTER_S1'] = 1
-        layer_config['FILTER_S2'] = 1
-      layer_config['STRIDE'] = stride
-      layer_config['IN_NUM_T'] = in_num_t
-      layer_config['OUT_NUM_T'] = out_num_t
-      layer_config['IN_H_T'] = in_h_t
-      layer_config['IN_W_T'] = in_w_t
-      layer_config['NXT_LAYER_BATCH'] = 1
-      layer_config['TASK_NUM1'] = task_num1
-      layer_config['TASK_NUM2'] = task_num2
-      layer_config['LOCAL_ACCUM_NUM'] = local_accum_num
-      layer_config['LOCAL_REG_NUM'] = local_reg_num
-      layer_config['ROW_IL_FACTOR'] = row_il_factor
-      layer_config['COL_IL_FACTOR'] = col_il_factor
-
-      if layer_type == "separable_conv":
-        depth_conv_en = 1
-        conv_en = 1
-      elif layer_type == "convb":
-        depth_conv_en = 0
-        conv_en = 1
-      elif layer_type == "max_pool":
-        depth_conv_en = 0
-        conv_en = 0
-
-      up_sample_en = 0
-#      ld_sel = 0
-#      wr_sel = 0
-      inter_load_en = 0
-      inter_write_en = 0
-
-#      if stage1_layer_cnt == 0:
-#        inter_write_en = 1
-#        inter_load_en = 0
-#      elif stage1_layer_cnt == 2:
-#        inter_write_en = 0
-#        inter_load_en = 1
-#      elif stage1_layer_cnt == 1:
-#        inter_write_en = 1
-#        inter_load_en = 1
-#      else:
-#        inter_write_en = 0
-#        inter_load_en = 0
-
-      if stage1_layer_cnt < STAGE1_LAYERS - 1:
-        if stage1_channel_cnt == 1:
-          layer_config['NXT_LAYER_BATCH'] = 2
-          max_layer_batch = max(max_layer_batch, tile['MAX_LAYER_BATCH'])
-
-      layer_en = depth_conv_en + (conv_en << 1) + (relu_en << 2) + (pool_en << 3) + (up_sample_en << 4) + (bias_en << 5) + (inter_load_en << 6) + (inter_write_en << 7)
-
-      layer_config['LAYER_EN'] = layer_en
-      layer_configs[layer_name] = layer_config
-
-      stage1_layer_cnt = stage1_layer_cnt + 1
-      if stage1_layer_cnt == STAGE1_LAYERS:
-        stage1_layer_cnt = 0
-        stage1_channel_cnt = stage1_channel_cnt + 1
-        if stage1_channel_cnt == 2:
-          stage1_channel_cnt = 0
-          stage1_iter_cnt = stage1_iter_cnt + 1
-          if stage1_iter_cnt == STAGE1_ITER:
-            stage1_iter_cnt = 0
-            stage2_line_id = line_id + 1
-            current_model = "STAGE2"
+  depths = [(int(net[layer_id]['stage']), it, int(net[layer_id]['depth'])) for layer_id, it in order]
+  for inst_id in range(len(order)):
+    if inst_id + 1 < len(order) and depths[inst_id + 1] == depths[inst_id]:
+      continue
+    stage, it, depth = depths[inst_id]
+    layer_batch = depths.count((stage, it, depth + 1))
+    if layer_batch > 1 and layer_batch <= tile['MAX_LAYER_BATCH']:
+      exec_configs[order[inst_id]]['NXT_LAYER_BATCH'] = layer_batch
+      max_layer_batch = max(max_layer_batch, tile['MAX_LAYER_BATCH'])
+
+  insts_check(net, order, exec_configs, in_out_offset, cin_size, outputs)
 
-## Change the execution order of two branches
-#      stage1_channel_cnt = stage1_channel_cnt + 1
-#      if stage1_channel_cnt == 2:
-#        stage1_channel_cnt = 0
-#        stage1_layer_cnt = stage1_layer_cnt + 1
-#        if stage1_layer_cnt == STAGE1_LAYERS:
-#          stage1_layer_cnt = 0
-#          stage1_iter_cnt = stage1_iter_cnt + 1
-#          if stage1_iter_cnt == STAGE1_ITER:
-#            stage1_iter_cnt = 0
-#            stage2_line_id = line_id + 1
-#            current_model == "STAGE2"
-    elif current_model == "STAGE2":
-      relu_en = 0
-      pool_en = 0
-      bias_en = 0
-      if len(content) > 1 and content[6] == "1":
-        bias_en = 1
-      if len(content) > 1 and content[5] == "1":
-        relu_en = 1
-#      if len(content) > 1 and content[4] == "2":
-#        pool_en = 1
-      if len(content) > 1 and content[1] == "max_pool":
-        pool_en = 1
-      layer_name = content[0]
-      layer_type = content[1]
-
-      #print(layer_name)
-
-      in_num = out_num
-      in_h = out_h
-      in_w = out_w
-      out_num = int(content[2])
-      filter_s = int(content[3])
-      stride = int(content[4])
-      in_num_t = int(content[7])
-      out_num_t = int(content[8])
-      in_h_t = int(content[9])
-      in_w_t = int(content[10])
-
-      if stage2_layer_cnt == 0:
-        in_num = MConv_Stage1_L1_5_out_num_hw + MConv_Stage1_L2_5_out_num_hw + Conv2d_3_pool_out_num_hw + Conv2d_7_out_num_hw + Conv2d_11_out_num_hw
-        in_h = Conv2d_3_pool_out_h
-        in_w = Conv2d_3_pool_out_w
-
-      if stride == 2:
-        out_h = int(ceil(float(in_h) / 2))
-        out_w = int(ceil(float(in_w) / 2))
-#        out_h = (in_h + 1) / 2
-#        out_w = (in_w + 1) / 2
-      else:
-        out_h = in_h
-        out_w = in_w
-
-      cur_filter_s = filter_s
-      nxt_filter_s = 0
-      if layer_name == "MConv_Stage2_L1_5" or layer_name == "MConv_Stage2_L2_5":
-        nxt_filter_s = filter_list[VGG_LAYERS + STAGE1_LAYERS * 2]
-        out_h_t = in_h_t_list[VGG_LAYERS + STAGE1_LAYERS * 2]
-        out_w_t = in_w_t_list[VGG_LAYERS + STAGE1_LAYERS * 2]
-      else:
-        nxt_filter_s = filter_list[VGG_LAYERS + STAGE1_LAYERS * 2 + stage2_layer_cnt + stage2_channel_cnt * STAGE2_LAYERS + 1]
-        out_h_t = in_h_t_list[VGG_LAYERS + STAGE1_LAYERS * 2 + stage2_layer_cnt + stage2_channel_cnt * STAGE2_LAYERS + 1]
-        out_w_t = in_w_t_list[VGG_LAYERS + STAGE1_LAYERS * 2 + stage2_layer_cnt + stage2_channel_cnt * STAGE2_LAYERS + 1]
-
-      in_num_hw = int(ceil(float(in_num) / in_num_t) * in_num_t)
-      out_num_hw = int(ceil(float(out_num) / out_num_t) * out_num_t)
-      in_h_hw = int(ceil(float(in_h) / in_h_t) * in_h_t + (cur_filter_s - 1))
-      in_w_hw = int(ceil(float(in_w) / in_w_t) * in_w_t + (cur_filter_s - 1))
-      out_h_hw = int(ceil(float(out_h) / out_h_t) * out_h_t + (nxt_filter_s - 1))
-      out_w_hw = int(ceil(float(out_w) / out_w_t) * out_w_t + (nxt_filter_s - 1))
-
-      task_num1 = int(ceil(float(in_num) / in_num_t) * ceil(float(out_num) / out_num_t) * ceil(float(in_h) / in_h_t) * ceil(float(in_w) / in_w_t))
-      task_num2 = int(ceil(float(out_num) / out_num_t) * ceil(float(in_h) / in_h_t) * ceil(float(in_w) / in_w_t))
-      if layer_type == "separable_conv":
-        local_accum_num = int(in_num_t / SA_SIMD * 1 * 1)
-      else:
-        local_accum_num = int(in_num_t / SA_SIMD * filter_s * filter_s)
-#      local_accum_num = int(in_num_t / SA_SIMD * filter_s * filter_s)
-      local_reg_num = int((in_h_t / stride) * (in_w_t / SA_COLS / stride) * (out_num_t / SA_ROWS))
-      row_il_factor = int(out_num_t / SA_ROWS)
-      col_il_factor = int(in_w_t / SA_COLS / stride)
-
-      if layer_name == "MConv_Stage2_L1_5":
-        MConv_Stage2_L1_5_out_num = out_num
-        MConv_Stage2_L1_5_out_num_hw = out_num_hw
-        MConv_Stage2_L1_5_out_h = out_h
-        MConv_Stage2_L1_5_out_w = out_w
-
-      if layer_name == "MConv_Stage2_L2_5":
-        Mconv_Stage2_L2_5_out_num = out_num
-        Mconv_Stage2_L2_5_out_num_hw = out_num_hw
-        Mconv_Stage2_L2_5_out_h = out_h
-        Mconv_Stage2_L2_5_out_w = out_w
-
-      # calculate cin_ cout, weight, bias size
-      cin_size = in_num * in_h * in_w
-      cin_size_hw = in_num_hw * in_h_hw * in_w_hw
-
-      cout_size = out_num * out_h * out_w
-      cout_size_hw = out_num_hw * out_h_hw * out_w_hw
-      cout_size_hw_concat = out_num * out_h_hw * out_w_hw
-
-      if layer_type == "separable_conv":
-        weight_size = in_num * filter_s * filter_s + in_num * out_num * 1 * 1
-        weight_size_hw = in_num_hw * filter_s * filter_s + in_num_hw *out_num_hw * 1 * 1
-        bias_size = out_num
-        bias_size_hw = out_num_hw
-      elif layer_type == "convb":
-        weight_size = in_num * out_num * filter_s * filter_s
-        weight_size_hw = in_num_hw * out_num_hw * filter_s * filter_s
-        bias_size = out_num
-        bias_size_hw = out_num_hw
-      else: # maxpool
-        weight_size = 0
-        weight_size_hw = 0
-        bias_size = 0
-        bias_size_hw = 0
-
-      weight_load_size = weight_size_hw
-      bias_load_size = bias_size_hw
-      weight_load.write(str(weight_offset) + " " + str(weight_load_size) + '\n')
-      bias_load.write(str(bias_offset) + " " + str(bias_load_size) + '\n')
-
-      weight_offset = weight_offset + weight_load_size
-      bias_offset = bias_offset + bias_load_size
-
-      layer_cin_size[layer_name] = cin_size
-      layer_cin_size_hw[layer_name] = cin_size_hw
-
-      layer_cout_size[layer_name] = cout_size
-      layer_cout_size_hw[layer_name] = cout_size_hw
-      layer_cout_size_hw_concat[layer_name] = cout_size_hw_concat
-
-      layer_weight_size[layer_name] = weight_size
-      layer_weight_size_hw[layer_name] = weight_size_hw
-
-      layer_bias_size[layer_name] = bias_size
-      layer_bias_size_hw[layer_name] = bias_size_hw
-
-      layer_config = {}
-      layer_config['IN_NUM'] = in_num
-      layer_config['OUT_NUM'] = out_num
-      layer_config['IN_H'] = in_h
-      layer_config['IN_W'] = in_w
-      layer_config['OUT_H'] = out_h
-      layer_config['OUT_W'] = out_w
-      layer_config['IN_NUM_HW'] = in_num_hw
-      layer_config['OUT_NUM_HW'] = out_num_hw
-      layer_config['IN_H_HW'] = in_h_hw
-      layer_config['IN_W_HW'] = in_w_hw
-      layer_config['OUT_H_HW'] = out_h_hw
-      layer_config['OUT_W_HW'] = out_w_hw
-      if layer_type == "separable_conv":
-        layer_config['FILTER_S1'] = filter_s
-        layer_config['FILTER_S2'] = 1
-      elif layer_type == "convb":
-        layer_config['FILTER_S1'] = 1
-        layer_config['FILTER_S2'] = filter_s
-      elif layer_type == "max_pool":
-        layer_config['FILTER_S1'] = 1
-        layer_config['FILTER_S2'] = 1
-
-      layer_config['STRIDE'] = stride
-      layer_config['IN_NUM_T'] = in_num_t
-      layer_config['OUT_NUM_T'] = out_num_t
-      layer_config['IN_H_T'] = in_h_t
-      layer_config['IN_W_T'] = in_w_t
-      layer_config['NXT_LAYER_BATCH'] = 1
-      layer_config['TASK_NUM1'] = task_num1
-      layer_config['TASK_NUM2'] = task_num2
-      layer_config['LOCAL_ACCUM_NUM'] = local_accum_num
-      layer_config['LOCAL_REG_NUM'] = local_reg_num
-      layer_config['ROW_IL_FACTOR'] = row_il_factor
-      layer_config['COL_IL_FACTOR'] = col_il_factor
-
-      if layer_type == "separable_conv":
-        depth_conv_en = 1
-        conv_en = 1
-      elif layer_type == "convb":
-        depth_conv_en = 0
-        conv_en = 1
-      elif layer_type == "max_pool":
-        depth_conv_en = 0
-        conv_en = 0
-
-      up_sample_en = 0
-#      ld_sel = 0
-#      wr_sel = 0
-      inter_load_en = 0
-      inter_write_en = 0
-
-#      if stage2_layer_cnt == 0:
-#        inter_write_en = 1
-#        inter_load_en = 0
-#      elif stage2_layer_cnt == STAGE2_LAYERS - 1:
-#        inter_write_en = 0
-#        inter_load_en = 1
-#      else:
-#        inter_write_en = 1
-#        inter_load_en = 1
-
-      if stage2_layer_cnt < STAGE2_LAYERS - 1:
-        if stage2_channel_cnt == 1:
-          layer_config['NXT_LAYER_BATCH'] = 2
-          max_layer_batch = max(max_layer_batch, tile['MAX_LAYER_BATCH'])
-
-      layer_en = depth_conv_en + (conv_en << 1) + (relu_en << 2) + (pool_en << 3) + (up_sample_en << 4) + (bias_en << 5) + (inter_load_en << 6) + (inter_write_en << 7)
-
-      layer_config['LAYER_EN'] = layer_en
-      layer_configs[layer_name] = layer_config
-
-      if stage2_layer_cnt == STAGE2_LAYERS - 1 and stage2_channel_cnt == 0 and stage2_iter_cnt == 0:
-        macros.write("#define STAGE2L_OUT_NUM " + str(out_num) + '\n')
-        macros.write("#define STAGE2L_OUT_NUM_T " + str(out_num_t) + '\n')
-        macros.write("#define STAGE2L_OUT_H " + str(out_h) + '\n')
-        macros.write("#define STAGE2L_OUT_W " + str(out_w) + '\n')
-        macros.write("#define STAGE2L_OUT_NUM_HW " + str(int(out_num_hw)) + '\n')
-        macros.write("#define STAGE2L_OUT_H_HW " + str(int(out_h_hw)) + '\n')
-        macros.write("#define STAGE2L_OUT_W_HW " + str(int(out_w_hw)) + '\n')
-        macros.write("#define STAGE2L_K " + str(int(nxt_filter_s)) + '\n')
-
-      if stage2_layer_cnt == STAGE2_LAYERS - 1 and stage2_channel_cnt == 1 and stage2_iter_cnt == 0:
-        macros.write("#define STAGE2R_OUT_NUM " + str(out_num) + '\n')
-        macros.write("#define STAGE2R_OUT_NUM_T " + str(out_num_t) + '\n')
-        macros.write("#define STAGE2R_OUT_H " + str(out_h) + '\n')
-        macros.write("#define STAGE2R_OUT_W " + str(out_w) + '\n')
-        macros.write("#define STAGE2R_OUT_NUM_HW " + str(int(out_num_hw)) + '\n')
-        macros.write("#define STAGE2R_OUT_H_HW " + str(int(out_h_hw)) + '\n')
-        macros.write("#define STAGE2R_OUT_W_HW " + str(int(out_w_hw)) + '\n')
-        macros.write("#define STAGE2R_K " + str(int(nxt_filter_s)) + '\n')
-
-      stage2_layer_cnt = stage2_layer_cnt + 1
-      if stage2_layer_cnt == STAGE2_LAYERS:
-        stage2_layer_cnt = 0
-        stage2_channel_cnt = stage2_channel_cnt + 1
-        if stage2_channel_cnt == 2:
-          stage2_channel_cnt = 0
-          stage2_iter_cnt = stage2_iter_cnt + 1
-          if stage2_iter_cnt == STAGE2_ITER:
-            stage2_iter_cnt = 0
-            current_model = "STAGE2"
-            break
-          else:
-            line_id = stage2_line_id - 1
-
-    line_id = line_id + 1
-
-  # calculate the region size
-  region0_layers = ["Conv2d_0", "Conv2d_1", "Conv2d_2", "Conv2d_3", "Conv2d_4", "Conv2d_5", "Conv2d_6"]
-  region1_layers = ["Conv2d_8", "Conv2d_9", "Conv2d_10"]
-  region2_layers = ["MConv_Stage1_L1_1", "MConv_Stage1_L1_2", "MConv_Stage1_L1_3", "MConv_Stage1_L1_4", \
-                    "MConv_Stage1_L2_1", "MConv_Stage1_L2_2", "MConv_Stage1_L2_3", "MConv_Stage1_L2_4"]
-  region3_layers = ["MConv_Stage2_L1_1", "MConv_Stage2_L1_2", "MConv_Stage2_L1_3", "MConv_Stage2_L1_4", \
-                    "MConv_Stage2_L2_1", "MConv_Stage2_L2_2", "MConv_Stage2_L2_3", "MConv_Stage2_L2_4"]
-  region4_layers = ["MConv_Stage1_L1_5", "MConv_Stage1_L2_5", "Conv2d_3_pool", "Conv2d_7", "Conv2d_11"]
-  region5_layers = ["MConv_Stage1_L1_5", "MConv_Stage1_L2_5"]
-
-  region0_offset = in_out_offset
-  region0_size = 0
-  region1_size = 0
-  region2_size = 0
-  region3_size = 0
-  region4_size = 0
-  region5_size = 0
-
-  for layer_name in region0_layers:
-    region0_size += layer_cout_size_hw[layer_name]
-  region1_offset = region0_offset + region0_size
-  for layer_name in region1_layers:
-    region1_size += layer_cout_size_hw[layer_name]
-  region2_offset = region1_offset + region1_size
-  for layer_name in region2_layers:
-    region2_size += layer_cout_size_hw[layer_name]
-  region3_offset = region2_offset + region2_size
-  for layer_name in region3_layers:
-    region3_size += layer_cout_size_hw[layer_name]
-  region4_offset = region3_offset + region3_size
-  for layer_name in region4_layers:
-    region4_size += layer_cout_size_hw[layer_name]
-  region5_offset = region4_offset + region4_size
-  for layer_name in region5_layers:
-    region5_size += layer_cout_size_hw[layer_name]
-#  region4_size += layer_cout_size_hw["MConv_Stage1_L1_5"]
-#  region4_size += layer_cout_size_hw["MConv_Stage1_L2_5"]
-#  region4_size += layer_cout_size_hw["Conv2d_3_pool"]
-#  region4_size += layer_cout_size_hw["Conv2d_7"]
-#  region4_size += layer_cout_size_hw["Conv2d_11"]
-
-  cin_size = region5_offset + region5_size
-  weight_size = weight_offset
-  bias_size = bias_offset
+  # write out macros
+  macros.write("#define IN_OUT_OFFSET " + str(int(in_out_offset)) + '\n')
+
+  layer_config = exec_configs[order[0]]
+  macros.write("#define LAYER1_IN_NUM " + str(layer_config['IN_NUM']) + '\n')
+  macros.write("#define LAYER1_OUT_NUM " + str(layer_config['OUT_NUM']) + '\n')
+  macros.write("#define LAYER1_IN_NUM_T " + str(layer_config['IN_NUM_T']) + '\n')
+  macros.write("#define LAYER1_OUT_NUM_T " + str(layer_config['OUT_NUM_T']) + '\n')
+  macros.write("#define LAYER1_IN_H " + str(layer_config['IN_H']) + '\n')
+  macros.write("#define LAYER1_IN_W " + str(layer_config['IN_W']) + '\n')
+  macros.write("#define LAYER1_OUT_H " + str(layer_config['OUT_H']) + '\n')
+  macros.write("#define LAYER1_OUT_W " + str(layer_config['OUT_W']) + '\n')
+  macros.write("#define LAYER1_IN_NUM_HW " + str(int(layer_config['IN_NUM_HW'])) + '\n')
+  macros.write("#define LAYER1_OUT_NUM_HW " + str(int(layer_config['OUT_NUM_HW'])) + '\n')
+  macros.write("#define LAYER1_IN_H_HW " + str(int(layer_config['IN_H_HW'])) + '\n')
+  macros.write("#define LAYER1_IN_W_HW " + str(int(layer_config['IN_W_HW'])) + '\n')
+  macros.write("#define LAYER1_OUT_H_HW " + str(int(layer_config['OUT_H_HW'])) + '\n')
+  macros.write("#define LAYER1_OUT_W_HW " + str(int(layer_config['OUT_W_HW'])) + '\n')
+  macros.write("#define LAYER1_K " + str(layer_config['NXT_FILTER_S']) + '\n')
+  macros.write("#define LAYER1_POOL " + str(layer_config['POOL_EN']) + '\n')
+
+  # the outputs of the last iterations
+  output_configs = [exec_configs[(layer_id, int(net[layer_id]['repeat']) - 1)] for layer_id in outputs]
+  for prefix, layer_config in zip(OUTPUT_MACROS, output_configs):
+    macros.write("#define " + prefix + "_OUT_NUM " + str(layer_config['OUT_NUM']) + '\n')
+    macros.write("#define " + prefix + "_OUT_NUM_T " + str(layer_config['OUT_NUM_T']) + '\n')
+    macros.write("#define " + prefix + "_OUT_H " + str(layer_config['OUT_H']) + '\n')
+    macros.write("#define " + prefix + "_OUT_W " + str(layer_config['OUT_W']) + '\n')
+    macros.write("#define " + prefix + "_OUT_NUM_HW " + str(int(layer_config['OUT_NUM_HW'])) + '\n')
+    macros.write("#define " + prefix + "_OUT_H_HW " + str(int(layer_config['OUT_H_HW'])) + '\n')
+    macros.write("#define " + prefix + "_OUT_W_HW " + str(int(layer_config['OUT_W_HW'])) + '\n')
+    macros.write("#define " + prefix + "_K " + str(int(layer_config['NXT_FILTER_S'])) + '\n')
 
   macros.write("#define CIN_SIZE " + str(int(cin_size)) + '\n')
-  macros.write("#define WEIGHT_SIZE " + str(int(weight_size)) + '\n')
-  macros.write("#define BIAS_SIZE " + str(int(bias_size)) + '\n')
-
-  # Pass3: To generate offsets
-  layer_output_size = []
-  layer_output_size_hw = []
-
-  # reinitialize all parameters
-  line_id = 1
-  current_model = "VGG"
-  cin_offset = 0
-  cout_offset = 0
-  weight_offset = 0
-  bias_offset = 0
-
-  vgg_layer_cnt = 0
-  vgg_layer_cnt = 0
-  stage1_layer_cnt = 0
-  stage1_iter_cnt = 0
-  stage2_layer_cnt = 0
-  stage2_iter_cnt = 0
-  stage1_channel_cnt = 0
-  stage2_channel_cnt = 0
-
-  in_num_hw = 0
-  out_num_hw = 0
-  in_h_hw = 0
-  in_w_hw = 0
-  out_h_hw = 0
-  out_w_hw = 0
-  filter_s = 0
-
-  in_num = network_in_num
-  out_num = network_in_num
-  in_h = network_in_h
-  in_w = network_in_w
-  out_h = network_in_h
-  out_w = network_in_w
-
-  while line_id < len(lines):
-    line = lines[line_id].strip('\n')
-    content = line.split(",")
-    if current_model == "VGG":
-      layer_name = content[0]
-      if layer_name == "Conv2d_7" or layer_name == "Conv2d_11" or layer_name == "Conv2d_3_pool":
-        nxt_filter_s = max(filter_list[VGG_LAYERS], filter_list[VGG_LAYERS + STAGE1_LAYERS * 2])
-      else:
-        nxt_filter_s = filter_list[vgg_layer_cnt + 1]
-
-      if layer_name == "Conv2d_7":
-#        print(region4_offset, layer_cout_size_hw['MConv_Stage1_L1_5'], layer_cout_size_hw['MConv_Stage1_L2_5'], layer_cout_size_hw['Conv2d_3_pool'])
-        cout_offset = region4_offset + layer_cout_size_hw['MConv_Stage1_L1_5'] + layer_cout_size_hw['MConv_Stage1_L2_5'] + layer_cout_size_hw['Conv2d_3_pool'] - in_out_offset
-#        print(cout_offset)
-      if layer_name == "Conv2d_8":
-        cin_offset = region4_offset + layer_cout_size_hw['MConv_Stage1_L1_5'] + layer_cout_size_hw['MConv_Stage1_L2_5'] + layer_cout_size_hw['Conv2d_3_pool']
-        cout_offset = region1_offset - in_out_offset
-      if layer_name == "Conv2d_9":
-        cin_offset = region1_offset
-      if layer_name == "Conv2d_11":
-        cout_offset = region4_offset + layer_cout_size_hw['MConv_Stage1_L1_5'] + layer_cout_size_hw['MConv_Stage1_L2_5'] + layer_cout_size_hw['Conv2d_3_pool'] + layer_cout_size_hw['Conv2d_7'] - in_out_offset
-      if layer_name == "Conv2d_3_pool":
-        cin_offset = region0_offset + layer_cout_size_hw['Conv2d_0'] + layer_cout_size_hw['Conv2d_1'] + layer_cout_size_hw['Conv2d_2'] + OUT_NUM_T * layer_configs['Conv2d_3']['OUT_W_HW'] * int(layer_configs['Conv2d_4']['FILTER_S1'] / 2) + OUT_NUM_T * int(layer_configs['Conv2d_4']['FILTER_S1'] / 2)
-#        print(cin_offset)
-#        print(layer_configs['Conv2d_4']['FILTER_S1'], layer_configs['Conv2d_3']['OUT_W_HW'])
-        cout_offset = region4_offset + layer_cout_size_hw['MConv_Stage1_L1_5'] + layer_cout_size_hw['MConv_Stage1_L2_5'] - in_out_offset
-
-      # Debug
-#      if layer_name == "Conv2d_2":
-#        print(cout_offset, layer_configs[layer_name]['OUT_W_HW'], nxt_filter_s)
-
-      shifted_cout_offset = cout_offset + layer_configs[layer_name]['OUT_NUM_T'] * layer_configs[layer_name]['OUT_W_HW'] * int(nxt_filter_s / 2) + layer_configs[layer_name]['OUT_NUM_T'] * int(nxt_filter_s / 2) + in_out_offset
-#      if layer_name == "Conv2d_7":
-#        print(shifted_cout_offset)
-
-      layer_configs[layer_name]['SHIFTED_COUT_OFFSET'] = shifted_cout_offset
-      layer_configs[layer_name]['CIN_OFFSET'] = cin_offset
-      layer_configs[layer_name]['WEIGHT_OFFSET'] = weight_offset
-      layer_configs[layer_name]['BIAS_OFFSET'] = bias_offset
-      layer_configs[layer_name]['COUT_OFFSET'] = cout_offset
-
-#      inst0 = [layer_configs[layer_name]['IN_NUM_HW'], layer_configs[layer_name]['OUT_NUM_HW'], layer_configs[layer_name]['IN_H_HW'], layer_configs[layer_name]['IN_W_HW'], layer_configs[layer_name]['OUT_H_HW'], layer_configs[layer_name]['OUT_W_HW']]
-#      inst1 = [layer_configs[layer_name]['IN_NUM'], layer_configs[layer_name]['OUT_NUM'], layer_configs[layer_name]['IN_H'], layer_configs[layer_name]['IN_W'], layer_configs[layer_name]['OUT_H'], layer_configs[layer_name]['OUT_W']]
-#      inst2 = [cin_offset, weight_offset, bias_offset, shifted_cout_offset, layer_configs[layer_name]['FILTER_S1'], layer_configs[layer_name]['FILTER_S2'], layer_configs[layer_name]['STRIDE']]
-#      inst3 = [layer_configs[layer_name]['LAYER_EN'], layer_configs[layer_name]['IN_NUM_T'], layer_configs[layer_name]['OUT_NUM_T']]
-
-#      if layer_name == "Conv2d_7":
-#        print(inst2)
-
-#      insts.writelines(" ".join(str(int(e)) for e in inst0) + "\n")
-#      insts.writelines(" ".join(str(int(e)) for e in inst1) + "\n")
-#      insts.writelines(" ".join(str(int(e)) for e in inst2) + "\n")
-#      insts.writelines(" ".join(str(int(e)) for e in inst3) + "\n")
-#      insts.writelines("\n")
-
-      cin_offset += layer_cin_size_hw[layer_name]
-      weight_offset += layer_weight_size_hw[layer_name]
-      bias_offset += layer_bias_size_hw[layer_name]
-      cout_offset += layer_cout_size_hw[layer_name]
-
-      vgg_layer_cnt = vgg_layer_cnt + 1
-  	  # store the start line number of stage 1
-      if vgg_layer_cnt == VGG_LAYERS:
-        current_model = "STAGE1"
-        stage1_line_id = line_id + 1
-      line_id = line_id + 1
-    elif current_model == "STAGE1":
-      layer_name = content[0]
-
-      if layer_name == "MConv_Stage1_L1_5" or layer_name == "MConv_Stage1_L2_5":
-        nxt_filter_s = max(filter_list[VGG_LAYERS], filter_list[VGG_LAYERS + STAGE1_LAYERS * 2])
-      else:
-        nxt_filter_s = filter_list[VGG_LAYERS + stage1_layer_cnt + stage1_channel_cnt * STAGE1_LAYERS + 1]
-
-      if layer_name == "MConv_Stage1_L1_1":
-        cin_offset = region4_offset + layer_cout_size_hw['MConv_Stage1_L1_5'] + layer_cout_size_hw['MConv_Stage1_L2_5']
-        cout_offset = region2_offset - in_out_offset
-      if layer_name == "MConv_Stage1_L1_2":
-        cin_offset = region2_offset
-      if layer_name == "MConv_Stage1_L1_5":
-        cout_offset = region4_offset - in_out_offset
-      if layer_name == "MConv_Stage1_L2_1":
-        cin_offset = region4_offset + layer_cout_size_hw['MConv_Stage1_L1_5'] + layer_cout_size_hw['MConv_Stage1_L2_5']
-        cout_offset = region2_offset + region2_size / 2 - in_out_offset
-      if layer_name == "MConv_Stage1_L2_2":
-        cin_offset = region2_offset + region2_size / 2
-      if layer_name == "MConv_Stage1_L2_5":
-        cout_offset = region4_offset + layer_cout_size_hw['MConv_Stage1_L1_5'] - in_out_offset
-
-      shifted_cout_offset = cout_offset + layer_configs[layer_name]['OUT_NUM_T'] * layer_configs[layer_name]['OUT_W_HW'] * int(nxt_filter_s / 2) + layer_configs[layer_name]['OUT_NUM_T'] * int(nxt_filter_s / 2) + in_out_offset
-
-      layer_configs[layer_name]['SHIFTED_COUT_OFFSET'] = shifted_cout_offset
-      layer_configs[layer_name]['CIN_OFFSET'] = cin_offset
-      layer_configs[layer_name]['WEIGHT_OFFSET'] = weight_offset
-      layer_configs[layer_name]['BIAS_OFFSET'] = bias_offset
-      layer_configs[layer_name]['COUT_OFFSET'] = cout_offset
-
-#      inst0 = [layer_configs[layer_name]['IN_NUM_HW'], layer_configs[layer_name]['OUT_NUM_HW'], layer_configs[layer_name]['IN_H_HW'], layer_configs[layer_name]['IN_W_HW'], layer_configs[layer_name]['OUT_H_HW'], layer_configs[layer_name]['OUT_W_HW']]
-#      inst1 = [layer_configs[layer_name]['IN_NUM'], layer_configs[layer_name]['OUT_NUM'], layer_configs[layer_name]['IN_H'], layer_configs[layer_name]['IN_W'], layer_configs[layer_name]['OUT_H'], layer_configs[layer_name]['OUT_W']]
-#      inst2 = [cin_offset, weight_offset, bias_offset, shifted_cout_offset, layer_configs[layer_name]['FILTER_S1'], layer_configs[layer_name]['FILTER_S2'], layer_configs[layer_name]['STRIDE']]
-#      inst3 = [layer_configs[layer_name]['LAYER_EN'], layer_configs[layer_name]['IN_NUM_T'], layer_configs[layer_name]['OUT_NUM_T']]
-#
-#      insts.writelines(" ".join(str(int(e)) for e in inst0) + "\n")
-#      insts.writelines(" ".join(str(int(e)) for e in inst1) + "\n")
-#      insts.writelines(" ".join(str(int(e)) for e in inst2) + "\n")
-#      insts.writelines(" ".join(str(int(e)) for e in inst3) + "\n")
-#      insts.writelines("\n")
-
-      cin_offset += layer_cin_size_hw[layer_name]
-      weight_offset += layer_weight_size_hw[layer_name]
-      bias_offset += layer_bias_size_hw[layer_name]
-      cout_offset += layer_cout_size_hw[layer_name]
-
-## Change the execution order of two branches
-#      stage1_channel_cnt = stage1_channel_cnt + 1
-#      if stage1_channel_cnt == 2:
-#        stage1_channel_cnt = 0
-#        stage1_layer_cnt = stage1_layer_cnt + 1
-#        if stage1_layer_cnt == STAGE1_LAYERS:
-#          stage1_layer_cnt = 0
-#          stage1_iter_cnt = stage1_iter_cnt + 1
-#          if stage1_iter_cnt == STAGE1_ITER:
-#            stage1_iter_cnt = 0
-#            stage2_line_id = line_id + 1
-#            current_model = "STAGE2"
-
-#      line_id = stage1_line_id + stage1_channel_cnt * STAGE1_LAYERS + stage1_layer_cnt + stage1_iter_cnt * STAGE1_LAYERS * 2
-#      if current_model == "STAGE2":
-#        line_id = stage2_line_id
-#      print(stage1_channel_cnt, stage1_layer_cnt, stage1_iter_cnt)
-
-      stage1_layer_cnt = stage1_layer_cnt + 1
-      if stage1_layer_cnt == STAGE1_LAYERS:
-        stage1_layer_cnt = 0
-        stage1_channel_cnt = stage1_channel_cnt + 1
-        if stage1_channel_cnt == 2:
-          stage1_channel_cnt = 0
-          stage1_iter_cnt = stage1_iter_cnt + 1
-          if stage1_iter_cnt == STAGE1_ITER:
-            stage1_iter_cnt = 0
-            current_model = "STAGE2"
-            stage2_line_id = line_id + 1
-      line_id = line_id + 1
-    elif current_model == "STAGE2":
-      layer_name = content[0]
-
-      if layer_name == "MConv_Stage2_L1_5" or layer_name == "MConv_Stage2_L2_5":
-        nxt_filter_s = max(filter_list[VGG_LAYERS], filter_list[VGG_LAYERS + STAGE1_LAYERS * 2])
-      else:
-        nxt_filter_s = filter_list[VGG_LAYERS + STAGE1_LAYERS + stage2_layer_cnt + stage2_channel_cnt * STAGE2_LAYERS + 1]
-
-      if stage2_iter_cnt % 2 == 0: # [2,4,6]
-        if layer_name == "MConv_Stage2_L1_1":
-          cin_offset = region4_offset
-          cout_offset = region3_offset - in_out_offset
-        if layer_name == "MConv_Stage2_L1_2":
-          cin_offset = region3_offset
-        if layer_name == "MConv_Stage2_L1_5":
-#          cout_offset = region4_offset - in_out_offset
-          cout_offset = region5_offset - in_out_offset
-          if stage2_iter_cnt == STAGE2_ITER - 1:
-            macros.write("#define STAGE2L_OFFSET " + str(int(cout_offset + in_out_offset)) + '\n')
-        if layer_name == "MConv_Stage2_L2_1":
-          cin_offset = region4_offset
-          cout_offset = region3_offset + region3_size / 2 - in_out_offset
-        if layer_name == "MConv_Stage2_L2_2":
-          cin_offset = region3_offset + region3_size / 2
-        if layer_name == "MConv_Stage2_L2_5":
-#          cout_offset = region4_offset + layer_cout_size_hw['MConv_Stage1_L1_5'] - in_out_offset
-          cout_offset = region5_offset + layer_cout_size_hw['MConv_Stage1_L1_5'] - in_out_offset
-          if stage2_iter_cnt == STAGE2_ITER - 1:
-            macros.write("#define STAGE2R_OFFSET " + str(int(cout_offset + in_out_offset)) + '\n')
-
-      elif stage2_iter_cnt % 2 == 1: # [3,5]
-        if layer_name == "MConv_Stage2_L1_1":
-#          cin_offset = region4_offset
-          cin_offset = region4_offset + layer_cout_size_hw['MConv_Stage1_L1_5'] + layer_cout_size_hw['MConv_Stage1_L2_5']
-          cout_offset = region3_offset - in_out_offset
-        if layer_name == "MConv_Stage2_L1_2":
-          cin_offset = region3_offset
-        if layer_name == "MConv_Stage2_L1_5":
-          cout_offset = region4_offset - in_out_offset
-          if stage2_iter_cnt == STAGE2_ITER - 1:
-            macros.write("#define STAGE2L_OFFSET " + str(int(cout_offset + in_out_offset)) + '\n')
-        if layer_name == "MConv_Stage2_L2_1":
-#          cin_offset = region4_offset
-          cin_offset = region4_offset + layer_cout_size_hw['MConv_Stage1_L1_5'] + layer_cout_size_hw['MConv_Stage1_L2_5']
-          cout_offset = region3_offset + region3_size / 2 - in_out_offset
-        if layer_name == "MConv_Stage2_L2_2":
-          cin_offset = region3_offset + region3_size / 2
-        if layer_name == "MConv_Stage2_L2_5":
-          cout_offset = region4_offset + layer_cout_size_hw['MConv_Stage1_L1_5'] - in_out_offset
-          if stage2_iter_cnt == STAGE2_ITER - 1:
-            macros.write("#define STAGE2R_OFFSET " + str(int(cout_offset + in_out_offset)) + '\n')
-
-      #print(layer_name)
-      shifted_cout_offset = cout_offset + layer_configs[layer_name]['OUT_NUM_T'] * layer_configs[layer_name]['OUT_W_HW'] * int(nxt_filter_s / 2) + layer_configs[layer_name]['OUT_NUM_T'] * int(nxt_filter_s / 2) + in_out_offset
-
-      layer_configs[layer_name + '_' + str(stage2_iter_cnt)] = {}
-      layer_configs[layer_name + '_' + str(stage2_iter_cnt)] = {}
-      layer_configs[layer_name + '_' + str(stage2_iter_cnt)] = {}
-      layer_configs[layer_name + '_' + str(stage2_iter_cnt)] = {}
-      layer_configs[layer_name + '_' + str(stage2_iter_cnt)] = {}
-      layer_configs[layer_name + '_' + str(stage2_iter_cnt)]['SHIFTED_COUT_OFFSET'] = shifted_cout_offset
-      layer_configs[layer_name + '_' + str(stage2_iter_cnt)]['CIN_OFFSET'] = cin_offset
-      layer_configs[layer_name + '_' + str(stage2_iter_cnt)]['WEIGHT_OFFSET'] = weight_offset
-      layer_configs[layer_name + '_' + str(stage2_iter_cnt)]['BIAS_OFFSET'] = bias_offset
-      layer_configs[layer_name + '_' + str(stage2_iter_cnt)]['COUT_OFFSET'] = cout_offset
-
-#      inst0 = [layer_configs[layer_name]['IN_NUM_HW'], layer_configs[layer_name]['OUT_NUM_HW'], layer_configs[layer_name]['IN_H_HW'], layer_configs[layer_name]['IN_W_HW'], layer_configs[layer_name]['OUT_H_HW'], layer_configs[layer_name]['OUT_W_HW']]
-#      inst1 = [layer_configs[layer_name]['IN_NUM'], layer_configs[layer_name]['OUT_NUM'], layer_configs[layer_name]['IN_H'], layer_configs[layer_name]['IN_W'], layer_configs[layer_name]['OUT_H'], layer_configs[layer_name]['OUT_W']]
-#      inst2 = [cin_offset, weight_offset, bias_offset, shifted_cout_offset, layer_configs[layer_name]['FILTER_S1'], layer_configs[layer_name]['FILTER_S2'], layer_configs[layer_name]['STRIDE']]
-#      inst3 = [layer_configs[layer_name]['LAYER_EN'], layer_configs[layer_name]['IN_NUM_T'], layer_configs[layer_name]['OUT_NUM_T']]
-
-#      insts.writelines(" ".join(str(int(e)) for e in inst0) + "\n")
-#      insts.writelines(" ".join(str(int(e)) for e in inst1) + "\n")
-#      insts.writelines(" ".join(str(int(e)) for e in inst2) + "\n")
-#      insts.writelines(" ".join(str(int(e)) for e in inst3) + "\n")
-#      insts.writelines("\n")
-
-      cin_offset += layer_cin_size_hw[layer_name]
-      weight_offset += layer_weight_size_hw[layer_name]
-      bias_offset += layer_bias_size_hw[layer_name]
-      cout_offset += layer_cout_size_hw[layer_name]
-
-      stage2_layer_cnt = stage2_layer_cnt + 1
-      if stage2_layer_cnt == STAGE2_LAYERS:
-        stage2_layer_cnt = 0
-        stage2_channel_cnt = stage2_channel_cnt + 1
-        if stage2_channel_cnt == 2:
-          stage2_channel_cnt = 0
-          stage2_iter_cnt = stage2_iter_cnt + 1
-          if stage2_iter_cnt == STAGE2_ITER:
-            stage2_iter_cnt = 0
-            current_model = "STAGE2"
-            break
-          else:
-            line_id = stage2_line_id - 1
-      line_id = line_id + 1
-#    line_id = line_id + 1
-
+  macros.write("#define WEIGHT_SIZE " + str(int(weight_offset)) + '\n')
+  macros.write("#define BIAS_SIZE " + str(int(bias_offset)) + '\n')
+  for prefix, layer_config in zip(OUTPUT_MACROS, output_configs):
+    macros.write("#define " + prefix + "_OFFSET " + str(int(layer_config['COUT_OFFSET'])) + '\n')
   macros.write("#define MAX_LAYER_BATCH " + str(int(max_layer_batch)) + '\n')
-  # Pass4: To print out insts
-  # reinitialize all parameters
-  line_id = 1
-  current_model = "VGG"
-
-  vgg_layer_cnt = 0
-  vgg_layer_cnt = 0
-  stage1_layer_cnt = 0
-  stage1_iter_cnt = 0
-  stage2_layer_cnt = 0
-  stage2_iter_cnt = 0
-  stage1_channel_cnt = 0
-  stage2_channel_cnt = 0
-
-  while line_id < len(lines):
-    line = lines[line_id].strip('\n')
-    content = line.split(",")
-    if current_model == "VGG":
-      layer_name = content[0]
-
-      inst0 = [layer_configs[layer_name]['IN_NUM_HW'], layer_configs[layer_name]['OUT_NUM_HW'], layer_configs[layer_name]['IN_H_HW'], layer_configs[layer_name]['IN_W_HW'], layer_configs[layer_name]['OUT_H_HW'], layer_configs[layer_name]['OUT_W_HW']]
-      inst1 = [layer_configs[layer_name]['IN_NUM'], layer_configs[layer_name]['OUT_NUM'], layer_configs[layer_name]['IN_H'], layer_configs[layer_name]['IN_W'], layer_configs[layer_name]['OUT_H'], layer_configs[layer_name]['OUT_W']]
-      inst2 = [layer_configs[layer_name]['CIN_OFFSET'], layer_configs[layer_name]['WEIGHT_OFFSET'], layer_configs[layer_name]['BIAS_OFFSET'], layer_configs[layer_name]['SHIFTED_COUT_OFFSET'], layer_configs[layer_name]['FILTER_S1'], layer_configs[layer_name]['FILTER_S2'], layer_configs[layer_name]['STRIDE']]
-      inst3 = [layer_configs[layer_name]['LAYER_EN'], layer_configs[layer_name]['IN_NUM_T'], layer_configs[layer_name]['OUT_NUM_T'], layer_configs[layer_name]['IN_H_T'], layer_configs[layer_name]['IN_W_T'], layer_configs[layer_name]['NXT_LAYER_BATCH']]
-      inst4 = [layer_configs[layer_name]['TASK_NUM1'], layer_configs[layer_name]['TASK_NUM2'], layer_configs[layer_name]['LOCAL_ACCUM_NUM'], layer_configs[layer_name]['LOCAL_REG_NUM'], layer_configs[layer_name]['ROW_IL_FACTOR'], layer_configs[layer_name]['COL_IL_FACTOR']]
-
-      insts.writelines(" ".join(str(int(e)) for e in inst0) + "\n")
-      insts.writelines(" ".join(str(int(e)) for e in inst1) + "\n")
-      insts.writelines(" ".join(str(int(e)) for e in inst2) + "\n")
-      insts.writelines(" ".join(str(int(e)) for e in inst3) + "\n")
-      insts.writelines(" ".join(str(int(e)) for e in inst4) + "\n")
-      insts.writelines("\n")
-
-      vgg_layer_cnt = vgg_layer_cnt + 1
-  	  # store the start line number of stage 1
-      if vgg_layer_cnt == VGG_LAYERS:
-        current_model = "STAGE1"
-        stage1_line_id = line_id + 1
-      line_id = line_id + 1
-    elif current_model == "STAGE1":
-      layer_name = content[0]
-
-      inst0 = [layer_configs[layer_name]['IN_NUM_HW'], layer_configs[layer_name]['OUT_NUM_HW'], layer_configs[layer_name]['IN_H_HW'], layer_configs[layer_name]['IN_W_HW'], layer_configs[layer_name]['OUT_H_HW'], layer_configs[layer_name]['OUT_W_HW']]
-      inst1 = [layer_configs[layer_name]['IN_NUM'], layer_configs[layer_name]['OUT_NUM'], layer_configs[layer_name]['IN_H'], layer_configs[layer_name]['IN_W'], layer_configs[layer_name]['OUT_H'], layer_configs[layer_name]['OUT_W']]
-      inst2 = [layer_configs[layer_name]['CIN_OFFSET'], layer_configs[layer_name]['WEIGHT_OFFSET'], layer_configs[layer_name]['BIAS_OFFSET'], layer_configs[layer_name]['SHIFTED_COUT_OFFSET'], layer_configs[layer_name]['FILTER_S1'], layer_configs[layer_name]['FILTER_S2'], layer_configs[layer_name]['STRIDE']]
-      inst3 = [layer_configs[layer_name]['LAYER_EN'], layer_configs[layer_name]['IN_NUM_T'], layer_configs[layer_name]['OUT_NUM_T'], layer_configs[layer_name]['IN_H_T'], layer_configs[layer_name]['IN_W_T'], layer_configs[layer_name]['NXT_LAYER_BATCH']]
-      inst4 = [layer_configs[layer_name]['TASK_NUM1'], layer_configs[layer_name]['TASK_NUM2'], layer_configs[layer_name]['LOCAL_ACCUM_NUM'], layer_configs[layer_name]['LOCAL_REG_NUM'], layer_configs[layer_name]['ROW_IL_FACTOR'], layer_configs[layer_name]['COL_IL_FACTOR']]
-
-      insts.writelines(" ".join(str(int(e)) for e in inst0) + "\n")
-      insts.writelines(" ".join(str(int(e)) for e in inst1) + "\n")
-      insts.writelines(" ".join(str(int(e)) for e in inst2) + "\n")
-      insts.writelines(" ".join(str(int(e)) for e in inst3) + "\n")
-      insts.writelines(" ".join(str(int(e)) for e in inst4) + "\n")
-      insts.writelines("\n")
-
-# Change the execution order of two branches
-      stage1_channel_cnt = stage1_channel_cnt + 1
-      if stage1_channel_cnt == 2:
-        stage1_channel_cnt = 0
-        stage1_layer_cnt = stage1_layer_cnt + 1
-        if stage1_layer_cnt == STAGE1_LAYERS:
-          stage1_layer_cnt = 0
-          stage1_iter_cnt = stage1_iter_cnt + 1
-          if stage1_iter_cnt == STAGE1_ITER:
-            stage1_iter_cnt = 0
-            stage2_line_id = line_id + 1
-            current_model = "STAGE2"
 
-      line_id = stage1_line_id + stage1_channel_cnt * STAGE1_LAYERS + stage1_layer_cnt + stage1_iter_cnt * STAGE1_LAYERS * 2
-      if current_model == "STAGE2":
-        line_id = stage2_line_id
-#      print(stage1_channel_cnt, stage1_layer_cnt, stage1_iter_cnt)
-
-#      stage1_layer_cnt = stage1_layer_cnt + 1
-#      if stage1_layer_cnt == STAGE1_LAYERS:
-#        stage1_layer_cnt = 0
-#        stage1_channel_cnt = stage1_channel_cnt + 1
-#        if stage1_channel_cnt == 2:
-#          stage1_channel_cnt = 0
-#          stage1_iter_cnt = stage1_iter_cnt + 1
-#          if stage1_iter_cnt == STAGE1_ITER:
-#            stage1_iter_cnt = 0
-#            current_model = "STAGE2"
-#            stage2_line_id = line_id + 1
-#      line_id = line_id + 1
-    elif current_model == "STAGE2":
-      layer_name = content[0]
-
-      inst0 = [layer_configs[layer_name]['IN_NUM_HW'], layer_configs[layer_name]['OUT_NUM_HW'], layer_configs[layer_name]['IN_H_HW'], layer_configs[layer_name]['IN_W_HW'], layer_configs[layer_name]['OUT_H_HW'], layer_configs[layer_name]['OUT_W_HW']]
-      inst1 = [layer_configs[layer_name]['IN_NUM'], layer_configs[layer_name]['OUT_NUM'], layer_configs[layer_name]['IN_H'], layer_configs[layer_name]['IN_W'], layer_configs[layer_name]['OUT_H'], layer_configs[layer_name]['OUT_W']]
-      inst2 = [layer_configs[layer_name + '_' + str(stage2_iter_cnt)]['CIN_OFFSET'], layer_configs[layer_name + '_' + str(stage2_iter_cnt)]['WEIGHT_OFFSET'], layer_configs[layer_name + '_' + str(stage2_iter_cnt)]['BIAS_OFFSET'], layer_configs[layer_name + '_' + str(stage2_iter_cnt)]['SHIFTED_COUT_OFFSET'], layer_configs[layer_name]['FILTER_S1'], layer_configs[layer_name]['FILTER_S2'], layer_configs[layer_name]['STRIDE']]
-      inst3 = [layer_configs[layer_name]['LAYER_EN'], layer_configs[layer_name]['IN_NUM_T'], layer_configs[layer_name]['OUT_NUM_T'], layer_configs[layer_name]['IN_H_T'], layer_configs[layer_name]['IN_W_T'], layer_configs[layer_name]['NXT_LAYER_BATCH']]
-      inst4 = [layer_configs[layer_name]['TASK_NUM1'], layer_configs[layer_name]['TASK_NUM2'], layer_configs[layer_name]['LOCAL_ACCUM_NUM'], layer_configs[layer_name]['LOCAL_REG_NUM'], layer_configs[layer_name]['ROW_IL_FACTOR'], layer_configs[layer_name]['COL_IL_FACTOR']]
-
-      insts.writelines(" ".join(str(int(e)) for e in inst0) + "\n")
-      insts.writelines(" ".join(str(int(e)) for e in inst1) + "\n")
-      insts.writelines(" ".join(str(int(e)) for e in inst2) + "\n")
-      insts.writelines(" ".join(str(int(e)) for e in inst3) + "\n")
-      insts.writelines(" ".join(str(int(e)) for e in inst4) + "\n")
-      insts.writelines("\n")
-
-# Change the execution order of two branches
-      stage2_channel_cnt = stage2_channel_cnt + 1
-      if stage2_channel_cnt == 2:
-        stage2_channel_cnt = 0
-        stage2_layer_cnt = stage2_layer_cnt + 1
-        if stage2_layer_cnt == STAGE2_LAYERS:
-          stage2_layer_cnt = 0
-          stage2_iter_cnt = stage2_iter_cnt + 1
-          if stage2_iter_cnt == STAGE2_ITER:
-            stage2_iter_cnt = 0
-            current_model = "STAGE2"
-            break
-
-      line_id = stage2_line_id + stage2_channel_cnt * STAGE2_LAYERS + stage2_layer_cnt
-
-#      stage2_layer_cnt = stage2_layer_cnt + 1
-#      if stage2_layer_cnt == STAGE2_LAYERS:
-#        stage2_layer_cnt = 0
-#        stage2_channel_cnt = stage2_channel_cnt + 1
-#        if stage2_channel_cnt == 2:
-#          stage2_channel_cnt = 0
-#          stage2_iter_cnt = stage2_iter_cnt + 1
-#          if stage2_iter_cnt == STAGE2_ITER:
-#            stage2_iter_cnt = 0
-#            current_model = "STAGE2"
-#            break
-#          else:
-#            line_id = stage2_line_id - 1
-#      line_id = line_id + 1
-
-#    line_id = line_id + 1
+  # Pass4: To print out insts
+  for layer_id, it in order:
+    layer_config = exec_configs[(layer_id, it)]
+    inst0 = [layer_config['IN_NUM_HW'], layer_config['OUT_NUM_HW'], layer_config['IN_H_HW'], layer_config['IN_W_HW'], layer_config['OUT_H_HW'], layer_config['OUT_W_HW']]
+    inst1 = [layer_config['IN_NUM'], layer_config['OUT_NUM'], layer_config['IN_H'], layer_config['IN_W'], layer_config['OUT_H'], layer_config['OUT_W']]
+    inst2 = [layer_config['CIN_OFFSET'], layer_config['WEIGHT_OFFSET'], layer_config['BIAS_OFFSET'], layer_config['SHIFTED_COUT_OFFSET'], layer_config['FILTER_S1'], layer_config['FILTER_S2'], layer_config['STRIDE']]
+    inst3 = [layer_config['LAYER_EN'], layer_config['IN_NUM_T'], layer_config['OUT_NUM_T'], layer_config['IN_H_T'], layer_config['IN_W_T'], layer_config['NXT_LAYER_BATCH']]
+    inst4 = [layer_config['TASK_NUM1'], layer_config['TASK_NUM2'], layer_config['LOCAL_ACCUM_NUM'], layer_config['LOCAL_REG_NUM'], layer_config['ROW_IL_FACTOR'], layer_config['COL_IL_FACTOR']]
+
+    insts.writelines(" ".join(str(int(e)) for e in inst0) + "\n")
+    insts.writelines(" ".join(str(int(e)) for e in inst1) + "\n")
+    insts.writelines(" ".join(str(int(e)) for e in inst2) + "\n")
+    insts.writelines(" ".join(str(int(e)) for e in inst3) + "\n")
+    insts.writelines(" ".join(str(int(e)) for e in inst4) + "\n")
+    insts.writelines("\n")
 
-  model.close()
   insts.close()
+  # the binary instructions, the config buffer of the kernel
+  inst_format.insts_convert(os.path.join(out_dir, "openpose.insts"), os.path.join(out_dir, "openpose.insts.bin"), \
+    dict([(name, model_config[name]) for name in inst_format.MODEL_FIELDS]))
 
   macros.close()
   weight_load.close()
   bias_load.close()
 
+  # the optional passes load the simulators and the DSE model, they are only imported when used
+  if fuse:
+    import layer_fuse
+    if fuse_buf is None:
+      fuse_buf = layer_fuse.board_load(layer_fuse.INTER_BUF_BOARD, f_tile)
+    layer_fuse.run(os.path.join(out_dir, "openpose.insts"), os.path.join(out_dir, "params.h"), os.path.join(out_dir, "layer_fuse.json"), fuse_buf)
+  if plan:
+    import ddr_plan
+    ddr_plan.run(os.path.join(out_dir, "openpose.insts"), os.path.join(out_dir, "params.h"), os.path.join(out_dir, "ddr_plan.json"))
+  if board is not None:
+    import roofline
+    roofline.run(os.path.join(out_dir, "openpose.insts"), board, None, os.path.join(out_dir, "roofline.json"), \
+      roofline.layer_names(f_model, f_model_config))
+
+'''
+macros of params.h that configure the kernel, they are the same for all the inputs of a bundle, which run on one bitstream
+'''
+BUNDLE_KERNEL_MACROS = ['IN_NUM_T', 'OUT_NUM_T', 'IN_H_T', 'IN_W_T', 'OUT_H_T', 'OUT_W_T', 'K_T', 'LAYER_NUM', 'VGG_LAYERS', \
+  'STAGE1_LAYERS', 'STAGE1_ITER', 'STAGE2_LAYERS', 'STAGE2_ITER', 'MAX_LAYER_BATCH']
+'''
+macros of params.h that the host needs to run one input of a bundle: the DDR layout and the outputs
+'''
+BUNDLE_INPUT_MACROS = ['IN_OUT_OFFSET', 'CIN_SIZE', 'WEIGHT_SIZE', 'BIAS_SIZE', 'STAGE2L_OFFSET', 'STAGE2R_OFFSET', \
+  'LAYER1_IN_H_HW', 'LAYER1_IN_W_HW', 'STAGE2L_OUT_H', 'STAGE2L_OUT_W', 'STAGE2L_OUT_H_HW', 'STAGE2L_OUT_W_HW', \
+  'STAGE2R_OUT_H', 'STAGE2R_OUT_W', 'STAGE2R_OUT_H_HW', 'STAGE2R_OUT_W_HW']
+'''
+bytes of the feature maps, weights and bias in DDR, float
+'''
+DATA_BYTES = 4
+
+'''
+parse an input resolution, H or HxW
+'''
+def resolution_parse(resolution):
+  content = resolution.lower().split('x')
+  if len(content) == 1:
+    return int(content[0]), int(content[0])
+  return int(content[0]), int(content[1])
+
+'''
+generate the instructions of several input resolutions of the same model and bitstream
+the model is parsed once, each resolution is written to bundle_dir/<IN_H>x<IN_W> and indexed in bundle_dir/bundle.json
+with its instructions, DDR layout and footprint, so that the host can switch between them without regenerating
+'''
+def bundle_run(f_tile, f_model, f_model_config, f_input_config, resolutions, bundle_dir, plan = False, fuse = False, \
+  fuse_buf = None, board = None):
+  model_config = network_ir.model_config_load(f_model, f_model_config)
+  with open(f_input_config, "r") as f:
+    input_config = json.loads(f.read())
+  model = network_ir.net_parse(f_model, model_config)
+
+  kernel = None
+  entries = []
+  for in_h, in_w in resolutions:
+    name = '%dx%d' % (in_h, in_w)
+    out_dir = os.path.join(bundle_dir, name)
+    if not os.path.isdir(out_dir):
+      os.makedirs(out_dir)
+    entry_input_config = dict(input_config)
+    entry_input_config['IN_H'] = in_h
+    entry_input_config['IN_W'] = in_w
+    f_entry_input_config = os.path.join(out_dir, "input.json")
+    with open(f_entry_input_config, "w") as f:
+      json.dump(entry_input_config, f, indent = 2)
+
+    run(f_tile, f_model, f_model_config, f_entry_input_config, out_dir, model, plan, fuse, fuse_buf, board)
+
+    macros = inst_format.params_load(os.path.join(out_dir, "params.h"))
+    entry_kernel = dict([(macro, macros[macro]) for macro in BUNDLE_KERNEL_MACROS + ['INTER_BUF_DEPTH'] if macro in macros])
+    if kernel is None:
+      kernel = entry_kernel
+    elif entry_kernel != kernel:
+      raise ValueError("%s: kernel configuration %s differs from %s" % (name, entry_kernel, kernel))
+    entry = {'NAME': name, 'IN_H': in_h, 'IN_W': in_w}
+    for f_name in ['input.json', 'openpose.insts', 'openpose.insts.bin', 'params.h', 'weight_offset.dat', 'bias_offset.dat']:
+      entry[f_name] = os.path.join(name, f_name)
+    for macro in BUNDLE_INPUT_MACROS:
+      entry[macro] = macros[macro]
+    entry['DDR_BYTES'] = (macros['CIN_SIZE'] + macros['WEIGHT_SIZE'] + macros['BIAS_SIZE']) * DATA_BYTES
+    entries.append(entry)
+
+  bundle = {}
+  bundle['KERNEL'] = kernel
+  bundle['CONFIG_SIZE'] = len(inst_format.MODEL_FIELDS) + kernel['LAYER_NUM'] * inst_format.CONFIG_PARAMS
+  # the host allocates the buffers once for the largest input
+  for macro in ['CIN_SIZE', 'WEIGHT_SIZE', 'BIAS_SIZE', 'DDR_BYTES']:
+    bundle['MAX_' + macro] = max([entry[macro] for entry in entries])
+  bundle['ENTRIES'] = entries
+  with open(os.path.join(bundle_dir, "bundle.json"), "w") as f:
+    json.dump(bundle, f, indent = 2)
+
+  print('%-10s %10s %10s %10s %10s' % ('input', 'CIN_SIZE', 'WEIGHT', 'BIAS', 'DDR MB'))
+  for entry in entries:
+    print('%-10s %10d %10d %10d %10.1f' % (entry['NAME'], entry['CIN_SIZE'], entry['WEIGHT_SIZE'], entry['BIAS_SIZE'], entry['DDR_BYTES'] / 1e6))
+  print('%d inputs written to %s' % (len(entries), os.path.join(bundle_dir, "bundle.json")))
+  return bundle
+
 if __name__ == "__main__":
   parser = argparse.ArgumentParser(description='Data reorganization.')
 
   parser.add_argument('-t', '--tile', metavar='TILE', required=True, help='tiling configuration', dest='tile')
-  parser.add_argument('-m', '--model', metavar='MODEL', required=True, help='model description', dest='model')
-  parser.add_argument('-mc', '--model-config', metavar='MODEL_CONFIG', required=True, help='model topology', dest='model_config')
+  parser.add_argument('-m', '--model', metavar='MODEL', required=True, help='model description (.model) or layer graph (.json)', dest='model')
+  parser.add_argument('-mc', '--model-config', metavar='MODEL_CONFIG', default=None, help='model topology, not used with a layer graph', dest='model_config')
 #  parser.add_argument('--cin', metavar='INPUT_FIGURE', required=True, help='input feature maps', dest='input_figure')
   parser.add_argument('-i', '--input-config', metavar='INPUT_CONFIG', required=True, help='input configuration', dest='input_config')
+  parser.add_argument('-r', '--resolutions', metavar='RESOLUTIONS', nargs='+', default=None, help='input resolutions of a bundle, H or HxW', dest='resolutions')
+  parser.add_argument('--bundle', metavar='BUNDLE', default='./bundle', help='bundle directory', dest='bundle')
+  parser.add_argument('--ddr-plan', help='pack the feature maps in DDR by their lifetimes', action='store_true', default=False, dest='ddr_plan')
+  parser.add_argument('--fuse', help='pass the feature maps of fused layers through the on-chip buffer', action='store_true', default=False, dest='fuse')
+  parser.add_argument('--fuse-buf', metavar='FUSE_BUF', type=int, default=None, help='size of the on-chip buffer in elements, sized by the board if not given', dest='fuse_buf')
+  parser.add_argument('--fuse-board', metavar='BOARD', default=None, help='board configuration the on-chip buffer is sized by, vu9p.json by default', dest='fuse_board')
+  parser.add_argument('--roofline', metavar='BOARD', default=None, help='write the DDR traffic and roofline report against the board configuration', dest='roofline')
+  parser.add_argument('--auto-tile', help='select the tiles of the layers with tile_tune.py and generate from the model with the tiles selected', action='store_true', default=False, dest='auto_tile')
+  parser.add_argument('--tile-objective', choices=['waste', 'cycles'], default='waste', help='objective of the tiles selected with --auto-tile', dest='tile_objective')
 
   args = parser.parse_args()
-  run(args.tile, args.model, args.model_config, args.input_config)
+  if args.fuse and args.fuse_buf is None:
+    import layer_fuse
+    args.fuse_buf = layer_fuse.board_load(args.fuse_board if args.fuse_board is not None else layer_fuse.INTER_BUF_BOARD, args.tile)
+  if args.auto_tile:
+    import tile_tune
+    f_tiled = tile_tune.model_tiled_name(os.path.basename(args.model))
+    tile_tune.run(args.tile, args.model, args.model_config, args.input_config, f_tiled, 'tile_tune.json', args.tile_objective)
+    print('tiles selected in %s, reorganize the data with it' % (f_tiled))
+    args.model = f_tiled
+  if args.resolutions is None:
+    run(args.tile, args.model, args.model_config, args.input_config, plan = args.ddr_plan, fuse = args.fuse, fuse_buf = args.fuse_buf, board = args.roofline)
+  else:
+    bundle_run(args.tile, args.model, args.model_config, args.input_config, [resolution_parse(r) for r in args.resolutions], args.bundle, \
+      args.ddr_plan, args.fuse, args.fuse_buf, args.roofline)
@@ -0,0 +1,303 @@
+import numpy as np
+import json
+import argparse
+import collections
+import os
+import sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data'))
+import inst_format
+import inst_sim
+import ddr_plan
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'dse'))
+import dse_p
+
+'''
+Functionality: layer fusion
+openpose.insts, params.h -> openpose.insts, params.h with the feature maps between fused layers kept on chip
+
+Each layer writes its output feature maps to DDR at COUT_OFFSET and the next layers read them back at CIN_OFFSET.
+The kernel can pass them on chip instead: inter_write pushes the output tiles of a layer to the on-chip buffer
+fifo_inter_write_1 in place of cout_write, and inter_load pops them as the input tiles of a later layer in place of
+cin_load. The buffer is enabled by two bits of LAYER_EN in inst3:
+  bit 6 INTER_LOAD_EN:  the input tiles are popped from the on-chip buffer, CIN_OFFSET is not used
+  bit 7 INTER_WRITE_EN: the output tiles are pushed to the on-chip buffer, COUT_OFFSET is not used
+A fused group is a chain of layers linked by the buffer: the first layer of the chain sets INTER_WRITE_EN, the last
+one INTER_LOAD_EN and the layers between set both. The buffer is a static fifo that persists across the engine calls,
+so the layers of a group keep their NXT_LAYER_BATCH, the layers only have to pop the feature maps in the order they
+were pushed.
+
+The links between the layers are found from the DDR cells the instructions access, as in ddr_plan.py. The output of
+a producer is passed on chip to a consumer if
+  - the consumer reads it without halo: a 1x1 filter or a pooling, which the kernel loads only once
+  - the consumer reads it once, with a single output channel tile
+  - the producer does not pool or stride, inter_write then pushes whole IN_H_T x IN_W_T tiles
+  - the consumer is the only reader of the output, the host does not read it, and the consumer reads nothing else
+  - the consumer reads the cells as the producer writes them, and pops the tiles in the order they are pushed: the
+    same tile shape, and either a single spatial tile or a single channel tile on both sides
+  - the fifo is popped in order and its peak occupancy fits in the buffer, INTER_BUF_DEPTH words in params.h
+The buffer is sized by the board JSON of the DSE: the BRAM18K of the board within BRAM18K_THRES, less the BRAM18K of
+the kernel buffers estimated by dse_p.res_est for the tiles of tile.json, hold the fifo of INTER_LANE floats per word.
+The candidates are taken in the order of the layers. The DDR writes of the producer and the DDR reads of the consumer
+are saved, the report lists them with the reason why the other candidates are not fused.
+'''
+
+'''
+bits of LAYER_EN of the on-chip buffer
+'''
+INTER_LOAD_BIT = 6
+INTER_WRITE_BIT = 7
+'''
+default board of the on-chip buffer
+'''
+INTER_BUF_BOARD = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'dse', 'vu9p.json')
+'''
+elements in a word of the on-chip buffer, INTER_WRITE_LANE of pose.h
+'''
+INTER_LANE = 8
+'''
+bytes of a feature map element in DDR, float
+'''
+DATA_BYTES = 4
+'''
+reasons why a producer and a consumer are not fused
+'''
+FUSE_REASONS = {
+  'halo': 'the consumer reads a halo',
+  'reload': 'the consumer reads its input once per output channel tile',
+  'pool': 'the producer pools or strides',
+  'shared': 'the output has other readers, or the consumer reads other feature maps',
+  'window': 'the consumer does not read the cells the producer writes',
+  'order': 'the tiles are not consumed in the order they are produced',
+  'fifo': 'the on-chip buffer would be popped out of order',
+  'buffer': 'the on-chip buffer is too small'
+}
+
+'''
+size of the on-chip buffer in elements on the board, with the kernel of the tiles of tile.json
+the fifo is in BRAM18K, 512 words of 36 bits each, as dse_p.BRAM_SDP_predict_HLS
+'''
+def board_buf_size(board, tile):
+  params = {'SIMD_LANE': INTER_LANE, 'SA_ROWS': tile['SA_ROWS'], 'SA_COLS': tile['SA_COLS'], 'SA_SIMD_LANE': tile['SA_SIMD'], \
+    'LAYER_IN_NUM_T': tile['IN_NUM_T'], 'LAYER_OUT_NUM_T': tile['OUT_NUM_T'], 'LAYER_IN_H_T': tile['IN_H_T'], \
+    'LAYER_IN_W_T': tile['IN_W_T'], 'LAYER_OUT_H_T': tile['OUT_H_T'], 'LAYER_OUT_W_T': tile['OUT_W_T'], 'K_T': tile['K_T'], \
+    'DATA_W0': DATA_BYTES * 8, 'DATA_W1': DATA_BYTES * 8, 'DATA_W2': DATA_BYTES * 8, 'BUS_W': 512, 'DATA_T0': 'float'}
+  kernel_bram = int(dse_p.res_est(params)[1])
+  board_bram = int(board['BRAM18K'] * board['BRAM18K_THRES'])
+  word_bram = int(dse_p.BRAM_SDP_predict_HLS(INTER_LANE * DATA_BYTES * 8, INTER_LANE * DATA_BYTES * 8 * 512))
+  depth = (board_bram - kernel_bram) // word_bram * 512
+  if depth <= 0:
+    raise ValueError("no BRAM18K left on %s for the on-chip buffer, the kernel takes %d of %d" % (board['BOARD'], kernel_bram, board_bram))
+  return depth * INTER_LANE
+
+'''
+tiles of a layer: input channel, output channel, row and column tiles
+'''
+def layer_tiles(inst):
+  return -(-inst['IN_NUM'] // inst['IN_NUM_T']), -(-inst['OUT_NUM'] // inst['OUT_NUM_T']), \
+    -(-inst['IN_H'] // inst['IN_H_T']), -(-inst['IN_W'] // inst['IN_W_T'])
+
+'''
+elements a layer pushes to the on-chip buffer, its whole output tiles
+'''
+def stream_size(inst):
+  in_tiles, out_tiles, h_tiles, w_tiles = layer_tiles(inst)
+  return out_tiles * inst['OUT_NUM_T'] * h_tiles * inst['IN_H_T'] * w_tiles * inst['IN_W_T']
+
+'''
+links of the layers through DDR, the accesses are replayed over two frames so that the cells read before they are
+written in a frame are linked to their writer in the previous frame
+return the readers of the output of each layer (-1 for the host), the writers of the input of each layer (-1 for
+the input and the cells never written, the zero halos) and the DDR cells read and written by each layer
+'''
+def layer_links(insts, params):
+  accesses = [ddr_plan.layer_access(inst) for inst in insts]
+  readers = [set() for inst in insts]
+  sources = [set() for inst in insts]
+  writer = np.full(params['CIN_SIZE'], -1, dtype = np.int32)
+  for frame in range(2):
+    # the input is written by the host
+    writer[:params['IN_OUT_OFFSET']] = -1
+    for layer_id, (read, write) in enumerate(accesses):
+      if frame == 1:
+        for source in np.unique(writer[read]):
+          sources[layer_id].add(int(source))
+          if source >= 0:
+            readers[source].add(layer_id)
+      writer[write] = layer_id
+  # the outputs are read by the host after the last layer
+  for prefix in ['STAGE2L', 'STAGE2R']:
+    offset = params[prefix + '_OFFSET']
+    out_size = params[prefix + '_OUT_NUM_HW'] * params[prefix + '_OUT_H_HW'] * params[prefix + '_OUT_W_HW']
+    for source in np.unique(writer[offset : offset + out_size]):
+      if source >= 0:
+        readers[source].add(-1)
+  return readers, sources, accesses
+
+'''
+check if the output of the layer producer can be passed on chip to the layer consumer
+return None, or the reason why not
+'''
+def fuse_check(insts, producer, consumer, readers, sources, accesses):
+  p = insts[producer]
+  c = insts[consumer]
+  filter_s1 = c['FILTER_S1'] if c['DEPTH_CONV_EN'] else 1
+  filter_s2 = c['FILTER_S2'] if c['CONV_EN'] else 1
+  if max(filter_s1, filter_s2) > 1:
+    return 'halo'
+  c_in_tiles, c_out_tiles, c_h_tiles, c_w_tiles = layer_tiles(c)
+  max_pool = not c['DEPTH_CONV_EN'] and not c['CONV_EN']
+  if c_out_tiles > 1 and not max_pool:
+    return 'reload'
+  if p['POOL_EN'] or p['STRIDE'] != 1:
+    return 'pool'
+  if readers[producer] != set([consumer]) or sources[consumer] != set([producer]):
+    return 'shared'
+  if not np.array_equal(np.sort(accesses[producer][1]), np.sort(accesses[consumer][0])):
+    return 'window'
+  p_in_tiles, p_out_tiles, p_h_tiles, p_w_tiles = layer_tiles(p)
+  if p['IN_H_T'] != c['IN_H_T'] or p['IN_W_T'] != c['IN_W_T'] or p_h_tiles != c_h_tiles or p_w_tiles != c_w_tiles \
+    or p_out_tiles * p['OUT_NUM_T'] != c_in_tiles * c['IN_NUM_T']:
+    return 'order'
+  # the producer pushes the channel tiles outermost, the consumer pops them innermost
+  if p_h_tiles * p_w_tiles > 1 and (p_out_tiles > 1 or c_in_tiles > 1):
+    return 'order'
+  return None
+
+'''
+replay the on-chip buffer of the fused layers, edges maps each consumer to its producer
+return the peak occupancy in elements, None if a layer would pop the output of another layer than its producer
+'''
+def fifo_peak(insts, edges):
+  producers = set(edges.values())
+  fifo = collections.deque()
+  occupancy = 0
+  peak = 0
+  for layer_id, inst in enumerate(insts):
+    if layer_id in edges:
+      if len(fifo) == 0 or fifo[0] != edges[layer_id]:
+        return None
+      fifo.popleft()
+    if layer_id in producers:
+      fifo.append(layer_id)
+      # the input of the layer is popped while its output is pushed
+      occupancy += stream_size(inst)
+      peak = max(peak, occupancy)
+    if layer_id in edges:
+      occupancy -= stream_size(insts[edges[layer_id]])
+  return peak
+
+'''
+chains of the fused layers, from the first producer to the last consumer
+'''
+def fuse_groups(edges):
+  consumers = dict([(producer, consumer) for consumer, producer in edges.items()])
+  groups = []
+  for producer in sorted(consumers):
+    if producer in edges:
+      continue
+    group = [producer]
+    while group[-1] in consumers:
+      group.append(consumers[group[-1]])
+    groups.append(group)
+  return groups
+
+'''
+fuse the layers of the instructions, buf_size is the size of the on-chip buffer in elements
+return the fused instructions, the macros to update and the report
+'''
+def layer_fuse(insts, params, buf_size):
+  for inst in insts:
+    if inst['INTER_LOAD_EN'] or inst['INTER_WRITE_EN']:
+      raise ValueError("the instructions are already fused")
+  readers, sources, accesses = layer_links(insts, params)
+  edges = {}
+  candidates = []
+  for producer in range(len(insts)):
+    for consumer in sorted(readers[producer]):
+      if consumer < 0:
+        continue
+      reason = fuse_check(insts, producer, consumer, readers, sources, accesses)
+      if reason is None:
+        trial = dict(edges)
+        trial[consumer] = producer
+        peak = fifo_peak(insts, trial)
+        if peak is None:
+          reason = 'fifo'
+        elif peak > buf_size:
+          reason = 'buffer'
+        else:
+          edges = trial
+      candidate = {'PRODUCER': producer, 'CONSUMER': consumer, 'FUSED': reason is None, 'REASON': reason}
+      candidate['SAVED_BYTES'] = (len(accesses[producer][1]) + len(accesses[consumer][0])) * DATA_BYTES if reason is None else 0
+      candidates.append(candidate)
+
+  fused = [dict(inst) for inst in insts]
+  for consumer, producer in edges.items():
+    fused[producer]['LAYER_EN'] |= 1 << INTER_WRITE_BIT
+    fused[producer]['INTER_WRITE_EN'] = 1
+    fused[consumer]['LAYER_EN'] |= 1 << INTER_LOAD_BIT
+    fused[consumer]['INTER_LOAD_EN'] = 1
+  macros = {'INTER_BUF_DEPTH': buf_size // INTER_LANE}
+
+  report = {}
+  report['FM_BYTES'] = sum([len(read) + len(write) for read, write in accesses]) * DATA_BYTES
+  report['SAVED_BYTES'] = sum([candidate['SAVED_BYTES'] for candidate in candidates])
+  report['FUSED_FM_BYTES'] = report['FM_BYTES'] - report['SAVED_BYTES']
+  report['BUF_SIZE'] = buf_size
+  report['BUF_PEAK'] = fifo_peak(insts, edges)
+  report['GROUPS'] = fuse_groups(edges)
+  report['CANDIDATES'] = candidates
+  return fused, macros, report
+
+def fuse_report(report):
+  print('%8s %8s %10s' % ('producer', 'consumer', 'saved MB'))
+  for candidate in report['CANDIDATES']:
+    if candidate['FUSED']:
+      print('%8d %8d %10.2f' % (candidate['PRODUCER'], candidate['CONSUMER'], candidate['SAVED_BYTES'] / 1e6))
+  reasons = collections.Counter([candidate['REASON'] for candidate in report['CANDIDATES'] if not candidate['FUSED']])
+  for reason, num in sorted(reasons.items(), key = lambda item: -item[1]):
+    print('%d not fused: %s' % (num, FUSE_REASONS[reason]))
+  print('fused groups: %s' % (' '.join(['-'.join([str(layer_id) for layer_id in group]) for group in report['GROUPS']])))
+  print('feature map traffic: %.1f MB -> %.1f MB per frame (-%.1f%%), on-chip buffer peak: %d/%d elements' % \
+    (report['FM_BYTES'] / 1e6, report['FUSED_FM_BYTES'] / 1e6, 100.0 * report['SAVED_BYTES'] / report['FM_BYTES'], \
+    report['BUF_PEAK'], report['BUF_SIZE']))
+
+'''
+load the board and the tiles, return the size of the on-chip buffer
+'''
+def board_load(f_board, f_tile):
+  with open(f_board, 'r') as f:
+    board = json.loads(f.read())
+  with open(f_tile, 'r') as f:
+    tile = json.loads(f.read())
+  return board_buf_size(board, tile)
+
+'''
+fuse the layers of the instructions and params.h in place
+'''
+def run(f_insts, f_params, f_report, buf_size):
+  insts = inst_sim.insts_load(f_insts)
+  params = inst_format.params_load(f_params)
+  fused, macros, report = layer_fuse(insts, params, buf_size)
+  fuse_report(report)
+
+  ddr_plan.insts_update(f_insts, fused, params)
+  ddr_plan.params_update(f_params, macros)
+  if f_report is not None:
+    with open(f_report, 'w') as f:
+      json.dump(report, f, indent = 2)
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description='Layer fusion.')
+
+  parser.add_argument('-n', '--insts', metavar='INSTS', required=True, help='instructions, rewritten in place with the text and binary formats', dest='insts')
+  parser.add_argument('-p', '--params', metavar='PARAMS', required=True, help='params.h, rewritten in place', dest='params')
+  parser.add_argument('-s', '--buf-size', metavar='BUF_SIZE', type=int, default=None, help='size of the on-chip buffer in elements, sized by the board if not given', dest='buf_size')
+  parser.add_argument('-b', '--board', metavar='BOARD', default=INTER_BUF_BOARD, help='board configuration', dest='board')
+  parser.add_argument('-t', '--tile', metavar='TILE', default='tile.json', help='tiling configuration of the kernel', dest='tile')
+  parser.add_argument('-o', '--output', metavar='OUTPUT', default='layer_fuse.json', help='fusion report', dest='output')
+
+  args = parser.parse_args()
+  if args.buf_size is None:
+    args.buf_size = board_load(args.board, args.tile)
+  run(args.insts, args.params, args.output, args.buf_size)
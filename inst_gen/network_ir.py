@@ -0,0 +1,455 @@
+import numpy as np
+import json
+import argparse
+import heapq
+
+'''
+network IR shared by dse_p.py, inst_parse.py and data_reorg.py
+the model is described as a layer graph, parsed once into a numpy structured array with one row per layer of the graph,
+the columns hold the layer attributes, the rows of the layers they read and the feature map shapes derived from the
+network input. the array has no python objects, so it is pickled as one buffer and can be saved and memory-mapped with
+net_save/net_load
+
+layer graph (.json):
+  input:  the name of the network input
+  blocks: the blocks of layers in the execution order, VGG, STAGE1 and STAGE2 for openpose
+    name:   the block name, the model configuration has <name>_LAYERS, the layers of one branch, and <name>_ITER
+    repeat: the number of times the block is executed, 1 by default
+    carry:  {name: [initial layer, layer]}, the inputs of a repeated block: the initial layer in the first
+            iteration, the layer of the previous iteration after
+    layers: the layers of the block, in the execution order of one iteration
+      name, type:  convb, separable_conv, max_pool, or concat
+      inputs:      the layer, concat or carry read, the channels of a concat in the order of its inputs
+      out_num, filter_s, stride, relu, bias, tile: [in_num_t, out_num_t, in_h_t, in_w_t] for the other types
+the model description (.model) with the topology file is converted to the same graph by model_graph
+'''
+
+NET_DTYPE = np.dtype([
+  ('name', 'U32'),
+  ('type', 'U16'),
+  # 0: VGG, 1: STAGE1, 2: STAGE2
+  ('stage', np.int32),
+  # branch and position in the branch of the stage layers
+  ('branch', np.int32),
+  ('depth', np.int32),
+  ('in_num', np.int32),
+  ('out_num', np.int32),
+  ('in_h', np.int32),
+  ('in_w', np.int32),
+  ('out_h', np.int32),
+  ('out_w', np.int32),
+  ('filter_s', np.int32),
+  ('filter_s1', np.int32),
+  ('filter_s2', np.int32),
+  ('stride', np.int32),
+  ('relu_en', np.int32),
+  ('bias_en', np.int32),
+  ('pool_en', np.int32),
+  ('depth_conv_en', np.int32),
+  ('point_conv_en', np.int32),
+  # tiling factors of the model file
+  ('in_num_t', np.int32),
+  ('out_num_t', np.int32),
+  ('in_h_t', np.int32),
+  ('in_w_t', np.int32),
+  # out_num padded to out_num_t
+  ('out_num_hw', np.int32),
+  # input channels as laid out in the feature maps, the sum of the padded channels of the concatenated feature maps
+  # for the first layers of the stages, in_num otherwise
+  ('in_num_cat', np.int32),
+  # the input feature maps come from a concatenation
+  ('in_concat', np.int32),
+  # the output feature maps are part of a concatenation
+  ('out_concat', np.int32),
+  # rows of the layers read, in the channel order of a concatenation, the carried layers by their initial layer
+  ('in_srcs', np.int32, (8,)),
+  ('in_src_num', np.int32),
+  # row of the initial layer the layer replaces in the concatenations of the next iterations of its block, -1 if the
+  # layer is not carried
+  ('carry', np.int32),
+  # executions of the block of the layer
+  ('repeat', np.int32)
+])
+MAX_IN_SRCS = 8
+GRAPH_LAYER_TYPES = ['convb', 'separable_conv', 'max_pool']
+
+'''
+the max pooling layer reads the output of Conv2d_3 instead of the previous layer
+'''
+POOL_SOURCE = {'Conv2d_3_pool': 'Conv2d_3'}
+'''
+VGG layers concatenated as the input of the stages, the first one decides the feature map size
+'''
+VGG_CONCAT = ['Conv2d_3_pool', 'Conv2d_7', 'Conv2d_11']
+
+def net_index(net, name):
+  return int(np.flatnonzero(net['name'] == name)[0])
+
+'''
+the layers concatenated as the input of the first layers of the stages, in the channel order of the model weights
+'''
+def net_concat_sources(net, layer_id):
+  return [int(src) for src in net[layer_id]['in_srcs'][:net[layer_id]['in_src_num']]]
+
+'''
+convert the model description and the topology file to the layer graph
+the VGG layers read the previous layer or POOL_SOURCE, the two branches of the stages read the concatenation of the
+VGG_CONCAT layers, preceded by the outputs of the previous stage in stage 2
+'''
+def model_graph(f_model, model_config):
+  VGG_LAYERS = model_config['VGG_LAYERS']
+  STAGE1_LAYERS = model_config['STAGE1_LAYERS']
+  STAGE2_LAYERS = model_config['STAGE2_LAYERS']
+
+  contents = []
+  with open(f_model, 'r') as model:
+    lines = model.readlines()
+  for line in lines[1:]:
+    content = line.strip('\n').split(',')
+    if len(content) > 1:
+      contents.append(content)
+  layers = []
+  for content in contents:
+    layer = {'name': content[0], 'type': content[1], 'out_num': int(content[2]), 'filter_s': int(content[3]), \
+      'stride': int(content[4]), 'relu': int(content[5] == "1"), 'bias': int(content[6] == "1"), \
+      'tile': [int(content[7]), int(content[8]), int(content[9]), int(content[10])]}
+    layers.append(layer)
+
+  vgg = layers[:VGG_LAYERS]
+  for layer_id, layer in enumerate(vgg):
+    if layer['name'] in POOL_SOURCE:
+      layer['inputs'] = [POOL_SOURCE[layer['name']]]
+    else:
+      layer['inputs'] = ['image'] if layer_id == 0 else [vgg[layer_id - 1]['name']]
+  blocks = [{'name': 'VGG', 'layers': vgg}]
+
+  stage1 = layers[VGG_LAYERS : VGG_LAYERS + STAGE1_LAYERS * 2]
+  stage2 = layers[VGG_LAYERS + STAGE1_LAYERS * 2 : VGG_LAYERS + STAGE1_LAYERS * 2 + STAGE2_LAYERS * 2]
+  carry = {}
+  for branch in range(2):
+    carry['STAGE2_L%d' % (branch + 1)] = [stage1[(branch + 1) * STAGE1_LAYERS - 1]['name'], stage2[(branch + 1) * STAGE2_LAYERS - 1]['name']]
+  for name, stage, stage_layers, concat in [('STAGE1', stage1, STAGE1_LAYERS, VGG_CONCAT), \
+    ('STAGE2', stage2, STAGE2_LAYERS, sorted(carry.keys()) + VGG_CONCAT)]:
+    for layer_id, layer in enumerate(stage):
+      layer['inputs'] = [name + '_concat'] if layer_id % stage_layers == 0 else [stage[layer_id - 1]['name']]
+    block = {'name': name, 'repeat': model_config[name + '_ITER']}
+    if name == 'STAGE2':
+      block['carry'] = carry
+    block['layers'] = [{'name': name + '_concat', 'type': 'concat', 'inputs': concat}] + stage
+    blocks.append(block)
+  return {'input': 'image', 'blocks': blocks}
+
+'''
+read a layer graph
+'''
+def graph_load(f_graph):
+  with open(f_graph, 'r') as f:
+    return json.loads(f.read())
+
+'''
+write a layer graph, one layer per line
+'''
+def graph_save(graph, f_graph):
+  blocks = []
+  for block in graph['blocks']:
+    head = dict([(key, value) for key, value in block.items() if key != 'layers'])
+    layers = ',\n'.join(['      ' + json.dumps(layer) for layer in block['layers']])
+    blocks.append('    ' + json.dumps(head)[:-1] + ', "layers": [\n' + layers + '\n    ]}')
+  with open(f_graph, 'w') as f:
+    f.write('{\n  "input": ' + json.dumps(graph['input']) + ',\n  "blocks": [\n' + ',\n'.join(blocks) + '\n  ]\n}\n')
+
+def model_is_graph(f_model):
+  return f_model.endswith('.json')
+
+'''
+convert the layer graph to the network IR without the feature map shapes
+the inputs must be declared before the layers that read them, so that the rows are in a topological order
+'''
+def graph_net(graph):
+  rows = []
+  nodes = {graph['input']: None}
+  for stage, block in enumerate(graph['blocks']):
+    carry = block.get('carry', {})
+    for name, (init, nxt) in carry.items():
+      if not isinstance(nodes.get(init, None), int):
+        raise ValueError("carry %s: %s is not a layer of a previous block" % (name, init))
+    concats = {}
+    first_rows = []
+    for layer in block['layers']:
+      if layer['name'] in nodes or layer['name'] in carry:
+        raise ValueError("layer %s is declared twice" % (layer['name']))
+      srcs = []
+      for src in layer['inputs']:
+        if src in carry:
+          srcs.append(carry[src][0])
+        elif src in nodes:
+          srcs.append(src)
+        else:
+          raise ValueError("layer %s reads %s, which is not declared before" % (layer['name'], src))
+      if layer['type'] == 'concat':
+        if any([not isinstance(nodes[src], int) for src in srcs]):
+          raise ValueError("concat %s reads a concat or the network input" % (layer['name']))
+        nodes[layer['name']] = 'concat'
+        concats[layer['name']] = srcs
+        continue
+      if layer['type'] not in GRAPH_LAYER_TYPES:
+        raise ValueError("layer %s: unknown type %s" % (layer['name'], layer['type']))
+      if len(srcs) != 1:
+        raise ValueError("layer %s reads %d inputs, a concat is required" % (layer['name'], len(srcs)))
+      row = dict(layer)
+      row['stage'] = stage
+      row['repeat'] = block.get('repeat', 1)
+      row['in_concat'] = int(srcs[0] in concats)
+      row['srcs'] = concats[srcs[0]] if srcs[0] in concats else [src for src in srcs if nodes[src] is not None]
+      # the layers that do not read a layer of the block start a branch of the block
+      if srcs[0] in concats or nodes[srcs[0]] is None or rows[nodes[srcs[0]]]['stage'] != stage:
+        first_rows.append(len(rows))
+        row['branch'], row['depth'] = len(first_rows) - 1, 0
+      else:
+        row['branch'], row['depth'] = rows[nodes[srcs[0]]]['branch'], rows[nodes[srcs[0]]]['depth'] + 1
+      nodes[layer['name']] = len(rows)
+      rows.append(row)
+    for name, (init, nxt) in carry.items():
+      if not isinstance(nodes.get(nxt, None), int) or rows[nodes[nxt]]['stage'] != stage:
+        raise ValueError("carry %s: %s is not a layer of the block" % (name, nxt))
+    # the layers read by a concatenation, directly or carried
+    for srcs in concats.values():
+      for src in srcs:
+        rows[nodes[src]]['out_concat'] = 1
+    for name, (init, nxt) in carry.items():
+      if any([name in layer['inputs'] for layer in block['layers'] if layer['type'] == 'concat']):
+        rows[nodes[nxt]]['out_concat'] = 1
+        rows[nodes[nxt]]['carry'] = init
+
+  net = np.zeros(len(rows), dtype = NET_DTYPE)
+  for layer_id, row in enumerate(rows):
+    layer = net[layer_id]
+    layer['name'] = row['name']
+    layer['type'] = row['type']
+    layer['stage'] = row['stage']
+    layer['repeat'] = row['repeat']
+    # the branches of the VGG layers are not numbered
+    if row['stage'] > 0:
+      layer['branch'], layer['depth'] = row['branch'], row['depth']
+    layer['out_num'] = row['out_num']
+    layer['filter_s'] = row['filter_s']
+    layer['stride'] = row['stride']
+    layer['relu_en'] = row['relu']
+    layer['bias_en'] = row['bias']
+    layer['in_num_t'], layer['out_num_t'], layer['in_h_t'], layer['in_w_t'] = row['tile']
+    if row['type'] == "separable_conv":
+      layer['filter_s1'], layer['filter_s2'] = row['filter_s'], 1
+      layer['depth_conv_en'], layer['point_conv_en'] = 1, 1
+    elif row['type'] == "convb":
+      layer['filter_s1'], layer['filter_s2'] = 1, row['filter_s']
+      layer['depth_conv_en'], layer['point_conv_en'] = 0, 1
+    elif row['type'] == "max_pool":
+      layer['filter_s1'], layer['filter_s2'] = 1, 1
+      layer['pool_en'] = 1
+    if len(row['srcs']) > MAX_IN_SRCS:
+      raise ValueError("layer %s reads %d layers, at most %d" % (row['name'], len(row['srcs']), MAX_IN_SRCS))
+    layer['in_srcs'] = -1
+    layer['in_srcs'][:len(row['srcs'])] = [nodes[src] for src in row['srcs']]
+    layer['in_src_num'] = len(row['srcs'])
+    layer['in_concat'] = row['in_concat']
+    layer['out_concat'] = row.get('out_concat', 0)
+    layer['carry'] = nodes[row['carry']] if 'carry' in row else -1
+  net['out_num_hw'] = -(-net['out_num'] // net['out_num_t']) * net['out_num_t']
+  return net
+
+'''
+model configuration of a layer graph: <name>_LAYERS, the layers of one branch, and <name>_ITER of each block
+'''
+def graph_model_config(graph):
+  net = graph_net(graph)
+  model_config = {}
+  for stage, block in enumerate(graph['blocks']):
+    layer_num = int(np.sum(net['stage'] == stage))
+    branch_num = int(np.max(net['branch'][net['stage'] == stage])) + 1
+    if layer_num % branch_num != 0:
+      raise ValueError("block %s: %d layers in %d branches" % (block['name'], layer_num, branch_num))
+    model_config[block['name'] + '_LAYERS'] = layer_num // branch_num
+    model_config[block['name'] + '_ITER'] = block.get('repeat', 1)
+  return model_config
+
+'''
+model configuration of the model: from the layer graph, or from the topology file of a model description
+'''
+def model_config_load(f_model, f_model_config):
+  if model_is_graph(f_model):
+    return graph_model_config(graph_load(f_model))
+  if f_model_config is None:
+    raise ValueError("%s: the model topology is required for a model description" % (f_model))
+  with open(f_model_config, "r") as f:
+    return json.loads(f.read())
+
+'''
+parse the model, return the network IR without the feature map shapes, which depend on the input
+'''
+def net_parse(f_model, model_config):
+  if model_is_graph(f_model):
+    return graph_net(graph_load(f_model))
+  return graph_net(model_graph(f_model, model_config))
+
+'''
+chain the feature map shapes of a parsed network from the input configuration
+return a new network IR, the parsed one is left untouched so that it can be shared by several inputs
+'''
+def net_shape(net, input_config):
+  net = net.copy()
+  for layer_id in range(len(net)):
+    layer = net[layer_id]
+    srcs = net_concat_sources(net, layer_id)
+    if len(srcs) == 0:
+      in_num, in_h, in_w = input_config['IN_NUM'], input_config['IN_H'], input_config['IN_W']
+    else:
+      in_num, in_h, in_w = int(np.sum(net['out_num'][srcs])), int(net[srcs[0]]['out_h']), int(net[srcs[0]]['out_w'])
+      if np.any(net['out_h'][srcs] != in_h) or np.any(net['out_w'][srcs] != in_w):
+        raise ValueError("layer %s concatenates feature maps of different sizes" % (layer['name']))
+    in_num_cat = in_num
+    if layer['in_concat']:
+      in_num_cat = int(np.sum(net['out_num_hw'][srcs]))
+    if layer['stride'] == 2:
+      out_h = -(-in_h // 2)
+      out_w = -(-in_w // 2)
+    else:
+      out_h = in_h
+      out_w = in_w
+    layer['in_num'], layer['in_h'], layer['in_w'] = in_num, in_h, in_w
+    layer['out_h'], layer['out_w'] = out_h, out_w
+    layer['in_num_cat'] = in_num_cat
+
+  return net
+
+'''
+parse the model description, return the network IR
+'''
+def net_build(f_model, model_config, input_config):
+  return net_shape(net_parse(f_model, model_config), input_config)
+
+'''
+the execution order of the layers, a topological order of the executions of the layers: the blocks are executed in
+order and repeat times each, the ready layers are executed in the order of the rows, which runs the branches of the
+stages one after the other
+model_config is not used, the repeats are in the IR
+return the row indices of net
+'''
+def net_schedule(net, model_config = None):
+  # executions (layer_id, iteration), the iterations of a block run one after the other
+  execs = [(int(layer_id), it) for stage in np.unique(net['stage']) for it in range(int(net['repeat'][net['stage'] == stage][0])) \
+    for layer_id in np.flatnonzero(net['stage'] == stage)]
+  deps = {}
+  users = dict([(e, []) for e in execs])
+  for layer_id, it in execs:
+    deps[(layer_id, it)] = 0
+    stage = net[layer_id]['stage']
+    srcs = [(src, it if net[src]['stage'] == stage else int(net[src]['repeat']) - 1) for src in net_concat_sources(net, layer_id)]
+    if it > 0:
+      # the previous iteration of the block, read through the carried layers
+      srcs += [(int(src), it - 1) for src in np.flatnonzero(net['stage'] == stage)]
+    for src in set(srcs):
+      deps[(layer_id, it)] += 1
+      users[src].append((layer_id, it))
+
+  ready = [(int(net[layer_id]['stage']), it, layer_id) for layer_id, it in execs if deps[(layer_id, it)] == 0]
+  heapq.heapify(ready)
+  schedule = []
+  while len(ready) > 0:
+    stage, it, layer_id = heapq.heappop(ready)
+    schedule.append(layer_id)
+    for user in users[(layer_id, it)]:
+      deps[user] -= 1
+      if deps[user] == 0:
+        heapq.heappush(ready, (int(net[user[0]]['stage']), user[1], user[0]))
+  if len(schedule) != len(execs):
+    raise ValueError("the layer graph has a cycle")
+  return np.array(schedule, dtype = np.int64)
+
+'''
+the executions of net_schedule as (row, iteration of the block of the layer)
+'''
+def net_executions(net):
+  its = np.zeros(len(net), dtype = np.int64)
+  execs = []
+  for layer_id in net_schedule(net):
+    execs.append((int(layer_id), int(its[layer_id])))
+    its[layer_id] += 1
+  return execs
+
+'''
+the executions in the order of the instructions: the order of net_schedule, with the branches of each iteration of a
+block interleaved by depth, so that the kernel can batch the layers of the same depth
+'''
+def net_inst_order(net):
+  return sorted(net_executions(net), key = lambda e: (int(net[e[0]]['stage']), e[1], int(net[e[0]]['depth']), int(net[e[0]]['branch'])))
+
+'''
+the rows of the layers that read the output of each layer, directly or through a concatenation, in the order of the
+rows. a carried layer is read by the readers of its initial layer
+'''
+def net_readers(net):
+  readers = [[] for layer_id in range(len(net))]
+  for layer_id in range(len(net)):
+    for src in net_concat_sources(net, layer_id):
+      readers[src].append(layer_id)
+  for layer_id in np.flatnonzero(net['carry'] >= 0):
+    readers[layer_id] = readers[layer_id] + readers[net[layer_id]['carry']]
+  return readers
+
+'''
+the rows of the network outputs, the layers that are not read by another layer, or only by the next iterations of
+their block
+'''
+def net_outputs(net):
+  srcs = set([src for layer_id in range(len(net)) for src in net_concat_sources(net, layer_id)])
+  return [layer_id for layer_id in range(len(net)) if layer_id not in srcs]
+
+'''
+the carried layers of the block of a layer, {initial layer: layer}
+'''
+def net_carried(net, layer_id):
+  rows = np.flatnonzero((net['stage'] == net[layer_id]['stage']) & (net['carry'] >= 0))
+  return dict([(int(net[row]['carry']), int(row)) for row in rows])
+
+'''
+the layers concatenated as the input of a layer in the iteration it of its block, in the channel order of the
+feature maps: the order of the graph in the even iterations. the carried layers are read from their second buffer in
+the odd iterations, at the other end of the concatenation, e.g. in the iterations [3,5] of the openpose stage 2:
+  conv2d_3_pool - conv2d_7 - conv2d_11 - mconv_stage1_L1_5 - mconv_stage1_L2_5
+the carried layers are given by their initial layer
+'''
+def net_concat_order(net, layer_id, it):
+  srcs = net_concat_sources(net, layer_id)
+  carried = [src for src in srcs if src in net_carried(net, layer_id)]
+  others = [src for src in srcs if src not in carried]
+  if len(carried) > 0 and srcs != carried + others and srcs != others + carried:
+    raise ValueError("layer %s: the carried layers are not at one end of the concatenation" % (net[layer_id]['name']))
+  if it % 2 == 0 or len(carried) == 0:
+    return srcs
+  return others + carried if srcs[0] in carried else carried + others
+
+def net_save(net, f_net):
+  np.save(f_net, net)
+
+'''
+load a saved network IR, memory-mapped read-only by default
+'''
+def net_load(f_net, mmap_mode = 'r'):
+  return np.load(f_net, mmap_mode = mmap_mode)
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description='Network IR generation.')
+
+  parser.add_argument('-m', '--model', metavar='MODEL', required=True, help='model description', dest='model')
+  parser.add_argument('-mc', '--model-config', metavar='MODEL_CONFIG', default=None, help='model topology, not used with a layer graph', dest='model_config')
+  parser.add_argument('-i', '--input-config', metavar='INPUT_CONFIG', required=True, help='input configuration', dest='input_config')
+  parser.add_argument('-o', '--output', metavar='OUTPUT', default='network.npy', help='network IR', dest='output')
+  parser.add_argument('-g', '--graph', metavar='GRAPH', default=None, help='write the layer graph of the model', dest='graph')
+
+  args = parser.parse_args()
+  model_config = model_config_load(args.model, args.model_config)
+  with open(args.input_config, "r") as f:
+    input_config = json.loads(f.read())
+  net_save(net_build(args.model, model_config, input_config), args.output)
+  if args.graph is not None:
+    graph_save(graph_load(args.model) if model_is_graph(args.model) else model_graph(args.model, model_config), args.graph)
@@ -0,0 +1,257 @@
+import json
+import csv
+import argparse
+import os
+import sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data'))
+import inst_sim
+import network_ir
+
+'''
+Functionality: DDR traffic and roofline report of the instructions
+openpose.insts, board.json -> bytes[LAYER][cin, weight, bias, cout], MACs[LAYER], operational intensity and bound
+
+The bytes of each layer are the DDR accesses of the kernel modules, as the engine iterates over the tiles: input
+channel tiles innermost, then rows, columns and output channel tiles.
+  cin:    cin_load reads an input tile with its halo for each task, IN_NUM_T * (IN_H_T + K - 1) * (IN_W_T + K - 1),
+          or the whole feature maps of IN_NUM_T channels if they fit in the tile buffer. The max pooling reads
+          the input once, the convolutions read it again for each output channel tile.
+  weight: weight_load reads the depthwise weights of the IN_NUM_T channels and the conv weights of the
+          IN_NUM_T x OUT_NUM_T channels for each task.
+  bias:   OUT_NUM_T values for each output tile of the convolutions.
+  cout:   cout_write writes whole output tiles, OUT_NUM_T * IN_H_T * IN_W_T, halved by the pooling or stride 2.
+The feature maps passed through the on-chip buffer by layer_fuse.py are not DDR traffic. The useful bytes are the
+same accesses without the halos, the channel and tile padding and the reloads, the overhead is the difference.
+The MACs are the multiply-accumulates of the depthwise and the conv, on the layer shape (MACs) and on the padded
+tiles the kernel computes (PADDED_MACS).
+
+The roofline of the board: the peak compute is the MACs of the DSPs available to the design, DSP * DSP_THRES /
+DSP_PER_MAC per cycle, at FRE. The bandwidth is the one of the BUS_W port of the kernel at FRE, bounded by the DDR_BW
+of the board JSON (GB/s) when it is given. A layer whose operational intensity, MACs / DDR byte, is lower than the
+ridge point peak / bandwidth is memory bound, compute bound otherwise. Its time is at least the largest of the
+compute time of its padded MACs and the transfer time of its bytes.
+'''
+
+'''
+parameters of the kernel, FRE can be read from opt_params.json
+'''
+HW_PARAMS = {
+  'DATA_W0': 32,
+  'DATA_W1': 32,
+  'DATA_W2': 32,
+  'BUS_W': 512,
+  'K_T': 3,
+  'FRE': 250
+}
+'''
+DSPs of a float MAC, as dse_p.res_est
+'''
+DSP_PER_MAC = 5
+'''
+fields of the layer records, in the order of the CSV columns
+'''
+RECORD_FIELDS = ['LAYER_ID', 'NAME', 'TYPE', 'IN_NUM', 'OUT_NUM', 'IN_H', 'IN_W', 'OUT_H', 'OUT_W', 'CIN_BYTES', \
+  'WEIGHT_BYTES', 'BIAS_BYTES', 'COUT_BYTES', 'BYTES', 'USEFUL_BYTES', 'OVERHEAD', 'MACS', 'PADDED_MACS', 'INTENSITY', \
+  'BOUND', 'TIME_US', 'TIME_SHARE']
+
+'''
+peak compute in MAC/s, bandwidth in byte/s and ridge point in MAC/byte of the board
+'''
+def board_roofs(board, hw):
+  roofs = {}
+  roofs['MACS_PER_CYCLE'] = int(board['DSP'] * board['DSP_THRES'] // DSP_PER_MAC)
+  roofs['PEAK_MACS'] = roofs['MACS_PER_CYCLE'] * hw['FRE'] * 1e6
+  roofs['BW'] = hw['BUS_W'] / 8 * hw['FRE'] * 1e6
+  if 'DDR_BW' in board:
+    roofs['BW'] = min(roofs['BW'], board['DDR_BW'] * 1e9)
+  roofs['RIDGE'] = roofs['PEAK_MACS'] / roofs['BW']
+  return roofs
+
+'''
+type of the layer of an instruction
+'''
+def layer_type(inst):
+  if inst['DEPTH_CONV_EN']:
+    return 'sep'
+  if inst['CONV_EN']:
+    return 'conv'
+  return 'pool'
+
+'''
+DDR bytes and MACs of the instruction of one layer
+return the bytes the kernel moves, the useful bytes, the MACs of the layer and the MACs of the padded tiles
+'''
+def layer_traffic(inst, hw):
+  in_tiles = -(-inst['IN_NUM'] // inst['IN_NUM_T'])
+  out_tiles = -(-inst['OUT_NUM'] // inst['OUT_NUM_T'])
+  h_tiles = -(-inst['IN_H'] // inst['IN_H_T'])
+  w_tiles = -(-inst['IN_W'] // inst['IN_W_T'])
+  tasks = in_tiles * h_tiles * w_tiles * out_tiles
+  max_pool = not inst['DEPTH_CONV_EN'] and not inst['CONV_EN']
+  filter_s1 = inst['FILTER_S1'] if inst['DEPTH_CONV_EN'] else 1
+  filter_s2 = inst['FILTER_S2'] if inst['CONV_EN'] else 1
+  filter_s = max(filter_s1, filter_s2)
+  stride1 = inst['STRIDE'] if inst['DEPTH_CONV_EN'] else 1
+  stride2 = inst['STRIDE'] if inst['CONV_EN'] and not inst['DEPTH_CONV_EN'] else 1
+  out_stride = 2 if inst['POOL_EN'] or inst['STRIDE'] == 2 else 1
+  in_bytes = hw['DATA_W0'] // 8
+  weight_bytes = hw['DATA_W1'] // 8
+  bias_bytes = hw['DATA_W2'] // 8
+
+  moved = {}
+  useful = {}
+  if inst['INTER_LOAD_EN']:
+    moved['CIN'] = 0
+    useful['CIN'] = 0
+  else:
+    if inst['IN_H_HW'] <= inst['IN_H_T'] + hw['K_T'] - 1 and inst['IN_W_HW'] <= inst['IN_W_T'] + hw['K_T'] - 1 and not max_pool:
+      tile_size = inst['IN_NUM_T'] * inst['IN_H_HW'] * inst['IN_W_HW']
+    else:
+      tile_size = inst['IN_NUM_T'] * (inst['IN_H_T'] + filter_s - 1) * (inst['IN_W_T'] + filter_s - 1)
+    loads = tasks // out_tiles if max_pool else tasks
+    moved['CIN'] = loads * tile_size * in_bytes
+    useful['CIN'] = inst['IN_NUM'] * inst['IN_H'] * inst['IN_W'] * in_bytes
+  moved['WEIGHT'] = 0
+  useful['WEIGHT'] = 0
+  if inst['DEPTH_CONV_EN']:
+    moved['WEIGHT'] += tasks * inst['IN_NUM_T'] * filter_s1 * filter_s1 * weight_bytes
+    useful['WEIGHT'] += inst['IN_NUM'] * filter_s1 * filter_s1 * weight_bytes
+  if inst['CONV_EN']:
+    moved['WEIGHT'] += tasks * inst['IN_NUM_T'] * inst['OUT_NUM_T'] * filter_s2 * filter_s2 * weight_bytes
+    useful['WEIGHT'] += inst['IN_NUM'] * inst['OUT_NUM'] * filter_s2 * filter_s2 * weight_bytes
+  moved['BIAS'] = 0
+  useful['BIAS'] = 0
+  if inst['CONV_EN']:
+    moved['BIAS'] = h_tiles * w_tiles * out_tiles * inst['OUT_NUM_T'] * bias_bytes
+    useful['BIAS'] = inst['OUT_NUM'] * bias_bytes
+  if inst['INTER_WRITE_EN']:
+    moved['COUT'] = 0
+    useful['COUT'] = 0
+  else:
+    out_tile_size = inst['OUT_NUM_T'] * (inst['IN_H_T'] // out_stride) * (inst['IN_W_T'] // out_stride)
+    moved['COUT'] = h_tiles * w_tiles * out_tiles * out_tile_size * in_bytes
+    useful['COUT'] = inst['OUT_NUM'] * inst['OUT_H'] * inst['OUT_W'] * in_bytes
+
+  def macs(in_num, out_num, in_h, in_w):
+    num = 0
+    h1, w1 = in_h // stride1, in_w // stride1
+    if inst['DEPTH_CONV_EN']:
+      num += in_num * filter_s1 * filter_s1 * h1 * w1
+    if inst['CONV_EN']:
+      num += out_num * in_num * filter_s2 * filter_s2 * (h1 // stride2) * (w1 // stride2)
+    return num
+  layer_macs = macs(inst['IN_NUM'], inst['OUT_NUM'], inst['IN_H'], inst['IN_W'])
+  padded_macs = macs(in_tiles * inst['IN_NUM_T'], out_tiles * inst['OUT_NUM_T'], h_tiles * inst['IN_H_T'], w_tiles * inst['IN_W_T'])
+  return moved, useful, layer_macs, padded_macs
+
+'''
+layer records of the instructions against the roofs of the board, names are the layer names if known
+'''
+def roofline(insts, roofs, hw, names = None):
+  records = []
+  for layer_id, inst in enumerate(insts):
+    moved, useful, layer_macs, padded_macs = layer_traffic(inst, hw)
+    record = {'LAYER_ID': layer_id, 'NAME': names[layer_id] if names is not None else '', 'TYPE': layer_type(inst)}
+    for name in ['IN_NUM', 'OUT_NUM', 'IN_H', 'IN_W', 'OUT_H', 'OUT_W']:
+      record[name] = inst[name]
+    for name in ['CIN', 'WEIGHT', 'BIAS', 'COUT']:
+      record[name + '_BYTES'] = moved[name]
+    record['BYTES'] = sum(moved.values())
+    record['USEFUL_BYTES'] = sum(useful.values())
+    record['OVERHEAD'] = 1.0 - float(record['USEFUL_BYTES']) / record['BYTES'] if record['BYTES'] > 0 else 0.0
+    record['MACS'] = layer_macs
+    record['PADDED_MACS'] = padded_macs
+    record['INTENSITY'] = float(layer_macs) / record['BYTES'] if record['BYTES'] > 0 else float('inf')
+    record['BOUND'] = 'memory' if record['INTENSITY'] < roofs['RIDGE'] else 'compute'
+    record['TIME_US'] = max(padded_macs / roofs['PEAK_MACS'], record['BYTES'] / roofs['BW']) * 1e6
+    records.append(record)
+  total_time = sum([record['TIME_US'] for record in records])
+  for record in records:
+    record['TIME_SHARE'] = record['TIME_US'] / total_time
+
+  summary = {}
+  for name in ['CIN_BYTES', 'WEIGHT_BYTES', 'BIAS_BYTES', 'COUT_BYTES', 'BYTES', 'USEFUL_BYTES', 'MACS', 'PADDED_MACS', 'TIME_US']:
+    summary[name] = sum([record[name] for record in records])
+  summary['INTENSITY'] = float(summary['MACS']) / summary['BYTES']
+  summary['MEMORY_BOUND_TIME_US'] = sum([record['TIME_US'] for record in records if record['BOUND'] == 'memory'])
+  summary['FPS_BOUND'] = 1e6 / summary['TIME_US']
+  return records, summary
+
+def roofline_report(records, summary, roofs, hw):
+  header = '%5s %-20s %-4s %-16s %8s %8s %7s %8s %6s %9s %7s %-7s %6s' % ('layer', 'name', 'type', 'shape', 'cin KB', \
+    'wgt KB', 'bias KB', 'cout KB', 'ovh %', 'MMAC', 'MAC/B', 'bound', 'time %')
+  print(header)
+  for record in records:
+    shape = '%dx%dx%d->%d' % (record['IN_NUM'], record['IN_H'], record['IN_W'], record['OUT_NUM'])
+    print('%5d %-20s %-4s %-16s %8.1f %8.1f %7.1f %8.1f %6.1f %9.2f %7.2f %-7s %6.2f' % (record['LAYER_ID'], record['NAME'][:20], \
+      record['TYPE'], shape, record['CIN_BYTES'] / 1e3, record['WEIGHT_BYTES'] / 1e3, record['BIAS_BYTES'] / 1e3, \
+      record['COUT_BYTES'] / 1e3, 100.0 * record['OVERHEAD'], record['MACS'] / 1e6, record['INTENSITY'], record['BOUND'], \
+      100.0 * record['TIME_SHARE']))
+  print('roofs at %d MHz: %.1f GMAC/s (%d MAC/cycle), %.1f GB/s, ridge point %.2f MAC/B' % (hw['FRE'], roofs['PEAK_MACS'] / 1e9, \
+    roofs['MACS_PER_CYCLE'], roofs['BW'] / 1e9, roofs['RIDGE']))
+  print('DDR traffic: %.1f MB per frame (cin %.1f, weight %.1f, bias %.1f, cout %.1f), %.1f%% overhead' % (summary['BYTES'] / 1e6, \
+    summary['CIN_BYTES'] / 1e6, summary['WEIGHT_BYTES'] / 1e6, summary['BIAS_BYTES'] / 1e6, summary['COUT_BYTES'] / 1e6, \
+    100.0 * (1.0 - float(summary['USEFUL_BYTES']) / summary['BYTES'])))
+  print('MACs: %.1f G (%.1f G padded), intensity %.2f MAC/B' % (summary['MACS'] / 1e9, summary['PADDED_MACS'] / 1e9, summary['INTENSITY']))
+  print('roofline bound: %.3f ms, %.2f FPS, memory bound layers %.1f%% of the time' % (summary['TIME_US'] / 1e3, summary['FPS_BOUND'], \
+    100.0 * summary['MEMORY_BOUND_TIME_US'] / summary['TIME_US']))
+
+'''
+names of the layers of the instructions, in the order inst_parse writes them, network_ir.net_inst_order, with the
+iteration of the layers of the repeated blocks
+'''
+def layer_names(f_model, f_model_config):
+  model_config = network_ir.model_config_load(f_model, f_model_config)
+  net = network_ir.net_parse(f_model, model_config)
+  names = []
+  for layer_id, it in network_ir.net_inst_order(net):
+    if net[layer_id]['repeat'] > 1:
+      names.append(str(net[layer_id]['name']) + '_' + str(it))
+    else:
+      names.append(str(net[layer_id]['name']))
+  return names
+
+'''
+report the instructions against the board, the records are written to f_report (JSON) and its CSV
+'''
+def run(f_insts, f_board, f_params, f_report, names = None):
+  insts = inst_sim.insts_load(f_insts)
+  with open(f_board, 'r') as f:
+    board = json.loads(f.read())
+  hw = dict(HW_PARAMS)
+  if f_params is not None:
+    with open(f_params, 'r') as f:
+      params = json.loads(f.read())
+    if 'FRE' in params:
+      hw['FRE'] = params['FRE']
+  if names is not None and len(names) != len(insts):
+    raise ValueError("%d layer names for %d instructions" % (len(names), len(insts)))
+
+  roofs = board_roofs(board, hw)
+  records, summary = roofline(insts, roofs, hw, names)
+  roofline_report(records, summary, roofs, hw)
+  if f_report is not None:
+    with open(f_report, 'w') as f:
+      json.dump({'BOARD': board['BOARD'], 'HW': hw, 'ROOFS': roofs, 'SUMMARY': summary, 'LAYERS': records}, f, indent = 2)
+    with open(os.path.splitext(f_report)[0] + '.csv', 'w', newline = '') as f:
+      writer = csv.writer(f)
+      writer.writerow(RECORD_FIELDS)
+      for record in records:
+        writer.writerow([record[field] for field in RECORD_FIELDS])
+  return records, summary
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description='DDR traffic and roofline report.')
+
+  parser.add_argument('-n', '--insts', metavar='INSTS', required=True, help='instructions, text or binary', dest='insts')
+  parser.add_argument('-b', '--board', metavar='BOARD', required=True, help='board configuration', dest='board')
+  parser.add_argument('-p', '--params', metavar='PARAMS', default=None, help='design parameters (opt_params.json), for FRE', dest='params')
+  parser.add_argument('-m', '--model', metavar='MODEL', default=None, help='model description or layer graph, for the layer names', dest='model')
+  parser.add_argument('-mc', '--model-config', metavar='MODEL_CONFIG', default=None, help='model topology, not used with a layer graph', dest='model_config')
+  parser.add_argument('-o', '--output', metavar='OUTPUT', default='roofline.json', help='report, also written as CSV', dest='output')
+
+  args = parser.parse_args()
+  names = None
+  if args.model is not None:
+    names = layer_names(args.model, args.model_config)
+  run(args.insts, args.board, args.params, args.output, names)
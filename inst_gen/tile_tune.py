@@ -0,0 +1,426 @@
+import numpy as np
+import json
+import argparse
+import os
+import sys
+import network_ir
+import roofline
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'dse'))
+import perf_sim
+
+'''
+Functionality: padding waste analysis and tile selection of the model
+openpose.model, tile.json, input.json -> wasted MACs and bytes of each layer, openpose.model with the tiles selected
+
+inst_parse.py pads the channels of each layer to multiples of its InchannelTile and OutchannelTile, and the feature
+maps to multiples of its InheightTile and InwidthTile. The kernel computes and moves the padding as any other data,
+e.g. the 19 output channels of MConv_Stage*_L2_5 are computed as a whole tile of 96. The waste of a layer is counted
+on the instruction the layer would get, with the loading rules of roofline.py: the MACs of the padded tiles that are
+not MACs of the layer, and the DDR bytes that are not bytes of the layer shape (padding, halos and reloads).
+
+The tiles are not free per layer, the feature maps are laid out by the tiles of the layers that write and read them:
+  - channels: the OutchannelTile of a layer is the InchannelTile of the layers that read its output. The feature maps
+    concatenated as the input of the stages, the outputs carried to the next iteration included, share one channel tile.
+    The max pooling keeps the channel tiles of its input. The layers tied by these rules form a channel group, which
+    takes a multiple of SA_SIMD (inputs) and SA_ROWS (outputs) up to IN_NUM_T and OUT_NUM_T of tile.json.
+  - rows and columns: a layer writes whole tiles, the kernel zeroes the rows and columns past OUT_H and OUT_W. The
+    layers that read the same feature maps share their layout, and so their padded input size, and the padded output
+    of a layer, its padded input size divided by the stride, must fit in the padded input size of its readers.
+    InheightTile is a multiple of the stride up to IN_H_T, InwidthTile / stride is a multiple of SA_COLS up to IN_W_T.
+The selection minimizes, over the iterations of the stages, one of the objectives:
+  - waste (default): the wasted MACs and DDR bytes of the layers, counted in the cycles they take from the systolic
+    array, SA_ROWS * SA_COLS * SA_SIMD MACs per cycle, and from the BUS_W port.
+  - cycles: the cycles of the layers, from the task cycles of the kernel modules of perf_sim.py: the tasks of a layer
+    stream through the pipeline at the pace of its slowest stage.
+With either objective, the tiles of a layer are rejected if its cycles or its DDR bytes exceed the ones of the tiles of
+the model, so the padding saved on a layer is not paid by the halos and reloads of smaller tiles, or by the layers
+that share its feature maps. The padded sizes and the channel groups are selected in turns, from the channel tiles of
+the model.
+'''
+
+OBJECTIVES = ['waste', 'cycles']
+
+'''
+channel group of the input or the output of a layer
+'''
+def channel_groups(net):
+  parent = {}
+  def find(node):
+    while parent.setdefault(node, node) != node:
+      node = parent[node]
+    return node
+  def union(node0, node1):
+    parent[find(node0)] = find(node1)
+
+  srcs_all = set()
+  for layer_id in range(len(net)):
+    find(('in', layer_id))
+    find(('out', layer_id))
+    srcs = network_ir.net_concat_sources(net, layer_id)
+    srcs_all.update(srcs)
+    for src in srcs:
+      union(('in', layer_id), ('out', src))
+    if net[layer_id]['pool_en']:
+      union(('in', layer_id), ('out', layer_id))
+  # the carried layers are read by the concatenations of their stage, in place of their initial layer
+  for layer_id in range(len(net)):
+    if net[layer_id]['out_concat'] and layer_id not in srcs_all:
+      for user_id in np.flatnonzero((net['stage'] == net[layer_id]['stage']) & (net['in_concat'] == 1)):
+        union(('out', layer_id), ('in', int(user_id)))
+
+  roots = sorted(set([find(node) for node in list(parent.keys())]), key = lambda node: (node[1], node[0]))
+  groups = {}
+  for node in list(parent.keys()):
+    groups[node] = roots.index(find(node))
+  return groups
+
+'''
+channel tiles allowed for each group
+'''
+def group_values(net, groups, tile):
+  values = []
+  for group in range(max(groups.values()) + 1):
+    nodes = [node for node in groups if groups[node] == group]
+    step = 1
+    max_value = None
+    for kind, layer_id in nodes:
+      factor, limit = (tile['SA_SIMD'], tile['IN_NUM_T']) if kind == 'in' else (tile['SA_ROWS'], tile['OUT_NUM_T'])
+      step = step * factor // np.gcd(step, factor)
+      max_value = limit if max_value is None else min(max_value, limit)
+    values.append(list(range(step, max_value + 1, step)))
+  return values
+
+'''
+padded input sizes of a layer and the tiles that give them, dim is 'h' or 'w'
+the tiles are multiples of the stride, and the column tiles divided by the stride are multiples of SA_COLS
+'''
+def spatial_options(layer, dim, tile):
+  stride = int(layer['stride'])
+  if dim == 'h':
+    candidates = range(stride, tile['IN_H_T'] + 1, stride)
+  else:
+    candidates = range(tile['SA_COLS'] * stride, tile['IN_W_T'] + 1, tile['SA_COLS'] * stride)
+  size = int(layer['in_' + dim])
+  options = {}
+  for t in candidates:
+    options.setdefault(-(-size // t) * t, []).append(t)
+  return options
+
+'''
+spatial groups of the layers, the layers that read the same feature maps share their layout and their padded input
+sizes. the carried layers are read by the concatenations of their stage, and the groups of a cycle of the stages
+are merged, the padded sizes of a cycle of layers without stride are the same
+return the group of each layer, the groups in a topological order and the edges (producer, reader, stride) of the groups
+'''
+def spatial_groups(net):
+  parent = list(range(len(net)))
+  def find(node):
+    while parent[node] != node:
+      node = parent[node]
+    return node
+  def union(node0, node1):
+    parent[find(node0)] = find(node1)
+
+  readers = dict([(layer_id, []) for layer_id in range(len(net))])
+  for layer_id in range(len(net)):
+    for src in network_ir.net_concat_sources(net, layer_id):
+      readers[src].append(layer_id)
+  for layer_id in range(len(net)):
+    if net[layer_id]['out_concat'] and len(readers[layer_id]) == 0:
+      readers[layer_id] = [int(user_id) for user_id in np.flatnonzero((net['stage'] == net[layer_id]['stage']) & (net['in_concat'] == 1))]
+  for src, users in readers.items():
+    for user in users[1:]:
+      union(users[0], user)
+
+  def group_edges():
+    return set([(find(src), find(user), int(net[src]['stride'])) for src in readers for user in readers[src]])
+  # merge the groups that reach each other
+  roots = sorted(set([find(layer_id) for layer_id in range(len(net))]))
+  reach = dict([(root, set([root])) for root in roots])
+  changed = True
+  while changed:
+    changed = False
+    for src, user, stride in group_edges():
+      if not reach[user] <= reach[src]:
+        reach[src] |= reach[user]
+        changed = True
+  for root0 in roots:
+    for root1 in reach[root0]:
+      if root0 in reach[root1]:
+        union(root0, root1)
+
+  edges = [edge for edge in group_edges() if edge[0] != edge[1]]
+  groups = [find(layer_id) for layer_id in range(len(net))]
+  order = []
+  pending = sorted(set(groups))
+  while len(pending) > 0:
+    ready = [group for group in pending if all([src in order for src, user, stride in edges if user == group])]
+    order.append(ready[0])
+    pending.remove(ready[0])
+  return groups, order, edges
+
+'''
+instruction fields of a layer with the given tiles, as inst_parse.py writes them, for roofline.layer_traffic and
+perf_sim.layer_tasks
+in_num is the input channels the kernel iterates over, the padded channels of a concatenation included
+'''
+def layer_inst(layer, in_num, in_num_t, out_num_t, in_h_t, in_w_t, tile):
+  halo = int(layer['filter_s']) - 1
+  stride = int(layer['stride'])
+  inst = {'IN_NUM': in_num, 'OUT_NUM': int(layer['out_num']), 'IN_H': int(layer['in_h']), 'IN_W': int(layer['in_w']), \
+    'OUT_H': int(layer['out_h']), 'OUT_W': int(layer['out_w']), 'FILTER_S1': int(layer['filter_s1']), \
+    'FILTER_S2': int(layer['filter_s2']), 'STRIDE': int(layer['stride']), 'IN_NUM_T': in_num_t, 'OUT_NUM_T': out_num_t, \
+    'IN_H_T': in_h_t, 'IN_W_T': in_w_t, 'DEPTH_CONV_EN': int(layer['depth_conv_en']), 'CONV_EN': int(layer['point_conv_en']), \
+    'POOL_EN': int(layer['pool_en']), 'BIAS_EN': int(layer['bias_en']), 'INTER_LOAD_EN': 0, 'INTER_WRITE_EN': 0}
+  inst['IN_H_HW'] = -(-inst['IN_H'] // in_h_t) * in_h_t + halo
+  inst['IN_W_HW'] = -(-inst['IN_W'] // in_w_t) * in_w_t + halo
+  inst['TASK_NUM2'] = -(-inst['OUT_NUM'] // out_num_t) * -(-inst['IN_H'] // in_h_t) * -(-inst['IN_W'] // in_w_t)
+  inst['TASK_NUM1'] = -(-in_num // in_num_t) * inst['TASK_NUM2']
+  if layer['type'] == 'separable_conv':
+    inst['LOCAL_ACCUM_NUM'] = in_num_t // tile['SA_SIMD']
+  else:
+    inst['LOCAL_ACCUM_NUM'] = in_num_t // tile['SA_SIMD'] * int(layer['filter_s']) * int(layer['filter_s'])
+  inst['LOCAL_REG_NUM'] = (in_h_t // stride) * (in_w_t // tile['SA_COLS'] // stride) * (out_num_t // tile['SA_ROWS'])
+  inst['ROW_IL_FACTOR'] = out_num_t // tile['SA_ROWS']
+  inst['COL_IL_FACTOR'] = in_w_t // tile['SA_COLS'] // stride
+  return inst
+
+'''
+cycles of the tasks of an instruction streamed through the pipeline stages of perf_sim.py: the cycles of the
+slowest stage of each task, and the filling of the pipeline by the first task
+'''
+def layer_cycles(inst, hw):
+  task_cycles = perf_sim.layer_tasks(inst, hw)
+  stage_cycles = np.stack([np.max(task_cycles[:, [perf_sim.MODULES.index(module) for module in stage]], axis = 1) \
+    for stage in perf_sim.STAGES], axis = 1)
+  return float(np.sum(np.max(stage_cycles, axis = 1)) + np.sum(stage_cycles[0]) - np.max(stage_cycles[0]))
+
+'''
+waste of one layer with the given tiles, for one execution
+return the cycles, the wasted MACs, the DDR bytes and the wasted bytes
+'''
+def layer_waste(net, layer_id, in_num_t, out_num_t, in_h_t, in_w_t, tile, hw):
+  layer = net[layer_id]
+  srcs = network_ir.net_concat_sources(net, layer_id)
+  in_num = int(layer['in_num'])
+  if layer['in_concat']:
+    in_num = int(np.sum(-(-net['out_num'][srcs] // in_num_t) * in_num_t))
+  inst = layer_inst(layer, in_num, in_num_t, out_num_t, in_h_t, in_w_t, tile)
+  moved, _, _, padded_macs = roofline.layer_traffic(inst, hw)
+  # the MACs and bytes of the layer shape, without the padded channels of the concatenation
+  useful, macs = roofline.layer_traffic(layer_inst(layer, int(layer['in_num']), in_num_t, out_num_t, in_h_t, in_w_t, tile), hw)[1:3]
+  moved_bytes = sum(moved.values())
+  return layer_cycles(inst, hw), padded_macs - macs, moved_bytes, moved_bytes - sum(useful.values())
+
+'''
+tiles of the model
+'''
+def model_tiles(net):
+  return [[int(layer['in_num_t']), int(layer['out_num_t']), int(layer['in_h_t']), int(layer['in_w_t'])] for layer in net]
+
+'''
+waste of the layers with the given tiles, the layers are weighted by the executions of their stage
+'''
+def net_waste(net, tiles, tile, hw):
+  records = []
+  for layer_id in range(len(net)):
+    cycles, macs, moved, wasted = layer_waste(net, layer_id, *(tiles[layer_id] + [tile, hw]))
+    repeat = int(net[layer_id]['repeat'])
+    records.append({'NAME': str(net[layer_id]['name']), 'TILE': tiles[layer_id], 'CYCLES': cycles * repeat, \
+      'WASTED_MACS': macs * repeat, 'BYTES': moved * repeat, 'WASTED_BYTES': wasted * repeat, \
+      'WASTE_CYCLES': objective_cost('waste', cycles, macs, moved, wasted, tile, hw)[0] * repeat})
+  return records
+
+'''
+cost of one execution of a layer for the objective, a tie is decided by the second value
+'''
+def objective_cost(objective, cycles, wasted_macs, moved, wasted_bytes, tile, hw):
+  if objective == 'cycles':
+    return cycles, moved
+  waste = wasted_macs / float(tile['SA_ROWS'] * tile['SA_COLS'] * tile['SA_SIMD']) + wasted_bytes / (hw['BUS_W'] / 8.0)
+  return waste, cycles
+
+'''
+select the tiles of the network
+the channel groups start from the tiles of the model, then the padded sizes of the spatial groups are selected in a
+topological order, the cheapest sizes that fit the outputs of the previous groups, and the channel groups by
+coordinate descent, until the tiles do not change
+'''
+def tile_tune(net, tile, hw, objective = 'waste', max_rounds = 8):
+  if objective not in OBJECTIVES:
+    raise ValueError("unknown objective %s, one of %s" % (objective, ', '.join(OBJECTIVES)))
+  groups = channel_groups(net)
+  values = group_values(net, groups, tile)
+  sgroups, order, edges = spatial_groups(net)
+  options = [dict([(dim, spatial_options(net[layer_id], dim, tile)) for dim in ['h', 'w']]) for layer_id in range(len(net))]
+
+  # the cycles and the DDR bytes of the layers with the tiles of the model, the tiles that exceed either are rejected
+  limits = []
+  for layer_id, layer_tiles in enumerate(model_tiles(net)):
+    cycles, _, moved, _ = layer_waste(net, layer_id, *(layer_tiles + [tile, hw]))
+    limits.append((cycles * (1 + 1e-9), moved * (1 + 1e-9)))
+
+  cache = {}
+  def layer_cost(layer_id, in_num_t, out_num_t, size):
+    key = (layer_id, in_num_t, out_num_t, size)
+    if key not in cache:
+      best = None
+      # the larger tiles first, a tie of the objective is decided by the second value, then keeps the fewer tasks
+      for in_h_t in reversed(options[layer_id]['h'][size[0]]):
+        for in_w_t in reversed(options[layer_id]['w'][size[1]]):
+          cycles, macs, moved, wasted = layer_waste(net, layer_id, in_num_t, out_num_t, in_h_t, in_w_t, tile, hw)
+          if cycles > limits[layer_id][0] or moved > limits[layer_id][1]:
+            continue
+          cost = objective_cost(objective, cycles, macs, moved, wasted, tile, hw)
+          if best is None or cost < best[:2]:
+            best = cost + (in_h_t, in_w_t)
+      if best is None:
+        cache[key] = (np.inf, None, None)
+      else:
+        cache[key] = (best[0] * int(net[layer_id]['repeat']), best[2], best[3])
+    return cache[key]
+
+  # start from the tiles of the model, the largest tile where they do not fit
+  current = [None] * len(values)
+  for layer_id, (in_num_t, out_num_t, in_h_t, in_w_t) in enumerate(model_tiles(net)):
+    for node, value in [(('in', layer_id), in_num_t), (('out', layer_id), out_num_t)]:
+      group = groups[node]
+      if current[group] is None or value not in values[group]:
+        current[group] = value if value in values[group] else values[group][-1]
+  members = [[layer_id for layer_id in range(len(net)) if group in (groups[('in', layer_id)], groups[('out', layer_id)])] \
+    for group in range(len(values))]
+  smembers = dict([(sgroup, [layer_id for layer_id in range(len(net)) if sgroups[layer_id] == sgroup]) for sgroup in order])
+  sizes = {}
+
+  def channel_cost(layer_id, channels):
+    return layer_cost(layer_id, channels[groups[('in', layer_id)]], channels[groups[('out', layer_id)]], sizes[sgroups[layer_id]])[0]
+
+  tiles = None
+  for round_id in range(max_rounds):
+    for sgroup in order:
+      lower = [0, 0]
+      for src, user, stride in edges:
+        if user == sgroup:
+          lower = [max(lower[0], sizes[src][0] // stride), max(lower[1], sizes[src][1] // stride)]
+      candidates = None
+      for layer_id in smembers[sgroup]:
+        layer_sizes = set([(size_h, size_w) for size_h in options[layer_id]['h'] for size_w in options[layer_id]['w']])
+        candidates = layer_sizes if candidates is None else candidates & layer_sizes
+      candidates = [size for size in candidates if size[0] >= lower[0] and size[1] >= lower[1]]
+      if len(candidates) == 0:
+        raise ValueError("no tiles of %s fit the outputs read by %s" % (str(dict([(name, tile[name]) for name in ['IN_H_T', 'IN_W_T']])), \
+          ', '.join([str(net[layer_id]['name']) for layer_id in smembers[sgroup]])))
+      # a tie keeps the smallest sizes, which leave the most choice to the next groups
+      sizes[sgroup] = min(candidates, key = lambda size: (sum([layer_cost(layer_id, current[groups[('in', layer_id)]], \
+        current[groups[('out', layer_id)]], size)[0] for layer_id in smembers[sgroup]]), size))
+
+    changed = True
+    while changed:
+      changed = False
+      for group in range(len(values)):
+        trial = list(current)
+        best = sum([channel_cost(layer_id, trial) for layer_id in members[group]])
+        # the larger tiles first, a tie keeps the fewer tasks
+        for value in reversed(values[group]):
+          trial[group] = value
+          cost = sum([channel_cost(layer_id, trial) for layer_id in members[group]])
+          if cost < best * (1 - 1e-9):
+            best = cost
+            current[group] = value
+            changed = True
+        trial[group] = current[group]
+
+    selected = []
+    for layer_id in range(len(net)):
+      in_num_t, out_num_t = current[groups[('in', layer_id)]], current[groups[('out', layer_id)]]
+      in_h_t, in_w_t = layer_cost(layer_id, in_num_t, out_num_t, sizes[sgroups[layer_id]])[1:]
+      selected.append([in_num_t, out_num_t, in_h_t, in_w_t])
+    if selected == tiles:
+      break
+    tiles = selected
+  return tiles
+
+'''
+name of the model with the tiles selected, next to f_model
+'''
+def model_tiled_name(f_model):
+  base, ext = os.path.splitext(f_model)
+  return base + '.tiled' + ext
+
+'''
+write the model with the tiles, the other columns and the layer graph are kept as they are
+'''
+def model_save(f_model, f_out, names, tiles):
+  tiles = dict(zip(names, tiles))
+  if network_ir.model_is_graph(f_model):
+    graph = network_ir.graph_load(f_model)
+    for block in graph['blocks']:
+      for layer in block['layers']:
+        if layer['name'] in tiles:
+          layer['tile'] = tiles[layer['name']]
+    network_ir.graph_save(graph, f_out)
+    return
+  with open(f_model, 'r') as f:
+    lines = f.readlines()
+  with open(f_out, 'w') as f:
+    f.write(lines[0])
+    for line in lines[1:]:
+      content = line.strip('\n').split(',')
+      if len(content) > 1 and content[0] in tiles:
+        content[7:11] = [str(value) for value in tiles[content[0]]]
+        line = ','.join(content) + '\n'
+      f.write(line)
+
+def waste_report(before, after):
+  print('%-20s %-16s %-16s %10s %10s %10s %10s %9s %9s' % ('layer', 'tiles', 'selected', 'waste MMAC', 'selected', \
+    'waste MB', 'selected', 'kcycles', 'selected'))
+  for record0, record1 in zip(before, after):
+    print('%-20s %-16s %-16s %10.2f %10.2f %10.2f %10.2f %9.1f %9.1f' % (record0['NAME'][:20], \
+      'x'.join([str(t) for t in record0['TILE']]), 'x'.join([str(t) for t in record1['TILE']]), record0['WASTED_MACS'] / 1e6, \
+      record1['WASTED_MACS'] / 1e6, record0['WASTED_BYTES'] / 1e6, record1['WASTED_BYTES'] / 1e6, record0['CYCLES'] / 1e3, record1['CYCLES'] / 1e3))
+  for name, records in [('model', before), ('selected', after)]:
+    print('%-8s wasted %.2f GMAC, DDR %.1f MB (%.1f MB wasted), waste %.2f Mcycles, %.2f Mcycles' % (name, \
+      sum([r['WASTED_MACS'] for r in records]) / 1e9, sum([r['BYTES'] for r in records]) / 1e6, \
+      sum([r['WASTED_BYTES'] for r in records]) / 1e6, sum([r['WASTE_CYCLES'] for r in records]) / 1e6, \
+      sum([r['CYCLES'] for r in records]) / 1e6))
+  for field, name in [('WASTED_MACS', 'wasted MACs'), ('WASTED_BYTES', 'wasted DDR bytes'), ('WASTE_CYCLES', 'waste'), ('CYCLES', 'cycles')]:
+    total0, total1 = sum([r[field] for r in before]), sum([r[field] for r in after])
+    if total1 > total0:
+      print('WARNING: the selected tiles increase the %s by %.1f%%' % (name, (total1 - total0) * 100.0 / total0))
+
+'''
+analyze the tiles of the model, and write the model with the tiles selected to f_out if given
+'''
+def run(f_tile, f_model, f_model_config, f_input_config, f_out = None, f_report = None, objective = 'waste'):
+  with open(f_tile, 'r') as f:
+    tile = json.loads(f.read())
+  with open(f_input_config, 'r') as f:
+    input_config = json.loads(f.read())
+  net = network_ir.net_build(f_model, network_ir.model_config_load(f_model, f_model_config), input_config)
+  hw = dict(perf_sim.HW_PARAMS)
+  hw['K_T'] = tile['K_T']
+
+  before = net_waste(net, model_tiles(net), tile, hw)
+  tiles = tile_tune(net, tile, hw, objective)
+  after = net_waste(net, tiles, tile, hw)
+  waste_report(before, after)
+  if f_report is not None:
+    with open(f_report, 'w') as f:
+      json.dump({'OBJECTIVE': objective, 'MODEL': before, 'SELECTED': after}, f, indent = 2)
+  if f_out is not None:
+    model_save(f_model, f_out, [record['NAME'] for record in after], tiles)
+  return tiles
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description='Padding waste analysis and tile selection.')
+
+  parser.add_argument('-t', '--tile', metavar='TILE', required=True, help='tiling configuration, the maximum tiles', dest='tile')
+  parser.add_argument('-m', '--model', metavar='MODEL', required=True, help='model description (.model) or layer graph (.json)', dest='model')
+  parser.add_argument('-mc', '--model-config', metavar='MODEL_CONFIG', default=None, help='model topology, not used with a layer graph', dest='model_config')
+  parser.add_argument('-i', '--input-config', metavar='INPUT_CONFIG', required=True, help='input configuration', dest='input_config')
+  parser.add_argument('-o', '--output', metavar='OUTPUT', default=None, help='model with the tiles selected, only the analysis if not given', dest='output')
+  parser.add_argument('-r', '--report', metavar='REPORT', default='tile_tune.json', help='waste of the layers', dest='report')
+  parser.add_argument('--objective', choices=OBJECTIVES, default='waste', help='minimize the wasted MACs and DDR bytes, or the cycles of perf_sim.py', dest='objective')
+
+  args = parser.parse_args()
+  run(args.tile, args.model, args.model_config, args.input_config, args.output, args.report, args.objective)
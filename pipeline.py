@@ -0,0 +1,312 @@
+import json
+import argparse
+import hashlib
+import glob
+import os
+import shutil
+import subprocess
+import sys
+import time
+
+'''
+Functionality: incremental driver of the generation flow
+openpose.model, tile.json, network_topology.json, input.json, weight.bin, bias.bin, cnn_features.json
+-> the outputs of inst_parse.py, data_reorg.py, the HLS kernel and the SDx kernel
+
+The flow is run as a chain of steps, each one the commands of a script of the repository:
+  - inst: inst_parse.py generates the instructions, params.h and the offsets (inst_gen)
+  - data: data_reorg.py reorganizes the weights and the bias (data)
+  - sim: inst_sim.py simulates the instructions on input.bin and checks the outputs against output.bin (data), only
+    run with --sim or when selected, as it takes up to a minute per frame, not run with --quant, the simulator reads
+    float data
+  - kernel: desp_gen.py and codegen.py generate the systolic array (HLS_project/HLS_kernel)
+  - hls: the kernel files and params.h are copied to the HLS project, as design_prepare.sh does
+  - sdx: sdx_kernel_create.sh merges the kernel files for the SDx project
+A step is keyed by the sha256 of its options and of the contents of its inputs, the scripts of the step included.
+The outputs of a step are the inputs of the next ones, so that a change is carried down the chain and only the steps
+that depend on it are run, e.g. a new tile of a layer reruns inst and data, but not the code generation.
+
+The outputs of each run are stored in a content-addressed cache:
+  <cache>/objects/<sha256[:2]>/<sha256>: the content of a file
+  <cache>/steps/<step>-<key>.json: the inputs of the step and the objects of its outputs
+A step whose outputs on disk still match its entry is skipped, a step with an entry whose outputs were removed or
+overwritten (clean.sh, another configuration) restores them from the cache, and only the other steps are run.
+'''
+
+PRJ_PATH = os.path.dirname(os.path.abspath(__file__))
+CACHE_DIR = os.path.join(PRJ_PATH, '.pipeline_cache')
+STEPS = ['inst', 'data', 'sim', 'kernel', 'hls', 'sdx']
+# the steps run by default, sim is opt-in
+DEFAULT_STEPS = ['inst', 'data', 'kernel', 'hls', 'sdx']
+
+'''
+The sha256 of the content of a file
+'''
+def file_hash(f_name):
+  sha = hashlib.sha256()
+  with open(f_name, 'rb') as f:
+    for chunk in iter(lambda: f.read(1 << 20), b''):
+      sha.update(chunk)
+  return sha.hexdigest()
+
+'''
+The path of a file relative to the repository, which names the file in the cache entries
+'''
+def rel_path(f_name):
+  return os.path.relpath(os.path.abspath(f_name), PRJ_PATH)
+
+'''
+The files matched by the patterns, relative to the repository. A pattern without wildcards is a file that must exist.
+'''
+def expand(patterns):
+  files = []
+  for pattern in patterns:
+    path = os.path.join(PRJ_PATH, pattern)
+    if glob.has_magic(pattern):
+      files += [rel_path(f) for f in sorted(glob.glob(path)) if os.path.isfile(f)]
+    elif os.path.isfile(path):
+      files.append(rel_path(path))
+    else:
+      raise FileNotFoundError('missing input ' + pattern)
+  return sorted(set(files))
+
+'''
+The steps of the flow: the directory the commands run in, the commands, the options that change the outputs, the
+inputs and the outputs, as patterns relative to the repository. A glob pattern may match nothing.
+'''
+def flow_steps(args):
+  model = rel_path(args.model)
+  tile = rel_path(args.tile)
+  input_config = rel_path(args.input_config)
+  model_config = rel_path(args.model_config) if args.model_config else None
+  configs = [tile, model, input_config] + ([model_config] if model_config else [])
+
+  # inst
+  inst_opts = []
+  if args.ddr_plan:
+    inst_opts.append('--ddr-plan')
+  if args.fuse:
+    inst_opts.append('--fuse')
+  if args.auto_tile:
+    inst_opts += ['--auto-tile', '--tile-objective', args.tile_objective]
+  cmd = [sys.executable, 'inst_parse.py', '-t', os.path.join(PRJ_PATH, tile), '-m', os.path.join(PRJ_PATH, model), '-i', os.path.join(PRJ_PATH, input_config)]
+  if model_config:
+    cmd += ['-mc', os.path.join(PRJ_PATH, model_config)]
+  inst = {
+    'NAME': 'inst',
+    'CWD': 'inst_gen',
+    'CMDS': [cmd + inst_opts],
+    'OPTS': inst_opts,
+    'INPUTS': configs + ['inst_gen/*.py', 'data/inst_sim.py', 'data/input_prep.py', 'data/output_post.py', 'dse/perf_sim.py', 'dse/dse_p.py'],
+    'OUTPUTS': ['inst_gen/openpose.insts', 'inst_gen/openpose.insts.bin', 'inst_gen/params.h', 'inst_gen/weight_offset.dat', 'inst_gen/bias_offset.dat']
+  }
+  if args.ddr_plan:
+    inst['OUTPUTS'].append('inst_gen/ddr_plan.json')
+  if args.fuse:
+    # the on-chip buffer is sized by the default board
+    inst['INPUTS'].append('dse/vu9p.json')
+    inst['OUTPUTS'].append('inst_gen/layer_fuse.json')
+
+  # data, reorganized by the model the instructions are generated from
+  data_model = model
+  if args.auto_tile:
+    base, ext = os.path.splitext(os.path.basename(model))
+    data_model = os.path.join('inst_gen', base + '.tiled' + ext)
+    inst['OUTPUTS'] += ['inst_gen/tile_tune.json', data_model]
+  data_opts = ['--quant', str(args.quant)] if args.quant else []
+  # the layers reorganized in parallel give the same outputs
+  data_opts_run = data_opts + (['--parallel'] if args.parallel else [])
+  cmd = [sys.executable, 'data_reorg.py', '-m', os.path.join(PRJ_PATH, data_model), '-i', os.path.join(PRJ_PATH, input_config),
+         '-w', os.path.abspath(args.weight), '-b', os.path.abspath(args.bias)]
+  if model_config:
+    cmd += ['-mc', os.path.join(PRJ_PATH, model_config)]
+  data = {
+    'NAME': 'data',
+    'CWD': 'data',
+    'CMDS': [cmd + data_opts_run],
+    'OPTS': data_opts,
+    'INPUTS': [data_model, input_config] + ([model_config] if model_config else []) +
+              [rel_path(args.weight), rel_path(args.bias), 'data/data_reorg.py', 'inst_gen/network_ir.py'],
+    'OUTPUTS': ['data/weight_reorg.bin', 'data/bias_reorg.bin'] + (['data/quant.json'] if args.quant else [])
+  }
+
+  # sim, a mismatch with output.bin stops the flow
+  sim = {
+    'NAME': 'sim',
+    'CWD': 'data',
+    'CMDS': [[sys.executable, 'inst_sim.py', '-n', '../inst_gen/openpose.insts', '-p', '../inst_gen/params.h', '-w', 'weight_reorg.bin',
+              '-b', 'bias_reorg.bin', '-f', 'input.bin', '-o', 'output.bin', '-d', 'sim_output.bin']],
+    'OPTS': [],
+    'INPUTS': ['inst_gen/openpose.insts', 'inst_gen/params.h', 'data/weight_reorg.bin', 'data/bias_reorg.bin', 'data/input.bin',
+               'data/output.bin', 'data/inst_sim.py', 'data/input_prep.py', 'data/output_post.py', 'inst_gen/inst_format.py'],
+    'OUTPUTS': ['data/sim_output.bin']
+  }
+
+  # kernel
+  kernel = {
+    'NAME': 'kernel',
+    'CWD': 'HLS_project/HLS_kernel',
+    'CMDS': [[sys.executable, 'desp_gen.py', '-i', 'cnn_features.json'], [sys.executable, 'codegen.py', '-i', './output/design_desp.json']],
+    'OPTS': [],
+    'INPUTS': ['HLS_project/HLS_kernel/cnn_features.json', 'HLS_project/HLS_kernel/desp_gen.py', 'HLS_project/HLS_kernel/codegen.py',
+               'HLS_project/HLS_kernel/code_template.py'],
+    'OUTPUTS': ['HLS_project/HLS_kernel/output/*']
+  }
+
+  # hls, the copies of design_prepare.sh
+  hls = {
+    'NAME': 'hls',
+    'CWD': 'HLS_project',
+    'CMDS': ['cp HLS_kernel/output/2D* .', 'cp HLS_kernel/output/common* .', 'cp ../inst_gen/params.h .'],
+    'OPTS': [],
+    'INPUTS': ['HLS_project/HLS_kernel/output/2D*', 'HLS_project/HLS_kernel/output/common*', 'inst_gen/params.h'],
+    'OUTPUTS': ['HLS_project/2D*', 'HLS_project/common*', 'HLS_project/params.h']
+  }
+
+  # sdx
+  sdx = {
+    'NAME': 'sdx',
+    'CWD': 'SDx_project',
+    'CMDS': [['bash', 'sdx_kernel_create.sh']],
+    'OPTS': [],
+    'INPUTS': ['HLS_project/2D*', 'HLS_project/common*', 'HLS_project/params.h', 'HLS_project/kernel.cpp', 'HLS_project/pose.h',
+               'SDx_project/sdx_kernel_create.sh', 'SDx_project/hw_kernel_modify.py'],
+    'OUTPUTS': ['SDx_project/src/hw_kernel.cpp', 'SDx_project/src/hw_kernel0.cpp', 'SDx_project/src/params.h', 'SDx_project/src/pose.h']
+  }
+
+  return [inst, data] + ([] if args.quant else [sim]) + [kernel, hls, sdx]
+
+'''
+The key of a step: the sha256 of its name, its options and the contents of its inputs
+'''
+def step_key(step, inputs):
+  desc = json.dumps([step['NAME'], step['OPTS'], sorted(inputs.items())])
+  return hashlib.sha256(desc.encode('utf-8')).hexdigest()
+
+def object_path(cache, sha):
+  return os.path.join(cache, 'objects', sha[:2], sha)
+
+def entry_path(cache, step, key):
+  return os.path.join(cache, 'steps', step['NAME'] + '-' + key + '.json')
+
+'''
+Store a file in the cache, under the sha256 of its content
+'''
+def store(cache, f_name):
+  sha = file_hash(f_name)
+  f_obj = object_path(cache, sha)
+  if not os.path.exists(f_obj):
+    if not os.path.exists(os.path.dirname(f_obj)):
+      os.makedirs(os.path.dirname(f_obj))
+    shutil.copyfile(f_name, f_obj + '.tmp')
+    os.rename(f_obj + '.tmp', f_obj)
+  return sha
+
+'''
+Bring the outputs of a cache entry on disk, the files that already match are left as they are
+return: the number of files restored, or None if an object of the entry is missing
+'''
+def restore(cache, outputs):
+  if not all(os.path.exists(object_path(cache, sha)) for sha in outputs.values()):
+    return None
+  restored = 0
+  for f_name, sha in sorted(outputs.items()):
+    path = os.path.join(PRJ_PATH, f_name)
+    if os.path.isfile(path) and file_hash(path) == sha:
+      continue
+    if not os.path.exists(os.path.dirname(path)):
+      os.makedirs(os.path.dirname(path))
+    # copied, not linked, the scripts rewrite some of their outputs in place
+    shutil.copyfile(object_path(cache, sha), path)
+    restored += 1
+  return restored
+
+def run_step(step, cache, force):
+  inputs = {}
+  for f_name in expand(step['INPUTS']):
+    inputs[f_name] = file_hash(os.path.join(PRJ_PATH, f_name))
+  key = step_key(step, inputs)
+  f_entry = entry_path(cache, step, key)
+
+  if not force and os.path.exists(f_entry):
+    with open(f_entry, 'r') as f:
+      entry = json.loads(f.read())
+    restored = restore(cache, entry['OUTPUTS'])
+    if restored is not None:
+      if restored:
+        print('%-6s restored %d of %d files from %s' % (step['NAME'], restored, len(entry['OUTPUTS']), key[:12]))
+      else:
+        print('%-6s up to date (%s)' % (step['NAME'], key[:12]))
+      return {'STEP': step['NAME'], 'KEY': key, 'STATUS': 'RESTORED' if restored else 'SKIPPED'}
+
+  print('%-6s running (%s)' % (step['NAME'], key[:12]))
+  start = time.time()
+  cwd = os.path.join(PRJ_PATH, step['CWD'])
+  for cmd in step['CMDS']:
+    subprocess.check_call(cmd, cwd=cwd, shell=isinstance(cmd, str))
+  elapsed = time.time() - start
+
+  outputs = {}
+  for f_name in expand(step['OUTPUTS']):
+    outputs[f_name] = store(cache, os.path.join(PRJ_PATH, f_name))
+  if not os.path.exists(os.path.dirname(f_entry)):
+    os.makedirs(os.path.dirname(f_entry))
+  entry = {'STEP': step['NAME'], 'KEY': key, 'INPUTS': inputs, 'OUTPUTS': outputs, 'TIME': elapsed}
+  with open(f_entry + '.tmp', 'w') as f:
+    f.write(json.dumps(entry, indent=2))
+  os.rename(f_entry + '.tmp', f_entry)
+  print('%-6s done in %.1f s, %d outputs cached' % (step['NAME'], elapsed, len(outputs)))
+  return {'STEP': step['NAME'], 'KEY': key, 'STATUS': 'RAN', 'TIME': elapsed}
+
+'''
+Run the steps of the flow in order, each one run, restored or skipped by the key of its inputs
+steps: the names of the steps to run, DEFAULT_STEPS by default. The steps not selected are not checked, their outputs on disk
+       are taken as the inputs of the next steps.
+force: the names of the steps to run even when cached
+'''
+def run(args, steps=None, force=[], cache=CACHE_DIR):
+  if steps is None:
+    steps = DEFAULT_STEPS
+  for name in list(steps) + list(force):
+    if name not in STEPS:
+      raise ValueError('unknown step ' + name + ', the steps are ' + ', '.join(STEPS))
+  if args.quant and 'sim' in steps:
+    raise ValueError('the sim step reads float data, it cannot be run with --quant')
+
+  status = []
+  for step in flow_steps(args):
+    if step['NAME'] not in steps:
+      continue
+    status.append(run_step(step, cache, step['NAME'] in force))
+  return status
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description='Incremental driver of the generation flow, with a content-addressed cache of the outputs.')
+
+  parser.add_argument('-t', '--tile', metavar='TILE', default=os.path.join(PRJ_PATH, 'inst_gen', 'tile.json'), help='tiling configuration', dest='tile')
+  parser.add_argument('-m', '--model', metavar='MODEL', default=os.path.join(PRJ_PATH, 'inst_gen', 'openpose.model'), help='model description (.model) or layer graph (.json)', dest='model')
+  parser.add_argument('-mc', '--model-config', metavar='MODEL_CONFIG', default=os.path.join(PRJ_PATH, 'inst_gen', 'network_topology.json'), help='model topology, not used with a layer graph', dest='model_config')
+  parser.add_argument('-i', '--input-config', metavar='INPUT_CONFIG', default=os.path.join(PRJ_PATH, 'inst_gen', 'input.json'), help='input configuration', dest='input_config')
+  parser.add_argument('-w', '--weight', metavar='WEIGHT', default=os.path.join(PRJ_PATH, 'data', 'weight.bin'), help='weights data', dest='weight')
+  parser.add_argument('-b', '--bias', metavar='BIAS', default=os.path.join(PRJ_PATH, 'data', 'bias.bin'), help='bias data', dest='bias')
+  parser.add_argument('--ddr-plan', help='pack the feature maps in DDR by their lifetimes', action='store_true', default=False, dest='ddr_plan')
+  parser.add_argument('--fuse', help='pass the feature maps of fused layers through the on-chip buffer', action='store_true', default=False, dest='fuse')
+  parser.add_argument('--auto-tile', help='select the tiles of the layers with tile_tune.py', action='store_true', default=False, dest='auto_tile')
+  parser.add_argument('--tile-objective', choices=['waste', 'cycles'], default='waste', help='objective of the tiles selected with --auto-tile', dest='tile_objective')
+  parser.add_argument('--quant', metavar='BITS', type=int, choices=[16, 8], default=0, help='export the data as fixed point of the given width', dest='quant')
+  parser.add_argument('--parallel', help='reorganize the layers in parallel', action='store_true', default=False)
+  parser.add_argument('--sim', help='also run the sim step, inst_sim.py on input.bin', action='store_true', default=False)
+  parser.add_argument('-s', '--steps', metavar='STEP', nargs='+', default=None, help='steps to run, of ' + ', '.join(STEPS), dest='steps')
+  parser.add_argument('-f', '--force', metavar='STEP', nargs='*', default=None, help='steps to run even when cached, all of them without a name', dest='force')
+  parser.add_argument('--cache', metavar='CACHE', default=CACHE_DIR, help='cache directory', dest='cache')
+
+  args = parser.parse_args()
+  if args.model.endswith('.json'):
+    args.model_config = None
+  force = []
+  if args.force is not None:
+    force = args.force if args.force else STEPS
+  steps = args.steps
+  if steps is None and args.sim:
+    steps = STEPS
+  run(args, steps=steps, force=force, cache=args.cache)